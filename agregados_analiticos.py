@@ -0,0 +1,475 @@
+"""
+Agregados Incrementales de Analíticas
+=====================================
+
+patrones_compra y productos_por_establecimiento se mantienen con deltas de
+las facturas nuevas en lugar de recalcular AVG/MIN/MAX/COUNT sobre toda la
+historia de cada producto: el costo por factura no crece con la historia.
+
+- Cada fila guarda su estado acumulado (suma_precios, num_precios); el
+  promedio es suma / num, mínimo y máximo con LEAST/GREATEST, última
+  compra con GREATEST y las veces/reportes suman las facturas nuevas
+- Una fila sin estado (creada por otro módulo, o nueva) se siembra una
+  sola vez con su historia, sin las facturas del lote ni las que siguen
+  en outbox_analitica
+- La conciliación recorre ambas tablas por páginas de id, recalcula desde
+  items_factura todo lo que mantienen los deltas (suma, conteo, mínimo,
+  máximo, última fecha, facturas) y corrige solo las filas con deriva (ítems
+  editados o borrados después de aplicados, fusiones, ...). Continúa
+  en la cola si agota AGREGADOS_CONCILIACION_PRESUPUESTO_SEG y al terminar
+  programa el siguiente barrido (AGREGADOS_CONCILIACION_INTERVALO_SEG)
+
+Lo usa el consumidor de outbox_analitica; analytics_updater sigue siendo
+el recálculo completo de los reprocesamientos manuales. Con SQLite no hay
+agregados incrementales.
+
+Autor: LecFac
+Versión: 1.0.0
+"""
+
+import os
+import threading
+import time
+from typing import Dict, List, Optional
+
+AGREGADOS_CONCILIACION_LOTE = int(os.environ.get("AGREGADOS_CONCILIACION_LOTE", "1000"))
+AGREGADOS_CONCILIACION_PRESUPUESTO_SEG = float(
+    os.environ.get("AGREGADOS_CONCILIACION_PRESUPUESTO_SEG", "120")
+)
+# 0 desactiva el barrido periódico (queda el endpoint manual)
+AGREGADOS_CONCILIACION_INTERVALO_SEG = int(
+    os.environ.get("AGREGADOS_CONCILIACION_INTERVALO_SEG", "86400")
+)
+
+TIPO_TRABAJO = "conciliar_agregados_analiticos"
+TABLAS = ["productos_por_establecimiento", "patrones_compra"]
+
+_lock = threading.Lock()
+_stats = {
+    "sembradas": 0,
+    "paginas": 0,
+    "revisadas": 0,
+    "corregidas": 0,
+    "barridos": 0,
+}
+
+
+def _activo() -> bool:
+    return os.environ.get("DATABASE_TYPE", "sqlite").lower() == "postgresql"
+
+
+def _sumar(**valores):
+    with _lock:
+        for clave, valor in valores.items():
+            _stats[clave] += valor
+
+
+# ============================================================================
+# DELTAS
+# ============================================================================
+
+
+def aplicar_patrones_compra(cursor, facturas: List[int]) -> int:
+    """Suma las facturas nuevas a patrones_compra, sin commit"""
+    cursor.execute("DROP TABLE IF EXISTS delta_patrones")
+    cursor.execute(
+        """
+        CREATE TEMP TABLE delta_patrones ON COMMIT DROP AS
+        SELECT usuario_id, producto_maestro_id,
+               COUNT(DISTINCT factura_id) AS facturas,
+               COALESCE(SUM(precio_pagado), 0) AS suma,
+               COUNT(precio_pagado) AS num,
+               MAX(fecha_creacion)::DATE AS ultima,
+               FALSE AS sembrar
+        FROM items_factura
+        WHERE factura_id = ANY(%s) AND producto_maestro_id IS NOT NULL
+        GROUP BY usuario_id, producto_maestro_id
+    """,
+        (facturas,),
+    )
+    cursor.execute("""
+        INSERT INTO patrones_compra (usuario_id, producto_maestro_id, veces_comprado)
+        SELECT usuario_id, producto_maestro_id, 0 FROM delta_patrones
+        ON CONFLICT (usuario_id, producto_maestro_id) DO NOTHING
+    """)
+    cursor.execute("""
+        UPDATE delta_patrones d SET sembrar = TRUE
+        FROM patrones_compra pc
+        WHERE pc.usuario_id = d.usuario_id
+          AND pc.producto_maestro_id = d.producto_maestro_id
+          AND pc.num_precios IS NULL
+    """)
+    cursor.execute(
+        """
+        UPDATE patrones_compra pc SET
+            veces_comprado = h.facturas,
+            suma_precios = h.suma,
+            num_precios = h.num,
+            ultima_compra = h.ultima
+        FROM delta_patrones d
+        CROSS JOIN LATERAL (
+            SELECT COUNT(DISTINCT i.factura_id) AS facturas,
+                   COALESCE(SUM(i.precio_pagado), 0) AS suma,
+                   COUNT(i.precio_pagado) AS num,
+                   MAX(i.fecha_creacion)::DATE AS ultima
+            FROM items_factura i
+            WHERE i.usuario_id = d.usuario_id
+              AND i.producto_maestro_id = d.producto_maestro_id
+              AND i.factura_id <> ALL(%s)
+              AND NOT EXISTS (
+                  SELECT 1 FROM outbox_analitica o WHERE o.factura_id = i.factura_id
+              )
+        ) h
+        WHERE d.sembrar
+          AND pc.usuario_id = d.usuario_id
+          AND pc.producto_maestro_id = d.producto_maestro_id
+    """,
+        (facturas,),
+    )
+    _sumar(sembradas=cursor.rowcount)
+    cursor.execute("""
+        UPDATE patrones_compra pc SET
+            veces_comprado = pc.veces_comprado + d.facturas,
+            suma_precios = pc.suma_precios + d.suma,
+            num_precios = pc.num_precios + d.num,
+            precio_promedio_pagado = COALESCE(
+                ROUND(
+                    (pc.suma_precios + d.suma)::NUMERIC
+                    / NULLIF(pc.num_precios + d.num, 0)
+                )::INTEGER,
+                pc.precio_promedio_pagado
+            ),
+            ultima_compra = GREATEST(pc.ultima_compra, d.ultima),
+            ultima_actualizacion = NOW()
+        FROM delta_patrones d
+        WHERE pc.usuario_id = d.usuario_id
+          AND pc.producto_maestro_id = d.producto_maestro_id
+    """)
+    return cursor.rowcount
+
+
+def aplicar_productos_por_establecimiento(cursor, facturas: List[int]) -> int:
+    """
+    Suma las facturas nuevas a productos_por_establecimiento, sin commit.
+    total_reportes suma una por factura, como analytics_updater.
+    """
+    cursor.execute("DROP TABLE IF EXISTS delta_ppe")
+    cursor.execute(
+        """
+        CREATE TEMP TABLE delta_ppe ON COMMIT DROP AS
+        SELECT i.producto_maestro_id, f.establecimiento_id,
+               COUNT(DISTINCT i.factura_id) AS facturas,
+               COALESCE(SUM(i.precio_pagado), 0) AS suma,
+               COUNT(i.precio_pagado) AS num,
+               MIN(i.precio_pagado) AS minimo,
+               MAX(i.precio_pagado) AS maximo,
+               MAX(f.fecha_factura)::TIMESTAMP AS ultima,
+               FALSE AS sembrar
+        FROM items_factura i
+        JOIN facturas f ON f.id = i.factura_id
+        WHERE i.factura_id = ANY(%s)
+          AND i.producto_maestro_id IS NOT NULL
+          AND f.establecimiento_id IS NOT NULL
+        GROUP BY i.producto_maestro_id, f.establecimiento_id
+    """,
+        (facturas,),
+    )
+    cursor.execute("""
+        INSERT INTO productos_por_establecimiento
+            (producto_maestro_id, establecimiento_id, total_reportes,
+             ultima_actualizacion)
+        SELECT producto_maestro_id, establecimiento_id, 0, NULL FROM delta_ppe
+        ON CONFLICT (producto_maestro_id, establecimiento_id) DO NOTHING
+    """)
+    cursor.execute("""
+        UPDATE delta_ppe d SET sembrar = TRUE
+        FROM productos_por_establecimiento ppe
+        WHERE ppe.producto_maestro_id = d.producto_maestro_id
+          AND ppe.establecimiento_id = d.establecimiento_id
+          AND ppe.num_precios IS NULL
+    """)
+    cursor.execute(
+        """
+        UPDATE productos_por_establecimiento ppe SET
+            suma_precios = h.suma,
+            num_precios = h.num,
+            precio_minimo = LEAST(ppe.precio_minimo, h.minimo),
+            precio_maximo = GREATEST(ppe.precio_maximo, h.maximo)
+        FROM delta_ppe d
+        CROSS JOIN LATERAL (
+            SELECT COALESCE(SUM(i.precio_pagado), 0) AS suma,
+                   COUNT(i.precio_pagado) AS num,
+                   MIN(i.precio_pagado) AS minimo,
+                   MAX(i.precio_pagado) AS maximo
+            FROM items_factura i
+            JOIN facturas f ON f.id = i.factura_id
+            WHERE i.producto_maestro_id = d.producto_maestro_id
+              AND f.establecimiento_id = d.establecimiento_id
+              AND i.factura_id <> ALL(%s)
+              AND NOT EXISTS (
+                  SELECT 1 FROM outbox_analitica o WHERE o.factura_id = i.factura_id
+              )
+        ) h
+        WHERE d.sembrar
+          AND ppe.producto_maestro_id = d.producto_maestro_id
+          AND ppe.establecimiento_id = d.establecimiento_id
+    """,
+        (facturas,),
+    )
+    _sumar(sembradas=cursor.rowcount)
+    cursor.execute("""
+        UPDATE productos_por_establecimiento ppe SET
+            suma_precios = ppe.suma_precios + d.suma,
+            num_precios = ppe.num_precios + d.num,
+            precio_actual = COALESCE(
+                ROUND(
+                    (ppe.suma_precios + d.suma)::NUMERIC
+                    / NULLIF(ppe.num_precios + d.num, 0)
+                )::INTEGER,
+                ppe.precio_actual
+            ),
+            precio_minimo = LEAST(ppe.precio_minimo, d.minimo),
+            precio_maximo = GREATEST(ppe.precio_maximo, d.maximo),
+            ultima_actualizacion = GREATEST(ppe.ultima_actualizacion, d.ultima),
+            total_reportes = COALESCE(ppe.total_reportes, 0) + d.facturas,
+            fecha_actualizacion = NOW()
+        FROM delta_ppe d
+        WHERE ppe.producto_maestro_id = d.producto_maestro_id
+          AND ppe.establecimiento_id = d.establecimiento_id
+    """)
+    return cursor.rowcount
+
+
+# ============================================================================
+# CONCILIACIÓN
+# ============================================================================
+
+# Una sentencia por página: estado recalculado desde items_factura (sin las
+# facturas que siguen en el outbox) y corrección de las filas con deriva.
+# Devuelve (último id de la página, filas revisadas, filas corregidas).
+_CONCILIAR = {
+    "productos_por_establecimiento": """
+        WITH pagina AS (
+            SELECT id, producto_maestro_id, establecimiento_id
+            FROM productos_por_establecimiento
+            WHERE id > %s
+            ORDER BY id
+            LIMIT %s
+        ),
+        historia AS (
+            SELECT p.id, h.*
+            FROM pagina p
+            CROSS JOIN LATERAL (
+                SELECT COUNT(DISTINCT i.factura_id) AS facturas,
+                       COALESCE(SUM(i.precio_pagado), 0) AS suma,
+                       COUNT(i.precio_pagado) AS num,
+                       MIN(i.precio_pagado) AS minimo,
+                       MAX(i.precio_pagado) AS maximo,
+                       MAX(f.fecha_factura)::TIMESTAMP AS ultima
+                FROM items_factura i
+                JOIN facturas f ON f.id = i.factura_id
+                WHERE i.producto_maestro_id = p.producto_maestro_id
+                  AND f.establecimiento_id = p.establecimiento_id
+                  AND NOT EXISTS (
+                      SELECT 1 FROM outbox_analitica o
+                      WHERE o.factura_id = i.factura_id
+                  )
+            ) h
+        ),
+        corregidas AS (
+            UPDATE productos_por_establecimiento ppe SET
+                suma_precios = c.suma,
+                num_precios = c.num,
+                precio_actual = COALESCE(
+                    ROUND(c.suma::NUMERIC / NULLIF(c.num, 0))::INTEGER,
+                    ppe.precio_actual
+                ),
+                precio_minimo = COALESCE(c.minimo, ppe.precio_minimo),
+                precio_maximo = COALESCE(c.maximo, ppe.precio_maximo),
+                ultima_actualizacion = COALESCE(c.ultima, ppe.ultima_actualizacion),
+                total_reportes = CASE
+                    WHEN c.facturas > 0 THEN c.facturas ELSE ppe.total_reportes
+                END,
+                fecha_actualizacion = NOW()
+            FROM historia c
+            WHERE ppe.id = c.id
+              AND (ppe.suma_precios IS DISTINCT FROM c.suma
+                   OR ppe.num_precios IS DISTINCT FROM c.num
+                   OR ppe.precio_minimo IS DISTINCT FROM
+                      COALESCE(c.minimo, ppe.precio_minimo)
+                   OR ppe.precio_maximo IS DISTINCT FROM
+                      COALESCE(c.maximo, ppe.precio_maximo)
+                   OR ppe.ultima_actualizacion IS DISTINCT FROM
+                      COALESCE(c.ultima, ppe.ultima_actualizacion)
+                   OR (c.facturas > 0
+                       AND ppe.total_reportes IS DISTINCT FROM c.facturas))
+            RETURNING ppe.id
+        )
+        SELECT (SELECT MAX(id) FROM pagina),
+               (SELECT COUNT(*) FROM pagina),
+               (SELECT COUNT(*) FROM corregidas)
+    """,
+    "patrones_compra": """
+        WITH pagina AS (
+            SELECT id, usuario_id, producto_maestro_id
+            FROM patrones_compra
+            WHERE id > %s
+            ORDER BY id
+            LIMIT %s
+        ),
+        historia AS (
+            SELECT p.id, h.*
+            FROM pagina p
+            CROSS JOIN LATERAL (
+                SELECT COUNT(DISTINCT i.factura_id) AS facturas,
+                       COALESCE(SUM(i.precio_pagado), 0) AS suma,
+                       COUNT(i.precio_pagado) AS num,
+                       MAX(i.fecha_creacion)::DATE AS ultima
+                FROM items_factura i
+                WHERE i.usuario_id = p.usuario_id
+                  AND i.producto_maestro_id = p.producto_maestro_id
+                  AND NOT EXISTS (
+                      SELECT 1 FROM outbox_analitica o
+                      WHERE o.factura_id = i.factura_id
+                  )
+            ) h
+        ),
+        corregidas AS (
+            UPDATE patrones_compra pc SET
+                veces_comprado = c.facturas,
+                suma_precios = c.suma,
+                num_precios = c.num,
+                precio_promedio_pagado = COALESCE(
+                    ROUND(c.suma::NUMERIC / NULLIF(c.num, 0))::INTEGER,
+                    pc.precio_promedio_pagado
+                ),
+                ultima_compra = COALESCE(c.ultima, pc.ultima_compra),
+                ultima_actualizacion = NOW()
+            FROM historia c
+            WHERE pc.id = c.id
+              AND (pc.suma_precios IS DISTINCT FROM c.suma
+                   OR pc.num_precios IS DISTINCT FROM c.num
+                   OR pc.veces_comprado IS DISTINCT FROM c.facturas
+                   OR pc.ultima_compra IS DISTINCT FROM
+                      COALESCE(c.ultima, pc.ultima_compra))
+            RETURNING pc.id
+        )
+        SELECT (SELECT MAX(id) FROM pagina),
+               (SELECT COUNT(*) FROM pagina),
+               (SELECT COUNT(*) FROM corregidas)
+    """,
+}
+
+
+def _conciliar_pagina(conn, tabla: str, desde: int) -> Optional[int]:
+    """Concilia una página; devuelve el último id o None si no quedan filas"""
+    from outbox_analitica import OUTBOX_ANALITICA_LOCK_KEY
+
+    cursor = conn.cursor()
+    try:
+        # Mismo lock que el consumidor del outbox: un lote a medio aplicar
+        # se contaría dos veces
+        cursor.execute("SELECT pg_advisory_xact_lock(%s)", (OUTBOX_ANALITICA_LOCK_KEY,))
+        cursor.execute(_CONCILIAR[tabla], (desde, AGREGADOS_CONCILIACION_LOTE))
+        ultimo, revisadas, corregidas = cursor.fetchone()
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+
+    if not revisadas:
+        return None
+    _sumar(paginas=1, revisadas=revisadas, corregidas=corregidas)
+    if corregidas:
+        print(f"🔧 [AGREGADOS] {tabla}: {corregidas} filas con deriva corregidas")
+    return ultimo
+
+
+def programar_conciliacion(
+    retraso_seg: int = 0, excluir_job_id: Optional[str] = None
+) -> Optional[str]:
+    """
+    Encola un barrido de conciliación salvo que ya haya uno en curso o
+    pendiente dentro de `retraso_seg`.
+
+    Returns:
+        job_id, o None si no hizo falta (o sin PostgreSQL)
+    """
+    if not _activo():
+        return None
+
+    from database import get_db_connection
+    from job_queue import encolar_trabajo
+
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        cursor.execute(
+            """
+            SELECT 1 FROM processing_jobs
+            WHERE tipo = %s
+              AND id IS DISTINCT FROM %s
+              AND (status = 'processing'
+                   OR (status = 'pending'
+                       AND disponible_en <= NOW() + (%s * INTERVAL '1 second')))
+            LIMIT 1
+        """,
+            (TIPO_TRABAJO, excluir_job_id, retraso_seg),
+        )
+        if cursor.fetchone():
+            conn.commit()
+            return None
+        job_id = encolar_trabajo(TIPO_TRABAJO, {}, conn=conn, retraso_seg=retraso_seg)
+        conn.commit()
+        return job_id
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def procesar_trabajo(job_id: str, payload: Dict, usuario_id: Optional[int]):
+    """
+    Handler de job_queue: concilia páginas desde payload {"tabla", "desde"}
+    hasta terminar o agotar el presupuesto (encola la continuación). Al
+    terminar programa el siguiente barrido.
+    """
+    from database import get_db_connection
+    from job_queue import encolar_trabajo
+
+    indice = TABLAS.index(payload.get("tabla", TABLAS[0]))
+    desde = int(payload.get("desde", 0))
+    inicio = time.monotonic()
+
+    conn = get_db_connection()
+    try:
+        while indice < len(TABLAS):
+            if time.monotonic() - inicio > AGREGADOS_CONCILIACION_PRESUPUESTO_SEG:
+                encolar_trabajo(
+                    TIPO_TRABAJO, {"tabla": TABLAS[indice], "desde": desde}, conn=conn
+                )
+                conn.commit()
+                return
+            ultimo = _conciliar_pagina(conn, TABLAS[indice], desde)
+            if ultimo is None:
+                indice, desde = indice + 1, 0
+            else:
+                desde = ultimo
+    finally:
+        conn.close()
+
+    _sumar(barridos=1)
+    print(f"✅ [AGREGADOS] Conciliación completa ({estadisticas()})")
+    if AGREGADOS_CONCILIACION_INTERVALO_SEG > 0:
+        programar_conciliacion(
+            AGREGADOS_CONCILIACION_INTERVALO_SEG, excluir_job_id=job_id
+        )
+
+
+def estadisticas() -> Dict:
+    with _lock:
+        return dict(_stats)
@@ -20,6 +20,18 @@ from typing import Optional
 logger = logging.getLogger(__name__)
 
 
+def _bloquear_outbox(cursor):
+    """
+    Mismo lock de transacción que el consumidor de outbox_analitica: el
+    recálculo completo no se cruza con un lote de deltas a medio aplicar.
+    Las facturas que siguen en el outbox se excluyen del recálculo (las
+    suma el consumidor) para no contarlas dos veces.
+    """
+    from outbox_analitica import OUTBOX_ANALITICA_LOCK_KEY
+
+    cursor.execute("SELECT pg_advisory_xact_lock(%s)", (OUTBOX_ANALITICA_LOCK_KEY,))
+
+
 def actualizar_historial_compras(cursor, conn, factura_id: int, usuario_id: int) -> int:
     """
     Actualiza historial_compras_usuario con los items de una factura.
@@ -70,7 +82,9 @@ def actualizar_patrones_compra(
     cursor, conn, usuario_id: int, productos_ids: list
 ) -> int:
     """
-    Recalcula patrones_compra para los productos de un usuario.
+    Recalcula patrones_compra para los productos de un usuario con toda su
+    historia ya aplicada (reprocesamiento manual; el flujo de facturas
+    aplica deltas con agregados_analiticos).
 
     Args:
         cursor: Cursor de PostgreSQL
@@ -85,32 +99,37 @@ def actualizar_patrones_compra(
         if not productos_ids:
             return 0
 
-        # Convertir lista a string para el query
-        productos_str = ",".join(str(pid) for pid in productos_ids)
-
-        query = f"""
+        query = """
             INSERT INTO patrones_compra
-                (usuario_id, producto_maestro_id, ultima_compra, veces_comprado, precio_promedio_pagado)
+                (usuario_id, producto_maestro_id, ultima_compra, veces_comprado,
+                 precio_promedio_pagado, suma_precios, num_precios)
             SELECT
                 if.usuario_id,
                 if.producto_maestro_id,
                 MAX(if.fecha_creacion)::DATE,
                 COUNT(DISTINCT if.factura_id),
-                AVG(if.precio_pagado)::INTEGER
+                AVG(if.precio_pagado)::INTEGER,
+                COALESCE(SUM(if.precio_pagado), 0),
+                COUNT(if.precio_pagado)
             FROM items_factura if
             WHERE if.usuario_id = %s
-              AND if.producto_maestro_id IN ({productos_str})
-              AND if.producto_maestro_id IS NOT NULL
+              AND if.producto_maestro_id = ANY(%s)
+              AND NOT EXISTS (
+                  SELECT 1 FROM outbox_analitica o WHERE o.factura_id = if.factura_id
+              )
             GROUP BY if.usuario_id, if.producto_maestro_id
             ON CONFLICT (usuario_id, producto_maestro_id) DO UPDATE SET
                 ultima_compra = EXCLUDED.ultima_compra,
                 veces_comprado = EXCLUDED.veces_comprado,
                 precio_promedio_pagado = EXCLUDED.precio_promedio_pagado,
+                suma_precios = EXCLUDED.suma_precios,
+                num_precios = EXCLUDED.num_precios,
                 ultima_actualizacion = NOW()
             RETURNING id;
         """
 
-        cursor.execute(query, (usuario_id,))
+        _bloquear_outbox(cursor)
+        cursor.execute(query, (usuario_id, [int(pid) for pid in productos_ids]))
         result = cursor.fetchall()
         conn.commit()
 
@@ -130,7 +149,9 @@ def actualizar_productos_por_establecimiento(
     cursor, conn, establecimiento_id: int, productos_ids: list
 ) -> int:
     """
-    Actualiza precios de productos por establecimiento.
+    Recalcula precios de productos por establecimiento con toda la historia
+    ya aplicada (reprocesamiento manual; el flujo de facturas aplica deltas
+    con agregados_analiticos).
 
     Args:
         cursor: Cursor de PostgreSQL
@@ -145,12 +166,11 @@ def actualizar_productos_por_establecimiento(
         if not productos_ids:
             return 0
 
-        productos_str = ",".join(str(pid) for pid in productos_ids)
-
-        query = f"""
+        query = """
             INSERT INTO productos_por_establecimiento
                 (producto_maestro_id, establecimiento_id, precio_actual, precio_minimo,
-                 precio_maximo, ultima_actualizacion, total_reportes)
+                 precio_maximo, ultima_actualizacion, total_reportes, suma_precios,
+                 num_precios)
             SELECT
                 if.producto_maestro_id,
                 f.establecimiento_id,
@@ -158,12 +178,16 @@ def actualizar_productos_por_establecimiento(
                 MIN(if.precio_pagado)::INTEGER,
                 MAX(if.precio_pagado)::INTEGER,
                 MAX(f.fecha_factura)::TIMESTAMP,
-                COUNT(*)
+                COUNT(*),
+                COALESCE(SUM(if.precio_pagado), 0),
+                COUNT(if.precio_pagado)
             FROM items_factura if
             INNER JOIN facturas f ON if.factura_id = f.id
             WHERE f.establecimiento_id = %s
-              AND if.producto_maestro_id IN ({productos_str})
-              AND if.producto_maestro_id IS NOT NULL
+              AND if.producto_maestro_id = ANY(%s)
+              AND NOT EXISTS (
+                  SELECT 1 FROM outbox_analitica o WHERE o.factura_id = if.factura_id
+              )
             GROUP BY if.producto_maestro_id, f.establecimiento_id
             ON CONFLICT (producto_maestro_id, establecimiento_id) DO UPDATE SET
                 precio_actual = EXCLUDED.precio_actual,
@@ -171,11 +195,16 @@ def actualizar_productos_por_establecimiento(
                 precio_maximo = GREATEST(productos_por_establecimiento.precio_maximo, EXCLUDED.precio_maximo),
                 ultima_actualizacion = EXCLUDED.ultima_actualizacion,
                 total_reportes = productos_por_establecimiento.total_reportes + 1,
+                suma_precios = EXCLUDED.suma_precios,
+                num_precios = EXCLUDED.num_precios,
                 fecha_actualizacion = NOW()
             RETURNING id;
         """
 
-        cursor.execute(query, (establecimiento_id,))
+        _bloquear_outbox(cursor)
+        cursor.execute(
+            query, (establecimiento_id, [int(pid) for pid in productos_ids])
+        )
         result = cursor.fetchall()
         conn.commit()
 
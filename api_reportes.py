@@ -10,6 +10,7 @@ from pydantic import BaseModel
 from typing import Optional, List
 from datetime import datetime
 from database import get_db_connection
+from busqueda_productos import buscar_en_tabla
 
 router = APIRouter(tags=["Reportes"])
 
@@ -590,22 +591,17 @@ async def buscar_productos(
         if not palabras:
             return {"success": True, "productos": []}
 
-        condiciones = " AND ".join(
-            ["UPPER(nombre_consolidado) LIKE %s" for _ in palabras]
-        )
-        params = [f"%{p}%" for p in palabras]
-
-        cursor.execute(
-            f"""
-            SELECT id, nombre_consolidado, codigo_ean, marca FROM productos_maestros_v2
-            WHERE {condiciones} ORDER BY veces_visto DESC NULLS LAST LIMIT %s
-        """,
-            params + [limit],
+        filas = buscar_en_tabla(
+            cursor,
+            "productos_maestros_v2",
+            "id, nombre_consolidado, codigo_ean, marca",
+            " ".join(palabras),
+            limit,
+            popularidad="veces_visto",
         )
 
         productos = [
-            {"id": r[0], "nombre": r[1], "ean": r[2], "marca": r[3]}
-            for r in cursor.fetchall()
+            {"id": r[0], "nombre": r[1], "ean": r[2], "marca": r[3]} for r in filas
         ]
         return {"success": True, "productos": productos}
 
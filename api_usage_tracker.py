@@ -20,9 +20,14 @@ def registrar_uso_api(
     referencia_tipo: str = None,
     exitoso: bool = True,
     error_mensaje: str = None,
+    cache_hit: bool = False,
+    tokens_ahorrados: int = 0,
 ) -> dict:
     """
     Registra el uso de la API de Claude y actualiza los límites del usuario.
+
+    cache_hit: el resultado salió de la caché OCR (sin llamada a Claude);
+    tokens_ahorrados guarda lo que habría costado.
     """
 
     conn = get_db_connection()
@@ -44,8 +49,9 @@ def registrar_uso_api(
                 tokens_input, tokens_output,
                 costo_input_usd, costo_output_usd,
                 referencia_id, referencia_tipo,
-                exitoso, error_mensaje
-            ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+                exitoso, error_mensaje,
+                cache_hit, tokens_ahorrados
+            ) VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
             RETURNING id
         """,
             (
@@ -60,6 +66,8 @@ def registrar_uso_api(
                 referencia_tipo,
                 exitoso,
                 error_mensaje,
+                cache_hit,
+                tokens_ahorrados,
             ),
         )
 
@@ -112,6 +120,8 @@ def registrar_uso_api(
             f"   🔢 Tokens: {tokens_input:,} in + {tokens_output:,} out = {tokens_total:,}"
         )
         print(f"   💰 Costo: ${costo_total:.6f} USD")
+        if cache_hit:
+            print(f"   ♻️ Cache hit: {tokens_ahorrados:,} tokens ahorrados")
         print(f"   📈 Uso mes: {porcentaje_usado:.1f}% ({limites[0]:,}/{limites[1]:,})")
 
         return {
@@ -119,6 +129,7 @@ def registrar_uso_api(
             "registro_id": registro_id,
             "tokens_usados": tokens_total,
             "costo_usd": costo_total,
+            "cache_hit": cache_hit,
             "limites": {
                 "tokens_usados_mes": limites[0],
                 "limite_tokens_mes": limites[1],
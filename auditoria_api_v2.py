@@ -25,6 +25,9 @@ import json
 import re
 import anthropic
 
+import claude_client
+import indice_referencia
+
 router = APIRouter()
 
 # Configuración
@@ -332,6 +335,7 @@ async def crear_producto_referencia(
 
             row = cursor.fetchone()
             conn.commit()
+            indice_referencia.marcar_desactualizado()
 
             print(f"🔄 [AUDITORÍA] Producto actualizado (validaciones: {row[6]})")
 
@@ -378,6 +382,7 @@ async def crear_producto_referencia(
 
             row = cursor.fetchone()
             conn.commit()
+            indice_referencia.marcar_desactualizado()
 
             tiene_imagen = "📷" if producto.imagen_base64 else ""
             print(f"✅ [AUDITORÍA] Producto creado: ID {row[0]} {tiene_imagen}")
@@ -473,6 +478,7 @@ async def actualizar_producto_referencia(
             raise HTTPException(status_code=404, detail="Producto no encontrado")
 
         conn.commit()
+        indice_referencia.marcar_desactualizado()
 
         print(f"✅ [AUDITORÍA] Producto actualizado: {row[2]}")
 
@@ -581,8 +587,6 @@ async def analizar_imagen_producto(request: ImagenAnalisisRequest):
                 status_code=500, detail="API key de Anthropic no configurada"
             )
 
-        client = anthropic.Anthropic(api_key=api_key)
-
         # Limpiar base64
         imagen_b64 = request.imagen_base64
         if "," in imagen_b64:
@@ -626,7 +630,9 @@ Si la imagen no es clara:
 
         print("🤖 [VISION] Enviando a Claude...")
 
-        message = client.messages.create(
+        message = await claude_client.crear_mensaje_async(
+            timeout=60,
+            etiqueta="auditoria_imagen",
             model="claude-sonnet-4-20250514",
             max_tokens=500,
             messages=[
@@ -248,12 +248,13 @@ async def obtener_estadisticas(current_user: dict = Depends(get_current_user)):
 # ============================================================
 # ENDPOINT: Analizar imagen con Claude Vision
 # ============================================================
-import anthropic
 import base64
 import os
 import re
 import json
 
+import claude_client
+
 
 class ImagenProductoRequest(BaseModel):
     imagen_base64: str
@@ -268,8 +269,6 @@ async def analizar_imagen_producto(request: ImagenProductoRequest):
     try:
         print("📸 Recibida imagen para análisis")
 
-        client = anthropic.Anthropic(api_key=os.getenv("ANTHROPIC_API_KEY"))
-
         imagen_b64 = request.imagen_base64
         if "," in imagen_b64:
             imagen_b64 = imagen_b64.split(",")[1]
@@ -288,7 +287,9 @@ RESPONDE SOLO en formato JSON:
 Si no puedes identificar el producto:
 {"nombre": "", "marca": "", "presentacion": "", "categoria": "", "confianza": 0.0}"""
 
-        message = client.messages.create(
+        message = await claude_client.crear_mensaje_async(
+            timeout=60,
+            etiqueta="auditoria_imagen",
             model="claude-sonnet-4-20250514",
             max_tokens=500,
             messages=[
@@ -0,0 +1,176 @@
+"""
+Benchmark del Detector de Duplicados
+====================================
+
+Mide detectar_duplicados_automaticamente con videos sintéticos de N líneas
+crudas (productos repetidos en varios frames con errores de OCR) y lo
+compara con la agrupación anterior, que comparaba cada producto contra
+todos los demás con son_productos_similares.
+
+- Tamaños por defecto: 50, 100, 200, 300 y 500 líneas (5 frames)
+- Reporta tiempo, pares candidatos, grupos y si los grupos cambian al
+  invertir el orden de los frames
+
+Uso:
+
+    python benchmark_duplicados.py
+    python benchmark_duplicados.py --tamanos 100 500 --frames 5 --sin-referencia
+
+Autor: LecFac
+Versión: 1.0.0
+"""
+
+import argparse
+import contextlib
+import io
+import random
+import time
+from typing import Dict, List, Tuple
+
+import duplicate_detector
+from duplicate_detector import (
+    detectar_duplicados_automaticamente,
+    son_productos_similares,
+)
+
+MARCAS = ["ALPINA", "COLANTA", "ZENU", "ROSAL", "FAMILIA", "NOEL", "DIANA", "FRUCO"]
+TIPOS = [
+    "LCH ENT",
+    "QSO TAJ",
+    "SALCH RANCH",
+    "P HIG",
+    "GALL CREM",
+    "ARROZ PREM",
+    "SALSA TOM",
+    "YOG GRIEGO",
+    "ACE VEG",
+    "HUEV AA",
+]
+PRESENTACIONES = ["1LT", "500G", "250G", "X12UND", "30M 12UND", "X30UND", "1KG"]
+ERRORES_OCR = {"O": "0", "I": "1", "E": "3", "S": "5", "M": "H", "N": "M"}
+
+
+def _catalogo(n: int, rng: random.Random) -> List[Tuple[str, int]]:
+    productos = set()
+    while len(productos) < n:
+        nombre = (
+            f"{rng.choice(TIPOS)} {rng.choice(MARCAS)} {rng.choice(PRESENTACIONES)}"
+        )
+        productos.add((nombre, rng.randrange(20, 400) * 100))
+    return sorted(productos)
+
+
+def _ruido(nombre: str, rng: random.Random) -> str:
+    letras = list(nombre)
+    for _ in range(rng.randint(0, 2)):
+        k = rng.randrange(len(letras))
+        letras[k] = ERRORES_OCR.get(letras[k], letras[k])
+    return "".join(letras)
+
+
+def generar_lineas(lineas: int, frames: int, semilla: int = 7) -> List[Dict]:
+    """Líneas crudas de un video: cada producto aparece en casi todos los frames"""
+    rng = random.Random(semilla)
+    catalogo = _catalogo(max(1, lineas // frames), rng)
+    resultado = []
+    while len(resultado) < lineas:
+        for nombre, precio in catalogo:
+            if len(resultado) >= lineas:
+                break
+            resultado.append(
+                {
+                    "codigo": "",
+                    "nombre": _ruido(nombre, rng),
+                    "valor": precio,
+                    "cantidad": 1,
+                }
+            )
+    return resultado
+
+
+def agrupar_todos_contra_todos(productos: List[Dict], umbral: float) -> int:
+    """Agrupación anterior (semilla contra todos, O(n²) pares); número de grupos"""
+    asignados = set()
+    grupos = 0
+    for i, prod1 in enumerate(productos):
+        if i in asignados:
+            continue
+        asignados.add(i)
+        grupos += 1
+        for j, prod2 in enumerate(productos):
+            if j not in asignados and son_productos_similares(prod1, prod2, umbral):
+                asignados.add(j)
+    return grupos
+
+
+def _detectar(productos: List[Dict]) -> Dict:
+    with contextlib.redirect_stdout(io.StringIO()):
+        return detectar_duplicados_automaticamente(productos, total_factura=0)
+
+
+def medir(lineas: int, frames: int, umbral: float, referencia: bool) -> Dict:
+    productos = generar_lineas(lineas, frames)
+    duplicate_detector._caracteristicas.cache_clear()
+
+    inicio = time.perf_counter()
+    resultado = _detectar(productos)
+    segundos = time.perf_counter() - inicio
+
+    invertido = _detectar(list(reversed(productos)))
+    grupos_invertido = invertido["metricas"]["grupos_identificados"]
+
+    fila = {
+        "lineas": lineas,
+        "segundos": segundos,
+        "pares_candidatos": resultado["metricas"]["pares_comparados"],
+        "pares_todos": lineas * (lineas - 1) // 2,
+        "grupos": resultado["metricas"]["grupos_identificados"],
+        "estable": grupos_invertido == resultado["metricas"]["grupos_identificados"],
+    }
+
+    if referencia:
+        duplicate_detector._caracteristicas.cache_clear()
+        inicio = time.perf_counter()
+        fila["grupos_referencia"] = agrupar_todos_contra_todos(productos, umbral)
+        fila["segundos_referencia"] = time.perf_counter() - inicio
+    return fila
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark del detector de duplicados")
+    parser.add_argument(
+        "--tamanos", type=int, nargs="+", default=[50, 100, 200, 300, 500]
+    )
+    parser.add_argument("--frames", type=int, default=5)
+    parser.add_argument("--umbral", type=float, default=0.75)
+    parser.add_argument(
+        "--sin-referencia",
+        action="store_true",
+        help="No medir la agrupación O(n²) anterior",
+    )
+    args = parser.parse_args()
+
+    print(f"\n🧪 BENCHMARK DETECTOR DE DUPLICADOS ({args.frames} frames)")
+    print("=" * 96)
+    print(
+        f"{'Líneas':>7} {'Tiempo':>9} {'Pares cand.':>12} {'Pares n²':>10} "
+        f"{'Grupos':>7} {'Estable':>8} {'Ref. tiempo':>12} {'Ref. grupos':>12}"
+    )
+    print("-" * 96)
+    for lineas in args.tamanos:
+        fila = medir(lineas, args.frames, args.umbral, not args.sin_referencia)
+        referencia = (
+            f"{fila['segundos_referencia']:>11.3f}s {fila['grupos_referencia']:>12}"
+            if "segundos_referencia" in fila
+            else f"{'-':>12} {'-':>12}"
+        )
+        print(
+            f"{fila['lineas']:>7} {fila['segundos']:>8.3f}s "
+            f"{fila['pares_candidatos']:>12} {fila['pares_todos']:>10} "
+            f"{fila['grupos']:>7} {'sí' if fila['estable'] else 'NO':>8} {referencia}"
+        )
+    print("=" * 96)
+
+
+if __name__ == "__main__":
+    main()
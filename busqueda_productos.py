@@ -0,0 +1,374 @@
+"""
+Búsqueda de Productos por Nombre
+================================
+
+API de consulta compartida para buscar productos por nombre en
+productos_maestros_v2, productos_referencia_ean, productos_referencia y el
+espejo de catálogos VTEX (catalogo_vtex).
+
+- Con pg_trgm (migración 007): índices GIN de trigramas sobre el nombre
+  normalizado (minúsculas y sin tildes) y una columna nombre_tsv
+  (tsvector de nombre + marca) con su propio índice GIN
+- El ranking se hace en SQL: similitud de palabra/trigramas + ts_rank +
+  popularidad (veces_visto, validaciones) con peso logarítmico
+- Sin pg_trgm (o con SQLite) se usa el LIKE de siempre, ordenado por
+  popularidad, con las mismas funciones
+
+Las consultas se escriben con placeholders $1, $2... (como en db_async) y
+sirven tanto para asyncpg como para cursores psycopg/SQLite.
+
+Autor: LecFac
+Versión: 1.0.0
+"""
+
+import os
+import re
+import threading
+import time
+from dataclasses import dataclass
+from typing import FrozenSet, List, Optional, Sequence, Tuple
+
+# Columna de nombre de cada tabla con búsqueda (la marca va al tsvector)
+TABLAS_BUSQUEDA = {
+    "productos_maestros_v2": "nombre_consolidado",
+    "productos_referencia_ean": "nombre",
+    "productos_referencia": "nombre",
+    "catalogo_vtex": "nombre",
+}
+COLUMNA_TSV = "nombre_tsv"
+FUNCION_NORMALIZAR = "lecfac_normalizar_busqueda"
+
+# Peso de ln(1 + popularidad) frente a la similitud (0..1)
+BUSQUEDA_PESO_POPULARIDAD = float(os.environ.get("BUSQUEDA_PESO_POPULARIDAD", "0.05"))
+# Segundos antes de volver a consultar el catálogo si no había soporte
+BUSQUEDA_REVISION_SOPORTE_SEG = 300
+# Palabras usadas en el modo LIKE (cada una es un LIKE '%...%')
+MAX_PALABRAS_LIKE = 4
+
+_soporte_lock = threading.Lock()
+_tablas_soportadas: Optional[FrozenSet[str]] = None
+_soporte_revisado_en = 0.0
+
+
+def _es_postgresql() -> bool:
+    return os.environ.get("DATABASE_TYPE", "sqlite").lower() == "postgresql"
+
+
+# ============================================================================
+# SOPORTE DEL ESQUEMA
+# ============================================================================
+
+SQL_TABLAS_CON_BUSQUEDA = f"""
+    SELECT c.relname
+    FROM pg_attribute a
+    JOIN pg_class c ON c.oid = a.attrelid
+    JOIN pg_namespace n ON n.oid = c.relnamespace
+    WHERE n.nspname = 'public'
+      AND a.attname = '{COLUMNA_TSV}'
+      AND NOT a.attisdropped
+      AND c.relname = ANY(%s)
+      AND EXISTS (SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm')
+      AND to_regprocedure('{FUNCION_NORMALIZAR}(text)') IS NOT NULL
+"""
+
+
+def tablas_en_cache() -> Optional[FrozenSet[str]]:
+    """Tablas con búsqueda por trigramas ya detectadas (None si hay que revisar)"""
+    with _soporte_lock:
+        if _tablas_soportadas is None:
+            return None
+        if (
+            not _tablas_soportadas
+            and time.monotonic() - _soporte_revisado_en > BUSQUEDA_REVISION_SOPORTE_SEG
+        ):
+            return None
+        return _tablas_soportadas
+
+
+def tablas_con_busqueda() -> FrozenSet[str]:
+    """
+    Tablas donde están los índices de trigramas y la columna nombre_tsv.
+
+    Se consulta una vez por proceso; si la migración 007 no pudo instalar
+    pg_trgm se vuelve a revisar cada BUSQUEDA_REVISION_SOPORTE_SEG.
+    """
+    global _tablas_soportadas, _soporte_revisado_en
+
+    tablas = tablas_en_cache()
+    if tablas is not None:
+        return tablas
+
+    if not _es_postgresql():
+        tablas = frozenset()
+    else:
+        from database import get_db_connection
+
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        try:
+            cursor.execute(SQL_TABLAS_CON_BUSQUEDA, (list(TABLAS_BUSQUEDA),))
+            tablas = frozenset(row[0] for row in cursor.fetchall())
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            print(f"⚠️ [BUSQUEDA] No se pudo revisar el soporte de trigramas: {e}")
+            return frozenset()
+        finally:
+            cursor.close()
+            conn.close()
+
+        if tablas:
+            print(f"🔎 [BUSQUEDA] Trigramas activos en: {', '.join(sorted(tablas))}")
+        else:
+            print("⚠️ [BUSQUEDA] Sin pg_trgm, se usa búsqueda LIKE")
+
+    with _soporte_lock:
+        _tablas_soportadas = tablas
+        _soporte_revisado_en = time.monotonic()
+    return tablas
+
+
+def olvidar_soporte():
+    """Fuerza a revisar de nuevo el soporte (tras crear los índices)"""
+    global _tablas_soportadas
+    with _soporte_lock:
+        _tablas_soportadas = None
+
+
+def asegurar_indices_busqueda(cursor) -> List[str]:
+    """
+    Instala pg_trgm/unaccent y crea la función de normalización, la columna
+    nombre_tsv y los índices GIN de cada tabla existente.
+
+    Sin permisos para CREATE EXTENSION no falla: deja el esquema como estaba
+    y la búsqueda sigue por LIKE.
+
+    Returns:
+        Tablas que quedaron con índices de búsqueda
+    """
+    extensiones = set()
+    for extension in ("pg_trgm", "unaccent"):
+        cursor.execute("SAVEPOINT busqueda_extension")
+        try:
+            cursor.execute(f"CREATE EXTENSION IF NOT EXISTS {extension}")
+            cursor.execute("RELEASE SAVEPOINT busqueda_extension")
+            extensiones.add(extension)
+        except Exception as e:
+            cursor.execute("ROLLBACK TO SAVEPOINT busqueda_extension")
+            print(f"   ⚠️ No se pudo instalar {extension}: {e}")
+
+    if "pg_trgm" not in extensiones:
+        return []
+
+    # unaccent() es STABLE; la envoltura con diccionario explícito es segura
+    # de marcar IMMUTABLE y así sirve para índices y columnas generadas
+    if "unaccent" in extensiones:
+        cuerpo = "SELECT lower(public.unaccent('public.unaccent'::regdictionary, $1))"
+    else:
+        cuerpo = "SELECT lower($1)"
+    cursor.execute(
+        f"""
+        CREATE OR REPLACE FUNCTION {FUNCION_NORMALIZAR}(text)
+        RETURNS text
+        LANGUAGE sql IMMUTABLE PARALLEL SAFE STRICT
+        AS $$ {cuerpo} $$
+    """
+    )
+
+    creadas = []
+    for tabla, columna in TABLAS_BUSQUEDA.items():
+        cursor.execute(
+            """
+            SELECT column_name FROM information_schema.columns
+            WHERE table_schema = 'public' AND table_name = %s
+        """,
+            (tabla,),
+        )
+        columnas = {row[0] for row in cursor.fetchall()}
+        if columna not in columnas:
+            continue
+
+        marca = "COALESCE(marca, '')" if "marca" in columnas else "''"
+        cursor.execute(
+            f"""
+            ALTER TABLE {tabla}
+            ADD COLUMN IF NOT EXISTS {COLUMNA_TSV} tsvector
+            GENERATED ALWAYS AS (
+                to_tsvector(
+                    'simple',
+                    {FUNCION_NORMALIZAR}(COALESCE({columna}, '') || ' ' || {marca})
+                )
+            ) STORED
+        """
+        )
+        cursor.execute(
+            f"""
+            CREATE INDEX IF NOT EXISTS idx_{tabla}_{columna}_trgm
+            ON {tabla} USING GIN ({FUNCION_NORMALIZAR}({columna}) gin_trgm_ops)
+        """
+        )
+        cursor.execute(
+            f"""
+            CREATE INDEX IF NOT EXISTS idx_{tabla}_{COLUMNA_TSV}
+            ON {tabla} USING GIN ({COLUMNA_TSV})
+        """
+        )
+        creadas.append(tabla)
+
+    olvidar_soporte()
+    return creadas
+
+
+# ============================================================================
+# CONSTRUCCIÓN DE CONSULTAS
+# ============================================================================
+
+
+@dataclass(frozen=True)
+class FiltroNombre:
+    """Condición WHERE y expresión de relevancia para un texto buscado"""
+
+    condicion: str
+    relevancia: str
+    parametros: Tuple
+    siguiente: int  # próximo número de placeholder libre
+
+
+def _palabras(texto: str) -> List[str]:
+    return re.findall(r"[^\W_]+", texto.upper())
+
+
+def construir_filtro(
+    texto: str,
+    columna: str,
+    tsv: Optional[str],
+    primer_param: int = 1,
+    popularidad: Optional[str] = None,
+    cualquier_palabra: bool = False,
+    marca: Optional[str] = None,
+) -> FiltroNombre:
+    """
+    Filtro de búsqueda por nombre con placeholders desde $primer_param.
+
+    Args:
+        texto: Texto buscado tal como lo escribió el usuario
+        columna: Columna de nombre (con alias, ej. "pm.nombre_consolidado")
+        tsv: Columna nombre_tsv con alias; None para usar el modo LIKE
+        popularidad: Columna numérica que desempata (veces_visto, validaciones)
+        cualquier_palabra: Basta con que coincida una palabra (para candidatos);
+            por defecto deben aparecer todas
+        marca: Columna de marca que también se busca en el modo LIKE (en el
+            modo trigramas ya está dentro de nombre_tsv)
+    """
+    palabras = _palabras(texto)
+    p = primer_param
+    popular = f"COALESCE({popularidad}, 0)" if popularidad else None
+
+    if tsv is None:
+        palabras_like = [w for w in palabras if len(w) >= 2][:MAX_PALABRAS_LIKE]
+        if not palabras_like:
+            palabras_like = [texto.strip().upper()]
+        union = " OR " if cualquier_palabra else " AND "
+        texto_like = f"{columna} || ' ' || COALESCE({marca}, '')" if marca else columna
+        condicion = union.join(
+            f"UPPER({texto_like}) LIKE ${p + i}" for i in range(len(palabras_like))
+        )
+        return FiltroNombre(
+            condicion=f"({condicion})",
+            relevancia=popular or "NULL",
+            parametros=tuple(f"%{w}%" for w in palabras_like),
+            siguiente=p + len(palabras_like),
+        )
+
+    nombre = f"{FUNCION_NORMALIZAR}({columna})"
+    consulta = f"{FUNCION_NORMALIZAR}(${p})"
+    if cualquier_palabra and palabras:
+        tsquery = f"to_tsquery('simple', {FUNCION_NORMALIZAR}(${p + 1}))"
+        parametros = (texto, " | ".join(palabras))
+    else:
+        tsquery = f"plainto_tsquery('simple', {consulta})"
+        parametros = (texto,)
+
+    relevancia = (
+        f"(word_similarity({consulta}, {nombre})"
+        f" + 0.5 * similarity({consulta}, {nombre})"
+        f" + ts_rank({tsv}, {tsquery})"
+    )
+    if popular:
+        relevancia += f" + {BUSQUEDA_PESO_POPULARIDAD} * ln(1 + GREATEST({popular}, 0))"
+    relevancia += ")"
+
+    return FiltroNombre(
+        condicion=f"({consulta} <% {nombre} OR {tsv} @@ {tsquery})",
+        relevancia=relevancia,
+        parametros=parametros,
+        siguiente=p + len(parametros),
+    )
+
+
+def filtro_para_tabla(
+    tabla: str,
+    texto: str,
+    alias: str = "",
+    primer_param: int = 1,
+    popularidad: Optional[str] = None,
+    cualquier_palabra: bool = False,
+    tablas: Optional[FrozenSet[str]] = None,
+) -> FiltroNombre:
+    """construir_filtro() con el modo (trigramas o LIKE) que soporta la tabla"""
+    if tablas is None:
+        tablas = tablas_con_busqueda()
+    prefijo = f"{alias}." if alias else ""
+    return construir_filtro(
+        texto,
+        prefijo + TABLAS_BUSQUEDA[tabla],
+        prefijo + COLUMNA_TSV if tabla in tablas else None,
+        primer_param=primer_param,
+        popularidad=prefijo + popularidad if popularidad else None,
+        cualquier_palabra=cualquier_palabra,
+        marca=prefijo + "marca",
+    )
+
+
+# ============================================================================
+# EJECUCIÓN SÍNCRONA
+# ============================================================================
+
+
+def ejecutar(cursor, sql: str, args: Sequence) -> list:
+    """Ejecuta una consulta con placeholders $n sobre un cursor psycopg/SQLite"""
+    from db_async import traducir_sql
+
+    sql_sync, params = traducir_sql(sql, args)
+    cursor.execute(sql_sync, params)
+    return cursor.fetchall()
+
+
+def buscar_en_tabla(
+    cursor,
+    tabla: str,
+    columnas: str,
+    texto: str,
+    limite: int,
+    popularidad: Optional[str] = None,
+    cualquier_palabra: bool = False,
+) -> list:
+    """
+    Filas de `tabla` cuyo nombre coincide con `texto`, de la más relevante
+    a la menos relevante.
+
+    Args:
+        columnas: Lista SELECT (ej. "id, nombre, marca")
+        popularidad: Columna de popularidad para el ranking
+    """
+    filtro = filtro_para_tabla(
+        tabla, texto, popularidad=popularidad, cualquier_palabra=cualquier_palabra
+    )
+    sql = f"""
+        SELECT {columnas}
+        FROM {tabla}
+        WHERE {filtro.condicion}
+        ORDER BY {filtro.relevancia} DESC, {TABLAS_BUSQUEDA[tabla]}
+        LIMIT ${filtro.siguiente}
+    """
+    return ejecutar(cursor, sql, filtro.parametros + (limite,))
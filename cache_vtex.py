@@ -0,0 +1,385 @@
+"""
+Caché de Consultas VTEX (positiva y negativa)
+=============================================
+
+Caché de dos niveles delante de las búsquedas de WebEnricher en la API de
+catálogo VTEX, con clave (tienda, tipo, código o texto buscado).
+
+- Nivel 1: LRU en memoria del proceso (VTEX_CACHE_LRU_MAX entradas)
+- Nivel 2: tabla vtex_consultas_cache (migración 009), compartida por
+  todas las instancias; con SQLite solo se usa la LRU
+- Guarda también los resultados vacíos (PLUs que VTEX no conoce, productos
+  locales): se responden sin salir a la red durante
+  VTEX_CACHE_TTL_NEGATIVO_HORAS
+- Los resultados positivos valen VTEX_CACHE_TTL_POSITIVO_DIAS, pero el
+  precio se considera viejo a los VTEX_CACHE_DIAS_PRECIO días
+  (DIAS_CACHE_PRECIO de product_resolver_v2): desde ahí la entrada se sigue
+  sirviendo y se revalida en segundo plano (stale-while-revalidate)
+- Errores de red, circuito abierto o respuestas que no son 200/206 nunca se
+  guardan
+
+Solo se guardan los campos de cada producto que usa WebEnricher.
+
+Autor: LecFac
+Versión: 1.0.0
+"""
+
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+
+VTEX_CACHE_HABILITADA = os.environ.get("VTEX_CACHE", "true").lower() == "true"
+VTEX_CACHE_TTL_POSITIVO_DIAS = float(
+    os.environ.get("VTEX_CACHE_TTL_POSITIVO_DIAS", "30")
+)
+VTEX_CACHE_TTL_NEGATIVO_HORAS = float(
+    os.environ.get("VTEX_CACHE_TTL_NEGATIVO_HORAS", "24")
+)
+VTEX_CACHE_DIAS_PRECIO = float(os.environ.get("VTEX_CACHE_DIAS_PRECIO", "7"))
+VTEX_CACHE_LRU_MAX = int(os.environ.get("VTEX_CACHE_LRU_MAX", "2000"))
+# Productos guardados por consulta (las búsquedas por texto piden 21)
+VTEX_CACHE_MAX_PRODUCTOS = 25
+# Intervalo mínimo entre purgas automáticas de la tabla (segundos)
+VTEX_CACHE_INTERVALO_PURGA = 3600
+
+TTL_POSITIVO_S = VTEX_CACHE_TTL_POSITIVO_DIAS * 86400
+TTL_NEGATIVO_S = VTEX_CACHE_TTL_NEGATIVO_HORAS * 3600
+FRESCURA_PRECIO_S = VTEX_CACHE_DIAS_PRECIO * 86400
+
+# Estado de una entrada
+FRESCA = "fresca"
+PRECIO_VIEJO = "precio_viejo"
+VENCIDA = "vencida"
+
+Clave = Tuple[str, str, str]
+
+_lru: "OrderedDict[Clave, Tuple[List[Dict], float]]" = OrderedDict()
+_lock = threading.Lock()
+_revalidando: set = set()
+_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="vtex-cache")
+_stats = {
+    "consultas": 0,
+    "hits_memoria": 0,
+    "hits_bd": 0,
+    "hits_negativos": 0,
+    "servidas_precio_viejo": 0,
+    "revalidaciones": 0,
+    "consultas_red": 0,
+    "guardadas": 0,
+    "errores": 0,
+}
+_ultima_purga = 0.0
+
+
+def _bd_activa() -> bool:
+    return (
+        VTEX_CACHE_HABILITADA
+        and os.environ.get("DATABASE_TYPE", "sqlite").lower() == "postgresql"
+    )
+
+
+def _incrementar(clave: str, valor: int = 1):
+    with _lock:
+        _stats[clave] += valor
+
+
+def _clave(establecimiento: str, tipo: str, clave: str) -> Clave:
+    return (
+        (establecimiento or "").strip().upper()[:30],
+        tipo,
+        (clave or "").strip().lower()[:200],
+    )
+
+
+def estado_entrada(productos: List[Dict], edad_s: float) -> str:
+    """FRESCA, PRECIO_VIEJO (servir y revalidar) o VENCIDA"""
+    if not productos:
+        return FRESCA if edad_s < TTL_NEGATIVO_S else VENCIDA
+    if edad_s >= TTL_POSITIVO_S:
+        return VENCIDA
+    return FRESCA if edad_s < FRESCURA_PRECIO_S else PRECIO_VIEJO
+
+
+def compactar(item: Dict) -> Dict:
+    """Producto VTEX reducido a los campos que lee WebEnricher"""
+    sku = (item.get("items") or [{}])[0]
+    oferta = (sku.get("sellers") or [{}])[0].get("commertialOffer") or {}
+    imagenes = sku.get("images") or []
+    return {
+        "productId": item.get("productId", ""),
+        "productName": item.get("productName", ""),
+        "productReference": item.get("productReference", ""),
+        "brand": item.get("brand", ""),
+        "link": item.get("link", ""),
+        "categories": (item.get("categories") or [])[:1],
+        "items": [
+            {
+                "name": sku.get("name", ""),
+                "ean": sku.get("ean", ""),
+                "referenceId": [
+                    {"Key": r.get("Key"), "Value": r.get("Value")}
+                    for r in sku.get("referenceId") or []
+                    if isinstance(r, dict)
+                ],
+                "sellers": [{"commertialOffer": {"Price": oferta.get("Price", 0)}}],
+                "images": (
+                    [{"imageUrl": imagenes[0].get("imageUrl", "")}] if imagenes else []
+                ),
+            }
+        ],
+    }
+
+
+# ============================================================================
+# NIVEL 1: MEMORIA
+# ============================================================================
+
+
+def _leer_memoria(clave: Clave) -> Optional[Tuple[List[Dict], float]]:
+    with _lock:
+        entrada = _lru.get(clave)
+        if entrada is not None:
+            _lru.move_to_end(clave)
+        return entrada
+
+
+def _escribir_memoria(clave: Clave, productos: List[Dict], guardado_en: float):
+    with _lock:
+        _lru[clave] = (productos, guardado_en)
+        _lru.move_to_end(clave)
+        while len(_lru) > VTEX_CACHE_LRU_MAX:
+            _lru.popitem(last=False)
+
+
+# ============================================================================
+# NIVEL 2: BASE DE DATOS
+# ============================================================================
+
+
+def _leer_bd(clave: Clave) -> Optional[Tuple[List[Dict], float]]:
+    """
+    (productos, edad en segundos) o None. Solo lectura: los aciertos se
+    cuentan en estadisticas(), no con un UPDATE por consulta.
+    """
+    from database import get_db_connection
+
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        cursor.execute(
+            """
+            SELECT productos, EXTRACT(EPOCH FROM NOW() - actualizado_en)
+            FROM vtex_consultas_cache
+            WHERE establecimiento = %s AND tipo = %s AND clave = %s
+        """,
+            clave,
+        )
+        fila = cursor.fetchone()
+        conn.commit()
+        if fila is None:
+            return None
+        productos = fila[0]
+        if isinstance(productos, str):
+            productos = json.loads(productos)
+        return productos, float(fila[1])
+    except Exception as e:
+        conn.rollback()
+        _incrementar("errores")
+        print(f"⚠️ [VTEX CACHE] Error consultando: {e}")
+        return None
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def _escribir_bd(clave: Clave, productos: List[Dict]):
+    from database import get_db_connection
+
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        cursor.execute(
+            """
+            INSERT INTO vtex_consultas_cache (
+                establecimiento, tipo, clave, productos, encontrado
+            ) VALUES (%s, %s, %s, %s, %s)
+            ON CONFLICT (establecimiento, tipo, clave) DO UPDATE SET
+                productos = EXCLUDED.productos,
+                encontrado = EXCLUDED.encontrado,
+                actualizado_en = CURRENT_TIMESTAMP
+        """,
+            clave + (json.dumps(productos), bool(productos)),
+        )
+        conn.commit()
+    except Exception as e:
+        conn.rollback()
+        _incrementar("errores")
+        print(f"⚠️ [VTEX CACHE] Error guardando: {e}")
+    finally:
+        cursor.close()
+        conn.close()
+
+    _purgar_si_corresponde()
+
+
+# ============================================================================
+# CONSULTA
+# ============================================================================
+
+
+def _guardar(clave: Clave, productos: List[Dict]):
+    productos = [compactar(p) for p in productos[:VTEX_CACHE_MAX_PRODUCTOS]]
+    _escribir_memoria(clave, productos, time.time())
+    if _bd_activa():
+        _escribir_bd(clave, productos)
+    _incrementar("guardadas")
+    return productos
+
+
+def _revalidar(clave: Clave, buscar: Callable[[], Optional[List[Dict]]]):
+    try:
+        productos = buscar()
+        _incrementar("consultas_red")
+        if productos is not None:
+            _guardar(clave, productos)
+    except Exception as e:
+        print(f"⚠️ [VTEX CACHE] No se pudo revalidar {clave}: {e}")
+    finally:
+        with _lock:
+            _revalidando.discard(clave)
+
+
+def _programar_revalidacion(clave: Clave, buscar: Callable):
+    with _lock:
+        if clave in _revalidando:
+            return
+        _revalidando.add(clave)
+        _stats["revalidaciones"] += 1
+    _executor.submit(_revalidar, clave, buscar)
+
+
+def consultar(
+    establecimiento: str,
+    tipo: str,
+    clave: str,
+    buscar: Callable[[], Optional[List[Dict]]],
+) -> Optional[List[Dict]]:
+    """
+    Productos VTEX de la consulta, desde la caché o llamando a `buscar`.
+
+    Args:
+        establecimiento: Tienda VTEX normalizada (CARULLA, EXITO, ...)
+        tipo: "plu", "ean", "texto", ...
+        clave: Código o texto buscado
+        buscar: Hace la solicitud; devuelve la lista de productos ([] = no
+            existe) o None si la respuesta no es cacheable
+
+    Returns:
+        Lista de productos (compactados si vienen de la caché), [] si VTEX no
+        tiene resultados, None si `buscar` devolvió None. Las excepciones de
+        `buscar` se propagan.
+    """
+    if not VTEX_CACHE_HABILITADA:
+        return buscar()
+
+    clave = _clave(establecimiento, tipo, clave)
+    _incrementar("consultas")
+
+    entrada = _leer_memoria(clave)
+    origen = "hits_memoria"
+    if entrada is not None:
+        productos, edad = entrada[0], time.time() - entrada[1]
+    elif _bd_activa():
+        leida = _leer_bd(clave)
+        productos, edad = leida if leida is not None else (None, 0.0)
+        if productos is not None:
+            origen = "hits_bd"
+            _escribir_memoria(clave, productos, time.time() - edad)
+    else:
+        productos = None
+
+    if productos is not None:
+        estado = estado_entrada(productos, edad)
+        if estado != VENCIDA:
+            _incrementar(origen)
+            if not productos:
+                _incrementar("hits_negativos")
+            if estado == PRECIO_VIEJO:
+                _incrementar("servidas_precio_viejo")
+                _programar_revalidacion(clave, buscar)
+            return productos
+
+    resultado = buscar()
+    _incrementar("consultas_red")
+    if resultado is None:
+        return None
+    _guardar(clave, resultado)
+    return resultado
+
+
+# ============================================================================
+# EXPIRACIÓN
+# ============================================================================
+
+
+def purgar() -> Dict:
+    """Elimina de la tabla las entradas vencidas"""
+    if not _bd_activa():
+        return {"eliminadas": 0}
+
+    from database import get_db_connection
+
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        cursor.execute(
+            """
+            DELETE FROM vtex_consultas_cache
+            WHERE actualizado_en < NOW() - (
+                CASE WHEN encontrado THEN %s ELSE %s END * INTERVAL '1 second'
+            )
+        """,
+            (TTL_POSITIVO_S, TTL_NEGATIVO_S),
+        )
+        eliminadas = cursor.rowcount
+        conn.commit()
+        if eliminadas:
+            print(f"🧹 [VTEX CACHE] Purga: {eliminadas} entradas vencidas")
+        return {"eliminadas": eliminadas}
+    except Exception as e:
+        conn.rollback()
+        print(f"⚠️ [VTEX CACHE] Error purgando: {e}")
+        return {"eliminadas": 0, "error": str(e)}
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def _purgar_si_corresponde():
+    global _ultima_purga
+    ahora = time.monotonic()
+    with _lock:
+        if ahora - _ultima_purga < VTEX_CACHE_INTERVALO_PURGA:
+            return
+        _ultima_purga = ahora
+    purgar()
+
+
+def estadisticas() -> Dict:
+    with _lock:
+        stats = dict(_stats)
+        stats["entradas_memoria"] = len(_lru)
+    hits = stats["hits_memoria"] + stats["hits_bd"]
+    stats["hit_rate"] = (
+        round(hits / stats["consultas"] * 100, 2) if stats["consultas"] else 0.0
+    )
+    stats["activa"] = VTEX_CACHE_HABILITADA
+    stats["bd"] = _bd_activa()
+    stats["ttl_positivo_dias"] = VTEX_CACHE_TTL_POSITIVO_DIAS
+    stats["ttl_negativo_horas"] = VTEX_CACHE_TTL_NEGATIVO_HORAS
+    stats["dias_precio"] = VTEX_CACHE_DIAS_PRECIO
+    return stats
@@ -12,13 +12,15 @@ CAMBIOS v6.0:
 """
 
 import asyncio
-import aiohttp
+import httpx
 from playwright.async_api import async_playwright
 import re
 from typing import Optional, Dict, List
 import urllib.parse
 import json
 
+import cliente_vtex
+
 
 class CarullaScraper:
     def __init__(self):
@@ -55,48 +57,44 @@ class CarullaScraper:
         # Formato: /api/catalog_system/pub/products/search/{termino}
         search_url = f"https://www.carulla.com/api/catalog_system/pub/products/search/{urllib.parse.quote(nombre_busqueda)}"
 
-        async with aiohttp.ClientSession() as session:
-            try:
-                print(f"🔎 API VTEX: {nombre_busqueda}")
-                print(f"   URL: {search_url}")
-
-                async with session.get(
-                    search_url,
-                    headers=headers,
-                    timeout=aiohttp.ClientTimeout(total=20),
-                    ssl=True,
-                ) as response:
-                    print(f"   Status: {response.status}")
-
-                    # VTEX retorna 200 o 206 (Partial Content) cuando hay resultados
-                    if response.status in [200, 206]:
-                        data = await response.json()
-
-                        for item in data[:max_results]:
-                            producto = self._parsear_producto_vtex(item)
-                            if producto:
-                                productos.append(producto)
-                                print(
-                                    f"   ✓ {producto['nombre'][:50]}... PLU:{producto['plu']}"
-                                )
-
-                        if productos:
-                            print(f"📦 API encontró {len(productos)} productos")
-                    else:
-                        print(f"   ⚠️ API respondió {response.status}")
-                        # Intentar leer el error
-                        try:
-                            error_text = await response.text()
-                            print(f"   Error: {error_text[:100]}")
-                        except:
-                            pass
+        try:
+            print(f"🔎 API VTEX: {nombre_busqueda}")
+            print(f"   URL: {search_url}")
 
-            except asyncio.TimeoutError:
-                print("   ⏱️ Timeout en API VTEX")
-            except aiohttp.ClientError as e:
-                print(f"   ❌ Error de conexión: {str(e)[:80]}")
-            except Exception as e:
-                print(f"   ❌ Error API: {type(e).__name__}: {str(e)[:80]}")
+            response = await cliente_vtex.get_async(
+                search_url, headers=headers, timeout=20
+            )
+            print(f"   Status: {response.status_code}")
+
+            # VTEX retorna 200 o 206 (Partial Content) cuando hay resultados
+            if response.status_code in [200, 206]:
+                data = response.json()
+
+                for item in data[:max_results]:
+                    producto = self._parsear_producto_vtex(item)
+                    if producto:
+                        productos.append(producto)
+                        print(
+                            f"   ✓ {producto['nombre'][:50]}... PLU:{producto['plu']}"
+                        )
+
+                if productos:
+                    print(f"📦 API encontró {len(productos)} productos")
+            else:
+                print(f"   ⚠️ API respondió {response.status_code}")
+                # Intentar leer el error
+                try:
+                    error_text = response.text
+                    print(f"   Error: {error_text[:100]}")
+                except:
+                    pass
+
+        except httpx.TimeoutException:
+            print("   ⏱️ Timeout en API VTEX")
+        except httpx.HTTPError as e:
+            print(f"   ❌ Error de conexión: {str(e)[:80]}")
+        except Exception as e:
+            print(f"   ❌ Error API: {type(e).__name__}: {str(e)[:80]}")
 
         return productos
 
@@ -114,25 +112,24 @@ class CarullaScraper:
 
         search_url = f"https://www.carulla.com/api/catalog_system/pub/products/search?fq=alternateIds_Ean:{ean}"
 
-        async with aiohttp.ClientSession() as session:
-            try:
-                print(f"🔎 Buscando EAN: {ean}")
+        try:
+            print(f"🔎 Buscando EAN: {ean}")
 
-                async with session.get(
-                    search_url, headers=headers, timeout=aiohttp.ClientTimeout(total=15)
-                ) as response:
-                    if response.status in [200, 206]:
-                        data = await response.json()
-                        if data and len(data) > 0:
-                            producto = self._parsear_producto_vtex(data[0])
-                            if producto:
-                                print(f"   ✅ Encontrado: {producto['nombre'][:50]}...")
-                                return producto
+            response = await cliente_vtex.get_async(
+                search_url, headers=headers, timeout=15
+            )
+            if response.status_code in [200, 206]:
+                data = response.json()
+                if data and len(data) > 0:
+                    producto = self._parsear_producto_vtex(data[0])
+                    if producto:
+                        print(f"   ✅ Encontrado: {producto['nombre'][:50]}...")
+                        return producto
 
-                    print(f"   ⚠️ EAN no encontrado (status {response.status})")
+            print(f"   ⚠️ EAN no encontrado (status {response.status_code})")
 
-            except Exception as e:
-                print(f"   ❌ Error buscando EAN: {str(e)[:50]}")
+        except Exception as e:
+            print(f"   ❌ Error buscando EAN: {str(e)[:50]}")
 
         return None
 
@@ -149,25 +146,24 @@ class CarullaScraper:
 
         search_url = f"https://www.carulla.com/api/catalog_system/pub/products/search?fq=skuId:{sku_id}"
 
-        async with aiohttp.ClientSession() as session:
-            try:
-                print(f"🔎 Buscando SKU ID: {sku_id}")
+        try:
+            print(f"🔎 Buscando SKU ID: {sku_id}")
 
-                async with session.get(
-                    search_url, headers=headers, timeout=aiohttp.ClientTimeout(total=15)
-                ) as response:
-                    if response.status in [200, 206]:
-                        data = await response.json()
-                        if data and len(data) > 0:
-                            producto = self._parsear_producto_vtex(data[0])
-                            if producto:
-                                print(f"   ✅ Encontrado: {producto['nombre'][:50]}...")
-                                return producto
+            response = await cliente_vtex.get_async(
+                search_url, headers=headers, timeout=15
+            )
+            if response.status_code in [200, 206]:
+                data = response.json()
+                if data and len(data) > 0:
+                    producto = self._parsear_producto_vtex(data[0])
+                    if producto:
+                        print(f"   ✅ Encontrado: {producto['nombre'][:50]}...")
+                        return producto
 
-                    print(f"   ⚠️ SKU ID no encontrado (status {response.status})")
+            print(f"   ⚠️ SKU ID no encontrado (status {response.status_code})")
 
-            except Exception as e:
-                print(f"   ❌ Error buscando SKU: {str(e)[:50]}")
+        except Exception as e:
+            print(f"   ❌ Error buscando SKU: {str(e)[:50]}")
 
         return None
 
@@ -187,25 +183,24 @@ class CarullaScraper:
         # VTEX usa alternateIds_RefId para buscar por referenceId
         search_url = f"https://www.carulla.com/api/catalog_system/pub/products/search?fq=alternateIds_RefId:{ref_id}"
 
-        async with aiohttp.ClientSession() as session:
-            try:
-                print(f"🔎 Buscando PLU/RefId: {ref_id}")
+        try:
+            print(f"🔎 Buscando PLU/RefId: {ref_id}")
 
-                async with session.get(
-                    search_url, headers=headers, timeout=aiohttp.ClientTimeout(total=15)
-                ) as response:
-                    if response.status in [200, 206]:
-                        data = await response.json()
-                        if data and len(data) > 0:
-                            producto = self._parsear_producto_vtex(data[0])
-                            if producto:
-                                print(f"   ✅ Encontrado: {producto['nombre'][:50]}...")
-                                return producto
+            response = await cliente_vtex.get_async(
+                search_url, headers=headers, timeout=15
+            )
+            if response.status_code in [200, 206]:
+                data = response.json()
+                if data and len(data) > 0:
+                    producto = self._parsear_producto_vtex(data[0])
+                    if producto:
+                        print(f"   ✅ Encontrado: {producto['nombre'][:50]}...")
+                        return producto
 
-                    print(f"   ⚠️ RefId no encontrado (status {response.status})")
+            print(f"   ⚠️ RefId no encontrado (status {response.status_code})")
 
-            except Exception as e:
-                print(f"   ❌ Error buscando RefId: {str(e)[:50]}")
+        except Exception as e:
+            print(f"   ❌ Error buscando RefId: {str(e)[:50]}")
 
         return None
 
@@ -0,0 +1,752 @@
+"""
+Espejo Local de los Catálogos VTEX
+==================================
+
+Copia en PostgreSQL del catálogo público de las tiendas VTEX (Carulla,
+Éxito, Jumbo, Olímpica, ...) para resolver PLU/EAN/nombre con consultas
+indexadas en lugar de llamar a la API de la tienda por cada producto.
+
+- Tabla catalogo_vtex (migración 010): un registro por SKU con EAN,
+  RefId/PLU, nombre, marca, categoría, precio e imagen
+- Sincronización por tienda como trabajo de la cola durable
+  ("sincronizar_catalogo_vtex"): recorre las categorías hoja del árbol
+  /category/tree y pagina cada una con fq=C:/.../ de a 50 productos
+- Checkpoint por página en catalogo_vtex_sincronizaciones (categoría y
+  _from actuales): si el trabajo se corta o agota su presupuesto de tiempo
+  continúa desde ahí en un trabajo nuevo
+- Delta: solo se reescriben los SKUs cuya huella (hash de los campos)
+  cambió; los demás quedan anotados en catalogo_vtex_vistos (migración 015)
+  y al completar la pasada se desactivan los que no aparecieron
+- Un solo worker por tienda (advisory lock): si el trabajo se reentrega
+  mientras el original sigue vivo, el duplicado termina sin tocar nada
+- Refresco periódico: al completar se encola la siguiente pasada con
+  CATALOGO_VTEX_INTERVALO_SEG de retraso (programar_refrescos la rearma al
+  arrancar)
+- Consultas con el mismo formato JSON de la API VTEX, así WebEnricher,
+  ProductResolver y /api/v2/buscar-productos las parsean igual; una tienda
+  se usa solo si su última sincronización completa tiene menos de
+  CATALOGO_VTEX_MAX_EDAD_SEG (si no, los llamadores van a la API en vivo)
+
+Las llamadas pasan por cliente_vtex (rate limit y circuit breaker por host).
+Con SQLite el espejo queda deshabilitado.
+
+Autor: LecFac
+Versión: 1.0.0
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import busqueda_productos
+import cliente_vtex
+import web_enricher
+from job_queue import encolar_trabajo
+
+CATALOGO_VTEX_TIENDAS = [
+    t.strip().upper()
+    for t in os.environ.get(
+        "CATALOGO_VTEX_TIENDAS", "CARULLA,EXITO,JUMBO,OLIMPICA"
+    ).split(",")
+    if t.strip()
+]
+CATALOGO_VTEX_NIVELES = int(os.environ.get("CATALOGO_VTEX_NIVELES", "3"))
+# Segundos de trabajo por job (por debajo de JOB_VISIBILITY_TIMEOUT)
+CATALOGO_VTEX_PRESUPUESTO_SEG = float(
+    os.environ.get("CATALOGO_VTEX_PRESUPUESTO_SEG", "480")
+)
+CATALOGO_VTEX_TIMEOUT = float(os.environ.get("CATALOGO_VTEX_TIMEOUT", "20"))
+# Productos por página (máximo de la API) y último _from que acepta VTEX
+PRODUCTOS_POR_PAGINA = 50
+MAX_DESDE = 2500
+# Cada cuánto se vuelve a sincronizar una tienda ya espejada (0 = solo manual)
+CATALOGO_VTEX_INTERVALO_SEG = int(
+    os.environ.get("CATALOGO_VTEX_INTERVALO_SEG", "86400")
+)
+# Antigüedad máxima del espejo; más vieja, las consultas van a la API en vivo
+CATALOGO_VTEX_MAX_EDAD_SEG = int(os.environ.get("CATALOGO_VTEX_MAX_EDAD_SEG", "259200"))
+# Segundos antes de volver a revisar qué tiendas tienen espejo completo
+REVISION_DISPONIBLE_SEG = 300
+# Advisory locks por tienda: worker de sincronización y alta de la fila
+CATALOGO_VTEX_LOCK_KEY = 7311019
+CATALOGO_VTEX_INICIO_LOCK_KEY = 7311119
+
+TIPO_TRABAJO = "sincronizar_catalogo_vtex"
+RUTA_BUSQUEDA = "/api/catalog_system/pub/products/search"
+RUTA_CATEGORIAS = "/api/catalog_system/pub/category/tree/{niveles}"
+
+# Estados de catalogo_vtex_sincronizaciones
+EN_CURSO = "en_curso"
+COMPLETADA = "completada"
+
+COLUMNAS = (
+    "sku_id, product_id, ean, plu, nombre, marca, categoria, precio, "
+    "presentacion, url_producto, imagen_url"
+)
+CAMPOS = [c.strip() for c in COLUMNAS.split(",")]
+
+_lock = threading.Lock()
+_disponibles: Dict[str, Tuple[bool, float]] = {}
+_stats = {"consultas": 0, "encontradas": 0, "errores": 0}
+
+
+def _activo() -> bool:
+    return os.environ.get("DATABASE_TYPE", "sqlite").lower() == "postgresql"
+
+
+def _incrementar(clave: str, valor: int = 1):
+    with _lock:
+        _stats[clave] += valor
+
+
+# ============================================================================
+# FORMATO
+# ============================================================================
+
+
+def filas_de_producto(item: Dict) -> List[Dict]:
+    """Un registro por SKU de un producto de la API de catálogo"""
+    filas = []
+    categorias = item.get("categories") or [""]
+    for sku in item.get("items") or []:
+        if not sku.get("itemId"):
+            continue
+        plu = ""
+        for ref in sku.get("referenceId") or []:
+            if isinstance(ref, dict) and ref.get("Value"):
+                plu = ref["Value"]
+                break
+        oferta = (sku.get("sellers") or [{}])[0].get("commertialOffer") or {}
+        imagenes = sku.get("images") or []
+        fila = {
+            "sku_id": str(sku["itemId"]),
+            "product_id": str(item.get("productId") or ""),
+            "ean": sku.get("ean") or "",
+            "plu": plu or item.get("productReference") or "",
+            "nombre": item.get("productName") or "",
+            "marca": item.get("brand") or "",
+            "categoria": categorias[0],
+            "precio": int(oferta.get("Price") or 0),
+            "presentacion": sku.get("name") or "",
+            "url_producto": item.get("link") or "",
+            "imagen_url": imagenes[0].get("imageUrl", "") if imagenes else "",
+        }
+        fila["huella"] = hashlib.md5(
+            json.dumps([fila[c] for c in CAMPOS], ensure_ascii=False).encode("utf-8")
+        ).hexdigest()
+        filas.append(fila)
+    return filas
+
+
+def a_producto_vtex(fila: Sequence) -> Dict:
+    """Registro del espejo (en el orden de COLUMNAS) con el formato de la API"""
+    f = dict(zip(CAMPOS, fila))
+    return {
+        "productId": f["product_id"],
+        "productName": f["nombre"],
+        "brand": f["marca"],
+        "productReference": f["plu"],
+        "link": f["url_producto"],
+        "categories": [f["categoria"]] if f["categoria"] else [],
+        "items": [
+            {
+                "itemId": f["sku_id"],
+                "name": f["presentacion"],
+                "ean": f["ean"],
+                "referenceId": [{"Key": "RefId", "Value": f["plu"]}],
+                "sellers": [{"commertialOffer": {"Price": f["precio"] or 0}}],
+                "images": ([{"imageUrl": f["imagen_url"]}] if f["imagen_url"] else []),
+            }
+        ],
+    }
+
+
+# ============================================================================
+# CONSULTAS
+# ============================================================================
+
+
+def disponible(establecimiento: str) -> bool:
+    """
+    True si la tienda tiene una sincronización completa con menos de
+    CATALOGO_VTEX_MAX_EDAD_SEG
+    """
+    if not _activo() or not establecimiento:
+        return False
+
+    ahora = time.monotonic()
+    with _lock:
+        entrada = _disponibles.get(establecimiento)
+    if entrada is not None and ahora - entrada[1] < REVISION_DISPONIBLE_SEG:
+        return entrada[0]
+
+    from database import get_db_connection
+
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        cursor.execute(
+            """
+            SELECT 1 FROM catalogo_vtex_sincronizaciones
+            WHERE establecimiento = %s AND estado = %s
+              AND terminada_en >= NOW() - (%s * INTERVAL '1 second')
+            LIMIT 1
+        """,
+            (establecimiento, COMPLETADA, CATALOGO_VTEX_MAX_EDAD_SEG),
+        )
+        resultado = cursor.fetchone() is not None
+        conn.commit()
+    except Exception as e:
+        conn.rollback()
+        print(f"⚠️ [CATALOGO VTEX] No se pudo revisar {establecimiento}: {e}")
+        resultado = False
+    finally:
+        cursor.close()
+        conn.close()
+
+    with _lock:
+        _disponibles[establecimiento] = (resultado, ahora)
+    return resultado
+
+
+def _consultar(sql: str, parametros: Sequence, dolar: bool = False) -> List[Dict]:
+    from database import get_db_connection
+
+    _incrementar("consultas")
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        if dolar:
+            filas = busqueda_productos.ejecutar(cursor, sql, parametros)
+        else:
+            cursor.execute(sql, parametros)
+            filas = cursor.fetchall()
+        conn.commit()
+    except Exception as e:
+        conn.rollback()
+        _incrementar("errores")
+        print(f"⚠️ [CATALOGO VTEX] Error consultando: {e}")
+        return []
+    finally:
+        cursor.close()
+        conn.close()
+
+    if filas:
+        _incrementar("encontradas")
+    return [a_producto_vtex(f) for f in filas]
+
+
+def buscar_codigo(establecimiento: str, tipo: str, codigo: str) -> List[Dict]:
+    """Productos de la tienda con ese PLU (tipo "plu") o EAN (tipo "ean")"""
+    columna = {"plu": "plu", "ean": "ean"}[tipo]
+    return _consultar(
+        f"""
+        SELECT {COLUMNAS} FROM catalogo_vtex
+        WHERE establecimiento = %s AND {columna} = %s AND activo
+        ORDER BY sku_id
+        LIMIT 5
+    """,
+        (establecimiento, codigo.strip()),
+    )
+
+
+def buscar_plus(establecimiento: str, plus: Sequence[str]) -> List[Dict]:
+    """Productos de la tienda con cualquiera de los PLUs (una sola consulta)"""
+    if not plus:
+        return []
+    return _consultar(
+        f"""
+        SELECT {COLUMNAS} FROM catalogo_vtex
+        WHERE establecimiento = %s AND plu = ANY(%s) AND activo
+        ORDER BY plu, sku_id
+    """,
+        (establecimiento, list(plus)),
+    )
+
+
+def buscar_texto(establecimiento: str, texto: str, limite: int = 20) -> List[Dict]:
+    """Búsqueda por nombre/marca con los índices de busqueda_productos"""
+    filtro = busqueda_productos.filtro_para_tabla(
+        "catalogo_vtex", texto, primer_param=2
+    )
+    return _consultar(
+        f"""
+        SELECT {COLUMNAS} FROM catalogo_vtex
+        WHERE establecimiento = $1 AND activo AND {filtro.condicion}
+        ORDER BY {filtro.relevancia} DESC, nombre
+        LIMIT ${filtro.siguiente}
+    """,
+        (establecimiento,) + filtro.parametros + (limite,),
+        dolar=True,
+    )
+
+
+# ============================================================================
+# SINCRONIZACIÓN
+# ============================================================================
+
+
+def _get_json(url: str):
+    resp = cliente_vtex.get(url, timeout=CATALOGO_VTEX_TIMEOUT)
+    if resp.status_code not in (200, 206):
+        raise RuntimeError(f"VTEX respondió {resp.status_code} en {url}")
+    return resp.json()
+
+
+def hojas_categorias(base_url: str) -> List[str]:
+    """Rutas /id/id/.../ de las categorías hoja del árbol de la tienda"""
+    arbol = _get_json(base_url + RUTA_CATEGORIAS.format(niveles=CATALOGO_VTEX_NIVELES))
+    hojas = []
+
+    def recorrer(nodos, ruta):
+        for nodo in nodos or []:
+            actual = f"{ruta}{nodo['id']}/"
+            if nodo.get("children"):
+                recorrer(nodo["children"], actual)
+            else:
+                hojas.append(actual)
+
+    recorrer(arbol, "/")
+    return hojas
+
+
+def _aplicar_pagina(
+    cursor, establecimiento: str, sincronizacion_id: int, filas: List[Dict]
+) -> Tuple[int, int]:
+    """
+    Escribe solo los SKUs nuevos o con huella distinta y anota todos los de
+    la página en catalogo_vtex_vistos (los iguales no se reescriben).
+
+    Returns:
+        (nuevos, actualizados)
+    """
+    por_sku = {f["sku_id"]: f for f in filas}
+    if not por_sku:
+        return 0, 0
+
+    cursor.execute(
+        """
+        SELECT sku_id, huella, activo FROM catalogo_vtex
+        WHERE establecimiento = %s AND sku_id = ANY(%s)
+    """,
+        (establecimiento, list(por_sku)),
+    )
+    existentes = {row[0]: (row[1], row[2]) for row in cursor.fetchall()}
+
+    cambiadas = [
+        f for sku, f in por_sku.items() if existentes.get(sku) != (f["huella"], True)
+    ]
+    if cambiadas:
+        cursor.executemany(
+            f"""
+            INSERT INTO catalogo_vtex (
+                establecimiento, {COLUMNAS}, huella, activo, sincronizacion_id
+            ) VALUES (%s, {", ".join(["%s"] * len(CAMPOS))}, %s, TRUE, %s)
+            ON CONFLICT (establecimiento, sku_id) DO UPDATE SET
+                {", ".join(f"{c} = EXCLUDED.{c}" for c in CAMPOS[1:])},
+                huella = EXCLUDED.huella,
+                activo = TRUE,
+                sincronizacion_id = EXCLUDED.sincronizacion_id,
+                actualizado_en = CURRENT_TIMESTAMP
+        """,
+            [
+                (
+                    establecimiento,
+                    *(f[c] for c in CAMPOS),
+                    f["huella"],
+                    sincronizacion_id,
+                )
+                for f in cambiadas
+            ],
+        )
+    cursor.execute(
+        """
+        INSERT INTO catalogo_vtex_vistos (sincronizacion_id, sku_id)
+        SELECT %s, unnest(%s::varchar[])
+        ON CONFLICT DO NOTHING
+    """,
+        (sincronizacion_id, list(por_sku)),
+    )
+
+    nuevos = sum(1 for f in cambiadas if f["sku_id"] not in existentes)
+    return nuevos, len(cambiadas) - nuevos
+
+
+def _sincronizacion_en_curso(cursor, establecimiento: str) -> int:
+    """
+    Id de la sincronización en curso de la tienda, creándola si no hay. El
+    lock de transacción evita que dos llamadas simultáneas abran dos filas.
+    """
+    cursor.execute(
+        "SELECT pg_advisory_xact_lock(%s, hashtext(%s))",
+        (CATALOGO_VTEX_INICIO_LOCK_KEY, establecimiento),
+    )
+    cursor.execute(
+        """
+        SELECT id FROM catalogo_vtex_sincronizaciones
+        WHERE establecimiento = %s AND estado = %s
+        ORDER BY id DESC
+        LIMIT 1
+    """,
+        (establecimiento, EN_CURSO),
+    )
+    fila = cursor.fetchone()
+    if fila:
+        return fila[0]
+    cursor.execute(
+        """
+        INSERT INTO catalogo_vtex_sincronizaciones (establecimiento, estado)
+        VALUES (%s, %s)
+        RETURNING id
+    """,
+        (establecimiento, EN_CURSO),
+    )
+    return cursor.fetchone()[0]
+
+
+def iniciar_sincronizacion(establecimiento: str) -> Optional[str]:
+    """
+    Encola la sincronización de una tienda (o la continuación de la que
+    quedó en curso).
+
+    Returns:
+        job_id, o None sin PostgreSQL
+    """
+    establecimiento = establecimiento.upper().strip()
+    if establecimiento not in web_enricher.VTEX_URLS:
+        raise ValueError(f"{establecimiento} no es una tienda VTEX")
+    if not _activo():
+        return None
+
+    from database import get_db_connection
+
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        sincronizacion_id = _sincronizacion_en_curso(cursor, establecimiento)
+        job_id = encolar_trabajo(
+            TIPO_TRABAJO, {"sincronizacion_id": sincronizacion_id}, conn=conn
+        )
+        conn.commit()
+        print(
+            f"🛒 [CATALOGO VTEX] {establecimiento}: sincronización "
+            f"{sincronizacion_id} encolada ({job_id})"
+        )
+        return job_id
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def _programar_refresco(cursor, conn, establecimiento: str, retraso_seg: int):
+    """Encola la próxima pasada de la tienda salvo que ya haya una pendiente"""
+    cursor.execute(
+        """
+        SELECT 1 FROM processing_jobs
+        WHERE tipo = %s AND status = 'pending'
+          AND payload->>'establecimiento' = %s
+        LIMIT 1
+    """,
+        (TIPO_TRABAJO, establecimiento),
+    )
+    if cursor.fetchone():
+        return None
+    return encolar_trabajo(
+        TIPO_TRABAJO,
+        {"establecimiento": establecimiento},
+        conn=conn,
+        retraso_seg=max(0, int(retraso_seg)),
+    )
+
+
+def programar_refrescos() -> int:
+    """
+    Al arrancar: rearma el refresco de las tiendas con alguna sincronización
+    completa y ninguna en curso (p. ej. si el trabajo programado se perdió).
+    El retraso descuenta la antigüedad de la última pasada.
+
+    Returns:
+        Tiendas con refresco encolado
+    """
+    if not _activo() or CATALOGO_VTEX_INTERVALO_SEG <= 0:
+        return 0
+
+    from database import get_db_connection
+
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        cursor.execute(
+            """
+            SELECT establecimiento,
+                   EXTRACT(EPOCH FROM NOW() - MAX(terminada_en))
+            FROM catalogo_vtex_sincronizaciones
+            WHERE establecimiento = ANY(%s)
+            GROUP BY establecimiento
+            HAVING COUNT(*) FILTER (WHERE estado = %s) > 0
+               AND COUNT(*) FILTER (WHERE estado = %s) = 0
+        """,
+            (CATALOGO_VTEX_TIENDAS, COMPLETADA, EN_CURSO),
+        )
+        programadas = 0
+        for establecimiento, edad in cursor.fetchall():
+            retraso = CATALOGO_VTEX_INTERVALO_SEG - float(edad or 0)
+            if _programar_refresco(cursor, conn, establecimiento, retraso):
+                programadas += 1
+        conn.commit()
+        return programadas
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def _liberar(cursor, establecimiento: str):
+    """Suelta el lock de sesión (las conexiones del pool lo conservarían)"""
+    cursor.execute(
+        "SELECT pg_advisory_unlock(%s, hashtext(%s))",
+        (CATALOGO_VTEX_LOCK_KEY, establecimiento),
+    )
+
+
+def sincronizar(job_id: str, payload: Dict, usuario_id: Optional[int]):
+    """
+    Handler de job_queue: avanza la sincronización desde su checkpoint hasta
+    terminarla o agotar CATALOGO_VTEX_PRESUPUESTO_SEG (entonces encola la
+    continuación). Un error deja el checkpoint y el trabajo se reintenta.
+
+    Un payload con "establecimiento" en vez de "sincronizacion_id" es el
+    refresco periódico: retoma la pasada en curso o abre una nueva.
+    """
+    from database import get_db_connection
+
+    inicio = time.monotonic()
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    bloqueada = None
+    try:
+        sincronizacion_id = payload.get("sincronizacion_id")
+        if sincronizacion_id is None:
+            sincronizacion_id = _sincronizacion_en_curso(
+                cursor, payload["establecimiento"]
+            )
+            payload = {"sincronizacion_id": sincronizacion_id}
+            conn.commit()
+
+        cursor.execute(
+            "SELECT establecimiento FROM catalogo_vtex_sincronizaciones WHERE id = %s",
+            (sincronizacion_id,),
+        )
+        fila = cursor.fetchone()
+        if not fila:
+            conn.commit()
+            return
+        cursor.execute(
+            "SELECT pg_try_advisory_lock(%s, hashtext(%s))",
+            (CATALOGO_VTEX_LOCK_KEY, fila[0]),
+        )
+        if not cursor.fetchone()[0]:
+            conn.commit()
+            print(f"⏭️ [CATALOGO VTEX] {fila[0]}: ya la sincroniza otro worker")
+            return
+        bloqueada = fila[0]
+
+        # Checkpoint leído con el lock tomado
+        cursor.execute(
+            """
+            SELECT establecimiento, estado, categorias, indice_categoria, desde
+            FROM catalogo_vtex_sincronizaciones
+            WHERE id = %s
+        """,
+            (sincronizacion_id,),
+        )
+        fila = cursor.fetchone()
+        if fila[1] != EN_CURSO:
+            conn.commit()
+            return
+        establecimiento, _, categorias, indice, desde = fila
+        base_url = web_enricher.VTEX_URLS[establecimiento]
+
+        if categorias is None:
+            categorias = hojas_categorias(base_url)
+            cursor.execute(
+                """
+                UPDATE catalogo_vtex_sincronizaciones
+                SET categorias = %s, actualizada_en = CURRENT_TIMESTAMP
+                WHERE id = %s
+            """,
+                (json.dumps(categorias), sincronizacion_id),
+            )
+            conn.commit()
+            print(f"🛒 [CATALOGO VTEX] {establecimiento}: {len(categorias)} categorías")
+        elif isinstance(categorias, str):
+            categorias = json.loads(categorias)
+
+        while indice < len(categorias):
+            if time.monotonic() - inicio > CATALOGO_VTEX_PRESUPUESTO_SEG:
+                # Liberar antes de que la continuación pueda tomar la tienda
+                _liberar(cursor, bloqueada)
+                bloqueada = None
+                encolar_trabajo(TIPO_TRABAJO, payload, conn=conn)
+                conn.commit()
+                print(
+                    f"⏸️ [CATALOGO VTEX] {establecimiento}: continúa en otro "
+                    f"trabajo (categoría {indice + 1}/{len(categorias)})"
+                )
+                return
+
+            productos = _get_json(
+                f"{base_url}{RUTA_BUSQUEDA}?fq=C:{categorias[indice]}"
+                f"&_from={desde}&_to={desde + PRODUCTOS_POR_PAGINA - 1}"
+            )
+            filas = [f for item in productos for f in filas_de_producto(item)]
+            nuevos, actualizados = _aplicar_pagina(
+                cursor, establecimiento, sincronizacion_id, filas
+            )
+
+            desde += PRODUCTOS_POR_PAGINA
+            if len(productos) < PRODUCTOS_POR_PAGINA or desde > MAX_DESDE:
+                if desde > MAX_DESDE:
+                    print(
+                        f"⚠️ [CATALOGO VTEX] {establecimiento}: categoría "
+                        f"{categorias[indice]} supera {MAX_DESDE} productos"
+                    )
+                indice, desde = indice + 1, 0
+
+            cursor.execute(
+                """
+                UPDATE catalogo_vtex_sincronizaciones
+                SET indice_categoria = %s, desde = %s,
+                    paginas = paginas + 1,
+                    skus = skus + %s,
+                    nuevos = nuevos + %s,
+                    actualizados = actualizados + %s,
+                    actualizada_en = CURRENT_TIMESTAMP
+                WHERE id = %s
+            """,
+                (indice, desde, len(filas), nuevos, actualizados, sincronizacion_id),
+            )
+            conn.commit()
+
+        # Pasada completa: lo que no apareció ya no está en el catálogo
+        cursor.execute(
+            """
+            UPDATE catalogo_vtex c
+            SET activo = FALSE, actualizado_en = CURRENT_TIMESTAMP
+            WHERE c.establecimiento = %s AND c.activo
+              AND c.sincronizacion_id IS DISTINCT FROM %s
+              AND NOT EXISTS (
+                  SELECT 1 FROM catalogo_vtex_vistos v
+                  WHERE v.sincronizacion_id = %s AND v.sku_id = c.sku_id
+              )
+        """,
+            (establecimiento, sincronizacion_id, sincronizacion_id),
+        )
+        desactivados = cursor.rowcount
+        cursor.execute(
+            "DELETE FROM catalogo_vtex_vistos WHERE sincronizacion_id = %s",
+            (sincronizacion_id,),
+        )
+        cursor.execute(
+            """
+            UPDATE catalogo_vtex_sincronizaciones
+            SET estado = %s, desactivados = %s,
+                actualizada_en = CURRENT_TIMESTAMP,
+                terminada_en = CURRENT_TIMESTAMP
+            WHERE id = %s
+            RETURNING skus, nuevos, actualizados
+        """,
+            (COMPLETADA, desactivados, sincronizacion_id),
+        )
+        skus, nuevos, actualizados = cursor.fetchone()
+        if CATALOGO_VTEX_INTERVALO_SEG > 0:
+            _programar_refresco(
+                cursor, conn, establecimiento, CATALOGO_VTEX_INTERVALO_SEG
+            )
+        conn.commit()
+        with _lock:
+            _disponibles.pop(establecimiento, None)
+        print(
+            f"✅ [CATALOGO VTEX] {establecimiento}: {skus} SKUs, {nuevos} nuevos, "
+            f"{actualizados} actualizados, {desactivados} desactivados"
+        )
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        if bloqueada:
+            try:
+                conn.rollback()
+                _liberar(cursor, bloqueada)
+                conn.commit()
+            except Exception as e:
+                print(f"⚠️ [CATALOGO VTEX] No se pudo liberar el lock: {e}")
+        cursor.close()
+        conn.close()
+
+
+# ============================================================================
+# ESTADO
+# ============================================================================
+
+
+def estado() -> Dict:
+    """Última sincronización y SKUs activos de cada tienda"""
+    if not _activo():
+        return {"activo": False, "tiendas": {}}
+
+    from database import get_db_connection
+
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        cursor.execute("""
+            SELECT DISTINCT ON (s.establecimiento)
+                s.establecimiento, s.id, s.estado, s.indice_categoria,
+                jsonb_array_length(COALESCE(s.categorias, '[]'::jsonb)),
+                s.skus, s.nuevos, s.actualizados, s.desactivados,
+                s.iniciada_en, s.terminada_en,
+                (SELECT COUNT(*) FROM catalogo_vtex c
+                 WHERE c.establecimiento = s.establecimiento AND c.activo)
+            FROM catalogo_vtex_sincronizaciones s
+            ORDER BY s.establecimiento, s.id DESC
+        """)
+        tiendas = {
+            row[0]: {
+                "sincronizacion_id": row[1],
+                "estado": row[2],
+                "categoria_actual": row[3],
+                "categorias": row[4],
+                "skus_vistos": row[5],
+                "nuevos": row[6],
+                "actualizados": row[7],
+                "desactivados": row[8],
+                "iniciada_en": row[9].isoformat() if row[9] else None,
+                "terminada_en": row[10].isoformat() if row[10] else None,
+                "skus_activos": row[11],
+            }
+            for row in cursor.fetchall()
+        }
+        conn.commit()
+        return {"activo": True, "tiendas": tiendas}
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def estadisticas() -> Dict:
+    with _lock:
+        stats = dict(_stats)
+        stats["tiendas_disponibles"] = sorted(
+            t for t, (ok, _) in _disponibles.items() if ok
+        )
+    stats["activo"] = _activo()
+    return stats
@@ -0,0 +1,498 @@
+"""
+Cliente Compartido de Claude
+============================
+
+Servicio único para todas las llamadas a la API de Anthropic del proceso.
+
+- Clientes reutilizados (sync y async) en lugar de uno nuevo por llamada,
+  así se reutilizan las conexiones HTTP keep-alive
+- Límite global de concurrencia (CLAUDE_MAX_CONCURRENCIA) compartido entre
+  threads (workers de OCR, frames de video) y el event loop
+- Presupuesto de tokens de entrada por minuto (CLAUDE_TOKENS_POR_MINUTO) para
+  no superar el rate limit de la cuenta con ráfagas de uploads
+- Reintentos con backoff exponencial y jitter en 429/529/5xx, respetando
+  retry-after cuando viene en la respuesta
+- Deadlines por solicitud: `timeout` (segundos) o `deadline` (time.monotonic
+  absoluto) acotan la espera de slot, los reintentos y cada intento HTTP
+
+Uso:
+
+    import claude_client
+
+    message = claude_client.crear_mensaje(
+        model="claude-sonnet-4-20250514", max_tokens=500, messages=[...],
+        timeout=60,
+    )
+
+    message = await claude_client.crear_mensaje_async(..., deadline=deadline)
+
+Autor: LecFac
+Versión: 1.0.0
+"""
+
+import asyncio
+import os
+import random
+import threading
+import time
+from collections import deque
+from typing import Dict, Optional
+
+import anthropic
+
+
+CLAUDE_MAX_CONCURRENCIA = int(os.environ.get("CLAUDE_MAX_CONCURRENCIA", "4"))
+CLAUDE_TOKENS_POR_MINUTO = int(os.environ.get("CLAUDE_TOKENS_POR_MINUTO", "40000"))
+CLAUDE_MAX_REINTENTOS = int(os.environ.get("CLAUDE_MAX_REINTENTOS", "4"))
+CLAUDE_BACKOFF_BASE = float(os.environ.get("CLAUDE_BACKOFF_BASE", "1.0"))
+CLAUDE_BACKOFF_MAX = float(os.environ.get("CLAUDE_BACKOFF_MAX", "30"))
+CLAUDE_TIMEOUT = float(os.environ.get("CLAUDE_TIMEOUT", "120"))
+
+# Estimación de tokens de entrada antes de conocer el usage real
+TOKENS_POR_IMAGEN = 1600
+CARACTERES_POR_TOKEN = 3.5
+
+# 429 rate limit, 529 overloaded, 5xx transitorios
+ESTADOS_REINTENTABLES = {408, 409, 429, 500, 502, 503, 504, 529}
+
+
+class ClaudeDeadlineExcedido(TimeoutError):
+    """La solicitud no pudo completarse antes de su deadline"""
+
+
+# ============================================================================
+# LÍMITE DE CONCURRENCIA (threads + asyncio)
+# ============================================================================
+
+
+class _Espera:
+    __slots__ = ("evento", "loop", "future", "entregado")
+
+    def __init__(self, evento=None, loop=None, future=None):
+        self.evento = evento
+        self.loop = loop
+        self.future = future
+        self.entregado = False
+
+
+def _resolver_future(future):
+    if not future.done():
+        future.set_result(True)
+
+
+class LimitadorConcurrencia:
+    """
+    Semáforo FIFO que pueden usar a la vez threads y corrutinas.
+
+    Al liberar un slot se entrega directamente al siguiente en la fila, sea
+    un thread (threading.Event) o una corrutina (future de su event loop).
+    """
+
+    def __init__(self, limite: int):
+        self.limite = max(1, limite)
+        self._lock = threading.Lock()
+        self._en_uso = 0
+        self._fila: deque = deque()
+
+    def _intentar_o_encolar(self, espera: _Espera) -> bool:
+        with self._lock:
+            if self._en_uso < self.limite and not self._fila:
+                self._en_uso += 1
+                return True
+            self._fila.append(espera)
+            return False
+
+    def _abandonar(self, espera: _Espera) -> bool:
+        """Sale de la fila; devuelve True si el slot ya había sido entregado"""
+        with self._lock:
+            if espera.entregado:
+                return True
+            self._fila.remove(espera)
+            return False
+
+    def adquirir(self, timeout: Optional[float] = None) -> bool:
+        espera = _Espera(evento=threading.Event())
+        if self._intentar_o_encolar(espera):
+            return True
+        if espera.evento.wait(timeout):
+            return True
+        if self._abandonar(espera):
+            return True
+        return False
+
+    async def adquirir_async(self, timeout: Optional[float] = None) -> bool:
+        loop = asyncio.get_running_loop()
+        espera = _Espera(loop=loop, future=loop.create_future())
+        if self._intentar_o_encolar(espera):
+            return True
+        try:
+            await asyncio.wait_for(asyncio.shield(espera.future), timeout)
+            return True
+        except asyncio.TimeoutError:
+            if self._abandonar(espera):
+                return True
+            return False
+        except asyncio.CancelledError:
+            if self._abandonar(espera):
+                self.liberar()
+            raise
+
+    def liberar(self):
+        with self._lock:
+            if not self._fila:
+                self._en_uso -= 1
+                return
+            espera = self._fila.popleft()
+            espera.entregado = True
+        if espera.evento is not None:
+            espera.evento.set()
+        else:
+            espera.loop.call_soon_threadsafe(_resolver_future, espera.future)
+
+    def estado(self) -> Dict:
+        with self._lock:
+            return {
+                "limite": self.limite,
+                "en_uso": self._en_uso,
+                "esperando": len(self._fila),
+            }
+
+
+# ============================================================================
+# PRESUPUESTO DE TOKENS (token bucket)
+# ============================================================================
+
+
+class PresupuestoTokens:
+    """
+    Token bucket de tokens de entrada por minuto.
+
+    reservar() descuenta el costo estimado de inmediato (el saldo puede
+    quedar negativo) y devuelve cuántos segundos hay que esperar antes de
+    enviar. ajustar() corrige el saldo con el usage real de la respuesta.
+    """
+
+    def __init__(self, tokens_por_minuto: int):
+        self.capacidad = max(1, tokens_por_minuto)
+        self.tasa = self.capacidad / 60.0
+        self._saldo = float(self.capacidad)
+        self._actualizado = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _recargar(self):
+        ahora = time.monotonic()
+        self._saldo = min(
+            self.capacidad, self._saldo + (ahora - self._actualizado) * self.tasa
+        )
+        self._actualizado = ahora
+
+    def reservar(self, tokens: int) -> float:
+        tokens = min(tokens, self.capacidad)
+        with self._lock:
+            self._recargar()
+            self._saldo -= tokens
+            return max(0.0, -self._saldo / self.tasa)
+
+    def ajustar(self, diferencia: int):
+        with self._lock:
+            self._recargar()
+            self._saldo -= diferencia
+
+    def devolver(self, tokens: int):
+        self.ajustar(-min(tokens, self.capacidad))
+
+    def saldo(self) -> int:
+        with self._lock:
+            self._recargar()
+            return int(self._saldo)
+
+
+# ============================================================================
+# ESTADO GLOBAL
+# ============================================================================
+
+_limitador = LimitadorConcurrencia(CLAUDE_MAX_CONCURRENCIA)
+_presupuesto = PresupuestoTokens(CLAUDE_TOKENS_POR_MINUTO)
+
+_stats_lock = threading.Lock()
+_stats = {
+    "llamadas": 0,
+    "exitosas": 0,
+    "reintentos": 0,
+    "rate_limited": 0,
+    "errores": 0,
+    "deadlines_excedidos": 0,
+    "espera_slot_s": 0.0,
+    "espera_tokens_s": 0.0,
+    "tokens_entrada": 0,
+    "tokens_salida": 0,
+}
+
+_cliente_sync: Optional[anthropic.Anthropic] = None
+_cliente_sync_lock = threading.Lock()
+# httpx.AsyncClient queda atado al event loop donde se usa por primera vez
+_clientes_async: Dict[int, tuple] = {}
+
+
+def _incrementar(clave: str, valor=1):
+    with _stats_lock:
+        _stats[clave] += valor
+
+
+def _api_key() -> str:
+    api_key = os.environ.get("ANTHROPIC_API_KEY", "").strip()
+    if not api_key:
+        raise ValueError("ANTHROPIC_API_KEY no configurada")
+    return api_key
+
+
+def get_cliente() -> anthropic.Anthropic:
+    """Cliente síncrono compartido (los reintentos los maneja este módulo)"""
+    global _cliente_sync
+    if _cliente_sync is None:
+        with _cliente_sync_lock:
+            if _cliente_sync is None:
+                _cliente_sync = anthropic.Anthropic(
+                    api_key=_api_key(), max_retries=0, timeout=CLAUDE_TIMEOUT
+                )
+    return _cliente_sync
+
+
+def get_cliente_async() -> anthropic.AsyncAnthropic:
+    """Cliente async compartido del event loop actual"""
+    loop = asyncio.get_running_loop()
+    entrada = _clientes_async.get(id(loop))
+    if entrada is None or entrada[0] is not loop:
+        # Loops de asyncio.run() ya terminados (handlers de la cola)
+        for clave, (otro_loop, _) in list(_clientes_async.items()):
+            if otro_loop.is_closed():
+                _clientes_async.pop(clave, None)
+        cliente = anthropic.AsyncAnthropic(
+            api_key=_api_key(), max_retries=0, timeout=CLAUDE_TIMEOUT
+        )
+        entrada = (loop, cliente)
+        _clientes_async[id(loop)] = entrada
+    return entrada[1]
+
+
+async def cerrar_clientes_async():
+    """Cierra el cliente async del loop actual (shutdown de la aplicación)"""
+    loop = asyncio.get_running_loop()
+    entrada = _clientes_async.pop(id(loop), None)
+    if entrada is not None:
+        await entrada[1].close()
+
+
+# ============================================================================
+# LÓGICA COMÚN
+# ============================================================================
+
+
+def _estimar_tokens_entrada(kwargs: Dict) -> int:
+    caracteres = len(str(kwargs.get("system", "")))
+    imagenes = 0
+    for mensaje in kwargs.get("messages", []):
+        contenido = mensaje.get("content", "")
+        if isinstance(contenido, str):
+            caracteres += len(contenido)
+            continue
+        for bloque in contenido:
+            if bloque.get("type") == "image":
+                imagenes += 1
+            else:
+                caracteres += len(str(bloque.get("text", "")))
+    return int(caracteres / CARACTERES_POR_TOKEN) + imagenes * TOKENS_POR_IMAGEN
+
+
+def _calcular_deadline(timeout: Optional[float], deadline: Optional[float]) -> float:
+    limite = time.monotonic() + (CLAUDE_TIMEOUT if timeout is None else timeout)
+    return limite if deadline is None else min(limite, deadline)
+
+
+def _restante(deadline: float, etiqueta: str) -> float:
+    restante = deadline - time.monotonic()
+    if restante <= 0:
+        _incrementar("deadlines_excedidos")
+        raise ClaudeDeadlineExcedido(f"[CLAUDE] Deadline excedido ({etiqueta})")
+    return restante
+
+
+def _es_reintentable(error: Exception) -> bool:
+    if isinstance(error, anthropic.APIConnectionError):
+        return True
+    if isinstance(error, anthropic.APIStatusError):
+        return error.status_code in ESTADOS_REINTENTABLES
+    return False
+
+
+def _espera_reintento(error: Exception, intento: int) -> float:
+    """Backoff exponencial con full jitter, o retry-after si el API lo indica"""
+    if isinstance(error, anthropic.APIStatusError):
+        if error.status_code == 429:
+            _incrementar("rate_limited")
+        try:
+            retry_after = error.response.headers.get("retry-after")
+            if retry_after:
+                return min(float(retry_after), CLAUDE_BACKOFF_MAX)
+        except (AttributeError, ValueError):
+            pass
+    tope = min(CLAUDE_BACKOFF_MAX, CLAUDE_BACKOFF_BASE * (2**intento))
+    return random.uniform(0, tope)
+
+
+def _registrar_usage(message, estimado: int):
+    usage = getattr(message, "usage", None)
+    if usage is None:
+        return
+    _presupuesto.ajustar(usage.input_tokens - estimado)
+    with _stats_lock:
+        _stats["exitosas"] += 1
+        _stats["tokens_entrada"] += usage.input_tokens
+        _stats["tokens_salida"] += usage.output_tokens
+
+
+# ============================================================================
+# API PÚBLICA
+# ============================================================================
+
+
+def crear_mensaje(
+    *,
+    timeout: Optional[float] = None,
+    deadline: Optional[float] = None,
+    etiqueta: str = "claude",
+    **kwargs,
+):
+    """
+    messages.create() con límite global, presupuesto de tokens y reintentos.
+
+    Args:
+        timeout: Segundos máximos para toda la operación (incluye esperas)
+        deadline: Instante límite absoluto (time.monotonic()) heredado del llamador
+        etiqueta: Nombre para logs
+        **kwargs: Argumentos de client.messages.create()
+
+    Raises:
+        ClaudeDeadlineExcedido: Si se agota el tiempo antes de obtener respuesta
+        anthropic.APIError: Errores no reintentables o tras agotar reintentos
+    """
+    cliente = get_cliente()
+    deadline = _calcular_deadline(timeout, deadline)
+    _incrementar("llamadas")
+
+    inicio = time.monotonic()
+    if not _limitador.adquirir(_restante(deadline, etiqueta)):
+        _incrementar("deadlines_excedidos")
+        raise ClaudeDeadlineExcedido(f"[CLAUDE] Sin slot libre a tiempo ({etiqueta})")
+    _incrementar("espera_slot_s", time.monotonic() - inicio)
+
+    try:
+        intento = 0
+        while True:
+            estimado = _estimar_tokens_entrada(kwargs)
+            espera = _presupuesto.reservar(estimado)
+            if espera > 0:
+                if espera >= _restante(deadline, etiqueta):
+                    _presupuesto.devolver(estimado)
+                    _incrementar("deadlines_excedidos")
+                    raise ClaudeDeadlineExcedido(
+                        f"[CLAUDE] Presupuesto de tokens agotado ({etiqueta})"
+                    )
+                _incrementar("espera_tokens_s", espera)
+                time.sleep(espera)
+
+            try:
+                message = cliente.messages.create(
+                    timeout=_restante(deadline, etiqueta), **kwargs
+                )
+                _registrar_usage(message, estimado)
+                return message
+            except Exception as e:
+                if not _es_reintentable(e) or intento >= CLAUDE_MAX_REINTENTOS:
+                    _incrementar("errores")
+                    raise
+                pausa = _espera_reintento(e, intento)
+                if pausa >= _restante(deadline, etiqueta):
+                    _incrementar("errores")
+                    raise
+                intento += 1
+                _incrementar("reintentos")
+                print(
+                    f"⚠️ [CLAUDE] {etiqueta}: {type(e).__name__}, "
+                    f"reintento {intento}/{CLAUDE_MAX_REINTENTOS} en {pausa:.1f}s"
+                )
+                time.sleep(pausa)
+    finally:
+        _limitador.liberar()
+
+
+async def crear_mensaje_async(
+    *,
+    timeout: Optional[float] = None,
+    deadline: Optional[float] = None,
+    etiqueta: str = "claude",
+    **kwargs,
+):
+    """Versión async de crear_mensaje() (no bloquea el event loop)"""
+    cliente = get_cliente_async()
+    deadline = _calcular_deadline(timeout, deadline)
+    _incrementar("llamadas")
+
+    inicio = time.monotonic()
+    if not await _limitador.adquirir_async(_restante(deadline, etiqueta)):
+        _incrementar("deadlines_excedidos")
+        raise ClaudeDeadlineExcedido(f"[CLAUDE] Sin slot libre a tiempo ({etiqueta})")
+    _incrementar("espera_slot_s", time.monotonic() - inicio)
+
+    try:
+        intento = 0
+        while True:
+            estimado = _estimar_tokens_entrada(kwargs)
+            espera = _presupuesto.reservar(estimado)
+            if espera > 0:
+                if espera >= _restante(deadline, etiqueta):
+                    _presupuesto.devolver(estimado)
+                    _incrementar("deadlines_excedidos")
+                    raise ClaudeDeadlineExcedido(
+                        f"[CLAUDE] Presupuesto de tokens agotado ({etiqueta})"
+                    )
+                _incrementar("espera_tokens_s", espera)
+                await asyncio.sleep(espera)
+
+            try:
+                message = await cliente.messages.create(
+                    timeout=_restante(deadline, etiqueta), **kwargs
+                )
+                _registrar_usage(message, estimado)
+                return message
+            except Exception as e:
+                if not _es_reintentable(e) or intento >= CLAUDE_MAX_REINTENTOS:
+                    _incrementar("errores")
+                    raise
+                pausa = _espera_reintento(e, intento)
+                if pausa >= _restante(deadline, etiqueta):
+                    _incrementar("errores")
+                    raise
+                intento += 1
+                _incrementar("reintentos")
+                print(
+                    f"⚠️ [CLAUDE] {etiqueta}: {type(e).__name__}, "
+                    f"reintento {intento}/{CLAUDE_MAX_REINTENTOS} en {pausa:.1f}s"
+                )
+                await asyncio.sleep(pausa)
+    finally:
+        _limitador.liberar()
+
+
+def estado() -> Dict:
+    """Estado del limitador, del presupuesto de tokens y contadores"""
+    with _stats_lock:
+        stats = dict(_stats)
+    stats["espera_slot_s"] = round(stats["espera_slot_s"], 2)
+    stats["espera_tokens_s"] = round(stats["espera_tokens_s"], 2)
+    return {
+        "concurrencia": _limitador.estado(),
+        "tokens_por_minuto": _presupuesto.capacidad,
+        "saldo_tokens": _presupuesto.saldo(),
+        **stats,
+    }
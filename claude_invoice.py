@@ -8,7 +8,7 @@ claude_invoice.py - VERSIÓN 6.2 - CON POSICIÓN VERTICAL DE PRODUCTOS
 - ✅ Mantiene todas las funcionalidades de V6.1
 """
 
-import anthropic
+import asyncio
 import base64
 import os
 import json
@@ -17,6 +17,12 @@ import unicodedata
 from typing import Dict, List, Tuple, Optional
 from datetime import datetime
 
+from concurrent.futures import ThreadPoolExecutor
+
+import claude_client
+import ocr_cache
+import ocr_franjas
+from preprocesamiento_imagen import debe_preprocesar, preprocesar_imagen
 
 # ==============================================================================
 # FILTRO DE TEXTO BASURA - VERSION 6.1 MEJORADA
@@ -243,44 +249,77 @@ def normalizar_establecimiento(nombre_raw: str) -> str:
 # ==============================================================================
 
 
-def parse_invoice_with_claude(
+MODELO_FACTURAS = "claude-sonnet-4-20250514"
+# Cambiarla invalida la caché de resultados OCR (ocr_cache)
+VERSION_PROMPT = "V6.2"
+
+
+def _preparar_solicitudes(
     image_path: str,
     establecimiento_preseleccionado: str = None,
-    aplicar_aprendizaje: bool = True,
-) -> Dict:
+    preprocesar: Optional[bool] = None,
+    franjas: Optional[bool] = None,
+) -> Tuple[List[Dict], Optional[Dict], Optional[Dict]]:
     """
-    Procesa factura con Claude Vision API - V6.2
-    Lee EXACTAMENTE como un humano leería la factura
-    NUEVO: Devuelve posición vertical de cada producto
+    Solicitudes para Claude (una, o una por franja si la factura es larga),
+    la división en franjas (None si no aplica) y el reporte del
+    preprocesamiento (None si se envió la imagen sin tocar)
     """
-    try:
-        print("=" * 80)
-        print("🤖 CLAUDE INVOICE V6.2 - CON POSICIÓN VERTICAL DE PRODUCTOS")
-        if establecimiento_preseleccionado:
-            print(f"🏪 ESTABLECIMIENTO: {establecimiento_preseleccionado.upper()}")
-        print("=" * 80)
+    with open(image_path, "rb") as f:
+        original = f.read()
+
+    media_type = "image/png" if image_path.lower().endswith(".png") else "image/jpeg"
+
+    imagen, reporte = original, None
+    if debe_preprocesar(preprocesar):
+        imagen, media_type, reporte = preprocesar_imagen(original, media_type)
+
+    division = None
+    modo = ocr_franjas.debe_usar_franjas(franjas)
+    dimensiones = (reporte or {}).get("dimensiones_final")
+    if modo or (
+        modo is None and (not dimensiones or ocr_franjas.es_factura_larga(*dimensiones))
+    ):
+        base = original
+        if reporte and reporte["aplicado"]:
+            # Recortada y enderezada pero sin reducir, para dividirla
+            base, _, _ = preprocesar_imagen(
+                original,
+                media_type,
+                lado_max=ocr_franjas.OCR_FRANJAS_LADO_MAX,
+                registrar=False,
+            )
+        division = ocr_franjas.dividir_en_franjas(base, forzar=bool(modo))
 
-        with open(image_path, "rb") as f:
-            image_data = base64.b64encode(f.read()).decode("utf-8")
+    if division is None:
+        solicitud = _solicitud_imagen(
+            imagen, media_type, establecimiento_preseleccionado
+        )
+        return [solicitud], None, reporte
 
-        media_type = (
-            "image/png" if image_path.lower().endswith(".png") else "image/jpeg"
+    solicitudes = [
+        _solicitud_imagen(
+            franja["bytes"], franja["media_type"], establecimiento_preseleccionado
         )
+        for franja in division["franjas"]
+    ]
+    return solicitudes, division, reporte
 
-        api_key = os.environ.get("ANTHROPIC_API_KEY", "").strip()
-        if not api_key:
-            raise ValueError("ANTHROPIC_API_KEY no configurada")
 
-        client = anthropic.Anthropic(api_key=api_key)
+def _solicitud_imagen(
+    imagen: bytes, media_type: str, establecimiento_preseleccionado: str = None
+) -> Dict:
+    """Argumentos de messages.create() para una imagen con el prompt V6.2"""
+    image_data = base64.b64encode(imagen).decode("utf-8")
 
-        establecimiento_info = (
-            f'"{establecimiento_preseleccionado.upper()}"'
-            if establecimiento_preseleccionado
-            else '"NOMBRE_DEL_ESTABLECIMIENTO"'
-        )
+    establecimiento_info = (
+        f'"{establecimiento_preseleccionado.upper()}"'
+        if establecimiento_preseleccionado
+        else '"NOMBRE_DEL_ESTABLECIMIENTO"'
+    )
 
-        # ========== PROMPT V6.2 - CON POSICIÓN VERTICAL ==========
-        prompt = f"""Eres un experto en leer facturas colombianas. Tu trabajo es leer EXACTAMENTE lo que está escrito, sin inventar ni modificar nada.
+    # ========== PROMPT V6.2 - CON POSICIÓN VERTICAL ==========
+    prompt = f"""Eres un experto en leer facturas colombianas. Tu trabajo es leer EXACTAMENTE lo que está escrito, sin inventar ni modificar nada.
 
 # 🔍 PASO 1: IDENTIFICA EL FORMATO DE LA FACTURA
 
@@ -460,252 +499,468 @@ Antes de responder:
 
 **ANALIZA LA IMAGEN Y RESPONDE SOLO CON JSON VÁLIDO:**"""
 
-        print("📸 Enviando imagen a Claude Vision API...")
-
-        message = client.messages.create(
-            model="claude-sonnet-4-20250514",
-            max_tokens=8000,
-            temperature=0,
-            messages=[
-                {
-                    "role": "user",
-                    "content": [
-                        {
-                            "type": "image",
-                            "source": {
-                                "type": "base64",
-                                "media_type": media_type,
-                                "data": image_data,
-                            },
+    return {
+        "model": MODELO_FACTURAS,
+        "max_tokens": 8000,
+        "temperature": 0,
+        "messages": [
+            {
+                "role": "user",
+                "content": [
+                    {
+                        "type": "image",
+                        "source": {
+                            "type": "base64",
+                            "media_type": media_type,
+                            "data": image_data,
                         },
-                        {"type": "text", "text": prompt},
-                    ],
-                }
-            ],
+                    },
+                    {"type": "text", "text": prompt},
+                ],
+            }
+        ],
+    }
+
+
+def _procesar_respuesta(message, establecimiento_preseleccionado: str = None) -> Dict:
+    """Extrae el JSON de la respuesta y aplica el post-procesamiento V6.2"""
+    response_text = message.content[0].text
+    print(f"✅ Respuesta recibida ({len(response_text)} caracteres)")
+
+    # Extraer JSON
+    json_str = response_text
+
+    if "```json" in response_text:
+        json_str = response_text.split("```json")[1].split("```")[0]
+    elif "```" in response_text:
+        json_str = response_text.split("```")[1].split("```")[0]
+    elif "{" in response_text:
+        start = response_text.find("{")
+        end = response_text.rfind("}") + 1
+        if start != -1 and end > start:
+            json_str = response_text[start:end]
+
+    json_str = json_str.strip()
+    data = json.loads(json_str)
+
+    if establecimiento_preseleccionado:
+        data["establecimiento"] = establecimiento_preseleccionado.upper()
+
+    # Validar fecha
+    if "fecha" in data and data["fecha"]:
+        try:
+            fecha_str = str(data["fecha"])
+            if len(fecha_str) >= 4:
+                año = int(fecha_str[:4])
+                if año < 2020:
+                    año_actual = datetime.now().year
+                    fecha_corregida = fecha_str.replace(str(año), str(año_actual), 1)
+                    print(f"   ⚠️  Año corregido: {año} → {año_actual}")
+                    data["fecha"] = fecha_corregida
+        except:
+            pass
+
+    # ========== POST-PROCESAMIENTO ==========
+    productos_finales = []
+    suma_total = 0
+
+    print(f"\n🔧 POST-PROCESAMIENTO (lectura exacta + filtrado):")
+
+    for prod in data.get("productos", []):
+        codigo = str(prod.get("codigo", "")).strip()
+        nombre = str(prod.get("nombre", "")).strip()
+        precio = prod.get("precio", 0)
+        cantidad = float(prod.get("cantidad", 1))
+        unidad = prod.get("unidad", "un")
+        posicion_vertical = prod.get("posicion_vertical", 50)  # Default: mitad
+
+        # Validar posición vertical
+        try:
+            posicion_vertical = int(posicion_vertical)
+            posicion_vertical = max(0, min(100, posicion_vertical))
+        except:
+            posicion_vertical = 50
+
+        # Filtrar basura
+        es_basura, razon = es_texto_basura(nombre)
+        if es_basura:
+            print(f"   🗑️  Ignorado: '{nombre[:40]}' - {razon}")
+            continue
+
+        # Corregir errores OCR
+        nombre_corregido = corregir_nombre_producto(nombre)
+        nombre_final = normalizar_nombre_producto(nombre_corregido)
+
+        if nombre_final != nombre.upper():
+            print(f"   📝 Corregido: '{nombre[:30]}' → '{nombre_final[:30]}'")
+
+        # Limpiar precio
+        precio_limpio = limpiar_precio_colombiano(precio)
+
+        # Validar precio
+        if precio_limpio < 100:
+            print(f"   ⚠️  Precio muy bajo: '{nombre_final}' - ${precio_limpio}")
+            continue
+
+        if precio_limpio > 10000000:
+            print(f"   ⚠️  Precio muy alto: '{nombre_final}' - ${precio_limpio:,}")
+            continue
+
+        # Calcular subtotal
+        subtotal = int(precio_limpio * cantidad)
+        suma_total += subtotal
+
+        # Agregar producto CON posición vertical
+        productos_finales.append(
+            {
+                "codigo": codigo,
+                "nombre": nombre_final,
+                "precio": precio_limpio,
+                "cantidad": cantidad,
+                "unidad": unidad,
+                "nombre_ocr_original": nombre,
+                "posicion_vertical": posicion_vertical,  # 🆕 V6.2
+            }
         )
 
-        response_text = message.content[0].text
-        print(f"✅ Respuesta recibida ({len(response_text)} caracteres)")
-
-        # Extraer JSON
-        json_str = response_text
-
-        if "```json" in response_text:
-            json_str = response_text.split("```json")[1].split("```")[0]
-        elif "```" in response_text:
-            json_str = response_text.split("```")[1].split("```")[0]
-        elif "{" in response_text:
-            start = response_text.find("{")
-            end = response_text.rfind("}") + 1
-            if start != -1 and end > start:
-                json_str = response_text[start:end]
-
-        json_str = json_str.strip()
-        data = json.loads(json_str)
-
-        if establecimiento_preseleccionado:
-            data["establecimiento"] = establecimiento_preseleccionado.upper()
-
-        # Validar fecha
-        if "fecha" in data and data["fecha"]:
-            try:
-                fecha_str = str(data["fecha"])
-                if len(fecha_str) >= 4:
-                    año = int(fecha_str[:4])
-                    if año < 2020:
-                        año_actual = datetime.now().year
-                        fecha_corregida = fecha_str.replace(
-                            str(año), str(año_actual), 1
-                        )
-                        print(f"   ⚠️  Año corregido: {año} → {año_actual}")
-                        data["fecha"] = fecha_corregida
-            except:
-                pass
-
-        # ========== POST-PROCESAMIENTO ==========
-        productos_finales = []
-        suma_total = 0
-
-        print(f"\n🔧 POST-PROCESAMIENTO (lectura exacta + filtrado):")
-
-        for prod in data.get("productos", []):
-            codigo = str(prod.get("codigo", "")).strip()
-            nombre = str(prod.get("nombre", "")).strip()
-            precio = prod.get("precio", 0)
-            cantidad = float(prod.get("cantidad", 1))
-            unidad = prod.get("unidad", "un")
-            posicion_vertical = prod.get("posicion_vertical", 50)  # Default: mitad
-
-            # Validar posición vertical
-            try:
-                posicion_vertical = int(posicion_vertical)
-                posicion_vertical = max(0, min(100, posicion_vertical))
-            except:
-                posicion_vertical = 50
-
-            # Filtrar basura
-            es_basura, razon = es_texto_basura(nombre)
-            if es_basura:
-                print(f"   🗑️  Ignorado: '{nombre[:40]}' - {razon}")
-                continue
-
-            # Corregir errores OCR
-            nombre_corregido = corregir_nombre_producto(nombre)
-            nombre_final = normalizar_nombre_producto(nombre_corregido)
-
-            if nombre_final != nombre.upper():
-                print(f"   📝 Corregido: '{nombre[:30]}' → '{nombre_final[:30]}'")
-
-            # Limpiar precio
-            precio_limpio = limpiar_precio_colombiano(precio)
-
-            # Validar precio
-            if precio_limpio < 100:
-                print(f"   ⚠️  Precio muy bajo: '{nombre_final}' - ${precio_limpio}")
-                continue
-
-            if precio_limpio > 10000000:
-                print(f"   ⚠️  Precio muy alto: '{nombre_final}' - ${precio_limpio:,}")
-                continue
-
-            # Calcular subtotal
-            subtotal = int(precio_limpio * cantidad)
-            suma_total += subtotal
-
-            # Agregar producto CON posición vertical
-            productos_finales.append(
-                {
-                    "codigo": codigo,
-                    "nombre": nombre_final,
-                    "precio": precio_limpio,
-                    "cantidad": cantidad,
-                    "unidad": unidad,
-                    "nombre_ocr_original": nombre,
-                    "posicion_vertical": posicion_vertical,  # 🆕 V6.2
-                }
-            )
+    data["productos"] = productos_finales
 
-        data["productos"] = productos_finales
-
-        # ========== VALIDACIÓN DE TOTAL ==========
-        total_declarado = data.get("total", 0)
-
-        print(f"\n🔍 VALIDACIÓN:")
-        print(f"   Total declarado: ${total_declarado:,}")
-        print(f"   Suma calculada: ${suma_total:,}")
-
-        if total_declarado > 0:
-            diferencia = abs(suma_total - total_declarado)
-            diferencia_pct = diferencia / total_declarado * 100
-            print(f"   Diferencia: ${diferencia:,} ({diferencia_pct:.1f}%)")
-
-            if diferencia_pct > 10:
-                print(f"   ⚠️  ALERTA: Diferencia mayor al 10%, revisar extracción")
-            else:
-                print(f"   ✅ Validación correcta")
-
-        # ========== ESTADÍSTICAS ==========
-        con_codigo = sum(1 for p in productos_finales if p.get("codigo"))
-        sin_codigo = sum(1 for p in productos_finales if not p.get("codigo"))
-        plus_unicos = set(p.get("codigo") for p in productos_finales if p.get("codigo"))
-
-        print(f"\n" + "=" * 80)
-        print(f"📊 RESULTADOS OCR V6.2 - CON POSICIÓN VERTICAL:")
-        print(f"   🏪 Establecimiento: {data.get('establecimiento', 'N/A')}")
-        print(f"   📅 Fecha: {data.get('fecha', 'N/A')}")
-        print(f"   💰 Total factura: ${total_declarado:,}")
-        print(f"   📦 Ítems totales: {len(productos_finales)}")
-        print(f"   🏷️  PLUs únicos: {len(plus_unicos)}")
-
-        print(f"\n📋 PRODUCTOS EXTRAÍDOS (con posición):")
-        for i, prod in enumerate(productos_finales, 1):
-            codigo_str = prod["codigo"] if prod["codigo"] else "SIN-COD"
-            pos = prod.get("posicion_vertical", "?")
-            print(
-                f"   {i:2}. [{pos:3}%] PLU:{codigo_str:10} | {prod['nombre'][:30]:30} | ${prod['precio']:,}"
-            )
+    # ========== VALIDACIÓN DE TOTAL ==========
+    total_declarado = data.get("total", 0)
 
-        print("=" * 80)
+    print(f"\n🔍 VALIDACIÓN:")
+    print(f"   Total declarado: ${total_declarado:,}")
+    print(f"   Suma calculada: ${suma_total:,}")
 
-        # Capturar tokens
-        tokens_input = message.usage.input_tokens
-        tokens_output = message.usage.output_tokens
+    if total_declarado > 0:
+        diferencia = abs(suma_total - total_declarado)
+        diferencia_pct = diferencia / total_declarado * 100
+        print(f"   Diferencia: ${diferencia:,} ({diferencia_pct:.1f}%)")
 
-        return {
-            "success": True,
-            "data": {
-                **data,
-                "metadatos": {
-                    "metodo": "claude-vision-v6.2-con-posicion",
-                    "modelo": "claude-sonnet-4-20250514",
-                    "establecimiento_confirmado": bool(establecimiento_preseleccionado),
-                    "items_totales": len(productos_finales),
-                    "plus_unicos": len(plus_unicos),
-                    "sin_codigo": sin_codigo,
-                    "suma_calculada": suma_total,
-                    "total_declarado": total_declarado,
-                },
-            },
-            "usage": {
-                "input_tokens": tokens_input,
-                "output_tokens": tokens_output,
-                "total_tokens": tokens_input + tokens_output,
-                "modelo": "claude-sonnet-4-20250514",
+        if diferencia_pct > 10:
+            print(f"   ⚠️  ALERTA: Diferencia mayor al 10%, revisar extracción")
+        else:
+            print(f"   ✅ Validación correcta")
+
+    # ========== ESTADÍSTICAS ==========
+    con_codigo = sum(1 for p in productos_finales if p.get("codigo"))
+    sin_codigo = sum(1 for p in productos_finales if not p.get("codigo"))
+    plus_unicos = set(p.get("codigo") for p in productos_finales if p.get("codigo"))
+
+    print(f"\n" + "=" * 80)
+    print(f"📊 RESULTADOS OCR V6.2 - CON POSICIÓN VERTICAL:")
+    print(f"   🏪 Establecimiento: {data.get('establecimiento', 'N/A')}")
+    print(f"   📅 Fecha: {data.get('fecha', 'N/A')}")
+    print(f"   💰 Total factura: ${total_declarado:,}")
+    print(f"   📦 Ítems totales: {len(productos_finales)}")
+    print(f"   🏷️  PLUs únicos: {len(plus_unicos)}")
+
+    print(f"\n📋 PRODUCTOS EXTRAÍDOS (con posición):")
+    for i, prod in enumerate(productos_finales, 1):
+        codigo_str = prod["codigo"] if prod["codigo"] else "SIN-COD"
+        pos = prod.get("posicion_vertical", "?")
+        print(
+            f"   {i:2}. [{pos:3}%] PLU:{codigo_str:10} | {prod['nombre'][:30]:30} | ${prod['precio']:,}"
+        )
+
+    print("=" * 80)
+
+    # Capturar tokens
+    tokens_input = message.usage.input_tokens
+    tokens_output = message.usage.output_tokens
+
+    return {
+        "success": True,
+        "data": {
+            **data,
+            "metadatos": {
+                "metodo": "claude-vision-v6.2-con-posicion",
+                "modelo": MODELO_FACTURAS,
+                "establecimiento_confirmado": bool(establecimiento_preseleccionado),
+                "items_totales": len(productos_finales),
+                "plus_unicos": len(plus_unicos),
+                "sin_codigo": sin_codigo,
+                "suma_calculada": suma_total,
+                "total_declarado": total_declarado,
             },
+        },
+        "usage": {
+            "input_tokens": tokens_input,
+            "output_tokens": tokens_output,
+            "total_tokens": tokens_input + tokens_output,
+            "modelo": MODELO_FACTURAS,
+        },
+    }
+
+
+def _fusionar_respuestas(
+    mensajes: List, division: Dict, establecimiento_preseleccionado: str = None
+) -> Dict:
+    """Resultado único a partir de las respuestas de cada franja"""
+    datos = [
+        _procesar_respuesta(m, establecimiento_preseleccionado)["data"]
+        for m in mensajes
+    ]
+    data = ocr_franjas.fusionar_franjas(datos, division)
+    if establecimiento_preseleccionado:
+        data["establecimiento"] = establecimiento_preseleccionado.upper()
+
+    tokens_input = sum(m.usage.input_tokens for m in mensajes)
+    tokens_output = sum(m.usage.output_tokens for m in mensajes)
+    return {
+        "success": True,
+        "data": data,
+        "usage": {
+            "input_tokens": tokens_input,
+            "output_tokens": tokens_output,
+            "total_tokens": tokens_input + tokens_output,
+            "modelo": MODELO_FACTURAS,
+        },
+    }
+
+
+def _usage(message) -> Dict:
+    if message is not None and hasattr(message, "usage"):
+        return {
+            "input_tokens": message.usage.input_tokens,
+            "output_tokens": message.usage.output_tokens,
+            "total_tokens": message.usage.input_tokens + message.usage.output_tokens,
+            "modelo": MODELO_FACTURAS,
         }
+    return {
+        "input_tokens": 0,
+        "output_tokens": 0,
+        "total_tokens": 0,
+        "modelo": MODELO_FACTURAS,
+    }
 
-    except json.JSONDecodeError as e:
-        print(f"❌ Error JSON: {e}")
-        print(
-            f"Respuesta: {response_text[:500] if 'response_text' in locals() else 'N/A'}"
-        )
-        usage_data = {}
-        if "message" in locals() and hasattr(message, "usage"):
-            usage_data = {
-                "input_tokens": message.usage.input_tokens,
-                "output_tokens": message.usage.output_tokens,
-                "total_tokens": message.usage.input_tokens
-                + message.usage.output_tokens,
-                "modelo": "claude-sonnet-4-20250514",
-            }
-        else:
-            usage_data = {
-                "input_tokens": 0,
-                "output_tokens": 0,
-                "total_tokens": 0,
-                "modelo": "claude-sonnet-4-20250514",
-            }
 
+def _resultado_error(e: Exception, message) -> Dict:
+    if isinstance(e, json.JSONDecodeError):
+        print(f"❌ Error JSON: {e}")
+        texto = message.content[0].text if message is not None else "N/A"
+        print(f"Respuesta: {texto[:500]}")
         return {
             "success": False,
             "error": "Error parseando respuesta JSON",
-            "usage": usage_data,
+            "usage": _usage(message),
         }
 
+    print(f"❌ Error: {e}")
+    import traceback
+
+    traceback.print_exc()
+    return {"success": False, "error": f"Error: {str(e)}", "usage": _usage(message)}
+
+
+def _consultar_cache(
+    image_path: str, establecimiento_preseleccionado: str, usuario_id: Optional[int]
+) -> Tuple[Tuple, Optional[Dict]]:
+    """Huellas de la imagen y resultado desde la caché OCR (None si no hay)"""
+    with open(image_path, "rb") as f:
+        huellas = ocr_cache.calcular_huellas(f.read())
+
+    cacheado = ocr_cache.buscar(
+        *huellas, VERSION_PROMPT, establecimiento_preseleccionado, usuario_id
+    )
+    if cacheado is None:
+        return huellas, None
+
+    usage = cacheado["usage"]
+    data = cacheado["data"]
+    data.setdefault("metadatos", {})["desde_cache"] = True
+    if establecimiento_preseleccionado:
+        data["establecimiento"] = establecimiento_preseleccionado.upper()
+
+    print(
+        f"♻️ OCR desde caché ({cacheado['tipo']}): "
+        f"{len(data.get('productos', []))} productos, "
+        f"~{usage.get('total_tokens', 0):,} tokens ahorrados"
+    )
+    return huellas, {
+        "success": True,
+        "data": data,
+        "usage": {
+            "input_tokens": 0,
+            "output_tokens": 0,
+            "total_tokens": 0,
+            "modelo": usage.get("modelo", MODELO_FACTURAS),
+            "cache_hit": True,
+            "tokens_ahorrados": int(usage.get("total_tokens", 0)),
+        },
+        "cache": {
+            "hit": True,
+            "tipo": cacheado["tipo"],
+            "distancia": cacheado["distancia"],
+        },
+        "preprocesamiento": None,
+    }
+
+
+def _guardar_en_cache(
+    huellas: Tuple,
+    resultado: Dict,
+    establecimiento_preseleccionado: str,
+    usuario_id: Optional[int],
+):
+    if huellas and resultado.get("success"):
+        ocr_cache.guardar(
+            *huellas,
+            VERSION_PROMPT,
+            resultado["data"],
+            resultado["usage"],
+            establecimiento_preseleccionado,
+            usuario_id,
+        )
+
+
+def _imprimir_encabezado(establecimiento_preseleccionado: str = None):
+    print("=" * 80)
+    print("🤖 CLAUDE INVOICE V6.2 - CON POSICIÓN VERTICAL DE PRODUCTOS")
+    if establecimiento_preseleccionado:
+        print(f"🏪 ESTABLECIMIENTO: {establecimiento_preseleccionado.upper()}")
+    print("=" * 80)
+
+
+def parse_invoice_with_claude(
+    image_path: str,
+    establecimiento_preseleccionado: str = None,
+    aplicar_aprendizaje: bool = True,
+    deadline: Optional[float] = None,
+    preprocesar: Optional[bool] = None,
+    usar_cache: bool = True,
+    usuario_id: Optional[int] = None,
+    franjas: Optional[bool] = None,
+) -> Dict:
+    """
+    Procesa factura con Claude Vision API - V6.2
+    Lee EXACTAMENTE como un humano leería la factura
+    NUEVO: Devuelve posición vertical de cada producto
+
+    Síncrona, para workers y threads. La llamada pasa por el cliente
+    compartido (claude_client): límite global, reintentos y `deadline`
+    (time.monotonic() absoluto) heredado del llamador.
+
+    `preprocesar` activa/desactiva el recorte y reducción de la imagen
+    (None = OCR_PREPROCESAR); el reporte vuelve en "preprocesamiento".
+
+    Con `usar_cache` la imagen se busca primero en ocr_cache (hash exacto o
+    perceptual entre las fotos de `usuario_id`); un hit no llama a Claude y
+    devuelve usage["cache_hit"] = True.
+
+    Las facturas largas se dividen en franjas solapadas que se procesan en
+    paralelo (ocr_franjas); `franjas` True/False fuerza o desactiva el modo,
+    None decide según la forma de la imagen.
+    """
+    message = None
+    huellas = None
+    try:
+        _imprimir_encabezado(establecimiento_preseleccionado)
+        if usar_cache:
+            huellas, cacheado = _consultar_cache(
+                image_path, establecimiento_preseleccionado, usuario_id
+            )
+            if cacheado:
+                return cacheado
+
+        solicitudes, division, reporte = _preparar_solicitudes(
+            image_path, establecimiento_preseleccionado, preprocesar, franjas
+        )
+
+        if division is None:
+            print("📸 Enviando imagen a Claude Vision API...")
+            message = claude_client.crear_mensaje(
+                deadline=deadline, etiqueta="factura", **solicitudes[0]
+            )
+            resultado = _procesar_respuesta(message, establecimiento_preseleccionado)
+        else:
+            print(f"📸 Enviando {len(solicitudes)} franjas a Claude Vision API...")
+            with ThreadPoolExecutor(max_workers=len(solicitudes)) as executor:
+                mensajes = list(
+                    executor.map(
+                        lambda s: claude_client.crear_mensaje(
+                            deadline=deadline, etiqueta="factura_franja", **s
+                        ),
+                        solicitudes,
+                    )
+                )
+            resultado = _fusionar_respuestas(
+                mensajes, division, establecimiento_preseleccionado
+            )
+        resultado["preprocesamiento"] = reporte
+        _guardar_en_cache(
+            huellas, resultado, establecimiento_preseleccionado, usuario_id
+        )
+        return resultado
+
     except Exception as e:
-        print(f"❌ Error: {e}")
-        import traceback
-
-        traceback.print_exc()
-
-        usage_data = {}
-        if "message" in locals() and hasattr(message, "usage"):
-            usage_data = {
-                "input_tokens": message.usage.input_tokens,
-                "output_tokens": message.usage.output_tokens,
-                "total_tokens": message.usage.input_tokens
-                + message.usage.output_tokens,
-                "modelo": "claude-sonnet-4-20250514",
-            }
+        return _resultado_error(e, message)
+
+
+async def parse_invoice_with_claude_async(
+    image_path: str,
+    establecimiento_preseleccionado: str = None,
+    aplicar_aprendizaje: bool = True,
+    deadline: Optional[float] = None,
+    preprocesar: Optional[bool] = None,
+    usar_cache: bool = True,
+    usuario_id: Optional[int] = None,
+    franjas: Optional[bool] = None,
+) -> Dict:
+    """Igual que parse_invoice_with_claude() sin bloquear el event loop"""
+    message = None
+    huellas = None
+    try:
+        _imprimir_encabezado(establecimiento_preseleccionado)
+        if usar_cache:
+            huellas, cacheado = await asyncio.to_thread(
+                _consultar_cache,
+                image_path,
+                establecimiento_preseleccionado,
+                usuario_id,
+            )
+            if cacheado:
+                return cacheado
+
+        solicitudes, division, reporte = await asyncio.to_thread(
+            _preparar_solicitudes,
+            image_path,
+            establecimiento_preseleccionado,
+            preprocesar,
+            franjas,
+        )
+
+        if division is None:
+            print("📸 Enviando imagen a Claude Vision API...")
+            message = await claude_client.crear_mensaje_async(
+                deadline=deadline, etiqueta="factura", **solicitudes[0]
+            )
+            resultado = _procesar_respuesta(message, establecimiento_preseleccionado)
         else:
-            usage_data = {
-                "input_tokens": 0,
-                "output_tokens": 0,
-                "total_tokens": 0,
-                "modelo": "claude-sonnet-4-20250514",
-            }
+            print(f"📸 Enviando {len(solicitudes)} franjas a Claude Vision API...")
+            mensajes = await asyncio.gather(
+                *[
+                    claude_client.crear_mensaje_async(
+                        deadline=deadline, etiqueta="factura_franja", **s
+                    )
+                    for s in solicitudes
+                ]
+            )
+            resultado = _fusionar_respuestas(
+                mensajes, division, establecimiento_preseleccionado
+            )
+        resultado["preprocesamiento"] = reporte
+        await asyncio.to_thread(
+            _guardar_en_cache,
+            huellas,
+            resultado,
+            establecimiento_preseleccionado,
+            usuario_id,
+        )
+        return resultado
 
-        return {"success": False, "error": f"Error: {str(e)}", "usage": usage_data}
+    except Exception as e:
+        return _resultado_error(e, message)
 
 
 print("=" * 80)
@@ -0,0 +1,430 @@
+"""
+Cliente HTTP Compartido para VTEX
+=================================
+
+Capa única para todas las llamadas a las tiendas VTEX (Carulla, Éxito,
+Jumbo, Olímpica, ...) de web_enricher, vtex_scraper, carulla_scraper y
+productos_api_v2.
+
+- Clientes httpx reutilizados (sync y uno async por event loop) con pool de
+  conexiones keep-alive y HTTP/2 si está instalado `h2`
+- Rate limit por host con token bucket (VTEX_RPS_POR_HOST, ráfaga
+  VTEX_RAFAGA_POR_HOST), compartido entre threads y corrutinas
+- Circuit breaker por host: tras VTEX_CIRCUITO_FALLOS fallos seguidos
+  (timeouts, errores de conexión, 429/5xx) el host queda abierto
+  VTEX_CIRCUITO_ENFRIAMIENTO segundos y las llamadas fallan de inmediato;
+  luego pasa una sola solicitud de prueba (semiabierto)
+- Métricas por host: solicitudes, errores, rechazos y tiempos de respuesta
+- GETs idénticos en vuelo al mismo tiempo (misma URL y parámetros) se
+  hacen una sola vez y comparten la respuesta (coalescencia, grupo "vtex")
+- VTEX_URL_STUB redirige todas las solicitudes a un servidor local
+  (stub_vtex.py) para pruebas; el host original va en X-Vtex-Host
+
+Uso:
+
+    import cliente_vtex
+
+    resp = cliente_vtex.get(url, timeout=10)
+    resp = await cliente_vtex.get_async(url, timeout=15)
+
+Autor: LecFac
+Versión: 1.0.0
+"""
+
+import asyncio
+import os
+import threading
+import time
+from collections import deque
+from typing import Dict, Optional
+from urllib.parse import urlsplit, urlunsplit
+
+import httpx
+
+import coalescencia
+
+try:
+    import h2  # noqa: F401
+
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+
+VTEX_TIMEOUT = float(os.environ.get("VTEX_TIMEOUT", "10"))
+VTEX_MAX_CONEXIONES = int(os.environ.get("VTEX_MAX_CONEXIONES", "40"))
+VTEX_MAX_KEEPALIVE = int(os.environ.get("VTEX_MAX_KEEPALIVE", "20"))
+VTEX_RPS_POR_HOST = float(os.environ.get("VTEX_RPS_POR_HOST", "5"))
+VTEX_RAFAGA_POR_HOST = int(os.environ.get("VTEX_RAFAGA_POR_HOST", "10"))
+VTEX_CIRCUITO_FALLOS = int(os.environ.get("VTEX_CIRCUITO_FALLOS", "5"))
+VTEX_CIRCUITO_ENFRIAMIENTO = float(os.environ.get("VTEX_CIRCUITO_ENFRIAMIENTO", "30"))
+VTEX_URL_STUB = os.environ.get("VTEX_URL_STUB", "").rstrip("/")
+
+HEADERS = {
+    "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36",
+    "Accept": "application/json",
+    "Accept-Language": "es-CO,es;q=0.9,en;q=0.8",
+}
+
+# Respuestas que cuentan como fallo del host para el circuit breaker
+ESTADOS_FALLO = {429, 500, 502, 503, 504}
+# Muestras de latencia por host para promedio/p95
+MUESTRAS_LATENCIA = 200
+
+
+class CircuitoAbierto(httpx.TransportError):
+    """El host acumuló fallos y sus llamadas se cortan sin salir a la red"""
+
+
+# ============================================================================
+# ESTADO POR HOST
+# ============================================================================
+
+
+class EstadoHost:
+    """Token bucket, circuit breaker y métricas de un host"""
+
+    def __init__(self, host: str):
+        self.host = host
+        self._lock = threading.Lock()
+        # Token bucket
+        self._saldo = float(VTEX_RAFAGA_POR_HOST)
+        self._actualizado = time.monotonic()
+        # Circuit breaker
+        self._fallos_seguidos = 0
+        self._abierto_hasta = 0.0
+        # Mientras corre la solicitud de prueba del estado semiabierto
+        self._sondeo_hasta = 0.0
+        # Métricas
+        self._latencias: deque = deque(maxlen=MUESTRAS_LATENCIA)
+        self.stats = {
+            "solicitudes": 0,
+            "errores": 0,
+            "rechazadas_circuito": 0,
+            "aperturas_circuito": 0,
+            "espera_rate_limit_s": 0.0,
+        }
+
+    # ------------------------------------------------------------------
+    def reservar(self) -> float:
+        """Toma un token; devuelve los segundos a esperar antes de enviar"""
+        with self._lock:
+            ahora = time.monotonic()
+            self._saldo = min(
+                VTEX_RAFAGA_POR_HOST,
+                self._saldo + (ahora - self._actualizado) * VTEX_RPS_POR_HOST,
+            )
+            self._actualizado = ahora
+            self._saldo -= 1
+            espera = max(0.0, -self._saldo / VTEX_RPS_POR_HOST)
+            self.stats["espera_rate_limit_s"] += espera
+            return espera
+
+    def devolver(self):
+        with self._lock:
+            self._saldo += 1
+
+    # ------------------------------------------------------------------
+    def permitir(self) -> bool:
+        """
+        Lanza CircuitoAbierto si el host está cortado.
+
+        Returns:
+            True si esta solicitud es la prueba del estado semiabierto (hay
+            que soltarla con soltar_sondeo() si termina sin registrar())
+        """
+        with self._lock:
+            if not self._abierto_hasta:
+                return False
+            ahora = time.monotonic()
+            if ahora >= self._abierto_hasta and ahora >= self._sondeo_hasta:
+                # Semiabierto: esta solicitud prueba si el host volvió
+                self._sondeo_hasta = ahora + VTEX_CIRCUITO_ENFRIAMIENTO
+                return True
+            self.stats["rechazadas_circuito"] += 1
+        raise CircuitoAbierto(f"[VTEX] Circuito abierto para {self.host}")
+
+    def soltar_sondeo(self):
+        """La prueba no llegó a salir (rate limit, cancelación): otra puede pasar"""
+        with self._lock:
+            self._sondeo_hasta = 0.0
+
+    def registrar(self, exito: bool, segundos: float):
+        with self._lock:
+            self.stats["solicitudes"] += 1
+            self._latencias.append(segundos)
+            self._sondeo_hasta = 0.0
+            if exito:
+                self._fallos_seguidos = 0
+                self._abierto_hasta = 0.0
+                return
+            self.stats["errores"] += 1
+            self._fallos_seguidos += 1
+            if self._abierto_hasta or self._fallos_seguidos >= VTEX_CIRCUITO_FALLOS:
+                if not self._abierto_hasta:
+                    self.stats["aperturas_circuito"] += 1
+                    print(
+                        f"🔌 [VTEX] Circuito abierto para {self.host} "
+                        f"({self._fallos_seguidos} fallos seguidos)"
+                    )
+                self._abierto_hasta = time.monotonic() + VTEX_CIRCUITO_ENFRIAMIENTO
+
+    def estado(self) -> Dict:
+        with self._lock:
+            latencias = sorted(self._latencias)
+            if not self._abierto_hasta:
+                circuito = "cerrado"
+            elif time.monotonic() >= self._abierto_hasta:
+                circuito = "semiabierto"
+            else:
+                circuito = "abierto"
+            return {
+                **self.stats,
+                "espera_rate_limit_s": round(self.stats["espera_rate_limit_s"], 2),
+                "circuito": circuito,
+                "fallos_seguidos": self._fallos_seguidos,
+                "ms_promedio": (
+                    round(sum(latencias) / len(latencias) * 1000, 1)
+                    if latencias
+                    else 0.0
+                ),
+                "ms_p95": (
+                    round(latencias[int(len(latencias) * 0.95)] * 1000, 1)
+                    if latencias
+                    else 0.0
+                ),
+            }
+
+
+_hosts: Dict[str, EstadoHost] = {}
+_hosts_lock = threading.Lock()
+
+
+def _estado_host(host: str) -> EstadoHost:
+    with _hosts_lock:
+        if host not in _hosts:
+            _hosts[host] = EstadoHost(host)
+        return _hosts[host]
+
+
+# ============================================================================
+# CLIENTES
+# ============================================================================
+
+_cliente_sync: Optional[httpx.Client] = None
+_cliente_sync_lock = threading.Lock()
+# httpx.AsyncClient queda atado al event loop donde se usa por primera vez
+_clientes_async: Dict[int, tuple] = {}
+
+
+def _opciones_cliente() -> Dict:
+    return {
+        "http2": HTTP2_AVAILABLE,
+        "headers": HEADERS,
+        "timeout": VTEX_TIMEOUT,
+        "follow_redirects": True,
+        "limits": httpx.Limits(
+            max_connections=VTEX_MAX_CONEXIONES,
+            max_keepalive_connections=VTEX_MAX_KEEPALIVE,
+        ),
+    }
+
+
+def get_cliente() -> httpx.Client:
+    """Cliente síncrono compartido (thread-safe)"""
+    global _cliente_sync
+    if _cliente_sync is None:
+        with _cliente_sync_lock:
+            if _cliente_sync is None:
+                _cliente_sync = httpx.Client(**_opciones_cliente())
+    return _cliente_sync
+
+
+def get_cliente_async() -> httpx.AsyncClient:
+    """Cliente async compartido del event loop actual"""
+    loop = asyncio.get_running_loop()
+    entrada = _clientes_async.get(id(loop))
+    if entrada is None or entrada[0] is not loop:
+        # Respaldo: loops ya terminados sin cerrar su cliente (job_queue los
+        # cierra al final de cada handler async con cerrar_clientes_async)
+        for clave, (otro_loop, _) in list(_clientes_async.items()):
+            if otro_loop.is_closed():
+                _clientes_async.pop(clave, None)
+        entrada = (loop, httpx.AsyncClient(**_opciones_cliente()))
+        _clientes_async[id(loop)] = entrada
+    return entrada[1]
+
+
+async def cerrar_clientes_async():
+    """
+    Cierra el cliente async del loop actual (shutdown de la aplicación y
+    fin de cada handler async de job_queue)
+    """
+    loop = asyncio.get_running_loop()
+    entrada = _clientes_async.pop(id(loop), None)
+    if entrada is not None:
+        await entrada[1].aclose()
+
+
+# ============================================================================
+# API PÚBLICA
+# ============================================================================
+
+
+def _preparar(url: str, headers: Optional[Dict]) -> tuple:
+    """(estado del host, url efectiva, headers) con la redirección al stub"""
+    partes = urlsplit(url)
+    host = partes.netloc
+    headers = dict(headers or {})
+    if VTEX_URL_STUB:
+        stub = urlsplit(VTEX_URL_STUB)
+        url = urlunsplit((stub.scheme, stub.netloc) + tuple(partes[2:]))
+        headers["X-Vtex-Host"] = host
+    return _estado_host(host), url, headers
+
+
+def _limite_espera(estado: EstadoHost, espera: float, timeout: float):
+    if espera > timeout:
+        estado.devolver()
+        raise httpx.PoolTimeout(
+            f"[VTEX] Rate limit de {estado.host}: espera {espera:.1f}s > timeout"
+        )
+
+
+def _clave(url: str, params: Optional[Dict]) -> tuple:
+    """Clave de coalescencia: URL original (tienda + consulta) y parámetros"""
+    return (url, tuple(sorted((k, str(v)) for k, v in (params or {}).items())))
+
+
+def get(
+    url: str,
+    *,
+    headers: Optional[Dict] = None,
+    params: Optional[Dict] = None,
+    timeout: Optional[float] = None,
+) -> httpx.Response:
+    """
+    GET con rate limit y circuit breaker del host. Si la misma consulta ya
+    está en vuelo (en otro thread o corrutina) espera y comparte su respuesta.
+
+    Bloquea (también durante la espera del rate limit): desde corrutinas
+    usar get_async() o llamarla con asyncio.to_thread().
+
+    Raises:
+        CircuitoAbierto: el host está cortado por fallos recientes
+        httpx.PoolTimeout: el rate limit pediría esperar más que `timeout`
+        httpx.HTTPError: errores de red / timeouts de la solicitud
+    """
+    return coalescencia.ejecutar(
+        "vtex",
+        _clave(url, params),
+        _get,
+        url,
+        headers=headers,
+        params=params,
+        timeout=timeout,
+    )
+
+
+async def get_async(
+    url: str,
+    *,
+    headers: Optional[Dict] = None,
+    params: Optional[Dict] = None,
+    timeout: Optional[float] = None,
+) -> httpx.Response:
+    """Versión async de get() (no bloquea el event loop)"""
+    return await coalescencia.ejecutar_async(
+        "vtex",
+        _clave(url, params),
+        _get_async,
+        url,
+        headers=headers,
+        params=params,
+        timeout=timeout,
+    )
+
+
+def _get(
+    url: str,
+    *,
+    headers: Optional[Dict] = None,
+    params: Optional[Dict] = None,
+    timeout: Optional[float] = None,
+) -> httpx.Response:
+    timeout = VTEX_TIMEOUT if timeout is None else timeout
+    estado, url, headers = _preparar(url, headers)
+    sondeo = estado.permitir()
+    registrada = False
+    try:
+        espera = estado.reservar()
+        _limite_espera(estado, espera, timeout)
+        if espera > 0:
+            time.sleep(espera)
+
+        inicio = time.monotonic()
+        try:
+            resp = get_cliente().get(
+                url, headers=headers, params=params, timeout=timeout
+            )
+        except httpx.HTTPError:
+            registrada = True
+            estado.registrar(False, time.monotonic() - inicio)
+            raise
+        registrada = True
+        estado.registrar(
+            resp.status_code not in ESTADOS_FALLO, time.monotonic() - inicio
+        )
+        return resp
+    finally:
+        if sondeo and not registrada:
+            estado.soltar_sondeo()
+
+
+async def _get_async(
+    url: str,
+    *,
+    headers: Optional[Dict] = None,
+    params: Optional[Dict] = None,
+    timeout: Optional[float] = None,
+) -> httpx.Response:
+    timeout = VTEX_TIMEOUT if timeout is None else timeout
+    estado, url, headers = _preparar(url, headers)
+    sondeo = estado.permitir()
+    registrada = False
+    try:
+        espera = estado.reservar()
+        _limite_espera(estado, espera, timeout)
+        if espera > 0:
+            await asyncio.sleep(espera)
+
+        inicio = time.monotonic()
+        try:
+            resp = await get_cliente_async().get(
+                url, headers=headers, params=params, timeout=timeout
+            )
+        except httpx.HTTPError:
+            registrada = True
+            estado.registrar(False, time.monotonic() - inicio)
+            raise
+        registrada = True
+        estado.registrar(
+            resp.status_code not in ESTADOS_FALLO, time.monotonic() - inicio
+        )
+        return resp
+    finally:
+        # Rate limit, cancelación o error inesperado antes de registrar
+        if sondeo and not registrada:
+            estado.soltar_sondeo()
+
+
+def estadisticas() -> Dict:
+    """Métricas y estado del circuito de cada host"""
+    with _hosts_lock:
+        hosts = list(_hosts.values())
+    return {
+        "http2": HTTP2_AVAILABLE,
+        "stub": VTEX_URL_STUB or None,
+        "rps_por_host": VTEX_RPS_POR_HOST,
+        "hosts": {estado.host: estado.estado() for estado in hosts},
+    }
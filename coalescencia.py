@@ -0,0 +1,215 @@
+"""
+Coalescencia de Consultas Externas en Vuelo (singleflight)
+==========================================================
+
+En hora pico muchos usuarios suben facturas de la misma tienda con los
+mismos PLUs, y las mismas consultas a VTEX, Perplexity o Claude corren al
+mismo tiempo. Con este módulo solo la primera llamada de cada clave sale a
+la red; las que llegan mientras está en vuelo esperan y reciben su mismo
+resultado (o su misma excepción).
+
+- Claves por grupo: "vtex" (URL + parámetros = tienda + código, en
+  cliente_vtex), "perplexity" (tienda + código + nombre normalizado +
+  precio) y "claude_validacion" (hash del modelo y el prompt)
+- Funciona entre threads (workers de la cola, ThreadPoolExecutor) y event
+  loops: un llamador async puede esperar una llamada iniciada en un thread
+  y al revés
+- No es una caché: al terminar la llamada la clave se libera y la
+  siguiente vuelve a ejecutarse
+- El resultado es el mismo objeto para todos los que esperaban: quien lo
+  modifique debe copiarlo antes
+- Si la llamada líder se cancela (CancelledError, KeyboardInterrupt), los
+  que esperaban la ejecutan por su cuenta
+- COALESCENCIA=false desactiva la deduplicación
+
+Uso:
+
+    resp = coalescencia.ejecutar("vtex", clave, _get, url, timeout=10)
+    resp = await coalescencia.ejecutar_async("vtex", clave, _get_async, url)
+
+Autor: LecFac
+Versión: 1.0.0
+"""
+
+import asyncio
+import os
+import threading
+from typing import Any, Callable, Dict, Hashable, List, Optional, Tuple
+
+COALESCENCIA_HABILITADA = os.environ.get("COALESCENCIA", "true").lower() == "true"
+
+
+class _Vuelo:
+    """Una llamada en curso y quienes esperan su resultado"""
+
+    __slots__ = (
+        "evento",
+        "hilo",
+        "futures",
+        "esperando",
+        "resultado",
+        "error",
+        "cancelado",
+    )
+
+    def __init__(self):
+        self.evento = threading.Event()
+        # Thread del líder: un llamador sync de ese mismo thread no puede
+        # esperarlo (bloquearía el loop que lo tiene que terminar)
+        self.hilo = threading.get_ident()
+        self.futures: List[Tuple[asyncio.AbstractEventLoop, asyncio.Future]] = []
+        self.esperando = 0
+        self.resultado: Any = None
+        self.error: Optional[BaseException] = None
+        self.cancelado = False
+
+
+_lock = threading.Lock()
+_vuelos: Dict[Tuple[str, Hashable], _Vuelo] = {}
+_stats: Dict[str, Dict[str, int]] = {}
+
+
+def _stats_grupo(grupo: str) -> Dict[str, int]:
+    stats = _stats.get(grupo)
+    if stats is None:
+        stats = _stats[grupo] = {
+            "llamadas": 0,
+            "ejecutadas": 0,
+            "colapsadas": 0,
+            "max_esperando": 0,
+        }
+    return stats
+
+
+def _unirse(
+    grupo: str, clave: Hashable, loop: Optional[asyncio.AbstractEventLoop]
+) -> Tuple[_Vuelo, bool, Optional[asyncio.Future]]:
+    """
+    Returns:
+        (vuelo, es_lider, future del seguidor async)
+    """
+    with _lock:
+        stats = _stats_grupo(grupo)
+        stats["llamadas"] += 1
+        vuelo = _vuelos.get((grupo, clave))
+
+        if vuelo is not None and (
+            loop is not None or vuelo.hilo != threading.get_ident()
+        ):
+            stats["colapsadas"] += 1
+            vuelo.esperando += 1
+            future = None
+            if loop is not None:
+                future = loop.create_future()
+                vuelo.futures.append((loop, future))
+            return vuelo, False, future
+
+        stats["ejecutadas"] += 1
+        propio = _Vuelo()
+        if vuelo is None:
+            _vuelos[(grupo, clave)] = propio
+        return propio, True, None
+
+
+def _entregar(future: asyncio.Future, vuelo: _Vuelo):
+    if future.done():
+        return
+    if vuelo.error is not None:
+        future.set_exception(vuelo.error)
+    else:
+        future.set_result(vuelo.resultado)
+
+
+def _terminar(
+    grupo: str,
+    clave: Hashable,
+    vuelo: _Vuelo,
+    resultado: Any = None,
+    error: Optional[BaseException] = None,
+):
+    with _lock:
+        if _vuelos.get((grupo, clave)) is vuelo:
+            del _vuelos[(grupo, clave)]
+        vuelo.resultado = resultado
+        vuelo.cancelado = error is not None and not isinstance(error, Exception)
+        vuelo.error = None if vuelo.cancelado else error
+        futures, vuelo.futures = vuelo.futures, []
+        stats = _stats_grupo(grupo)
+        stats["max_esperando"] = max(stats["max_esperando"], vuelo.esperando)
+
+    vuelo.evento.set()
+    for loop, future in futures:
+        try:
+            loop.call_soon_threadsafe(_entregar, future, vuelo)
+        except RuntimeError:
+            # Loop cerrado: nadie queda esperando ese future
+            pass
+
+
+def _resultado(vuelo: _Vuelo) -> Any:
+    if vuelo.error is not None:
+        raise vuelo.error
+    return vuelo.resultado
+
+
+def ejecutar(grupo: str, clave: Hashable, fn: Callable, *args, **kwargs) -> Any:
+    """
+    Ejecuta fn(*args, **kwargs) salvo que ya haya una llamada en vuelo con
+    la misma (grupo, clave): en ese caso espera y devuelve su resultado.
+    """
+    if not COALESCENCIA_HABILITADA:
+        return fn(*args, **kwargs)
+
+    vuelo, lider, _ = _unirse(grupo, clave, None)
+    if not lider:
+        vuelo.evento.wait()
+        if vuelo.cancelado:
+            return fn(*args, **kwargs)
+        return _resultado(vuelo)
+
+    try:
+        resultado = fn(*args, **kwargs)
+    except BaseException as e:
+        _terminar(grupo, clave, vuelo, error=e)
+        raise
+    _terminar(grupo, clave, vuelo, resultado=resultado)
+    return resultado
+
+
+async def ejecutar_async(
+    grupo: str, clave: Hashable, fn: Callable, *args, **kwargs
+) -> Any:
+    """Versión async de ejecutar(); fn es una función async"""
+    if not COALESCENCIA_HABILITADA:
+        return await fn(*args, **kwargs)
+
+    vuelo, lider, future = _unirse(grupo, clave, asyncio.get_running_loop())
+    if not lider:
+        resultado = await future
+        if vuelo.cancelado:
+            return await fn(*args, **kwargs)
+        return resultado
+
+    try:
+        resultado = await fn(*args, **kwargs)
+    except BaseException as e:
+        _terminar(grupo, clave, vuelo, error=e)
+        raise
+    _terminar(grupo, clave, vuelo, resultado=resultado)
+    return resultado
+
+
+def estadisticas() -> Dict:
+    """Llamadas, ejecutadas y colapsadas por grupo"""
+    with _lock:
+        en_vuelo: Dict[str, int] = {}
+        for grupo, _ in _vuelos:
+            en_vuelo[grupo] = en_vuelo.get(grupo, 0) + 1
+        grupos = {grupo: dict(stats) for grupo, stats in _stats.items()}
+
+    for grupo, stats in grupos.items():
+        stats["en_vuelo"] = en_vuelo.get(grupo, 0)
+        stats["tasa_colapso"] = round(
+            stats["colapsadas"] / stats["llamadas"] if stats["llamadas"] else 0.0, 3
+        )
+    return {"habilitada": COALESCENCIA_HABILITADA, "grupos": grupos}
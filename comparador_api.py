@@ -8,7 +8,7 @@
 
 from fastapi import APIRouter, HTTPException, Query
 import logging
-from database import get_db_connection
+import db_async
 from datetime import datetime
 from typing import Optional
 
@@ -49,70 +49,25 @@ async def buscar_mejor_en_tienda(
     print(f"   📊 Ordenar por: {ordenar_por}")
     print(f"{'='*60}")
 
-    conn = None
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-
         # Limpiar búsqueda
-        busqueda_limpia = busqueda.strip().upper()
-        busqueda_pattern = f"%{busqueda_limpia}%"
+        busqueda_limpia = busqueda.strip()
 
         # Query con LEFT JOIN a calificaciones para obtener ratings
-        query = """
-            SELECT
-                pm.id,
-                pm.nombre_consolidado,
-                pm.marca,
-                pm.codigo_ean,
-                e.id as establecimiento_id,
-                e.nombre_normalizado as establecimiento,
-                ppe.precio_unitario,
-                ppe.fecha_actualizacion,
-                COALESCE(ppe.total_reportes, 1) as veces_visto,
-                COALESCE(ratings.rating_promedio, 0) as rating,
-                COALESCE(ratings.total_calificaciones, 0) as num_opiniones
-            FROM productos_maestros_v2 pm
-            INNER JOIN productos_por_establecimiento ppe
-                ON pm.id = ppe.producto_maestro_id
-            INNER JOIN establecimientos e
-                ON ppe.establecimiento_id = e.id
-            LEFT JOIN (
-                SELECT
-                    producto_maestro_id,
-                    ROUND(AVG(calificacion), 1) as rating_promedio,
-                    COUNT(*) as total_calificaciones
-                FROM calificaciones_productos
-                GROUP BY producto_maestro_id
-            ) ratings ON pm.id = ratings.producto_maestro_id
-            WHERE UPPER(pm.nombre_consolidado) LIKE %s
-              AND ppe.precio_unitario > 0
-        """
-
-        params = [busqueda_pattern]
-
-        # Filtrar por establecimiento si se especifica
-        if establecimiento_id:
-            query += " AND e.id = %s"
-            params.append(establecimiento_id)
-
-        cursor.execute(query, params)
-        rows = cursor.fetchall()
+        # (filtro y ranking por nombre en busqueda_productos)
+        rows = await db_async.buscar_productos_en_tienda(
+            busqueda_limpia, establecimiento_id
+        )
 
         print(f"📊 Productos encontrados: {len(rows)}")
 
         if not rows:
             # Buscar establecimientos disponibles para sugerir
-            cursor.execute(
-                """
-                SELECT id, nombre_normalizado
-                FROM establecimientos
-                ORDER BY nombre_normalizado
-            """
-            )
-            establecimientos = [{"id": r[0], "nombre": r[1]} for r in cursor.fetchall()]
+            establecimientos = [
+                {"id": r[0], "nombre": r[1]}
+                for r in await db_async.listar_establecimientos()
+            ]
 
-            conn.close()
             return {
                 "success": True,
                 "mensaje": f"No encontramos productos con '{busqueda}'",
@@ -240,8 +195,6 @@ async def buscar_mejor_en_tienda(
         if establecimiento_id and productos:
             nombre_establecimiento = productos[0]["establecimiento"]
 
-        conn.close()
-
         print(f"✅ Retornando {len(productos)} productos ordenados por {ordenar_por}")
 
         return {
@@ -278,8 +231,6 @@ async def buscar_mejor_en_tienda(
         import traceback
 
         traceback.print_exc()
-        if conn:
-            conn.close()
         raise HTTPException(status_code=500, detail=str(e))
 
 
@@ -295,29 +246,8 @@ async def listar_establecimientos():
     """
     print("📍 Obteniendo lista de establecimientos...")
 
-    conn = None
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-
-        cursor.execute(
-            """
-            SELECT
-                e.id,
-                e.nombre_normalizado,
-                e.cadena,
-                COUNT(DISTINCT ppe.producto_maestro_id) as total_productos
-            FROM establecimientos e
-            LEFT JOIN productos_por_establecimiento ppe
-                ON e.id = ppe.establecimiento_id
-            GROUP BY e.id, e.nombre_normalizado, e.cadena
-            HAVING COUNT(DISTINCT ppe.producto_maestro_id) > 0
-            ORDER BY e.cadena, e.nombre_normalizado
-        """
-        )
-
-        rows = cursor.fetchall()
-        conn.close()
+        rows = await db_async.listar_establecimientos_con_productos()
 
         establecimientos = []
         for row in rows:
@@ -341,8 +271,6 @@ async def listar_establecimientos():
 
     except Exception as e:
         logger.error(f"❌ Error listando establecimientos: {e}")
-        if conn:
-            conn.close()
         raise HTTPException(status_code=500, detail=str(e))
 
 
@@ -360,43 +288,12 @@ async def obtener_productos_comparables():
     print("🛒 MODO PRODUCTO: Comparando mismo producto entre tiendas")
     print("=" * 80)
 
-    conn = None
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-
-        query = """
-            SELECT
-                pm.id,
-                pm.codigo_ean,
-                pm.nombre_consolidado,
-                pm.marca,
-                COALESCE(pm.codigo_lecfac, CONCAT('prod-', pm.id)) as codigo_lecfac,
-                COALESCE(c.nombre, 'Sin categoría') as categoria,
-                ppe.codigo_plu,
-                e.nombre_normalizado as establecimiento,
-                ppe.precio_unitario,
-                ppe.fecha_actualizacion,
-                COALESCE(ppe.total_reportes, 1) as total_reportes
-            FROM productos_maestros_v2 pm
-            INNER JOIN productos_por_establecimiento ppe
-                ON pm.id = ppe.producto_maestro_id
-            INNER JOIN establecimientos e
-                ON ppe.establecimiento_id = e.id
-            LEFT JOIN categorias c
-                ON pm.categoria_id = c.id
-            WHERE ppe.precio_unitario > 0
-            ORDER BY codigo_lecfac, ppe.precio_unitario ASC
-        """
-
-        cursor.execute(query)
-        rows = cursor.fetchall()
+        rows = await db_async.obtener_precios_comparables()
 
         print(f"📊 Total filas obtenidas: {len(rows)}")
 
         if len(rows) == 0:
-            cursor.close()
-            conn.close()
             return {
                 "success": True,
                 "productos": [],
@@ -495,9 +392,6 @@ async def obtener_productos_comparables():
             else 0
         )
 
-        cursor.close()
-        conn.close()
-
         print(f"✅ {len(productos_comparables)} productos comparables")
 
         return {
@@ -515,8 +409,6 @@ async def obtener_productos_comparables():
         import traceback
 
         traceback.print_exc()
-        if conn:
-            conn.close()
         return {
             "success": False,
             "error": str(e),
@@ -530,49 +422,14 @@ async def comparar_producto_especifico(producto_id: int):
     """
     🛒 MODO 2 (detalle): Compara precios de UN producto específico entre tiendas
     """
-    conn = None
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-
-        cursor.execute(
-            """
-            SELECT codigo_lecfac, nombre_consolidado
-            FROM productos_maestros_v2
-            WHERE id = %s
-        """,
-            (producto_id,),
-        )
-
-        result = cursor.fetchone()
+        result, precios_rows = await db_async.obtener_precios_producto(producto_id)
         if not result:
             raise HTTPException(status_code=404, detail="Producto no encontrado")
 
         codigo_lecfac = result[0]
         nombre = result[1]
 
-        cursor.execute(
-            """
-            SELECT
-                pm.id,
-                e.nombre_normalizado,
-                ppe.codigo_plu,
-                ppe.precio_unitario,
-                ppe.fecha_actualizacion,
-                ppe.total_reportes
-            FROM productos_maestros_v2 pm
-            JOIN productos_por_establecimiento ppe ON pm.id = ppe.producto_maestro_id
-            JOIN establecimientos e ON ppe.establecimiento_id = e.id
-            WHERE pm.codigo_lecfac = %s
-            ORDER BY ppe.precio_unitario ASC
-        """,
-            (codigo_lecfac,),
-        )
-
-        precios_rows = cursor.fetchall()
-        cursor.close()
-        conn.close()
-
         precios = []
         for row in precios_rows:
             fecha = row[4]
@@ -607,8 +464,6 @@ async def comparar_producto_especifico(producto_id: int):
         raise
     except Exception as e:
         logger.error(f"❌ Error: {e}")
-        if conn:
-            conn.close()
         raise HTTPException(status_code=500, detail=str(e))
 
 
@@ -624,34 +479,8 @@ async def buscar_productos_rapido(
 
     Retorna hasta 10 sugerencias de productos que coincidan
     """
-    conn = None
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-
-        busqueda_pattern = f"%{q.strip().upper()}%"
-
-        cursor.execute(
-            """
-            SELECT DISTINCT
-                pm.id,
-                pm.nombre_consolidado,
-                pm.marca,
-                COUNT(DISTINCT ppe.establecimiento_id) as num_tiendas
-            FROM productos_maestros_v2 pm
-            INNER JOIN productos_por_establecimiento ppe
-                ON pm.id = ppe.producto_maestro_id
-            WHERE UPPER(pm.nombre_consolidado) LIKE %s
-              AND ppe.precio_unitario > 0
-            GROUP BY pm.id, pm.nombre_consolidado, pm.marca
-            ORDER BY num_tiendas DESC, pm.nombre_consolidado
-            LIMIT 10
-        """,
-            (busqueda_pattern,),
-        )
-
-        rows = cursor.fetchall()
-        conn.close()
+        rows = await db_async.buscar_productos_rapido(q.strip())
 
         sugerencias = []
         for row in rows:
@@ -671,8 +500,6 @@ async def buscar_productos_rapido(
 
     except Exception as e:
         logger.error(f"❌ Error en búsqueda rápida: {e}")
-        if conn:
-            conn.close()
         return {"success": False, "sugerencias": []}
 
 
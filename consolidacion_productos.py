@@ -1,14 +1,11 @@
 # consolidacion_productos.py - VERSIÓN MEJORADA CON NORMALIZACIÓN Y MEJOR MATCHING
 
-import anthropic
-import os
 from typing import Optional, Dict, List
 import unicodedata
 from datetime import datetime
 from difflib import SequenceMatcher
 
-# Cliente de Anthropic
-client = anthropic.Anthropic(api_key=os.getenv("ANTHROPIC_API_KEY"))
+import claude_client
 
 
 # ============================================================================
@@ -166,7 +163,9 @@ Confianza:
 - 0.40-0.59: Mucha incertidumbre"""
 
     try:
-        message = client.messages.create(
+        message = claude_client.crear_mensaje(
+            timeout=30,
+            etiqueta="mejorar_nombre",
             model="claude-sonnet-4-20250514",
             max_tokens=250,
             temperature=0.2,  # Más bajo = más consistente
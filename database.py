@@ -11,6 +11,7 @@
 import os
 import sqlite3
 import bcrypt
+from contextlib import contextmanager
 from urllib.parse import urlparse
 from datetime import datetime, timedelta, date
 from typing import Optional, List, Dict, Any
@@ -40,12 +41,9 @@ except ImportError:
 
 
 def get_db_connection():
-    """Obtiene conexión a la base de datos"""
+    """Obtiene conexión a la base de datos (PostgreSQL desde el pool del proceso)"""
     database_type = os.environ.get("DATABASE_TYPE", "sqlite").lower()
 
-    print(f"🔍 DATABASE_TYPE configurado: {database_type}")
-    print(f"🔍 POSTGRESQL_AVAILABLE: {POSTGRESQL_AVAILABLE}")
-
     if database_type == "postgresql" and POSTGRESQL_AVAILABLE:
         conn = get_postgresql_connection()
         if conn:
@@ -61,60 +59,68 @@ def get_db_connection():
         return get_sqlite_connection()
 
 
-def get_postgresql_connection():
-    """Conexión a PostgreSQL (compatible psycopg2 y psycopg3)"""
-    if not POSTGRESQL_AVAILABLE:
-        print("❌ PostgreSQL libraries no disponibles")
-        return None
+def _crear_conexion_postgresql(database_url: str):
+    """Abre una conexión física nueva (solo la usa el pool)"""
+    if PSYCOPG_VERSION == 3:
+        import psycopg
 
-    try:
-        database_url = os.environ.get("DATABASE_URL")
+        return psycopg.connect(database_url, connect_timeout=10)
 
-        print(f"🔍 DATABASE_URL configurada: {'Sí' if database_url else 'No'}")
+    import psycopg2
 
-        if not database_url:
-            print("❌ DATABASE_URL no configurada en variables de entorno")
-            print("💡 Verifica que Railway tenga la variable DATABASE_URL configurada")
-            return None
+    url = urlparse(database_url)
 
-        print(f"🔗 Intentando conectar a PostgreSQL (psycopg{PSYCOPG_VERSION})...")
+    # Validar que tenemos todos los componentes necesarios
+    if not url.hostname:
+        raise ValueError(
+            f"DATABASE_URL inválida - hostname es None. URL: {database_url[:50]}..."
+        )
 
-        if PSYCOPG_VERSION == 3:
-            import psycopg
+    return psycopg2.connect(
+        host=url.hostname,
+        database=url.path[1:],
+        user=url.username,
+        password=url.password,
+        port=url.port or 5432,
+        connect_timeout=10,
+        sslmode="prefer",
+        options="-c search_path=public",
+    )
 
-            conn = psycopg.connect(database_url)
-        else:
-            import psycopg2
 
-            url = urlparse(database_url)
+def get_postgres_pool(database_url: str = None):
+    """Pool de conexiones del proceso para DATABASE_URL (o la URL indicada)"""
+    from db_pool import get_pool
 
-            # Debug: Ver qué estamos parseando
-            print(f"🔍 Parseando DATABASE_URL:")
-            print(f"   Host: {url.hostname}")
-            print(f"   Port: {url.port or 5432}")
-            print(f"   Database: {url.path[1:] if url.path else 'N/A'}")
-            print(f"   User: {url.username}")
+    database_url = database_url or os.environ.get("DATABASE_URL")
+    if not database_url:
+        return None
+    return get_pool(database_url, lambda: _crear_conexion_postgresql(database_url))
 
-            # Validar que tenemos todos los componentes necesarios
-            if not url.hostname:
-                raise ValueError(
-                    f"DATABASE_URL inválida - hostname es None. URL: {database_url[:50]}..."
-                )
 
-            conn = psycopg2.connect(
-                host=url.hostname,
-                database=url.path[1:],
-                user=url.username,
-                password=url.password,
-                port=url.port or 5432,
-                connect_timeout=10,
-                sslmode="prefer",
-                options="-c search_path=public",
-            )
+def get_postgresql_connection():
+    """Conexión a PostgreSQL desde el pool (compatible psycopg2 y psycopg3)
 
-        print(f"✅ Conexión PostgreSQL exitosa (psycopg{PSYCOPG_VERSION})")
-        return conn
+    conn.close() devuelve la conexión al pool en lugar de cerrarla.
+    """
+    if not POSTGRESQL_AVAILABLE:
+        print("❌ PostgreSQL libraries no disponibles")
+        return None
+
+    from db_pool import PoolTimeoutError
+
+    try:
+        pool = get_postgres_pool()
+        if pool is None:
+            print("❌ DATABASE_URL no configurada en variables de entorno")
+            print("💡 Verifica que Railway tenga la variable DATABASE_URL configurada")
+            return None
 
+        return pool.getconn()
+
+    except PoolTimeoutError:
+        # Pool agotado: no tiene sentido caer a SQLite, que el endpoint falle
+        raise
     except Exception as e:
         print(f"❌ ERROR CONECTANDO A POSTGRESQL: {e}")
         import traceback
@@ -123,12 +129,31 @@ def get_postgresql_connection():
         return get_sqlite_connection()
 
 
+@contextmanager
+def conexion_db():
+    """
+    Context manager sobre get_db_connection():
+    commit al salir, rollback si hay excepción y devolución al pool siempre.
+    """
+    conn = get_db_connection()
+    try:
+        yield conn
+        conn.commit()
+    except Exception:
+        try:
+            conn.rollback()
+        except Exception:
+            pass
+        raise
+    finally:
+        conn.close()
+
+
 def get_sqlite_connection():
     """Conexión a SQLite (fallback)"""
     try:
         conn = sqlite3.connect("lecfac.db")
         conn.row_factory = sqlite3.Row
-        print("✅ Conexión SQLite exitosa")
         return conn
     except Exception as e:
         print(f"❌ Error conectando a SQLite: {e}")
@@ -136,33 +161,45 @@ def get_sqlite_connection():
 
 
 def create_tables():
-    """Crear tablas según el tipo de base de datos"""
+    """Crear tablas según el tipo de base de datos
+
+    En PostgreSQL solo se aplican las migraciones pendientes (ver migraciones.py);
+    si el esquema está al día no se ejecuta ningún DDL.
+    """
     database_type = os.environ.get("DATABASE_TYPE", "sqlite").lower()
 
     if database_type == "postgresql" and POSTGRESQL_AVAILABLE:
-        create_postgresql_tables()
+        from migraciones import aplicar_migraciones
+
+        aplicar_migraciones()
     else:
         create_sqlite_tables()
 
 
-def create_postgresql_tables():
+def create_postgresql_tables(conn=None):
     """
     Crear tablas en PostgreSQL con ARQUITECTURA UNIFICADA
     Incluye:
     - ✅ Sistema nuevo: productos_canonicos + productos_variantes
     - ✅ Sistema legacy: productos_maestros (con migración)
     - ✅ Todas las tablas auxiliares completas
+
+    Args:
+        conn: conexión de la migración; con ella los errores se propagan
+              (la migración no queda registrada) y no se cierra
     """
-    if not POSTGRESQL_AVAILABLE:
-        print("❌ PostgreSQL no disponible, creando tablas SQLite")
-        create_sqlite_tables()
-        return
+    propia = conn is None
+    if propia:
+        if not POSTGRESQL_AVAILABLE:
+            print("❌ PostgreSQL no disponible, creando tablas SQLite")
+            create_sqlite_tables()
+            return
 
-    conn = get_postgresql_connection()
-    if not conn:
-        print("❌ No se pudo crear conexión PostgreSQL")
-        create_sqlite_tables()
-        return
+        conn = get_postgresql_connection()
+        if not conn:
+            print("❌ No se pudo crear conexión PostgreSQL")
+            create_sqlite_tables()
+            return
 
     try:
         cursor = conn.cursor()
@@ -1713,8 +1750,10 @@ def create_postgresql_tables():
         traceback.print_exc()
         if conn:
             conn.rollback()
+        if not propia:
+            raise
     finally:
-        if conn:
+        if conn and propia:
             conn.close()
 
 
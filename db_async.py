@@ -0,0 +1,464 @@
+"""
+Capa de Acceso a Datos Asíncrona (asyncpg)
+==========================================
+
+Pool asyncpg para que los endpoints async de FastAPI esperen (await) las
+consultas en lugar de bloquear el event loop con psycopg.
+
+- Pool asyncpg propio (ASYNC_DB_POOL_MIN / ASYNC_DB_POOL_MAX)
+- Sentencias preparadas: asyncpg prepara y cachea cada SQL por conexión
+  (ASYNC_DB_STATEMENT_CACHE)
+- Si asyncpg o PostgreSQL no están disponibles, las mismas funciones corren
+  la consulta síncrona en un hilo (asyncio.to_thread) para no bloquear el loop
+
+Las consultas se escriben una sola vez con placeholders $1, $2...; para el
+fallback síncrono se traducen a %s (psycopg) o ? (SQLite).
+
+Las filas devueltas se indexan por posición (row[0]) tanto con asyncpg
+(Record) como con el fallback (tuplas), así el código de los endpoints
+que arma las respuestas no cambia.
+
+Autor: LecFac
+Versión: 1.0.0
+"""
+
+import asyncio
+import os
+import re
+from typing import Any, List, Optional, Sequence, Tuple
+
+import busqueda_productos
+
+try:
+    import asyncpg
+
+    ASYNCPG_AVAILABLE = True
+except ImportError:
+    asyncpg = None
+    ASYNCPG_AVAILABLE = False
+
+
+ASYNC_DB_POOL_MIN = int(os.environ.get("ASYNC_DB_POOL_MIN", "2"))
+ASYNC_DB_POOL_MAX = int(os.environ.get("ASYNC_DB_POOL_MAX", "10"))
+ASYNC_DB_STATEMENT_CACHE = int(os.environ.get("ASYNC_DB_STATEMENT_CACHE", "256"))
+ASYNC_DB_COMMAND_TIMEOUT = float(os.environ.get("ASYNC_DB_COMMAND_TIMEOUT", "30"))
+
+_pool = None
+
+
+# ============================================================================
+# CICLO DE VIDA DEL POOL
+# ============================================================================
+
+
+def _es_postgresql() -> bool:
+    return os.environ.get("DATABASE_TYPE", "sqlite").lower() == "postgresql"
+
+
+async def iniciar_pool_async():
+    """Crea el pool asyncpg (llamar desde el lifespan de FastAPI)"""
+    global _pool
+
+    if _pool is not None:
+        return _pool
+
+    database_url = os.environ.get("DATABASE_URL")
+    if not ASYNCPG_AVAILABLE or not _es_postgresql() or not database_url:
+        print("⚠️ [ASYNC DB] asyncpg no disponible, usando fallback en hilos")
+        return None
+
+    try:
+        _pool = await asyncpg.create_pool(
+            dsn=database_url,
+            min_size=ASYNC_DB_POOL_MIN,
+            max_size=ASYNC_DB_POOL_MAX,
+            statement_cache_size=ASYNC_DB_STATEMENT_CACHE,
+            command_timeout=ASYNC_DB_COMMAND_TIMEOUT,
+            server_settings={"search_path": "public"},
+        )
+        print(
+            f"✅ [ASYNC DB] Pool asyncpg listo "
+            f"(min={ASYNC_DB_POOL_MIN}, max={ASYNC_DB_POOL_MAX})"
+        )
+    except Exception as e:
+        print(f"❌ [ASYNC DB] No se pudo crear pool asyncpg: {e}")
+        _pool = None
+
+    return _pool
+
+
+async def cerrar_pool_async():
+    """Cierra el pool asyncpg (shutdown)"""
+    global _pool
+
+    if _pool is not None:
+        pool, _pool = _pool, None
+        await pool.close()
+
+
+def disponible() -> bool:
+    """True si las consultas van por asyncpg nativo"""
+    return _pool is not None
+
+
+def estado_pool_async() -> dict:
+    """Estado del pool asyncpg para monitoreo"""
+    if _pool is None:
+        return {"activo": False}
+    return {
+        "activo": True,
+        "min_size": _pool.get_min_size(),
+        "max_size": _pool.get_max_size(),
+        "abiertas": _pool.get_size(),
+        "libres": _pool.get_idle_size(),
+    }
+
+
+# ============================================================================
+# EJECUCIÓN (asyncpg nativo o fallback síncrono en hilo)
+# ============================================================================
+
+_PLACEHOLDER = re.compile(r"\$(\d+)")
+
+
+def traducir_sql(sql: str, args: Sequence[Any]) -> Tuple[str, tuple]:
+    """Convierte $n a placeholders posicionales de psycopg/SQLite"""
+    marcador = "%s" if _es_postgresql() else "?"
+    orden = [int(n) - 1 for n in _PLACEHOLDER.findall(sql)]
+    if marcador == "%s":
+        sql = sql.replace("%", "%%")
+    sql = _PLACEHOLDER.sub(marcador, sql)
+    return sql, tuple(args[i] for i in orden)
+
+
+def _ejecutar_sync(consultas: List[Tuple[str, Sequence[Any], str]]) -> list:
+    """Ejecuta varias consultas con una sola conexión del pool síncrono"""
+    from database import get_db_connection
+
+    conn = get_db_connection()
+    try:
+        cursor = conn.cursor()
+        resultados = []
+        for sql, args, modo in consultas:
+            sql_sync, params = traducir_sql(sql, args)
+            cursor.execute(sql_sync, params)
+            if modo == "fetch":
+                resultados.append(cursor.fetchall())
+            elif modo == "fetchrow":
+                resultados.append(cursor.fetchone())
+            else:
+                fila = cursor.fetchone()
+                resultados.append(fila[0] if fila else None)
+        cursor.close()
+        return resultados
+    finally:
+        conn.close()
+
+
+async def _ejecutar(consultas: List[Tuple[str, Sequence[Any], str]]) -> list:
+    """Ejecuta varias consultas sobre una sola conexión (asyncpg o hilo)"""
+    if _pool is None:
+        return await asyncio.to_thread(_ejecutar_sync, consultas)
+
+    resultados = []
+    async with _pool.acquire() as conn:
+        for sql, args, modo in consultas:
+            if modo == "fetch":
+                resultados.append(await conn.fetch(sql, *args))
+            elif modo == "fetchrow":
+                resultados.append(await conn.fetchrow(sql, *args))
+            else:
+                resultados.append(await conn.fetchval(sql, *args))
+    return resultados
+
+
+async def fetch(sql: str, *args) -> list:
+    """Todas las filas de la consulta"""
+    return (await _ejecutar([(sql, args, "fetch")]))[0]
+
+
+async def fetchrow(sql: str, *args):
+    """Primera fila o None"""
+    return (await _ejecutar([(sql, args, "fetchrow")]))[0]
+
+
+async def fetchval(sql: str, *args):
+    """Primer valor de la primera fila o None"""
+    return (await _ejecutar([(sql, args, "fetchval")]))[0]
+
+
+# ============================================================================
+# REPOSITORIO: FACTURAS (app móvil)
+# ============================================================================
+
+SQL_FACTURAS_USUARIO = """
+    SELECT
+        f.id,
+        f.establecimiento,
+        f.total_factura,
+        f.fecha_factura,
+        f.fecha_cargue,
+        f.productos_guardados,
+        f.tiene_imagen,
+        f.estado_validacion,
+        f.cadena
+    FROM facturas f
+    WHERE f.usuario_id = $1
+    ORDER BY f.fecha_cargue DESC
+    LIMIT $2 OFFSET $3
+"""
+
+SQL_TOTAL_FACTURAS_USUARIO = "SELECT COUNT(*) FROM facturas WHERE usuario_id = $1"
+
+
+async def obtener_facturas_usuario(
+    usuario_id: int, limit: int, offset: int
+) -> Tuple[list, int]:
+    """Página de facturas del usuario y total de facturas"""
+    filas, total = await _ejecutar(
+        [
+            (SQL_FACTURAS_USUARIO, (usuario_id, limit, offset), "fetch"),
+            (SQL_TOTAL_FACTURAS_USUARIO, (usuario_id,), "fetchval"),
+        ]
+    )
+    return filas, total or 0
+
+
+# ============================================================================
+# REPOSITORIO: INVENTARIO
+# ============================================================================
+
+SQL_INVENTARIO_USUARIO = """
+    SELECT
+        iu.id,
+        iu.producto_maestro_id,
+        pm.codigo_ean,
+        pm.nombre_consolidado,
+        pm.marca,
+        COALESCE(c.nombre, 'Sin categoría') as categoria,
+        iu.cantidad_actual,
+        iu.unidad_medida,
+        iu.nivel_alerta,
+        iu.fecha_ultima_compra,
+        iu.precio_ultima_compra,
+        iu.precio_promedio,
+        iu.establecimiento,
+        iu.numero_compras,
+        iu.total_gastado,
+        CASE
+            WHEN iu.cantidad_actual <= iu.nivel_alerta THEN 'bajo'
+            WHEN iu.cantidad_actual <= (iu.nivel_alerta * 2) THEN 'medio'
+            ELSE 'normal'
+        END as estado_stock
+    FROM inventario_usuario iu
+    JOIN productos_maestros_v2 pm ON iu.producto_maestro_id = pm.id
+    LEFT JOIN categorias c ON pm.categoria_id = c.id
+    WHERE iu.usuario_id = $1
+    ORDER BY
+        CASE
+            WHEN iu.cantidad_actual <= iu.nivel_alerta THEN 1
+            WHEN iu.cantidad_actual <= (iu.nivel_alerta * 2) THEN 2
+            ELSE 3
+        END,
+        iu.fecha_ultima_actualizacion DESC
+"""
+
+
+async def obtener_inventario_usuario(usuario_id: int) -> list:
+    """Inventario del usuario ordenado por urgencia de reposición"""
+    return await fetch(SQL_INVENTARIO_USUARIO, usuario_id)
+
+
+# ============================================================================
+# REPOSITORIO: COMPARADOR DE PRECIOS
+# ============================================================================
+
+SQL_PRODUCTOS_EN_TIENDA = """
+    SELECT
+        pm.id,
+        pm.nombre_consolidado,
+        pm.marca,
+        pm.codigo_ean,
+        e.id as establecimiento_id,
+        e.nombre_normalizado as establecimiento,
+        ppe.precio_unitario,
+        ppe.fecha_actualizacion,
+        COALESCE(ppe.total_reportes, 1) as veces_visto,
+        COALESCE(ratings.rating_promedio, 0) as rating,
+        COALESCE(ratings.total_calificaciones, 0) as num_opiniones
+    FROM productos_maestros_v2 pm
+    INNER JOIN productos_por_establecimiento ppe
+        ON pm.id = ppe.producto_maestro_id
+    INNER JOIN establecimientos e
+        ON ppe.establecimiento_id = e.id
+    LEFT JOIN (
+        SELECT
+            producto_maestro_id,
+            ROUND(AVG(calificacion), 1) as rating_promedio,
+            COUNT(*) as total_calificaciones
+        FROM calificaciones_productos
+        GROUP BY producto_maestro_id
+    ) ratings ON pm.id = ratings.producto_maestro_id
+    WHERE {condicion}
+      AND ppe.precio_unitario > 0
+      {filtro_establecimiento}
+    ORDER BY {relevancia} DESC
+    LIMIT {limite}
+"""
+
+SQL_ESTABLECIMIENTOS_TODOS = """
+    SELECT id, nombre_normalizado
+    FROM establecimientos
+    ORDER BY nombre_normalizado
+"""
+
+SQL_ESTABLECIMIENTOS_CON_PRODUCTOS = """
+    SELECT
+        e.id,
+        e.nombre_normalizado,
+        e.cadena,
+        COUNT(DISTINCT ppe.producto_maestro_id) as total_productos
+    FROM establecimientos e
+    LEFT JOIN productos_por_establecimiento ppe
+        ON e.id = ppe.establecimiento_id
+    GROUP BY e.id, e.nombre_normalizado, e.cadena
+    HAVING COUNT(DISTINCT ppe.producto_maestro_id) > 0
+    ORDER BY e.cadena, e.nombre_normalizado
+"""
+
+SQL_PRECIOS_COMPARABLES = """
+    SELECT
+        pm.id,
+        pm.codigo_ean,
+        pm.nombre_consolidado,
+        pm.marca,
+        COALESCE(pm.codigo_lecfac, CONCAT('prod-', pm.id)) as codigo_lecfac,
+        COALESCE(c.nombre, 'Sin categoría') as categoria,
+        ppe.codigo_plu,
+        e.nombre_normalizado as establecimiento,
+        ppe.precio_unitario,
+        ppe.fecha_actualizacion,
+        COALESCE(ppe.total_reportes, 1) as total_reportes
+    FROM productos_maestros_v2 pm
+    INNER JOIN productos_por_establecimiento ppe
+        ON pm.id = ppe.producto_maestro_id
+    INNER JOIN establecimientos e
+        ON ppe.establecimiento_id = e.id
+    LEFT JOIN categorias c
+        ON pm.categoria_id = c.id
+    WHERE ppe.precio_unitario > 0
+    ORDER BY codigo_lecfac, ppe.precio_unitario ASC
+"""
+
+SQL_PRODUCTO_LECFAC = """
+    SELECT codigo_lecfac, nombre_consolidado
+    FROM productos_maestros_v2
+    WHERE id = $1
+"""
+
+SQL_PRECIOS_POR_LECFAC = """
+    SELECT
+        pm.id,
+        e.nombre_normalizado,
+        ppe.codigo_plu,
+        ppe.precio_unitario,
+        ppe.fecha_actualizacion,
+        ppe.total_reportes
+    FROM productos_maestros_v2 pm
+    JOIN productos_por_establecimiento ppe ON pm.id = ppe.producto_maestro_id
+    JOIN establecimientos e ON ppe.establecimiento_id = e.id
+    WHERE pm.codigo_lecfac = $1
+    ORDER BY ppe.precio_unitario ASC
+"""
+
+SQL_BUSQUEDA_RAPIDA = """
+    SELECT
+        pm.id,
+        pm.nombre_consolidado,
+        pm.marca,
+        COUNT(DISTINCT ppe.establecimiento_id) as num_tiendas
+    FROM productos_maestros_v2 pm
+    INNER JOIN productos_por_establecimiento ppe
+        ON pm.id = ppe.producto_maestro_id
+    WHERE {condicion}
+      AND ppe.precio_unitario > 0
+    GROUP BY pm.id, pm.nombre_consolidado, pm.marca
+    ORDER BY {relevancia} DESC, num_tiendas DESC, pm.nombre_consolidado
+    LIMIT 10
+"""
+
+# Filas (producto, tienda) que se rankean en Python en el modo tienda
+LIMITE_PRODUCTOS_EN_TIENDA = 200
+
+
+async def _filtro_nombre_maestro(texto: str, primer_param: int = 1):
+    """Filtro por nombre sobre productos_maestros_v2 (alias pm)"""
+    tablas = busqueda_productos.tablas_en_cache()
+    if tablas is None:
+        tablas = await asyncio.to_thread(busqueda_productos.tablas_con_busqueda)
+    return busqueda_productos.filtro_para_tabla(
+        "productos_maestros_v2",
+        texto,
+        alias="pm",
+        primer_param=primer_param,
+        popularidad="veces_visto",
+        tablas=tablas,
+    )
+
+
+async def buscar_productos_en_tienda(
+    texto: str, establecimiento_id: Optional[int] = None
+) -> list:
+    """Productos cuyo nombre coincide con `texto`, con precio y rating"""
+    filtro = await _filtro_nombre_maestro(texto)
+    args = list(filtro.parametros)
+    filtro_establecimiento = ""
+    if establecimiento_id:
+        filtro_establecimiento = f"AND e.id = ${filtro.siguiente}"
+        args.append(establecimiento_id)
+    sql = SQL_PRODUCTOS_EN_TIENDA.format(
+        condicion=filtro.condicion,
+        relevancia=filtro.relevancia,
+        filtro_establecimiento=filtro_establecimiento,
+        limite=LIMITE_PRODUCTOS_EN_TIENDA,
+    )
+    return await fetch(sql, *args)
+
+
+async def listar_establecimientos() -> list:
+    """Todos los establecimientos (id, nombre)"""
+    return await fetch(SQL_ESTABLECIMIENTOS_TODOS)
+
+
+async def listar_establecimientos_con_productos() -> list:
+    """Establecimientos con al menos un producto con precio"""
+    return await fetch(SQL_ESTABLECIMIENTOS_CON_PRODUCTOS)
+
+
+async def obtener_precios_comparables() -> list:
+    """Precios por establecimiento de todos los productos, agrupables por codigo_lecfac"""
+    return await fetch(SQL_PRECIOS_COMPARABLES)
+
+
+async def obtener_precios_producto(producto_id: int):
+    """(codigo_lecfac, nombre) del producto y sus precios por tienda"""
+    if _pool is None:
+        fila = await fetchrow(SQL_PRODUCTO_LECFAC, producto_id)
+        if not fila:
+            return None, []
+        return fila, await fetch(SQL_PRECIOS_POR_LECFAC, fila[0])
+
+    async with _pool.acquire() as conn:
+        fila = await conn.fetchrow(SQL_PRODUCTO_LECFAC, producto_id)
+        if not fila:
+            return None, []
+        return fila, await conn.fetch(SQL_PRECIOS_POR_LECFAC, fila[0])
+
+
+async def buscar_productos_rapido(texto: str) -> list:
+    """Sugerencias de autocompletado (máx. 10)"""
+    filtro = await _filtro_nombre_maestro(texto)
+    sql = SQL_BUSQUEDA_RAPIDA.format(
+        condicion=filtro.condicion, relevancia=filtro.relevancia
+    )
+    return await fetch(sql, *filtro.parametros)
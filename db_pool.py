@@ -0,0 +1,354 @@
+"""
+Pool de Conexiones PostgreSQL
+=============================
+
+Pool de conexiones compartido por todo el proceso. Evita abrir una conexión
+TCP+TLS nueva por cada llamada a get_db_connection().
+
+- Tamaño mínimo/máximo configurable (DB_POOL_MIN / DB_POOL_MAX)
+- Timeout de checkout (DB_POOL_TIMEOUT) en lugar de agotar los slots de Postgres
+- Verificación de conexiones ociosas antes de entregarlas (DB_POOL_CHECK_IDLE)
+- Reciclaje de conexiones viejas (DB_POOL_MAX_LIFETIME)
+
+Las conexiones se entregan envueltas en PooledConnection: el código existente
+sigue llamando conn.close(), que ahora devuelve la conexión al pool.
+
+Uso recomendado en código nuevo:
+
+    from database import conexion_db
+
+    with conexion_db() as conn:
+        cursor = conn.cursor()
+        cursor.execute("SELECT 1")
+
+Autor: LecFac
+Versión: 1.0.0
+"""
+
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Tuple
+
+
+DB_POOL_MIN = int(os.environ.get("DB_POOL_MIN", "1"))
+DB_POOL_MAX = int(os.environ.get("DB_POOL_MAX", "10"))
+DB_POOL_TIMEOUT = float(os.environ.get("DB_POOL_TIMEOUT", "10"))
+DB_POOL_CHECK_IDLE = float(os.environ.get("DB_POOL_CHECK_IDLE", "30"))
+DB_POOL_MAX_LIFETIME = float(os.environ.get("DB_POOL_MAX_LIFETIME", "1800"))
+
+
+class PoolTimeoutError(Exception):
+    """No hubo conexión libre dentro del timeout de checkout"""
+
+
+def _conexion_cerrada(conn) -> bool:
+    """psycopg2 expone closed como int, psycopg3 como bool"""
+    try:
+        return bool(conn.closed)
+    except Exception:
+        return True
+
+
+class PooledConnection:
+    """
+    Envoltorio de una conexión del pool.
+
+    Delega todo a la conexión real excepto close(), que la devuelve al pool.
+    Si el llamador olvida cerrarla, se devuelve al ser recolectada.
+    """
+
+    __slots__ = ("_pool", "_conn", "_devuelta")
+
+    def __init__(self, pool: "ConnectionPool", conn):
+        object.__setattr__(self, "_pool", pool)
+        object.__setattr__(self, "_conn", conn)
+        object.__setattr__(self, "_devuelta", False)
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def __setattr__(self, name, value):
+        setattr(self._conn, name, value)
+
+    def __enter__(self):
+        self._conn.__enter__()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return self._conn.__exit__(exc_type, exc, tb)
+
+    @property
+    def raw(self):
+        """Conexión psycopg subyacente"""
+        return self._conn
+
+    def close(self):
+        """Devuelve la conexión al pool (no la cierra)"""
+        if self._devuelta:
+            return
+        object.__setattr__(self, "_devuelta", True)
+        self._pool.putconn(self._conn)
+
+    def __del__(self):
+        try:
+            if not self._devuelta:
+                self.close()
+        except Exception:
+            pass
+
+
+class ConnectionPool:
+    """Pool de conexiones thread-safe con timeout y health-check"""
+
+    def __init__(
+        self,
+        connect: Callable[[], object],
+        min_size: int = DB_POOL_MIN,
+        max_size: int = DB_POOL_MAX,
+        timeout: float = DB_POOL_TIMEOUT,
+        check_idle: float = DB_POOL_CHECK_IDLE,
+        max_lifetime: float = DB_POOL_MAX_LIFETIME,
+    ):
+        if max_size < 1:
+            raise ValueError("max_size debe ser >= 1")
+
+        self._connect = connect
+        self.min_size = max(0, min(min_size, max_size))
+        self.max_size = max_size
+        self.timeout = timeout
+        self.check_idle = check_idle
+        self.max_lifetime = max_lifetime
+
+        self._cond = threading.Condition()
+        # (conn, creada_en, ultimo_uso)
+        self._idle: List[Tuple[object, float, float]] = []
+        self._creadas: Dict[int, float] = {}
+        self._cerrado = False
+
+        self.stats = {
+            "checkouts": 0,
+            "conexiones_creadas": 0,
+            "conexiones_descartadas": 0,
+            "health_checks_fallidos": 0,
+            "timeouts": 0,
+            "espera_total_s": 0.0,
+        }
+
+    # ------------------------------------------------------------------
+    # Checkout / devolución
+    # ------------------------------------------------------------------
+    def getconn(self, timeout: Optional[float] = None) -> PooledConnection:
+        """Obtiene una conexión del pool, esperando hasta `timeout` segundos"""
+        timeout = self.timeout if timeout is None else timeout
+        inicio = time.monotonic()
+        limite = inicio + timeout
+
+        while True:
+            crear = False
+            with self._cond:
+                if self._cerrado:
+                    raise RuntimeError("El pool de conexiones está cerrado")
+
+                while not self._idle and len(self._creadas) >= self.max_size:
+                    restante = limite - time.monotonic()
+                    if restante <= 0:
+                        self.stats["timeouts"] += 1
+                        raise PoolTimeoutError(
+                            f"Sin conexiones libres tras {timeout:.1f}s "
+                            f"({len(self._creadas)}/{self.max_size} en uso)"
+                        )
+                    self._cond.wait(restante)
+
+                if self._idle:
+                    conn, creada_en, ultimo_uso = self._idle.pop()
+                else:
+                    # Reservar el slot antes de conectar fuera del lock
+                    conn, creada_en, ultimo_uso = None, time.monotonic(), None
+                    crear = True
+                    slot = object()
+                    self._creadas[id(slot)] = creada_en
+
+            if crear:
+                try:
+                    conn = self._connect()
+                except Exception:
+                    with self._cond:
+                        self._creadas.pop(id(slot), None)
+                        self._cond.notify()
+                    raise
+                with self._cond:
+                    self._creadas.pop(id(slot), None)
+                    self._creadas[id(conn)] = creada_en
+                    self.stats["conexiones_creadas"] += 1
+            elif not self._conexion_sana(conn, creada_en, ultimo_uso):
+                self._descartar(conn)
+                continue
+
+            with self._cond:
+                self.stats["checkouts"] += 1
+                self.stats["espera_total_s"] += time.monotonic() - inicio
+            return PooledConnection(self, conn)
+
+    def putconn(self, conn):
+        """Devuelve una conexión al pool dejando la transacción limpia"""
+        if _conexion_cerrada(conn):
+            self._descartar(conn)
+            return
+
+        try:
+            conn.rollback()
+            if getattr(conn, "autocommit", False):
+                conn.autocommit = False
+        except Exception:
+            self._descartar(conn)
+            return
+
+        with self._cond:
+            if self._cerrado:
+                self._cerrar_silencioso(conn)
+                self._creadas.pop(id(conn), None)
+                return
+            creada_en = self._creadas.get(id(conn), time.monotonic())
+            self._idle.append((conn, creada_en, time.monotonic()))
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self, timeout: Optional[float] = None):
+        """Checkout con commit al salir sin error y rollback si hay excepción"""
+        conn = self.getconn(timeout)
+        try:
+            yield conn
+            conn.commit()
+        except Exception:
+            try:
+                conn.rollback()
+            except Exception:
+                pass
+            raise
+        finally:
+            conn.close()
+
+    # ------------------------------------------------------------------
+    # Mantenimiento
+    # ------------------------------------------------------------------
+    def _conexion_sana(self, conn, creada_en: float, ultimo_uso: float) -> bool:
+        """Descarta conexiones cerradas, viejas o que fallan un SELECT 1"""
+        if _conexion_cerrada(conn):
+            return False
+
+        ahora = time.monotonic()
+        if self.max_lifetime and ahora - creada_en > self.max_lifetime:
+            return False
+
+        if ultimo_uso is not None and ahora - ultimo_uso < self.check_idle:
+            return True
+
+        try:
+            cursor = conn.cursor()
+            cursor.execute("SELECT 1")
+            cursor.fetchone()
+            cursor.close()
+            conn.rollback()
+            return True
+        except Exception as e:
+            print(f"⚠️ [POOL] Conexión ociosa inválida, descartando: {e}")
+            with self._cond:
+                self.stats["health_checks_fallidos"] += 1
+            return False
+
+    def _descartar(self, conn):
+        self._cerrar_silencioso(conn)
+        with self._cond:
+            self._creadas.pop(id(conn), None)
+            self.stats["conexiones_descartadas"] += 1
+            self._cond.notify()
+
+    @staticmethod
+    def _cerrar_silencioso(conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def precalentar(self):
+        """Abre min_size conexiones por adelantado"""
+        conexiones = []
+        try:
+            for _ in range(self.min_size):
+                conexiones.append(self.getconn())
+        finally:
+            for conn in conexiones:
+                conn.close()
+
+    def cerrar(self):
+        """Cierra todas las conexiones ociosas y rechaza nuevos checkouts"""
+        with self._cond:
+            self._cerrado = True
+            idle, self._idle = self._idle, []
+            for conn, _, _ in idle:
+                self._creadas.pop(id(conn), None)
+            self._cond.notify_all()
+        for conn, _, _ in idle:
+            self._cerrar_silencioso(conn)
+
+    def estado(self) -> Dict:
+        """Estado actual del pool para monitoreo"""
+        with self._cond:
+            total = len(self._creadas)
+            libres = len(self._idle)
+            checkouts = self.stats["checkouts"]
+            return {
+                "min_size": self.min_size,
+                "max_size": self.max_size,
+                "abiertas": total,
+                "libres": libres,
+                "en_uso": total - libres,
+                "espera_promedio_ms": round(
+                    self.stats["espera_total_s"] * 1000 / checkouts, 2
+                )
+                if checkouts
+                else 0.0,
+                **self.stats,
+            }
+
+
+# ============================================================================
+# POOLS GLOBALES (uno por DSN)
+# ============================================================================
+
+_pools: Dict[str, ConnectionPool] = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(dsn: str, connect: Callable[[], object]) -> ConnectionPool:
+    """Devuelve el pool del proceso para `dsn`, creándolo la primera vez"""
+    pool = _pools.get(dsn)
+    if pool is not None:
+        return pool
+
+    with _pools_lock:
+        pool = _pools.get(dsn)
+        if pool is None:
+            pool = ConnectionPool(connect)
+            _pools[dsn] = pool
+            print(
+                f"✅ [POOL] Pool PostgreSQL creado "
+                f"(min={pool.min_size}, max={pool.max_size}, timeout={pool.timeout}s)"
+            )
+        return pool
+
+
+def estado_pools() -> List[Dict]:
+    """Estado de todos los pools del proceso"""
+    return [pool.estado() for pool in list(_pools.values())]
+
+
+def cerrar_pools():
+    """Cierra todos los pools (shutdown de la aplicación)"""
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.cerrar()
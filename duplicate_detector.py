@@ -10,305 +10,44 @@ CAMBIOS V2.0:
 - ✅ Normaliza errores OCR comunes (H→M, N→M en metros)
 - ✅ Extrae y compara metros para papel higiénico
 - ✅ Mantiene cantidad=1 para video (no suma frames)
+- ✅ Bloques de candidatos (código, clave, tramo de precio, marca) y
+  union-find: la similitud fuzzy solo se calcula dentro de cada bloque y
+  los grupos no dependen del orden de los frames
 
 AUTOR: LecFac Team
 ÚLTIMA ACTUALIZACIÓN: 2025-12-08
 ==================================================================
 """
 
+import math
 import os
 import re
 from typing import List, Dict, Tuple, Optional
 from difflib import SequenceMatcher
 
+import motor_similitud
+import normalizacion_nombres
+from normalizacion_nombres import extraer_marca, memoizar
 
-# =============================================================================
-# DICCIONARIO DE ABREVIATURAS COLOMBIANAS (del product_matcher V10.3)
-# =============================================================================
-ABREVIATURAS_COLOMBIA = {
-    # Papel higiénico y limpieza
-    "P HIG": "PAPEL HIGIENICO",
-    "PAP HIG": "PAPEL HIGIENICO",
-    "P ATG": "PAPEL HIGIENICO",  # Error OCR común
-    "P HTG": "PAPEL HIGIENICO",  # Error OCR
-    "PHIG": "PAPEL HIGIENICO",
-    "PAP": "PAPEL",
-    "HIG": "HIGIENICO",
-    "ROSAL30H": "ROSAL 30M",  # H es error OCR de M
-    "ROSAL30N": "ROSAL 30M",  # N es error OCR de M
-    "ROSAL30M": "ROSAL 30M",
-    "ROSALSON": "ROSAL 30M",  # Error OCR
-    "ROSAL3OH": "ROSAL 30M",  # O en vez de 0
-    "ULTRACONF": "ULTRACONFORT",
-    "ULTRACNF": "ULTRACONFORT",
-    # Huevos
-    "HUEV": "HUEVOS",
-    "HVS": "HUEVOS",
-    "AA": "TIPO AA",
-    "AAA": "TIPO AAA",
-    "X30": "30 UNIDADES",
-    "X30UND": "30 UNIDADES",
-    "X30UHD": "30 UNIDADES",  # Error OCR
-    "X15": "15 UNIDADES",
-    "X12": "12 UNIDADES",
-    "X12UND": "12 UNIDADES",
-    "X12R": "12 ROLLOS",
-    # Aceites y grasas
-    "ACE": "ACEITE",
-    "ACE VEG": "ACEITE VEGETAL",
-    "ACEIT": "ACEITE",
-    "VEG": "VEGETAL",
-    "VEGETAL": "VEGETAL",
-    "GIRAS": "GIRASOL",
-    "MZLLA": "MAZOLA",
-    # Lácteos
-    "LCH": "LECHE",
-    "LECH": "LECHE",
-    "YOG": "YOGURT",
-    "YOGH": "YOGURT",
-    "QSO": "QUESO",
-    "QESO": "QUESO",
-    "MANT": "MANTEQUILLA",
-    "MARG": "MARGARINA",
-    "DESLA": "DESLACTOSADA",
-    "DESLAC": "DESLACTOSADA",
-    "SEMIDES": "SEMIDESCREMADA",
-    "DESC": "DESCREMADA",
-    "ENT": "ENTERA",
-    # Carnes
-    "PCH": "PECHUGA",
-    "PECH": "PECHUGA",
-    "PLL": "POLLO",
-    "POLL": "POLLO",
-    "CRN": "CARNE",
-    "CARN": "CARNE",
-    "RES": "RES",
-    "CRD": "CERDO",
-    "CERD": "CERDO",
-    "MOL": "MOLIDA",
-    "MOLD": "MOLIDA",
-    "COST": "COSTILLA",
-    "CHUL": "CHULETA",
-    "LOM": "LOMO",
-    # Bebidas
-    "GAS": "GASEOSA",
-    "GASS": "GASEOSA",
-    "JGO": "JUGO",
-    "JUG": "JUGO",
-    "AGU": "AGUA",
-    "CCA": "COCA COLA",
-    "CCOLA": "COCA COLA",
-    "PPS": "PEPSI",
-    "PEPS": "PEPSI",
-    "POSTB": "POSTOBON",
-    "POSTBN": "POSTOBON",
-    # Limpieza
-    "JAB": "JABON",
-    "JAB LAV": "JABON LAVAPLATOS",
-    "LAVAP": "LAVAPLATOS",
-    "DET": "DETERGENTE",
-    "DETERG": "DETERGENTE",
-    "LIMP": "LIMPIADOR",
-    "LIMPIA": "LIMPIADOR",
-    "DESINF": "DESINFECTANTE",
-    "CLOR": "CLORO",
-    "BLNQ": "BLANQUEADOR",
-    "SUAV": "SUAVIZANTE",
-    "SUAVIZ": "SUAVIZANTE",
-    # Panadería
-    "PN": "PAN",
-    "PAND": "PANDEBONO",
-    "PDBON": "PANDEBONO",
-    "ALMOJ": "ALMOJABANA",
-    "BUNS": "PANES",
-    "TAJD": "TAJADO",
-    "TAJ": "TAJADO",
-    "INTEG": "INTEGRAL",
-    "INTGR": "INTEGRAL",
-    "BLA": "BLANCO",
-    "BLANC": "BLANCO",
-    # Snacks
-    "PAP FRT": "PAPAS FRITAS",
-    "PAPFRT": "PAPAS FRITAS",
-    "PAP FR": "PAPAS FRITAS",
-    "CHOC": "CHOCOLATE",
-    "CHOCOL": "CHOCOLATE",
-    "GALL": "GALLETAS",
-    "GALLT": "GALLETAS",
-    # Granos y cereales
-    "ARR": "ARROZ",
-    "ARRZ": "ARROZ",
-    "FRIJ": "FRIJOL",
-    "FRIJL": "FRIJOL",
-    "LENT": "LENTEJA",
-    "LENTJ": "LENTEJA",
-    "GARB": "GARBANZO",
-    "AVN": "AVENA",
-    "AVEN": "AVENA",
-    # Frutas y verduras
-    "TOM": "TOMATE",
-    "TOMT": "TOMATE",
-    "CEB": "CEBOLLA",
-    "CEBL": "CEBOLLA",
-    "ZAN": "ZANAHORIA",
-    "ZANAH": "ZANAHORIA",
-    "PAP": "PAPA",
-    "PLAT": "PLATANO",
-    "BANAN": "BANANO",
-    "MZN": "MANZANA",
-    "MANZ": "MANZANA",
-    "NAR": "NARANJA",
-    "NARNJ": "NARANJA",
-    "LIM": "LIMON",
-    "LIMN": "LIMON",
-    # Marcas comunes
-    "FAM": "FAMILIA",
-    "FAML": "FAMILIA",
-    "ALPN": "ALPINA",
-    "ALP": "ALPINA",
-    "COLNT": "COLANTA",
-    "COL": "COLANTA",
-    "ALQ": "ALQUERIA",
-    "ALQR": "ALQUERIA",
-    "ZNU": "ZENU",
-    "RCHM": "RANCHERA",
-    "RNCH": "RANCHERA",
-    "KOIPE": "KOIPE",
-    "GOURM": "GOURMET",
-    "PREM": "PREMIUM",
-    # Unidades y cantidades
-    "UND": "UNIDADES",
-    "UHD": "UNIDADES",  # Error OCR
-    "UDS": "UNIDADES",
-    "GR": "GRAMOS",
-    "GRS": "GRAMOS",
-    "KG": "KILOGRAMOS",
-    "KGS": "KILOGRAMOS",
-    "ML": "MILILITROS",
-    "MLS": "MILILITROS",
-    "LT": "LITROS",
-    "LTS": "LITROS",
-    "PZS": "PIEZAS",
-    "PCS": "PIEZAS",
-}
+# Diferencia máxima de precio entre dos lecturas del mismo producto
+TOLERANCIA_PRECIO = 0.15
+# Ancho de los tramos logarítmicos de precio: dos precios a ±15% caen en el
+# mismo tramo o en tramos contiguos
+ANCHO_TRAMO_PRECIO = -math.log(1 - TOLERANCIA_PRECIO)
 
 
 # =============================================================================
-# MARCAS CONOCIDAS (para evitar confusiones en matching)
+# ABREVIATURAS Y MARCAS (diccionarios en normalizacion_nombres)
 # =============================================================================
-MARCAS_CONOCIDAS = {
-    # Papel y limpieza
-    "ROSAL",
-    "FAMILIA",
-    "SCOTT",
-    "ELITE",
-    "SUAVE",
-    "COTTONELLE",
-    "RENOVA",
-    "NEVAX",
-    "PETALO",
-    # Huevos
-    "ORO",
-    "KIKES",
-    "SANTAREYES",
-    "HUEVOS ORO",
-    "CAMPO VERDE",
-    # Lácteos
-    "ALPINA",
-    "COLANTA",
-    "ALQUERIA",
-    "PARMALAT",
-    "CELEMA",
-    "COOLECHERA",
-    "ALGARRA",
-    "NORMANDY",
-    "YOPLAIT",
-    "DANONE",
-    "NESTLE",
-    "POMAR",
-    # Carnes
-    "ZENU",
-    "RANCHERA",
-    "PIETRÁN",
-    "RICA",
-    "KOIPE",
-    "SUIZO",
-    # Bebidas
-    "COCA COLA",
-    "PEPSI",
-    "POSTOBON",
-    "BIG COLA",
-    "COLOMBIANA",
-    "JUGOS HIT",
-    "FRUTIÑO",
-    "COUNTRY HILL",
-    "DEL VALLE",
-    # Snacks
-    "MARGARITA",
-    "SUPER RICAS",
-    "YUPI",
-    "FRITO LAY",
-    "RAMO",
-    "NOEL",
-    "COLOMBINA",
-    "DUCALES",
-    "FESTIVAL",
-    "CHOCORAMO",
-    # Aceites
-    "MAZOLA",
-    "GOURMET",
-    "PREMIER",
-    "OLEOCALI",
-    "LA BUENA",
-    # Limpieza
-    "FAB",
-    "ARIEL",
-    "DERSA",
-    "TOP",
-    "AXION",
-    "LIS",
-    "CLOROX",
-    "FABULOSO",
-    "VANISH",
-    # Supermercados (marcas propias)
-    "EKONO",
-    "MARCA PROPIA",
-    "ARA",
-    "EXITO",
-    "JUMBO",
-    "OLIMPICA",
-    "D1",
-    "CARULLA",
-    "ALKOSTO",
-}
-
-
 def expandir_abreviaturas(nombre: str) -> str:
     """
-    Expande abreviaturas colombianas en el nombre del producto.
+    Expande abreviaturas colombianas en el nombre del producto, con los
+    errores de OCR de video (perfil "video" de normalizacion_nombres).
 
     Ejemplo:
         "P HIG ROSAL30H 12UND" → "PAPEL HIGIENICO ROSAL 30M 12 UNIDADES"
     """
-    if not nombre:
-        return ""
-
-    nombre_upper = nombre.upper().strip()
-
-    # Ordenar abreviaturas de mayor a menor longitud para evitar reemplazos parciales
-    abreviaturas_ordenadas = sorted(
-        ABREVIATURAS_COLOMBIA.items(), key=lambda x: len(x[0]), reverse=True
-    )
-
-    for abrev, expansion in abreviaturas_ordenadas:
-        # Buscar la abreviatura como palabra completa o al inicio/final
-        patron = r"\b" + re.escape(abrev) + r"\b"
-        nombre_upper = re.sub(patron, expansion, nombre_upper)
-
-    # Normalizar espacios múltiples
-    nombre_upper = " ".join(nombre_upper.split())
-
-    return nombre_upper
+    return normalizacion_nombres.expandir_abreviaturas(nombre, "video")
 
 
 def extraer_metros(nombre: str) -> Optional[int]:
@@ -376,22 +115,6 @@ def extraer_cantidad(nombre: str) -> Optional[int]:
     return None
 
 
-def extraer_marca(nombre: str) -> Optional[str]:
-    """
-    Extrae la marca del nombre si está en la lista de marcas conocidas.
-    """
-    if not nombre:
-        return None
-
-    nombre_upper = nombre.upper()
-
-    for marca in MARCAS_CONOCIDAS:
-        if marca in nombre_upper:
-            return marca
-
-    return None
-
-
 def calcular_similitud(nombre1: str, nombre2: str) -> float:
     """
     Calcula la similitud entre dos nombres usando SequenceMatcher.
@@ -416,6 +139,20 @@ def normalizar_nombre_para_comparacion(nombre: str) -> Dict:
             "clave_agrupacion": str
         }
     """
+    nombre_expandido, metros, cantidad, marca, clave = _caracteristicas(nombre)
+    return {
+        "nombre_original": nombre,
+        "nombre_expandido": nombre_expandido,
+        "metros": metros,
+        "cantidad": cantidad,
+        "marca": marca,
+        "clave_agrupacion": clave,
+    }
+
+
+@memoizar("duplicados")
+def _caracteristicas(nombre: str) -> Tuple:
+    """(expandido, metros, cantidad, marca, clave); se repite en cada par comparado"""
     nombre_expandido = expandir_abreviaturas(nombre)
     metros = extraer_metros(nombre)
     cantidad = extraer_cantidad(nombre)
@@ -451,18 +188,14 @@ def normalizar_nombre_para_comparacion(nombre: str) -> Dict:
 
     clave = "_".join(sorted(partes_clave)) if partes_clave else nombre_expandido[:20]
 
-    return {
-        "nombre_original": nombre,
-        "nombre_expandido": nombre_expandido,
-        "metros": metros,
-        "cantidad": cantidad,
-        "marca": marca,
-        "clave_agrupacion": clave,
-    }
+    return nombre_expandido, metros, cantidad, marca, clave
 
 
 def son_productos_similares(
-    prod1: Dict, prod2: Dict, umbral_similitud: float = 0.75
+    prod1: Dict,
+    prod2: Dict,
+    umbral_similitud: float = 0.75,
+    similitud: Optional[float] = None,
 ) -> bool:
     """
     Determina si dos productos son probablemente el mismo basándose en:
@@ -470,6 +203,9 @@ def son_productos_similares(
     2. Marca coincidente (si ambos tienen marca)
     3. Metros coincidentes (si ambos tienen metros)
     4. Precio similar (±10%)
+
+    `similitud` permite pasar la similitud ya calculada en bloque
+    (motor_similitud.pares_similares)
     """
     info1 = normalizar_nombre_para_comparacion(prod1.get("nombre", ""))
     info2 = normalizar_nombre_para_comparacion(prod2.get("nombre", ""))
@@ -479,7 +215,10 @@ def son_productos_similares(
         return True
 
     # Similitud de nombre expandido
-    similitud = calcular_similitud(info1["nombre_expandido"], info2["nombre_expandido"])
+    if similitud is None:
+        similitud = calcular_similitud(
+            info1["nombre_expandido"], info2["nombre_expandido"]
+        )
 
     if similitud < umbral_similitud:
         return False
@@ -498,12 +237,180 @@ def son_productos_similares(
 
     if precio1 > 0 and precio2 > 0:
         diferencia_precio = abs(precio1 - precio2) / max(precio1, precio2)
-        if diferencia_precio > 0.15:  # Más de 15% de diferencia
+        if diferencia_precio > TOLERANCIA_PRECIO:  # Más de 15% de diferencia
             return False
 
     return True
 
 
+# =============================================================================
+# AGRUPACIÓN: BLOQUES DE CANDIDATOS + UNION-FIND
+# =============================================================================
+class _UnionFind:
+    """
+    Conjuntos disjuntos; la raíz de cada conjunto es su menor índice.
+
+    Cada raíz guarda las marcas, metros y rango de precios del conjunto para
+    no encadenar por similitud productos que no pueden ser el mismo.
+    """
+
+    def __init__(self, productos: List[Dict]):
+        self.padre = list(range(len(productos)))
+        self.marcas = [{p["marca"]} if p["marca"] else set() for p in productos]
+        self.metros = [{p["metros"]} if p["metros"] else set() for p in productos]
+        self.precios = [
+            (p["valor"], p["valor"]) if p["valor"] > 0 else None for p in productos
+        ]
+
+    def raiz(self, i: int) -> int:
+        while self.padre[i] != i:
+            self.padre[i] = self.padre[self.padre[i]]
+            i = self.padre[i]
+        return i
+
+    def compatibles(self, i: int, j: int) -> bool:
+        """Una sola marca, unos solos metros y precios a ±15% al unirlos"""
+        ri, rj = self.raiz(i), self.raiz(j)
+        if len(self.marcas[ri] | self.marcas[rj]) > 1:
+            return False
+        if len(self.metros[ri] | self.metros[rj]) > 1:
+            return False
+        pi, pj = self.precios[ri], self.precios[rj]
+        if pi and pj:
+            minimo, maximo = min(pi[0], pj[0]), max(pi[1], pj[1])
+            if (maximo - minimo) / maximo > TOLERANCIA_PRECIO:
+                return False
+        return True
+
+    def unir(self, i: int, j: int):
+        ri, rj = self.raiz(i), self.raiz(j)
+        if ri == rj:
+            return
+        raiz, hijo = min(ri, rj), max(ri, rj)
+        self.padre[hijo] = raiz
+        self.marcas[raiz] |= self.marcas[hijo]
+        self.metros[raiz] |= self.metros[hijo]
+        pr, ph = self.precios[raiz], self.precios[hijo]
+        if pr and ph:
+            self.precios[raiz] = (min(pr[0], ph[0]), max(pr[1], ph[1]))
+        else:
+            self.precios[raiz] = pr or ph
+
+
+def _tramo_precio(valor: float) -> int:
+    return math.floor(math.log(valor) / ANCHO_TRAMO_PRECIO)
+
+
+def _bloques_fuzzy(productos: List[Dict]) -> List[List[int]]:
+    """
+    Índices que vale la pena comparar con similitud fuzzy.
+
+    son_productos_similares descarta precios a más de ±15% y marcas
+    distintas, así que cada bloque es un tramo de precio más el contiguo,
+    partido por marca. Los productos sin precio o sin marca son compatibles
+    con todos y entran en cada bloque.
+    """
+    tramos: Dict[int, List[int]] = {}
+    sin_precio = []
+    for i, prod in enumerate(productos):
+        if not prod["nombre_expandido"]:
+            continue
+        if prod["valor"] > 0:
+            tramos.setdefault(_tramo_precio(prod["valor"]), []).append(i)
+        else:
+            sin_precio.append(i)
+
+    ventanas = [
+        tramos[t] + tramos.get(t + 1, []) + sin_precio
+        for t in sorted(tramos)
+        if t - 1 not in tramos or t + 1 in tramos
+    ] or [sin_precio]
+
+    bloques = []
+    for ventana in ventanas:
+        por_marca: Dict[str, List[int]] = {}
+        sin_marca = []
+        for i in sorted(ventana):
+            marca = productos[i]["marca"]
+            if marca:
+                por_marca.setdefault(marca, []).append(i)
+            else:
+                sin_marca.append(i)
+        for marca in sorted(por_marca):
+            bloques.append(sorted(por_marca[marca] + sin_marca))
+        if not por_marca:
+            bloques.append(sin_marca)
+    return [bloque for bloque in bloques if len(bloque) > 1]
+
+
+def agrupar_productos(
+    productos: List[Dict], umbral_similitud: float = 0.75
+) -> Tuple[List[List[Dict]], int, int]:
+    """
+    Agrupa lecturas del mismo producto (productos normalizados del PASO 1).
+
+    1. Mismo código o misma clave de agrupación → mismo grupo, sin fuzzy
+    2. Similitud fuzzy (motor_similitud) solo dentro de cada bloque de
+       _bloques_fuzzy; cada par se valida con son_productos_similares
+    3. Los pares fuzzy se unen de mayor a menor similitud (desempate por
+       nombre y precio, no por posición) y solo si los grupos siguen siendo
+       compatibles: el resultado no depende del orden de los frames
+
+    Cada grupo queda en orden de aparición y los grupos ordenados por su
+    primer producto.
+
+    Returns:
+        (grupos, bloques comparados, pares candidatos)
+    """
+    uf = _UnionFind(productos)
+
+    primero: Dict[str, int] = {}
+    for i, prod in enumerate(productos):
+        claves = ["clave:" + prod["clave_agrupacion"]]
+        if prod["codigo"]:
+            claves.append("codigo:" + prod["codigo"])
+        for clave in claves:
+            uf.unir(primero.setdefault(clave, i), i)
+
+    bloques = _bloques_fuzzy(productos)
+    pares_comparados = 0
+    candidatos: Dict[Tuple[int, int], float] = {}
+    for bloque in bloques:
+        pares_comparados += len(bloque) * (len(bloque) - 1) // 2
+        similares = motor_similitud.pares_similares(
+            [productos[i]["nombre_expandido"].lower() for i in bloque],
+            umbral_similitud,
+        )
+        for (a, b), similitud in similares.items():
+            candidatos[(bloque[a], bloque[b])] = similitud
+
+    def orden(par):
+        i, j = par
+        lados = sorted(
+            [
+                (productos[i]["nombre"], productos[i]["valor"]),
+                (productos[j]["nombre"], productos[j]["valor"]),
+            ]
+        )
+        return (-candidatos[par], lados)
+
+    for i, j in sorted(candidatos, key=orden):
+        if uf.raiz(i) == uf.raiz(j) or not uf.compatibles(i, j):
+            continue
+        if son_productos_similares(
+            {"nombre": productos[i]["nombre"], "valor": productos[i]["valor"]},
+            {"nombre": productos[j]["nombre"], "valor": productos[j]["valor"]},
+            umbral_similitud,
+            candidatos[(i, j)],
+        ):
+            uf.unir(i, j)
+
+    por_raiz: Dict[int, List[Dict]] = {}
+    for i, prod in enumerate(productos):
+        por_raiz.setdefault(uf.raiz(i), []).append(prod)
+    return [por_raiz[r] for r in sorted(por_raiz)], len(bloques), pares_comparados
+
+
 def detectar_duplicados_automaticamente(
     productos: List[Dict],
     total_factura: float,
@@ -589,47 +496,13 @@ def detectar_duplicados_automaticamente(
             print(f"   '{prod['nombre'][:40]}' → '{prod['nombre_expandido'][:40]}'")
 
     # PASO 2: Agrupar productos similares
-    grupos = []  # Lista de grupos, cada grupo es una lista de productos similares
-    productos_asignados = set()
-
-    for i, prod1 in enumerate(productos_normalizados):
-        if i in productos_asignados:
-            continue
-
-        # Crear nuevo grupo con este producto
-        grupo = [prod1]
-        productos_asignados.add(i)
-
-        # Buscar productos similares
-        for j, prod2 in enumerate(productos_normalizados):
-            if j in productos_asignados:
-                continue
-
-            # Primero: verificar por código si ambos tienen
-            if prod1["codigo"] and prod2["codigo"]:
-                if prod1["codigo"] == prod2["codigo"]:
-                    grupo.append(prod2)
-                    productos_asignados.add(j)
-                    continue
-
-            # Segundo: verificar por clave de agrupación
-            if prod1["clave_agrupacion"] == prod2["clave_agrupacion"]:
-                grupo.append(prod2)
-                productos_asignados.add(j)
-                continue
-
-            # Tercero: verificar por similitud fuzzy
-            if son_productos_similares(
-                {"nombre": prod1["nombre"], "valor": prod1["valor"]},
-                {"nombre": prod2["nombre"], "valor": prod2["valor"]},
-                umbral_similitud,
-            ):
-                grupo.append(prod2)
-                productos_asignados.add(j)
-
-        grupos.append(grupo)
+    # Union-find sobre claves exactas y pares fuzzy dentro de cada bloque
+    grupos, bloques, pares_comparados = agrupar_productos(
+        productos_normalizados, umbral_similitud
+    )
 
     print(f"\n📦 Grupos únicos identificados: {len(grupos)}")
+    print(f"   Bloques fuzzy: {bloques} ({pares_comparados} pares candidatos)")
 
     # PASO 3: Consolidar cada grupo en un solo producto
     productos_consolidados = []
@@ -726,6 +599,8 @@ def detectar_duplicados_automaticamente(
             "productos_despues_limpieza": len(productos_consolidados),
             "duplicados_consolidados": duplicados_eliminados,
             "grupos_identificados": len(grupos),
+            "bloques_fuzzy": bloques,
+            "pares_comparados": pares_comparados,
             "diferencia_total": diferencia,
             "diferencia_porcentaje": diferencia_porcentaje,
             "suma_productos": suma_productos,
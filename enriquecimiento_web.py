@@ -0,0 +1,333 @@
+"""
+Enriquecimiento Web (VTEX) en Segundo Plano
+===========================================
+
+Saca el PASO 3 de product_matcher (búsqueda en la API VTEX de Carulla,
+Éxito, Jumbo, ...) de la transacción que guarda la factura.
+
+- Las líneas sin match en PAPA/auditoría se guardan de inmediato con el
+  dato de cache VTEX / PLU existente / OCR y el producto queda marcado
+  enriquecimiento_web = 'pendiente'
+- Al confirmar la factura se encola un trabajo "enriquecer_web" en la cola
+  durable (job_queue) con todas esas líneas, en la misma transacción
+- El worker lanza las búsquedas VTEX en paralelo (pool propio de hilos con
+  límite global y límite por host) y luego valida cada resultado contra
+  auditoría y actualiza el producto, igual que lo habría hecho el PASO 3
+
+Así el tiempo de guardado de una factura ya no depende de lo que tarden
+las páginas de los supermercados. ENRIQUECIMIENTO_WEB_MODO=sync vuelve al
+flujo anterior (también se usa sin PostgreSQL, donde no hay cola).
+
+Autor: LecFac
+Versión: 1.0.0
+"""
+
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+from urllib.parse import urlparse
+
+import fusion_productos
+from job_queue import encolar_trabajo
+from web_enricher import WebEnricher, es_tienda_vtex, obtener_url_vtex
+
+# async = diferir a la cola | sync = buscar durante el guardado
+ENRIQUECIMIENTO_WEB_MODO = os.environ.get("ENRIQUECIMIENTO_WEB_MODO", "async").lower()
+# Búsquedas VTEX simultáneas en el proceso y por host
+ENRIQUECIMIENTO_WEB_CONCURRENCIA = int(
+    os.environ.get("ENRIQUECIMIENTO_WEB_CONCURRENCIA", "16")
+)
+ENRIQUECIMIENTO_WEB_POR_HOST = int(os.environ.get("ENRIQUECIMIENTO_WEB_POR_HOST", "4"))
+
+TIPO_TRABAJO = "enriquecer_web"
+
+# Valores de productos_maestros_v2.enriquecimiento_web
+PENDIENTE = "pendiente"
+COMPLETADO = "completado"
+SIN_RESULTADO = "sin_resultado"
+FUSIONADO = "fusionado"
+
+_executor = ThreadPoolExecutor(
+    max_workers=ENRIQUECIMIENTO_WEB_CONCURRENCIA, thread_name_prefix="vtex"
+)
+_semaforos_host: Dict[str, threading.BoundedSemaphore] = {}
+_lock = threading.Lock()
+_stats = {
+    "trabajos": 0,
+    "lineas": 0,
+    "encontradas": 0,
+    "actualizadas": 0,
+    "fusionadas": 0,
+    "sin_resultado": 0,
+    "descartadas": 0,
+    "ms_busqueda_total": 0.0,
+}
+
+
+def web_asincrono() -> bool:
+    """True si el PASO 3 se difiere a la cola (requiere PostgreSQL)"""
+    return (
+        ENRIQUECIMIENTO_WEB_MODO == "async"
+        and os.environ.get("DATABASE_TYPE", "sqlite").lower() == "postgresql"
+    )
+
+
+def debe_diferirse(establecimiento: str) -> bool:
+    """La línea habría pasado por el PASO 3 y este se hace en segundo plano"""
+    return web_asincrono() and es_tienda_vtex(establecimiento)
+
+
+def _sumar(**valores):
+    with _lock:
+        for clave, valor in valores.items():
+            _stats[clave] += valor
+
+
+def estadisticas() -> Dict:
+    with _lock:
+        stats = dict(_stats)
+    total = stats.pop("ms_busqueda_total")
+    stats.update(
+        {
+            "modo": "async" if web_asincrono() else "sync",
+            "concurrencia": ENRIQUECIMIENTO_WEB_CONCURRENCIA,
+            "por_host": ENRIQUECIMIENTO_WEB_POR_HOST,
+            "ms_promedio_busqueda": (
+                round(total / stats["lineas"], 1) if stats["lineas"] else 0.0
+            ),
+        }
+    )
+    return stats
+
+
+# ============================================================================
+# PRODUCTOR (durante el guardado de la factura)
+# ============================================================================
+
+
+def diferir(
+    lineas: List[Dict],
+    establecimiento_id: int,
+    establecimiento_nombre: str,
+    cursor,
+    conn,
+) -> Optional[str]:
+    """
+    Marca los productos como pendientes y encola el trabajo, en la
+    transacción del llamador (no hace commit).
+
+    Args:
+        lineas: [{"producto_id", "plu", "nombre", "precio"}, ...]
+
+    Returns:
+        job_id del trabajo encolado
+    """
+    if not lineas:
+        return None
+
+    cursor.execute(
+        """
+        UPDATE productos_maestros_v2
+        SET enriquecimiento_web = %s
+        WHERE id = ANY(%s)
+    """,
+        (PENDIENTE, sorted({l["producto_id"] for l in lineas})),
+    )
+    job_id = encolar_trabajo(
+        TIPO_TRABAJO,
+        {
+            "establecimiento_id": establecimiento_id,
+            "establecimiento": establecimiento_nombre,
+            "lineas": lineas,
+        },
+        conn=conn,
+    )
+    print(f"   🌐 [WEB] {len(lineas)} líneas diferidas al trabajo {job_id}")
+    return job_id
+
+
+# ============================================================================
+# CONSUMIDOR (worker de job_queue)
+# ============================================================================
+
+
+def _semaforo(establecimiento: str) -> threading.BoundedSemaphore:
+    host = urlparse(obtener_url_vtex(establecimiento) or "").netloc
+    with _lock:
+        if host not in _semaforos_host:
+            _semaforos_host[host] = threading.BoundedSemaphore(
+                ENRIQUECIMIENTO_WEB_POR_HOST
+            )
+        return _semaforos_host[host]
+
+
+def _buscar(linea: Dict, establecimiento: str):
+    """Búsqueda VTEX bloqueante de una línea (corre en el pool de hilos)"""
+    with _semaforo(establecimiento):
+        inicio = time.perf_counter()
+        resultado = WebEnricher().enriquecer(
+            codigo=linea["plu"],
+            nombre_ocr=linea["nombre"],
+            establecimiento=establecimiento,
+            precio_ocr=linea["precio"] or 0,
+        )
+    _sumar(lineas=1, ms_busqueda_total=(time.perf_counter() - inicio) * 1000)
+    return resultado
+
+
+async def buscar_lineas(lineas: List[Dict], establecimiento: str) -> List:
+    """Todas las búsquedas VTEX de un trabajo en paralelo"""
+    loop = asyncio.get_running_loop()
+    return await asyncio.gather(
+        *(
+            loop.run_in_executor(_executor, _buscar, linea, establecimiento)
+            for linea in lineas
+        )
+    )
+
+
+def aplicar_resultado(cursor, linea: Dict, web: Optional[Dict]) -> str:
+    """
+    Actualiza el producto de la línea con el dato web (ya validado contra
+    auditoría). Solo mejora: si el producto ya tiene igual o más confianza
+    (o es PAPA) queda como está.
+
+    Si el EAN web ya es de otro producto y el de la línea era un producto
+    creado solo con OCR, ese producto se fusiona en el que tiene el EAN
+    (como habría hecho crear_o_actualizar_producto en el flujo síncrono).
+
+    Returns:
+        Nuevo valor de enriquecimiento_web
+    """
+    producto_id = linea["producto_id"]
+    cursor.execute(
+        """
+        SELECT confianza_datos, fuente_datos, es_producto_papa
+        FROM productos_maestros_v2
+        WHERE id = %s
+    """,
+        (producto_id,),
+    )
+    row = cursor.fetchone()
+    if not row:
+        return SIN_RESULTADO
+
+    if not web:
+        estado = SIN_RESULTADO
+    elif row[2] or float(row[0] or 0) >= web["confianza"]:
+        estado = COMPLETADO
+        _sumar(descartadas=1)
+    else:
+        estado = COMPLETADO
+        destino = None
+        if web.get("codigo_ean"):
+            cursor.execute(
+                """
+                SELECT id FROM productos_maestros_v2
+                WHERE codigo_ean = %s AND id <> %s
+                ORDER BY id
+                LIMIT 1
+            """,
+                (web["codigo_ean"], producto_id),
+            )
+            fila = cursor.fetchone()
+            destino = fila[0] if fila else None
+
+        if destino and row[1] == "OCR":
+            _mover_a_producto(cursor, producto_id, destino)
+            _actualizar_producto(cursor, destino, web, con_ean=False)
+            estado = FUSIONADO
+            _sumar(fusionadas=1)
+        else:
+            _actualizar_producto(cursor, producto_id, web, con_ean=destino is None)
+            _sumar(actualizadas=1)
+
+    cursor.execute(
+        """
+        UPDATE productos_maestros_v2
+        SET enriquecimiento_web = %s
+        WHERE id = %s
+    """,
+        (estado, producto_id),
+    )
+    return estado
+
+
+def _actualizar_producto(cursor, producto_id: int, web: Dict, con_ean: bool):
+    cursor.execute(
+        """
+        UPDATE productos_maestros_v2
+        SET nombre_consolidado = COALESCE(%s, nombre_consolidado),
+            codigo_ean = COALESCE(%s, codigo_ean),
+            marca = COALESCE(%s, marca),
+            fuente_datos = %s,
+            confianza_datos = %s
+        WHERE id = %s
+    """,
+        (
+            web.get("nombre") or None,
+            (web.get("codigo_ean") or None) if con_ean else None,
+            web.get("marca") or None,
+            web["fuente"],
+            web["confianza"],
+            producto_id,
+        ),
+    )
+
+
+def _mover_a_producto(cursor, origen: int, destino: int):
+    """
+    Fusiona el producto OCR en el producto que ya tiene el EAN: items,
+    precios por tienda, inventario, patrones y demás referencias pasan al
+    destino (fusion_productos) y el producto OCR se elimina.
+    """
+    fusion_productos.fusionar_en_cursor(cursor, {origen: destino})
+
+
+async def procesar_trabajo(job_id: str, payload: Dict, usuario_id: Optional[int]):
+    """Handler de job_queue para los trabajos "enriquecer_web" """
+    from database import get_db_connection
+    from product_matcher import validar_resultado_web
+
+    establecimiento = payload.get("establecimiento") or ""
+    lineas = payload.get("lineas") or []
+    if not lineas:
+        return
+
+    inicio = time.perf_counter()
+    resultados = await buscar_lineas(lineas, establecimiento)
+    encontradas = sum(1 for r in resultados if r.encontrado)
+    _sumar(trabajos=1, encontradas=encontradas)
+    print(
+        f"🌐 [WEB] {job_id}: {encontradas}/{len(lineas)} encontradas en "
+        f"{establecimiento} ({time.perf_counter() - inicio:.1f}s)"
+    )
+
+    conn = get_db_connection()
+    try:
+        cursor = conn.cursor()
+        for linea, resultado in zip(lineas, resultados):
+            cursor.execute("SAVEPOINT enriquecer_linea")
+            try:
+                web = (
+                    validar_resultado_web(resultado, cursor)
+                    if resultado.encontrado
+                    else None
+                )
+                estado = aplicar_resultado(cursor, linea, web)
+                cursor.execute("RELEASE SAVEPOINT enriquecer_linea")
+                if estado == SIN_RESULTADO:
+                    _sumar(sin_resultado=1)
+            except Exception as e:
+                print(f"   ⚠️ [WEB] Producto {linea.get('producto_id')}: {e}")
+                cursor.execute("ROLLBACK TO SAVEPOINT enriquecer_linea")
+        conn.commit()
+        cursor.close()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
@@ -39,26 +39,17 @@ class EstablecimientoUpdate(BaseModel):
 # ============================================================================
 
 def get_db_connection():
-    """Obtener conexión según tipo de DB"""
+    """Obtener conexión según tipo de DB (PostgreSQL desde el pool compartido)"""
     database_type = os.getenv("DATABASE_TYPE", "sqlite")
 
     if database_type == "postgresql":
-        import psycopg2
-        from urllib.parse import urlparse
+        from database import get_postgres_pool
 
-        database_url = os.getenv("DATABASE_URL")
-        if not database_url:
+        pool = get_postgres_pool()
+        if pool is None:
             raise Exception("DATABASE_URL no configurada")
 
-        result = urlparse(database_url)
-        conn = psycopg2.connect(
-            host=result.hostname,
-            port=result.port,
-            database=result.path[1:],
-            user=result.username,
-            password=result.password
-        )
-        return conn, "postgresql"
+        return pool.getconn(), "postgresql"
     else:
         import sqlite3
         conn = sqlite3.connect("lecfac.db")
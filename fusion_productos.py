@@ -0,0 +1,492 @@
+"""
+Motor de Fusión de Productos por Conjuntos
+==========================================
+
+Fusiona lotes de duplicados de productos_maestros_v2 (muchos duplicados →
+un sobreviviente cada uno) en una sola transacción, con sentencias por
+conjunto en lugar de un UPDATE por tabla y por par.
+
+- El mapeo duplicado → sobreviviente va a una tabla temporal y cada tabla
+  se re-apunta con un solo UPDATE ... FROM
+- Tablas con una fila por producto y clave (precios por tienda,
+  inventario, patrones de compra, códigos, variantes de nombre, revisión):
+  las filas que chocarían se consolidan en una (sumas, mínimos, máximos)
+  y se queda la más reciente
+- El sobreviviente completa sus datos vacíos (EAN, marca, categoría, ...)
+  con los de sus duplicados; veces_visto se suma
+- Los patrones de compra afectados se recalculan una sola vez al final
+- dry_run=True ejecuta todo y hace rollback: devuelve las filas que se
+  tocarían
+- Tablas o columnas que no existen en la base se saltan
+
+Con SQLite no hay fusión por conjuntos.
+
+Uso:
+
+    resultado = fusion_productos.fusionar({228: 150, 230: 150, 17: 9})
+    mapeo = fusion_productos.mapeo_de_grupos([(150, [228, 230]), (9, [17])])
+
+Autor: LecFac
+Versión: 1.0.0
+"""
+
+import os
+import time
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+# (tabla, columna): sin restricción única que incluya al producto, se
+# re-apuntan directamente
+TABLAS_REAPUNTAR: List[Tuple[str, str]] = [
+    ("items_factura", "producto_maestro_id"),
+    ("precios_productos", "producto_maestro_id"),
+    ("precios_historicos_v2", "producto_maestro_id"),
+    ("auditoria_productos", "producto_maestro_id"),
+    ("alertas_usuario", "producto_maestro_id"),
+    ("historial_cambios_productos", "producto_maestro_id"),
+    ("codigos_alternativos", "producto_maestro_id"),
+    ("codigos_locales", "producto_maestro_id"),
+    ("log_mejoras_nombres", "producto_maestro_id"),
+    ("productos_maestros_v2", "producto_papa_id"),
+]
+
+# tabla -> clave única (además del producto), columna de fecha para elegir
+# la fila que queda (la más reciente) y cómo se agregan las demás columnas
+TABLAS_CONSOLIDAR: Dict[str, Dict] = {
+    "productos_por_establecimiento": {
+        "clave": ["establecimiento_id"],
+        "orden": "ultima_actualizacion",
+        "agregados": {
+            "precio_minimo": "MIN",
+            "precio_maximo": "MAX",
+            "total_reportes": "SUM",
+            "suma_precios": "SUM",
+            "num_precios": "SUM",
+            "fecha_creacion": "MIN",
+        },
+    },
+    "inventario_usuario": {
+        "clave": ["usuario_id"],
+        "orden": "fecha_ultima_actualizacion",
+        "agregados": {
+            "cantidad_actual": "SUM",
+            "cantidad_total_comprada": "SUM",
+            "precio_minimo": "MIN",
+            "precio_maximo": "MAX",
+            "fecha_ultima_compra": "MAX",
+            "fecha_creacion": "MIN",
+        },
+    },
+    "patrones_compra": {
+        "clave": ["usuario_id"],
+        "orden": "ultima_compra",
+        "agregados": {"fecha_creacion": "MIN"},
+    },
+    "codigos_establecimiento": {
+        "clave": ["establecimiento_id", "codigo_local"],
+        "orden": "ultima_vez_visto",
+        "agregados": {
+            "veces_visto": "SUM",
+            "primera_vez_visto": "MIN",
+            "ultima_vez_visto": "MAX",
+        },
+    },
+    "variantes_nombres": {
+        "clave": ["nombre_variante", "establecimiento_id"],
+        "orden": "fecha_ultima_vez",
+        "agregados": {
+            "veces_visto": "SUM",
+            "fecha_primera_vez": "MIN",
+            "fecha_ultima_vez": "MAX",
+        },
+    },
+    "productos_revision_admin": {"clave": [], "orden": None, "agregados": {}},
+}
+
+# Datos del sobreviviente que se completan con los del duplicado más
+# confiable cuando están vacíos
+COLUMNAS_COMPLETAR = [
+    "codigo_ean",
+    "marca",
+    "categoria_id",
+    "peso_neto",
+    "unidad_medida",
+]
+# Columnas del sobreviviente que acumulan las de sus duplicados:
+# columna -> (agregado sobre los duplicados v, asignación sobre p y d)
+ACUMULAR_SOBREVIVIENTE = {
+    "veces_visto": (
+        "SUM(COALESCE(v.veces_visto, 0))",
+        "COALESCE(p.veces_visto, 0) + d.veces_visto",
+    ),
+    "confianza_datos": (
+        "MAX(v.confianza_datos)",
+        "GREATEST(p.confianza_datos, d.confianza_datos)",
+    ),
+    "fecha_primera_vez": (
+        "MIN(v.fecha_primera_vez)",
+        "LEAST(p.fecha_primera_vez, d.fecha_primera_vez)",
+    ),
+}
+
+
+def _activo() -> bool:
+    return os.environ.get("DATABASE_TYPE", "sqlite").lower() == "postgresql"
+
+
+# ============================================================================
+# MAPEO
+# ============================================================================
+
+
+def mapeo_de_grupos(grupos: Iterable[Tuple[int, Iterable[int]]]) -> Dict[int, int]:
+    """
+    [(sobreviviente, [duplicados]), ...] → {duplicado: sobreviviente}
+
+    Raises:
+        ValueError: si un duplicado aparece con dos sobrevivientes distintos
+    """
+    mapeo: Dict[int, int] = {}
+    for sobreviviente, duplicados in grupos:
+        for duplicado in duplicados:
+            if duplicado == sobreviviente:
+                continue
+            if mapeo.get(duplicado, sobreviviente) != sobreviviente:
+                raise ValueError(
+                    f"Producto {duplicado} asignado a {mapeo[duplicado]} "
+                    f"y a {sobreviviente}"
+                )
+            mapeo[duplicado] = sobreviviente
+    return mapeo
+
+
+def resolver_mapeo(mapeo: Dict[int, int]) -> Dict[int, int]:
+    """
+    Sigue las cadenas (a → b, b → c ⇒ a → c) para que ningún sobreviviente
+    sea a su vez duplicado.
+
+    Raises:
+        ValueError: si hay un ciclo
+    """
+    mapeo = {d: s for d, s in mapeo.items() if d != s}
+    resuelto: Dict[int, int] = {}
+    for duplicado in mapeo:
+        visitados = [duplicado]
+        destino = mapeo[duplicado]
+        while destino in mapeo:
+            if destino in visitados:
+                raise ValueError(f"Ciclo en el mapeo de fusión: {visitados}")
+            visitados.append(destino)
+            destino = mapeo[destino]
+        resuelto[duplicado] = destino
+    return resuelto
+
+
+# ============================================================================
+# SENTENCIAS
+# ============================================================================
+
+
+def _columnas_existentes(cursor, tablas: Sequence[str]) -> Dict[str, set]:
+    cursor.execute(
+        """
+        SELECT table_name, column_name FROM information_schema.columns
+        WHERE table_schema = current_schema() AND table_name = ANY(%s)
+    """,
+        (list(tablas),),
+    )
+    columnas: Dict[str, set] = {}
+    for tabla, columna in cursor.fetchall():
+        columnas.setdefault(tabla, set()).add(columna)
+    return columnas
+
+
+def _reapuntar(cursor, tabla: str, columna: str) -> int:
+    cursor.execute(f"""
+        UPDATE {tabla} t SET {columna} = m.sobreviviente_id
+        FROM fusion_mapeo m
+        WHERE t.{columna} = m.duplicado_id
+    """)
+    return cursor.rowcount
+
+
+def _consolidar(cursor, tabla: str, spec: Dict, columnas: set) -> Dict[str, int]:
+    """
+    Deja una sola fila por (sobreviviente, clave) con los agregados del
+    grupo y re-apunta las que quedan.
+
+    Returns:
+        {"consolidadas": filas borradas, "reapuntadas": filas movidas}
+    """
+    clave = [c for c in spec["clave"] if c in columnas]
+    particion = ", ".join(["destino"] + [f"t.{c}" for c in clave])
+    orden = ", ".join(
+        ([f"t.{spec['orden']} DESC NULLS LAST"] if spec["orden"] in columnas else [])
+        + ["t.es_duplicado", "t.id"]
+    )
+    cursor.execute("DROP TABLE IF EXISTS fusion_filas")
+    cursor.execute(f"""
+        CREATE TEMP TABLE fusion_filas ON COMMIT DROP AS
+        SELECT t.id,
+               ROW_NUMBER() OVER (PARTITION BY {particion} ORDER BY {orden}) AS n,
+               FIRST_VALUE(t.id) OVER (
+                   PARTITION BY {particion} ORDER BY {orden}
+               ) AS fila_destino
+        FROM (
+            SELECT t.*,
+                   COALESCE(m.sobreviviente_id, t.producto_maestro_id) AS destino,
+                   m.duplicado_id IS NOT NULL AS es_duplicado
+            FROM {tabla} t
+            LEFT JOIN fusion_mapeo m ON m.duplicado_id = t.producto_maestro_id
+            WHERE t.producto_maestro_id IN (SELECT id FROM fusion_afectados)
+        ) t
+    """)
+
+    agregados = {c: f for c, f in spec["agregados"].items() if c in columnas}
+    if agregados:
+        calculos = ", ".join(
+            f"{funcion}(t.{columna}) AS {columna}"
+            for columna, funcion in agregados.items()
+        )
+        asignaciones = ", ".join(f"{c} = g.{c}" for c in agregados)
+        cursor.execute(f"""
+            UPDATE {tabla} t SET {asignaciones}
+            FROM (
+                SELECT f.fila_destino, {calculos}
+                FROM fusion_filas f JOIN {tabla} t ON t.id = f.id
+                GROUP BY f.fila_destino
+                HAVING COUNT(*) > 1
+            ) g
+            WHERE t.id = g.fila_destino
+        """)
+
+    cursor.execute(f"""
+        DELETE FROM {tabla} t USING fusion_filas f
+        WHERE t.id = f.id AND f.n > 1
+    """)
+    consolidadas = cursor.rowcount
+    return {
+        "consolidadas": consolidadas,
+        "reapuntadas": _reapuntar(cursor, tabla, "producto_maestro_id"),
+    }
+
+
+def _completar_sobrevivientes(cursor, columnas: set) -> int:
+    completar = [c for c in COLUMNAS_COMPLETAR if c in columnas]
+    orden = (
+        "v.confianza_datos DESC NULLS LAST, v.id"
+        if "confianza_datos" in columnas
+        else "v.id"
+    )
+    mejores = [
+        f"""(ARRAY_AGG(v.{c} ORDER BY {orden})
+             FILTER (WHERE NULLIF(v.{c}::text, '') IS NOT NULL))[1] AS {c}"""
+        for c in completar
+    ]
+    asignaciones = [
+        f"{c} = CASE WHEN NULLIF(p.{c}::text, '') IS NULL THEN d.{c} ELSE p.{c} END"
+        for c in completar
+    ]
+    for columna, (agregado, asignacion) in ACUMULAR_SOBREVIVIENTE.items():
+        if columna in columnas:
+            mejores.append(f"{agregado} AS {columna}")
+            asignaciones.append(f"{columna} = {asignacion}")
+    if "fecha_ultima_actualizacion" in columnas:
+        asignaciones.append("fecha_ultima_actualizacion = CURRENT_TIMESTAMP")
+    if not mejores:
+        return 0
+
+    cursor.execute(f"""
+        UPDATE productos_maestros_v2 p SET
+            {", ".join(asignaciones)}
+        FROM (
+            SELECT m.sobreviviente_id,
+                   {", ".join(mejores)}
+            FROM fusion_mapeo m
+            JOIN productos_maestros_v2 v ON v.id = m.duplicado_id
+            GROUP BY m.sobreviviente_id
+        ) d
+        WHERE p.id = d.sobreviviente_id
+    """)
+    return cursor.rowcount
+
+
+def _recalcular_patrones(cursor) -> int:
+    """
+    Patrones de compra de los sobrevivientes, desde items_factura sin las
+    facturas que siguen en outbox_analitica (esas las suma el consumidor)
+    """
+    cursor.execute("""
+        UPDATE patrones_compra pc SET
+            ultima_compra = s.ultima_compra,
+            veces_comprado = s.veces_comprado,
+            precio_promedio_pagado = s.precio_promedio_pagado,
+            suma_precios = s.suma_precios,
+            num_precios = s.num_precios,
+            ultima_actualizacion = CURRENT_TIMESTAMP
+        FROM (
+            SELECT i.usuario_id, i.producto_maestro_id,
+                   MAX(i.fecha_creacion)::DATE AS ultima_compra,
+                   COUNT(DISTINCT i.factura_id) AS veces_comprado,
+                   AVG(i.precio_pagado)::INTEGER AS precio_promedio_pagado,
+                   COALESCE(SUM(i.precio_pagado), 0) AS suma_precios,
+                   COUNT(i.precio_pagado) AS num_precios
+            FROM items_factura i
+            WHERE i.producto_maestro_id IN (
+                SELECT DISTINCT sobreviviente_id FROM fusion_mapeo
+            )
+              AND NOT EXISTS (
+                  SELECT 1 FROM outbox_analitica o WHERE o.factura_id = i.factura_id
+              )
+            GROUP BY i.usuario_id, i.producto_maestro_id
+        ) s
+        WHERE pc.usuario_id = s.usuario_id
+          AND pc.producto_maestro_id = s.producto_maestro_id
+    """)
+    return cursor.rowcount
+
+
+# ============================================================================
+# FUSIÓN
+# ============================================================================
+
+
+def fusionar_en_cursor(cursor, mapeo: Dict[int, int]) -> Dict:
+    """
+    Ejecuta la fusión con el cursor dado, sin commit (el llamador decide).
+
+    Args:
+        mapeo: {duplicado_id: sobreviviente_id}; se resuelven las cadenas
+
+    Returns:
+        {"productos_fusionados", "sobrevivientes", "tablas": {tabla: filas}}
+
+    Raises:
+        ValueError: mapeo con ciclos o productos que no existen
+    """
+    mapeo = resolver_mapeo(mapeo)
+    if not mapeo:
+        return {"productos_fusionados": 0, "sobrevivientes": 0, "tablas": {}}
+
+    from outbox_analitica import OUTBOX_ANALITICA_LOCK_KEY
+
+    # Antes que cualquier fila, en el mismo orden que el consumidor del
+    # outbox: sus deltas no se cruzan con la consolidación ni el recálculo
+    cursor.execute("SELECT pg_advisory_xact_lock(%s)", (OUTBOX_ANALITICA_LOCK_KEY,))
+
+    ids = sorted(set(mapeo) | set(mapeo.values()))
+    # Bloqueo en orden de id: dos fusiones concurrentes no se cruzan
+    cursor.execute(
+        """
+        SELECT id FROM productos_maestros_v2
+        WHERE id = ANY(%s)
+        ORDER BY id
+        FOR UPDATE
+    """,
+        (ids,),
+    )
+    faltantes = set(ids) - {row[0] for row in cursor.fetchall()}
+    if faltantes:
+        raise ValueError(f"Productos inexistentes: {sorted(faltantes)}")
+
+    cursor.execute("DROP TABLE IF EXISTS fusion_mapeo")
+    cursor.execute("""
+        CREATE TEMP TABLE fusion_mapeo (
+            duplicado_id INTEGER PRIMARY KEY,
+            sobreviviente_id INTEGER NOT NULL
+        ) ON COMMIT DROP
+    """)
+    cursor.execute(
+        """
+        INSERT INTO fusion_mapeo (duplicado_id, sobreviviente_id)
+        SELECT * FROM unnest(%s::int[], %s::int[])
+    """,
+        (list(mapeo), list(mapeo.values())),
+    )
+    cursor.execute("DROP TABLE IF EXISTS fusion_afectados")
+    cursor.execute("""
+        CREATE TEMP TABLE fusion_afectados ON COMMIT DROP AS
+        SELECT duplicado_id AS id FROM fusion_mapeo
+        UNION
+        SELECT sobreviviente_id FROM fusion_mapeo
+    """)
+
+    existentes = _columnas_existentes(
+        cursor,
+        [t for t, _ in TABLAS_REAPUNTAR] + list(TABLAS_CONSOLIDAR),
+    )
+    tablas: Dict[str, Dict[str, int]] = {}
+
+    for tabla, spec in TABLAS_CONSOLIDAR.items():
+        columnas = existentes.get(tabla, set())
+        if {"id", "producto_maestro_id"} <= columnas:
+            tablas[tabla] = _consolidar(cursor, tabla, spec, columnas)
+
+    for tabla, columna in TABLAS_REAPUNTAR:
+        if columna in existentes.get(tabla, set()):
+            filas = _reapuntar(cursor, tabla, columna)
+            tablas.setdefault(tabla, {})["reapuntadas"] = filas
+
+    completados = _completar_sobrevivientes(
+        cursor, existentes.get("productos_maestros_v2", set())
+    )
+    cursor.execute("""
+        DELETE FROM productos_maestros_v2
+        WHERE id IN (SELECT duplicado_id FROM fusion_mapeo)
+    """)
+    tablas["productos_maestros_v2"] = {
+        "completados": completados,
+        "eliminados": cursor.rowcount,
+    }
+
+    if "patrones_compra" in tablas and "items_factura" in existentes:
+        tablas["patrones_compra"]["recalculados"] = _recalcular_patrones(cursor)
+
+    return {
+        "productos_fusionados": len(mapeo),
+        "sobrevivientes": len(set(mapeo.values())),
+        "tablas": tablas,
+    }
+
+
+def fusionar(mapeo: Dict[int, int], dry_run: bool = False) -> Optional[Dict]:
+    """
+    Fusiona el lote completo en una transacción propia.
+
+    Args:
+        mapeo: {duplicado_id: sobreviviente_id}
+        dry_run: hace rollback al final; el resultado trae las filas que se
+                 habrían tocado
+
+    Returns:
+        Resultado de fusionar_en_cursor() + dry_run y ms, o None sin
+        PostgreSQL
+    """
+    if not _activo():
+        return None
+
+    from database import get_db_connection
+
+    inicio = time.perf_counter()
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        resultado = fusionar_en_cursor(cursor, mapeo)
+        if dry_run:
+            conn.rollback()
+        else:
+            conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+        conn.close()
+
+    resultado["dry_run"] = dry_run
+    resultado["ms"] = round((time.perf_counter() - inicio) * 1000, 1)
+    if not dry_run:
+        print(
+            f"🔗 [FUSION] {resultado['productos_fusionados']} productos en "
+            f"{resultado['sobrevivientes']} ({resultado['ms']} ms)"
+        )
+    return resultado
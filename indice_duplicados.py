@@ -0,0 +1,732 @@
+"""
+Índice Incremental de Candidatos a Duplicado (MinHash/LSH)
+==========================================================
+
+Pares de productos_maestros_v2 con nombres casi iguales, calculados una vez
+y mantenidos al día, para que las vistas de duplicados del admin respondan
+sobre todo el catálogo sin comparar cada producto contra todos los demás.
+
+- Firma MinHash de INDICE_DUPLICADOS_BANDAS x INDICE_DUPLICADOS_FILAS
+  permutaciones sobre los trigramas del nombre normalizado (abreviaturas
+  expandidas, como en el matching)
+- LSH por bandas (tabla duplicados_bandas): dos productos son candidatos
+  si coinciden en al menos una banda; los candidatos se puntúan con
+  motor_similitud.similitud y se guardan los pares >= INDICE_DUPLICADOS_UMBRAL
+  (tabla duplicados_pares), más los pares con el mismo EAN
+- Incremental: triggers de productos_maestros_v2 (migración 011) anotan en
+  duplicados_pendientes cada producto creado, renombrado, con EAN cambiado
+  o borrado; actualizar() reprocesa solo esos
+- Las consultas responden con el índice tal como está e informan cuántos
+  productos faltan; los procesa el trabajo "actualizar_indice_duplicados"
+  de la cola durable (que la consulta encola si hace falta)
+- Cubetas gigantes (nombres genéricos) aportan a lo sumo
+  INDICE_DUPLICADOS_MAX_CUBETA candidatos por banda
+- Al cambiar bandas/filas hay que llamar a reconstruir()
+
+Con SQLite el índice queda deshabilitado.
+
+Autor: LecFac
+Versión: 1.0.0
+"""
+
+import hashlib
+import os
+import random
+import struct
+import threading
+import time
+import zlib
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from indice_referencia import trigramas
+from motor_similitud import similitud
+from normalizacion_nombres import analizar_nombre_sin_cache, palabras_significativas
+
+try:
+    import numpy as np
+
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+
+INDICE_DUPLICADOS_BANDAS = int(os.environ.get("INDICE_DUPLICADOS_BANDAS", "20"))
+INDICE_DUPLICADOS_FILAS = int(os.environ.get("INDICE_DUPLICADOS_FILAS", "3"))
+INDICE_DUPLICADOS_UMBRAL = float(os.environ.get("INDICE_DUPLICADOS_UMBRAL", "0.80"))
+INDICE_DUPLICADOS_MAX_CUBETA = int(
+    os.environ.get("INDICE_DUPLICADOS_MAX_CUBETA", "200")
+)
+INDICE_DUPLICADOS_LOTE = int(os.environ.get("INDICE_DUPLICADOS_LOTE", "500"))
+# Tiempo máximo de un trabajo de la cola antes de encolar su continuación
+INDICE_DUPLICADOS_PRESUPUESTO_SEG = float(
+    os.environ.get("INDICE_DUPLICADOS_PRESUPUESTO_SEG", "240")
+)
+
+TIPO_TRABAJO = "actualizar_indice_duplicados"
+# pg_try_advisory_lock: un solo proceso actualiza el índice a la vez (dos
+# lotes concurrentes no verían las bandas del otro y perderían pares)
+INDICE_DUPLICADOS_LOCK_KEY = 7311022
+
+PERMUTACIONES = INDICE_DUPLICADOS_BANDAS * INDICE_DUPLICADOS_FILAS
+# Hash universal (a*x + b) mod p; a, b < 2^31 y x < 2^32 caben en uint64
+_PRIMO = (1 << 61) - 1
+_MASCARA = (1 << 32) - 1
+_rng = random.Random(20240611)
+_A = [_rng.randrange(1, 1 << 31) for _ in range(PERMUTACIONES)]
+_B = [_rng.randrange(0, 1 << 31) for _ in range(PERMUTACIONES)]
+if NUMPY_AVAILABLE:
+    _A_NP = np.array(_A, dtype=np.uint64)
+    _B_NP = np.array(_B, dtype=np.uint64)
+    _PRIMO_NP = np.uint64(_PRIMO)
+    _MASCARA_NP = np.uint64(_MASCARA)
+
+_lock = threading.Lock()
+_stats = {
+    "lotes": 0,
+    "productos": 0,
+    "candidatos": 0,
+    "pares": 0,
+    "ms_lotes": 0.0,
+    "consultas": 0,
+}
+
+
+def _activo() -> bool:
+    return os.environ.get("DATABASE_TYPE", "sqlite").lower() == "postgresql"
+
+
+def _sumar(**valores):
+    with _lock:
+        for clave, valor in valores.items():
+            _stats[clave] += valor
+
+
+# ============================================================================
+# FIRMAS
+# ============================================================================
+
+
+def firma_minhash(texto: str) -> List[int]:
+    """Mínimo de cada permutación sobre los trigramas de `texto` ([] si no hay)"""
+    hashes = [zlib.crc32(t.encode("utf-8")) for t in trigramas(texto)]
+    if not hashes:
+        return []
+    if NUMPY_AVAILABLE:
+        x = np.array(hashes, dtype=np.uint64)[:, None]
+        valores = ((x * _A_NP + _B_NP) % _PRIMO_NP) & _MASCARA_NP
+        return valores.min(axis=0).tolist()
+    return [
+        min(((a * h + b) % _PRIMO) & _MASCARA for h in hashes) for a, b in zip(_A, _B)
+    ]
+
+
+def bandas(firma: Sequence[int]) -> List[Tuple[int, int]]:
+    """[(banda, hash BIGINT con signo de las filas de esa banda), ...]"""
+    filas = INDICE_DUPLICADOS_FILAS
+    resultado = []
+    for banda in range(len(firma) // filas):
+        datos = struct.pack(f">{filas}I", *firma[banda * filas : (banda + 1) * filas])
+        digest = hashlib.blake2b(datos, digest_size=8).digest()
+        resultado.append((banda, int.from_bytes(digest, "big", signed=True)))
+    return resultado
+
+
+def _ean_valido(ean: Optional[str]) -> Optional[str]:
+    ean = (ean or "").strip()
+    return ean if len(ean) >= 8 and ean.isdigit() else None
+
+
+# ============================================================================
+# ACTUALIZACIÓN
+# ============================================================================
+
+
+def _procesar_lote(cursor, limite: int) -> int:
+    """
+    Reprocesa hasta `limite` productos pendientes (sin commit).
+
+    Returns:
+        Productos procesados (0 = no quedan pendientes)
+    """
+    inicio = time.perf_counter()
+    cursor.execute(
+        """
+        SELECT p.producto_id, p.encolado_en, v.nombre_consolidado, v.codigo_ean
+        FROM duplicados_pendientes p
+        LEFT JOIN productos_maestros_v2 v ON v.id = p.producto_id
+        ORDER BY p.encolado_en
+        LIMIT %s
+    """,
+        (limite,),
+    )
+    filas = cursor.fetchall()
+    if not filas:
+        return 0
+
+    ids = [f[0] for f in filas]
+    cursor.execute("DELETE FROM duplicados_bandas WHERE producto_id = ANY(%s)", (ids,))
+    cursor.execute("DELETE FROM duplicados_firmas WHERE producto_id = ANY(%s)", (ids,))
+    cursor.execute(
+        """
+        DELETE FROM duplicados_pares
+        WHERE producto_id_1 = ANY(%s) OR producto_id_2 = ANY(%s)
+    """,
+        (ids, ids),
+    )
+
+    # Productos que siguen existiendo: nombre normalizado y bandas
+    textos: Dict[int, str] = {}
+    eans: Dict[int, str] = {}
+    bandas_lote: List[Tuple[int, int, int]] = []
+    for producto_id, _, nombre, ean in filas:
+        if nombre is None:
+            continue
+        texto = analizar_nombre_sin_cache(nombre).expandido
+        firma = firma_minhash(texto)
+        if not firma:
+            continue
+        textos[producto_id] = texto
+        if _ean_valido(ean):
+            eans[producto_id] = _ean_valido(ean)
+        bandas_lote.extend((producto_id, b, h) for b, h in bandas(firma))
+
+    if textos:
+        cursor.execute(
+            """
+            INSERT INTO duplicados_firmas (producto_id, nombre_normalizado)
+            SELECT * FROM unnest(%s::int[], %s::text[])
+        """,
+            (list(textos), list(textos.values())),
+        )
+        columnas = list(zip(*bandas_lote))
+        cursor.execute(
+            """
+            INSERT INTO duplicados_bandas (producto_id, banda, hash)
+            SELECT * FROM unnest(%s::int[], %s::smallint[], %s::bigint[])
+            ON CONFLICT DO NOTHING
+        """,
+            (list(columnas[0]), list(columnas[1]), list(columnas[2])),
+        )
+
+    # Candidatos: mismas bandas (incluye a los del propio lote)
+    candidatos = set()
+    if bandas_lote:
+        columnas = list(zip(*bandas_lote))
+        cursor.execute(
+            """
+            SELECT DISTINCT l.producto_id, c.producto_id
+            FROM unnest(%s::int[], %s::smallint[], %s::bigint[])
+                AS l(producto_id, banda, hash)
+            CROSS JOIN LATERAL (
+                SELECT b.producto_id FROM duplicados_bandas b
+                WHERE b.banda = l.banda AND b.hash = l.hash
+                LIMIT %s
+            ) c
+            WHERE c.producto_id <> l.producto_id
+        """,
+            (
+                list(columnas[0]),
+                list(columnas[1]),
+                list(columnas[2]),
+                INDICE_DUPLICADOS_MAX_CUBETA,
+            ),
+        )
+        candidatos = {(min(a, b), max(a, b)) for a, b in cursor.fetchall()}
+
+    faltantes = {i for par in candidatos for i in par} - set(textos)
+    if faltantes:
+        cursor.execute(
+            """
+            SELECT producto_id, nombre_normalizado FROM duplicados_firmas
+            WHERE producto_id = ANY(%s)
+        """,
+            (list(faltantes),),
+        )
+        textos.update(cursor.fetchall())
+
+    pares: Dict[Tuple[int, int], List] = {}
+    palabras: Dict[int, frozenset] = {}
+    for a, b in candidatos:
+        if a not in textos or b not in textos:
+            continue
+        for i in (a, b):
+            if i not in palabras:
+                palabras[i] = palabras_significativas(textos[i])
+        puntaje = similitud(textos[a], textos[b], palabras[a], palabras[b])
+        if puntaje >= INDICE_DUPLICADOS_UMBRAL:
+            pares[(a, b)] = [round(puntaje, 4), False]
+
+    # Mismo EAN: duplicado seguro aunque los nombres difieran
+    if eans:
+        cursor.execute(
+            """
+            SELECT l.producto_id, v.id, v.nombre_consolidado
+            FROM unnest(%s::int[], %s::text[]) AS l(producto_id, ean)
+            JOIN productos_maestros_v2 v
+              ON v.codigo_ean = l.ean AND v.id <> l.producto_id
+        """,
+            (list(eans), list(eans.values())),
+        )
+        for a, b, nombre in cursor.fetchall():
+            par = (min(a, b), max(a, b))
+            if par not in pares:
+                texto_b = textos.get(b) or analizar_nombre_sin_cache(nombre).expandido
+                pares[par] = [round(similitud(textos[a], texto_b), 4), False]
+            pares[par][1] = True
+
+    if pares:
+        claves = list(pares)
+        cursor.execute(
+            """
+            INSERT INTO duplicados_pares
+                (producto_id_1, producto_id_2, similitud, mismo_ean)
+            SELECT * FROM unnest(%s::int[], %s::int[], %s::float8[], %s::bool[])
+            ON CONFLICT (producto_id_1, producto_id_2) DO UPDATE
+            SET similitud = EXCLUDED.similitud,
+                mismo_ean = EXCLUDED.mismo_ean,
+                actualizado_en = CURRENT_TIMESTAMP
+        """,
+            (
+                [a for a, _ in claves],
+                [b for _, b in claves],
+                [pares[c][0] for c in claves],
+                [pares[c][1] for c in claves],
+            ),
+        )
+
+    # Solo se quitan los pendientes que no volvieron a cambiar mientras tanto
+    cursor.execute(
+        """
+        DELETE FROM duplicados_pendientes p
+        USING unnest(%s::int[], %s::timestamp[]) AS l(producto_id, encolado_en)
+        WHERE p.producto_id = l.producto_id AND p.encolado_en = l.encolado_en
+    """,
+        (ids, [f[1] for f in filas]),
+    )
+
+    _sumar(
+        lotes=1,
+        productos=len(filas),
+        candidatos=len(candidatos),
+        pares=len(pares),
+        ms_lotes=(time.perf_counter() - inicio) * 1000,
+    )
+    return len(filas)
+
+
+def actualizar(presupuesto_seg: float, lote: int = INDICE_DUPLICADOS_LOTE) -> Dict:
+    """
+    Drena pendientes por lotes (un commit por lote) hasta terminar o agotar
+    el presupuesto. Si otro proceso ya está actualizando no hace nada.
+
+    Returns:
+        {"procesados", "completo", "ocupado"}
+    """
+    if not _activo():
+        return {"procesados": 0, "completo": True, "ocupado": False}
+
+    from database import get_db_connection
+
+    inicio = time.monotonic()
+    procesados = 0
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        cursor.execute("SELECT pg_try_advisory_lock(%s)", (INDICE_DUPLICADOS_LOCK_KEY,))
+        if not cursor.fetchone()[0]:
+            conn.commit()
+            return {"procesados": 0, "completo": False, "ocupado": True}
+        try:
+            while True:
+                n = _procesar_lote(cursor, lote)
+                conn.commit()
+                procesados += n
+                if n < lote:
+                    return {
+                        "procesados": procesados,
+                        "completo": True,
+                        "ocupado": False,
+                    }
+                if time.monotonic() - inicio > presupuesto_seg:
+                    return {
+                        "procesados": procesados,
+                        "completo": False,
+                        "ocupado": False,
+                    }
+        finally:
+            conn.rollback()
+            cursor.execute(
+                "SELECT pg_advisory_unlock(%s)", (INDICE_DUPLICADOS_LOCK_KEY,)
+            )
+            conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def programar_actualizacion() -> Optional[str]:
+    """
+    Encola el trabajo de actualización salvo que ya haya uno pendiente o en
+    curso.
+
+    Returns:
+        job_id, o None si no hizo falta (o sin PostgreSQL)
+    """
+    if not _activo():
+        return None
+
+    from database import get_db_connection
+    from job_queue import encolar_trabajo
+
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        cursor.execute(
+            """
+            SELECT 1 FROM processing_jobs
+            WHERE tipo = %s AND status IN ('pending', 'processing')
+            LIMIT 1
+        """,
+            (TIPO_TRABAJO,),
+        )
+        if cursor.fetchone():
+            conn.commit()
+            return None
+        job_id = encolar_trabajo(TIPO_TRABAJO, {}, conn=conn)
+        conn.commit()
+        return job_id
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def procesar_trabajo(job_id: str, payload: Dict, usuario_id: Optional[int]):
+    """
+    Handler de job_queue: actualiza el índice hasta agotar
+    INDICE_DUPLICADOS_PRESUPUESTO_SEG y encola la continuación si quedan
+    pendientes.
+    """
+    from database import get_db_connection
+    from job_queue import encolar_trabajo
+
+    resultado = actualizar(INDICE_DUPLICADOS_PRESUPUESTO_SEG)
+    print(
+        f"🔁 [INDICE DUPLICADOS] {resultado['procesados']} productos reindexados"
+        + ("" if resultado["completo"] else " (continúa)")
+    )
+    if resultado["completo"] or resultado["ocupado"]:
+        return
+
+    conn = get_db_connection()
+    try:
+        encolar_trabajo(TIPO_TRABAJO, payload, conn=conn)
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def pendientes() -> Dict:
+    """
+    Para las consultas del admin: productos que faltan por indexar, sin
+    drenarlos en la petición. Si hay, se asegura de que el trabajo de la
+    cola esté encolado.
+
+    Returns:
+        {"pendientes", "pendiente_desde"}
+    """
+    if not _activo():
+        return {"pendientes": 0, "pendiente_desde": None}
+
+    from database import get_db_connection
+
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        cursor.execute("SELECT COUNT(*), MIN(encolado_en) FROM duplicados_pendientes")
+        total, mas_antiguo = cursor.fetchone()
+        conn.commit()
+    finally:
+        cursor.close()
+        conn.close()
+
+    if total:
+        programar_actualizacion()
+    return {
+        "pendientes": total,
+        "pendiente_desde": mas_antiguo.isoformat() if mas_antiguo else None,
+    }
+
+
+def reconstruir() -> Optional[Dict]:
+    """
+    Vacía el índice y marca todo el catálogo como pendiente (necesario al
+    cambiar INDICE_DUPLICADOS_BANDAS/FILAS).
+
+    Returns:
+        {"productos", "job_id"} del trabajo que lo recalcula, o None sin
+        PostgreSQL
+    """
+    if not _activo():
+        return None
+
+    from database import get_db_connection
+
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        cursor.execute(
+            "TRUNCATE duplicados_pares, duplicados_bandas, duplicados_firmas"
+        )
+        cursor.execute("""
+            INSERT INTO duplicados_pendientes (producto_id)
+            SELECT id FROM productos_maestros_v2
+            ON CONFLICT (producto_id) DO UPDATE SET encolado_en = clock_timestamp()
+        """)
+        marcados = cursor.rowcount
+        conn.commit()
+        print(f"🔁 [INDICE DUPLICADOS] Reconstrucción: {marcados} productos")
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+        conn.close()
+    return {"productos": marcados, "job_id": programar_actualizacion()}
+
+
+# ============================================================================
+# CONSULTAS
+# ============================================================================
+
+
+def pares(
+    umbral: float = 0.85,
+    limite: int = 100,
+    desde: int = 0,
+    producto_id: Optional[int] = None,
+) -> List[Dict]:
+    """
+    Pares candidatos ordenados de más a menos parecidos (los de mismo EAN
+    se incluyen siempre).
+
+    Args:
+        umbral: similitud mínima (>= INDICE_DUPLICADOS_UMBRAL para que tenga
+                efecto)
+        producto_id: solo los pares de ese producto
+    """
+    if not _activo():
+        return []
+
+    from database import get_db_connection
+
+    _sumar(consultas=1)
+    filtro, parametros = "", [umbral]
+    if producto_id is not None:
+        filtro = "AND (d.producto_id_1 = %s OR d.producto_id_2 = %s)"
+        parametros += [producto_id, producto_id]
+
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        cursor.execute(
+            f"""
+            SELECT d.producto_id_1, a.nombre_consolidado, a.codigo_ean,
+                   d.producto_id_2, b.nombre_consolidado, b.codigo_ean,
+                   d.similitud, d.mismo_ean
+            FROM duplicados_pares d
+            JOIN productos_maestros_v2 a ON a.id = d.producto_id_1
+            JOIN productos_maestros_v2 b ON b.id = d.producto_id_2
+            WHERE (d.similitud >= %s OR d.mismo_ean) {filtro}
+            ORDER BY d.mismo_ean DESC, d.similitud DESC,
+                     d.producto_id_1, d.producto_id_2
+            LIMIT %s OFFSET %s
+        """,
+            parametros + [limite, desde],
+        )
+        resultado = [
+            {
+                "producto_id_1": row[0],
+                "nombre_1": row[1],
+                "codigo_ean_1": row[2],
+                "producto_id_2": row[3],
+                "nombre_2": row[4],
+                "codigo_ean_2": row[5],
+                "similitud": round(float(row[6]), 3),
+                "mismo_ean": row[7],
+            }
+            for row in cursor.fetchall()
+        ]
+        conn.commit()
+        return resultado
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def agrupar(aristas: Sequence[Tuple[int, int, float]]) -> List[Dict]:
+    """
+    Componentes conexos de los pares (a, b, similitud), de mayor a menor
+    (empates: mayor similitud, menor id).
+
+    Returns:
+        [{"producto_ids", "pares", "similitud_max", "similitud_min"}, ...]
+    """
+    padre: Dict[int, int] = {}
+
+    def raiz(x: int) -> int:
+        padre.setdefault(x, x)
+        while padre[x] != x:
+            padre[x] = padre[padre[x]]
+            x = padre[x]
+        return x
+
+    for a, b, _ in aristas:
+        ra, rb = raiz(a), raiz(b)
+        if ra != rb:
+            padre[max(ra, rb)] = min(ra, rb)
+
+    grupos: Dict[int, Dict] = {}
+    for a, b, puntaje in aristas:
+        grupo = grupos.setdefault(
+            raiz(a),
+            {
+                "producto_ids": set(),
+                "pares": 0,
+                "similitud_max": 0.0,
+                "similitud_min": 1.0,
+            },
+        )
+        grupo["producto_ids"].update((a, b))
+        grupo["pares"] += 1
+        grupo["similitud_max"] = max(grupo["similitud_max"], puntaje)
+        grupo["similitud_min"] = min(grupo["similitud_min"], puntaje)
+
+    resultado = []
+    for grupo in grupos.values():
+        grupo["producto_ids"] = sorted(grupo["producto_ids"])
+        resultado.append(grupo)
+    resultado.sort(
+        key=lambda g: (
+            -len(g["producto_ids"]),
+            -g["similitud_max"],
+            g["producto_ids"][0],
+        )
+    )
+    return resultado
+
+
+def clusters(umbral: float = 0.85, limite: int = 50) -> List[Dict]:
+    """
+    Grupos de productos unidos por pares >= umbral (o mismo EAN), los más
+    grandes primero, con nombre y EAN de cada producto.
+
+    Son componentes conexos: A~B y B~C quedan juntos aunque A y C no se
+    parezcan tanto; similitud_min lo deja ver.
+    """
+    if not _activo():
+        return []
+
+    from database import get_db_connection
+
+    _sumar(consultas=1)
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        cursor.execute(
+            """
+            SELECT producto_id_1, producto_id_2, similitud FROM duplicados_pares
+            WHERE similitud >= %s OR mismo_ean
+        """,
+            (umbral,),
+        )
+        grupos = agrupar([(a, b, float(s)) for a, b, s in cursor.fetchall()])[:limite]
+
+        ids = [i for g in grupos for i in g["producto_ids"]]
+        productos = {}
+        if ids:
+            cursor.execute(
+                """
+                SELECT id, nombre_consolidado, codigo_ean, marca
+                FROM productos_maestros_v2 WHERE id = ANY(%s)
+            """,
+                (ids,),
+            )
+            productos = {
+                row[0]: {
+                    "id": row[0],
+                    "nombre": row[1],
+                    "codigo_ean": row[2],
+                    "marca": row[3],
+                }
+                for row in cursor.fetchall()
+            }
+        conn.commit()
+    finally:
+        cursor.close()
+        conn.close()
+
+    return [
+        {
+            "productos": [productos[i] for i in g["producto_ids"] if i in productos],
+            "pares": g["pares"],
+            "similitud_max": round(g["similitud_max"], 3),
+            "similitud_min": round(g["similitud_min"], 3),
+        }
+        for g in grupos
+    ]
+
+
+# ============================================================================
+# ESTADO
+# ============================================================================
+
+
+def estado() -> Dict:
+    """Tamaño del índice y pendientes por procesar"""
+    if not _activo():
+        return {"activo": False}
+
+    from database import get_db_connection
+
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        cursor.execute("""
+            SELECT
+                (SELECT COUNT(*) FROM duplicados_firmas),
+                (SELECT COUNT(*) FROM duplicados_pares),
+                (SELECT COUNT(*) FROM duplicados_pares WHERE mismo_ean),
+                (SELECT COUNT(*) FROM duplicados_pendientes),
+                (SELECT MIN(encolado_en) FROM duplicados_pendientes)
+        """)
+        firmas, total_pares, mismo_ean, pendientes, mas_antiguo = cursor.fetchone()
+        conn.commit()
+    finally:
+        cursor.close()
+        conn.close()
+
+    return {
+        "activo": True,
+        "productos_indexados": firmas,
+        "pares": total_pares,
+        "pares_mismo_ean": mismo_ean,
+        "pendientes": pendientes,
+        "pendiente_desde": mas_antiguo.isoformat() if mas_antiguo else None,
+        "bandas": INDICE_DUPLICADOS_BANDAS,
+        "filas": INDICE_DUPLICADOS_FILAS,
+        "umbral": INDICE_DUPLICADOS_UMBRAL,
+        **estadisticas(),
+    }
+
+
+def estadisticas() -> Dict:
+    with _lock:
+        stats = dict(_stats)
+    stats["ms_por_lote"] = round(stats.pop("ms_lotes") / max(stats["lotes"], 1), 1)
+    stats["numpy"] = NUMPY_AVAILABLE
+    return stats
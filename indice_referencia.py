@@ -0,0 +1,411 @@
+"""
+Índice en Memoria de productos_referencia_ean
+=============================================
+
+Índice residente del catálogo de auditoría para
+product_matcher.buscar_en_auditoria_por_nombre(), que antes hacía un
+`UPPER(nombre) LIKE '%palabra%' OR ...` (scan secuencial) y re-expandía las
+abreviaturas de cada candidato en cada línea de factura.
+
+- Cada referencia se guarda ya preparada: nombre limpio, nombre con
+  abreviaturas expandidas, palabras significativas y marca/cantidad/metros
+- Listas invertidas por palabra y por trigrama de caracteres (tolera
+  errores de OCR)
+- candidatos() devuelve el top-k por coincidencia de palabras + trigramas;
+  las palabras que no están en el catálogo buscan por sus trigramas
+- Refresco incremental por fecha_creacion/fecha_actualizacion cada
+  INDICE_REFERENCIA_REFRESCO_SEG, y recarga completa cada
+  INDICE_REFERENCIA_RECARGA_SEG (recoge borrados)
+
+Autor: LecFac
+Versión: 1.0.0
+"""
+
+import heapq
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Dict, Iterable, List, Optional
+
+from normalizacion_nombres import analizar_nombre, analizar_nombre_sin_cache
+
+INDICE_REFERENCIA_HABILITADO = (
+    os.environ.get("INDICE_REFERENCIA", "true").lower() == "true"
+)
+INDICE_REFERENCIA_REFRESCO_SEG = int(
+    os.environ.get("INDICE_REFERENCIA_REFRESCO_SEG", "60")
+)
+INDICE_REFERENCIA_RECARGA_SEG = int(
+    os.environ.get("INDICE_REFERENCIA_RECARGA_SEG", "3600")
+)
+
+# Peso de una palabra completa frente a un trigrama al rankear candidatos
+PESO_PALABRA = 3
+# Palabras/trigramas presentes en más de esta fracción del catálogo no
+# generan candidatos, solo puntúan (son las listas más largas)
+FRACCION_MAX_LISTA = 0.05
+# Margen al pedir cambios, por transacciones que confirman con fecha anterior
+MARGEN_REFRESCO_SEG = 120
+
+COLUMNAS = """
+    id, codigo_ean, nombre, marca, presentacion, categoria, validaciones,
+    GREATEST(fecha_creacion, COALESCE(fecha_actualizacion, fecha_creacion))
+"""
+
+
+def trigramas(texto: str) -> set:
+    """Trigramas de caracteres de cada palabra, con bordes (' LE', 'LEC', ...)"""
+    resultado = set()
+    for palabra in texto.split():
+        palabra = f" {palabra} "
+        for i in range(len(palabra) - 2):
+            resultado.add(palabra[i : i + 3])
+    return resultado
+
+
+def preparar_referencia(row, memoizar: bool = True) -> Dict:
+    """
+    Referencia con todo lo que necesita el scoring de product_matcher ya
+    calculado. `row` = (id, codigo_ean, nombre, marca, presentacion,
+    categoria, validaciones, ...)
+
+    memoizar=False para cargas del catálogo completo (el índice ya guarda
+    el resultado)
+    """
+    nombre = row[2] or ""
+    if memoizar:
+        analisis = analizar_nombre(nombre)
+    else:
+        analisis = analizar_nombre_sin_cache(nombre)
+    return {
+        "referencia_id": row[0],
+        "codigo_ean": row[1],
+        "nombre": nombre,
+        "marca": row[3],
+        "presentacion": row[4],
+        "categoria": row[5],
+        "validaciones": row[6] or 0,
+        "nombre_upper": nombre.upper(),
+        "nombre_limpio": analisis.limpio,
+        "palabras": analisis.palabras,
+        "nombre_expandido": analisis.expandido,
+        "palabras_expandido": analisis.palabras_expandido,
+        "marca_extraida": analisis.marca,
+        "cantidad_extraida": analisis.cantidad,
+        "metros_extraidos": analisis.metros,
+    }
+
+
+class IndiceReferencia:
+    """Índice invertido (palabras + trigramas) sobre productos_referencia_ean"""
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._carga_lock = threading.Lock()
+        self._entradas: Dict[int, Dict] = {}
+        self._por_palabra: Dict[str, set] = {}
+        self._por_trigrama: Dict[str, set] = {}
+        self._marca_agua = None  # Mayor fecha de cambio vista
+        self._ultimo_refresco = 0.0
+        self._ultima_recarga = 0.0
+        self._ultimo_fallo = float("-inf")
+        self._desactualizado = False
+        self._memoria_bytes = 0
+        self._stats = {
+            "busquedas": 0,
+            "recargas": 0,
+            "refrescos": 0,
+            "actualizadas": 0,
+            "us_busqueda_total": 0.0,
+        }
+
+    # ------------------------------------------------------------------
+    # Mantenimiento
+    # ------------------------------------------------------------------
+
+    def _indexar(self, entrada: Dict):
+        id_ = entrada["referencia_id"]
+        for palabra in entrada["palabras"] | entrada["palabras_expandido"]:
+            self._por_palabra.setdefault(palabra, set()).add(id_)
+        for trigrama in trigramas(entrada["nombre_expandido"]):
+            self._por_trigrama.setdefault(trigrama, set()).add(id_)
+        self._entradas[id_] = entrada
+
+    def _desindexar(self, id_: int):
+        entrada = self._entradas.pop(id_, None)
+        if entrada is None:
+            return
+        for palabra in entrada["palabras"] | entrada["palabras_expandido"]:
+            ids = self._por_palabra.get(palabra)
+            if ids is not None:
+                ids.discard(id_)
+                if not ids:
+                    del self._por_palabra[palabra]
+        for trigrama in trigramas(entrada["nombre_expandido"]):
+            ids = self._por_trigrama.get(trigrama)
+            if ids is not None:
+                ids.discard(id_)
+                if not ids:
+                    del self._por_trigrama[trigrama]
+
+    def _aplicar(self, filas: Iterable) -> int:
+        n = 0
+        for row in filas:
+            self._desindexar(row[0])
+            self._indexar(preparar_referencia(row, memoizar=False))
+            if row[7] is not None and (
+                self._marca_agua is None or row[7] > self._marca_agua
+            ):
+                self._marca_agua = row[7]
+            n += 1
+        return n
+
+    def recargar(self, cursor):
+        """Reconstruye el índice completo desde la tabla"""
+        inicio = time.monotonic()
+        cursor.execute(f"SELECT {COLUMNAS} FROM productos_referencia_ean")
+        filas = cursor.fetchall()
+
+        nuevo = IndiceReferencia()
+        nuevo._aplicar(filas)
+
+        with self._lock:
+            self._entradas = nuevo._entradas
+            self._por_palabra = nuevo._por_palabra
+            self._por_trigrama = nuevo._por_trigrama
+            self._marca_agua = nuevo._marca_agua
+            self._ultima_recarga = self._ultimo_refresco = time.monotonic()
+            self._desactualizado = False
+            self._stats["recargas"] += 1
+            self._memoria_bytes = self._estimar_memoria()
+
+        print(
+            f"📚 [ÍNDICE REFERENCIA] {len(filas)} referencias indexadas en "
+            f"{(time.monotonic() - inicio) * 1000:.0f} ms "
+            f"(~{self._memoria_bytes / 1024 / 1024:.1f} MB)"
+        )
+
+    def refrescar(self, cursor):
+        """Incorpora las referencias creadas o modificadas desde el último refresco"""
+        with self._lock:
+            marca_agua = self._marca_agua
+        if marca_agua is None:
+            self.recargar(cursor)
+            return
+
+        cursor.execute(
+            f"""
+            SELECT {COLUMNAS}
+            FROM productos_referencia_ean
+            WHERE GREATEST(fecha_creacion, COALESCE(fecha_actualizacion, fecha_creacion))
+                  > %s - (%s * INTERVAL '1 second')
+        """,
+            (marca_agua, MARGEN_REFRESCO_SEG),
+        )
+        filas = cursor.fetchall()
+
+        with self._lock:
+            n = self._aplicar(filas)
+            self._ultimo_refresco = time.monotonic()
+            self._desactualizado = False
+            self._stats["refrescos"] += 1
+            self._stats["actualizadas"] += n
+
+    def asegurar_actualizado(self, conectar):
+        """
+        Carga o refresca el índice si corresponde. La primera carga es
+        síncrona; las recargas completas corren en un hilo aparte mientras
+        se sigue sirviendo el índice anterior. `conectar` abre una conexión
+        propia (nunca se usa la transacción del llamador).
+        """
+        if not self._entradas:
+            with self._carga_lock:
+                if self._entradas or (
+                    time.monotonic() - self._ultimo_fallo
+                    < INDICE_REFERENCIA_REFRESCO_SEG
+                ):
+                    return
+                try:
+                    self._ejecutar(self.recargar, conectar)
+                except Exception:
+                    self._ultimo_fallo = time.monotonic()
+                    raise
+            return
+
+        ahora = time.monotonic()
+        with self._lock:
+            if ahora - self._ultima_recarga >= INDICE_REFERENCIA_RECARGA_SEG:
+                accion = self.recargar
+            elif (
+                self._desactualizado
+                or ahora - self._ultimo_refresco >= INDICE_REFERENCIA_REFRESCO_SEG
+            ):
+                accion = self.refrescar
+            else:
+                return
+
+        if not self._carga_lock.acquire(blocking=False):
+            return  # Otro hilo ya lo está actualizando
+
+        def tarea():
+            try:
+                self._ejecutar(accion, conectar)
+            except Exception as e:
+                print(f"⚠️ [ÍNDICE REFERENCIA] No se pudo actualizar: {e}")
+            finally:
+                # Sin reintentar en cada búsqueda si la BD falla
+                with self._lock:
+                    self._ultimo_refresco = time.monotonic()
+                    if accion == self.recargar:
+                        self._ultima_recarga = self._ultimo_refresco
+                self._carga_lock.release()
+
+        if accion == self.recargar:
+            threading.Thread(target=tarea, daemon=True).start()
+        else:
+            tarea()
+
+    @staticmethod
+    def _ejecutar(accion, conectar):
+        conn = conectar()
+        cursor = conn.cursor()
+        try:
+            accion(cursor)
+        finally:
+            cursor.close()
+            conn.close()
+
+    def marcar_desactualizado(self):
+        """Fuerza un refresco incremental en la próxima búsqueda"""
+        with self._lock:
+            self._desactualizado = True
+
+    # ------------------------------------------------------------------
+    # Búsqueda
+    # ------------------------------------------------------------------
+
+    def candidatos(self, palabras: List[str], limite: int = 50) -> List[Dict]:
+        """
+        Top-`limite` referencias que comparten palabras o trigramas con las
+        palabras buscadas, de más a menos coincidencias (desempate por
+        validaciones). Una palabra que no está en el catálogo (error de OCR)
+        busca por sus trigramas.
+        """
+        inicio = time.perf_counter()
+        with self._lock:
+            maximo = max(1, int(len(self._entradas) * FRACCION_MAX_LISTA))
+            # Las listas selectivas generan candidatos; las demasiado comunes
+            # y los trigramas de palabras conocidas solo suman puntaje
+            generadoras, puntuadoras = [], []
+            for palabra in set(palabras):
+                ids = self._por_palabra.get(palabra)
+                if ids:
+                    destino = generadoras if len(ids) <= maximo else puntuadoras
+                    destino.append((ids, PESO_PALABRA))
+                for trigrama in trigramas(palabra):
+                    ids_trigrama = self._por_trigrama.get(trigrama)
+                    if not ids_trigrama:
+                        continue
+                    if ids or len(ids_trigrama) > maximo:
+                        puntuadoras.append((ids_trigrama, 1))
+                    else:
+                        generadoras.append((ids_trigrama, 1))
+
+            if not generadoras and puntuadoras:
+                puntuadoras.sort(key=lambda l: len(l[0]))
+                generadoras.append(puntuadoras.pop(0))
+
+            conteo = Counter()
+            for ids, peso in generadoras:
+                for id_ in ids:
+                    conteo[id_] += peso
+            for ids, peso in puntuadoras:
+                for id_ in conteo:
+                    if id_ in ids:
+                        conteo[id_] += peso
+
+            entradas = self._entradas
+            mejores = heapq.nlargest(
+                limite,
+                conteo.items(),
+                key=lambda par: (par[1], entradas[par[0]]["validaciones"]),
+            )
+            resultado = [entradas[id_] for id_, _ in mejores]
+
+            self._stats["busquedas"] += 1
+            self._stats["us_busqueda_total"] += (time.perf_counter() - inicio) * 1e6
+        return resultado
+
+    # ------------------------------------------------------------------
+    # Estado
+    # ------------------------------------------------------------------
+
+    def _estimar_memoria(self) -> int:
+        total = sys.getsizeof(self._entradas)
+        for entrada in self._entradas.values():
+            total += sys.getsizeof(entrada)
+            for valor in entrada.values():
+                total += sys.getsizeof(valor)
+        for indice in (self._por_palabra, self._por_trigrama):
+            total += sys.getsizeof(indice)
+            for clave, ids in indice.items():
+                total += sys.getsizeof(clave) + sys.getsizeof(ids)
+        return total
+
+    def estadisticas(self) -> Dict:
+        with self._lock:
+            stats = dict(self._stats)
+            busquedas = stats.pop("us_busqueda_total")
+            stats.update(
+                {
+                    "habilitado": INDICE_REFERENCIA_HABILITADO,
+                    "referencias": len(self._entradas),
+                    "palabras": len(self._por_palabra),
+                    "trigramas": len(self._por_trigrama),
+                    "memoria_mb": round(self._memoria_bytes / 1024 / 1024, 2),
+                    "us_promedio_busqueda": (
+                        round(busquedas / stats["busquedas"], 1)
+                        if stats["busquedas"]
+                        else 0.0
+                    ),
+                    "marca_agua": (
+                        self._marca_agua.isoformat()
+                        if hasattr(self._marca_agua, "isoformat")
+                        else self._marca_agua
+                    ),
+                }
+            )
+        return stats
+
+
+_indice = IndiceReferencia()
+
+
+def candidatos(palabras: List[str], limite: int = 50) -> Optional[List[Dict]]:
+    """
+    Candidatos desde el índice del proceso, refrescándolo si corresponde.
+    None si el índice está deshabilitado o no se pudo cargar (el llamador
+    usa la consulta SQL de siempre).
+    """
+    if not INDICE_REFERENCIA_HABILITADO:
+        return None
+
+    from database import get_db_connection
+
+    try:
+        _indice.asegurar_actualizado(get_db_connection)
+    except Exception as e:
+        print(f"⚠️ [ÍNDICE REFERENCIA] No se pudo actualizar: {e}")
+    if not _indice._entradas:
+        return None
+    return _indice.candidatos(palabras, limite)
+
+
+def marcar_desactualizado():
+    _indice.marcar_desactualizado()
+
+
+def estadisticas() -> Dict:
+    return _indice.estadisticas()
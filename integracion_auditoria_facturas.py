@@ -221,7 +221,7 @@ EJEMPLO COMPLETO: Cómo se vería tu endpoint de subir factura con todo integrad
 
 ```python
 from fastapi import APIRouter, UploadFile, File, HTTPException
-from claude_invoice import parse_invoice_with_claude
+from claude_invoice import parse_invoice_with_claude_async
 from integracion_auditoria_facturas import (
     procesar_factura_con_auditoria,
     normalizar_productos_durante_carga
@@ -246,7 +246,7 @@ async def subir_factura(
 
         # 2. Procesar con Claude Vision
         print("📹 Procesando video con Claude Vision...")
-        result = parse_invoice_with_claude(temp_path)
+        result = await parse_invoice_with_claude_async(temp_path)
 
         if not result["success"]:
             raise HTTPException(status_code=400, detail=result["error"])
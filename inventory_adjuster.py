@@ -22,7 +22,7 @@ def get_db_connection():
     return get_conn()
 
 
-def ajustar_precios_items_por_total(factura_id: int, conn=None) -> bool:
+def ajustar_precios_items_por_total(factura_id: int, conn=None, commit: bool = True) -> bool:
     """
     Ajusta precios de items proporcionalmente cuando hay descuento global
 
@@ -33,6 +33,8 @@ def ajustar_precios_items_por_total(factura_id: int, conn=None) -> bool:
     Args:
         factura_id: ID de la factura
         conn: Conexión a BD (opcional, se crea si no se provee)
+        commit: False deja el ajuste en la transacción del llamador y
+                propaga los errores (el llamador hace rollback)
 
     Returns:
         True si se ajustaron precios, False si no fue necesario
@@ -153,7 +155,8 @@ def ajustar_precios_items_por_total(factura_id: int, conn=None) -> bool:
             items_ajustados += 1
 
         if items_ajustados > 0:
-            conn.commit()
+            if commit:
+                conn.commit()
             print(f"   ✅ {items_ajustados} items ajustados")
             return True
         else:
@@ -161,6 +164,8 @@ def ajustar_precios_items_por_total(factura_id: int, conn=None) -> bool:
             return False
 
     except Exception as e:
+        if not commit:
+            raise
         print(f"❌ Error ajustando precios: {e}")
         import traceback
         traceback.print_exc()
@@ -173,7 +178,7 @@ def ajustar_precios_items_por_total(factura_id: int, conn=None) -> bool:
             conn.close()
 
 
-def limpiar_items_duplicados(factura_id: int, conn=None) -> int:
+def limpiar_items_duplicados(factura_id: int, conn=None, commit: bool = True) -> int:
     """
     Elimina items duplicados en una factura
 
@@ -185,6 +190,8 @@ def limpiar_items_duplicados(factura_id: int, conn=None) -> int:
     Args:
         factura_id: ID de la factura
         conn: Conexión a BD (opcional)
+        commit: False deja la limpieza en la transacción del llamador y
+                propaga los errores (el llamador hace rollback)
 
     Returns:
         Número de items eliminados
@@ -280,7 +287,8 @@ def limpiar_items_duplicados(factura_id: int, conn=None) -> int:
             print(f"   ✓ Producto {producto_id}: {len(items)} → 1 (cantidad: {cantidad_total})")
 
         if items_eliminados > 0:
-            conn.commit()
+            if commit:
+                conn.commit()
             print(f"   ✅ {items_eliminados} items duplicados eliminados")
         else:
             print(f"   ℹ️ No se encontraron duplicados")
@@ -288,6 +296,8 @@ def limpiar_items_duplicados(factura_id: int, conn=None) -> int:
         return items_eliminados
 
     except Exception as e:
+        if not commit:
+            raise
         print(f"❌ Error limpiando duplicados: {e}")
         import traceback
         traceback.print_exc()
@@ -0,0 +1,663 @@
+"""
+Cola de Trabajos Durable sobre processing_jobs
+==============================================
+
+Reemplaza la Queue en memoria de ocr_processor y las BackgroundTasks de
+video. Los trabajos viven en la tabla processing_jobs, así que sobreviven
+reinicios y cualquier proceso/nodo con workers puede tomarlos.
+
+- Reclamo con SELECT ... FOR UPDATE SKIP LOCKED (sin dobles procesamientos)
+- Pool de workers configurable por proceso (JOB_WORKERS)
+- Despertar por LISTEN/NOTIFY en lugar de dormir en un bucle
+- Visibility timeout: si un worker muere, el trabajo vuelve a estar
+  disponible cuando vence bloqueado_hasta (con heartbeat mientras corre)
+- Reintentos con backoff exponencial + jitter
+- Dead letter: al agotar max_intentos queda en status 'failed' con el
+  último error; /admin/jobs/dead-letter los lista y permite reencolar
+
+Los trabajos que dependen de un archivo local (video/imagen en /tmp)
+se encolan con `nodo` = hostname para que solo los reclame ese nodo. Cada
+nodo deja un latido en job_nodos (migración 017); si un nodo no late
+durante JOB_NODO_CADUCIDAD_SEG sus trabajos fijados pasan a dead letter,
+sin nodo para que /admin/jobs/dead-letter pueda reencolarlos.
+
+Autor: LecFac
+Versión: 1.0.0
+"""
+
+import asyncio
+import inspect
+import json
+import os
+import random
+import select
+import socket
+import threading
+import time
+import traceback
+import uuid
+from typing import Any, Callable, Dict, List, Optional
+
+
+JOB_WORKERS = int(os.environ.get("JOB_WORKERS", "2"))
+JOB_VISIBILITY_TIMEOUT = int(os.environ.get("JOB_VISIBILITY_TIMEOUT", "600"))
+JOB_MAX_INTENTOS = int(os.environ.get("JOB_MAX_INTENTOS", "3"))
+JOB_BACKOFF_BASE = float(os.environ.get("JOB_BACKOFF_BASE", "10"))
+JOB_BACKOFF_MAX = float(os.environ.get("JOB_BACKOFF_MAX", "600"))
+# Sondeo de respaldo: recoge reintentos programados y trabajos huérfanos
+JOB_POLL_RESPALDO = float(os.environ.get("JOB_POLL_RESPALDO", "30"))
+# Sin latido durante este tiempo el nodo se da por caído
+JOB_NODO_CADUCIDAD_SEG = int(os.environ.get("JOB_NODO_CADUCIDAD_SEG", "900"))
+
+CANAL_NOTIFY = "lecfac_jobs"
+NODO_LOCAL = os.environ.get("JOB_NODO") or socket.gethostname()
+
+
+def _es_postgresql() -> bool:
+    return os.environ.get("DATABASE_TYPE", "sqlite").lower() == "postgresql"
+
+
+# ============================================================================
+# REGISTRO DE HANDLERS
+# ============================================================================
+
+# tipo -> {"handler": fn(job_id, payload, usuario_id), "al_morir": fn | None}
+_handlers: Dict[str, Dict[str, Optional[Callable]]] = {}
+
+
+def registrar_handler(
+    tipo: str, handler: Callable, al_morir: Optional[Callable] = None
+):
+    """
+    Registra la función que procesa los trabajos de `tipo`.
+
+    handler(job_id, payload, usuario_id) puede ser sync o async; si lanza
+    excepción el trabajo se reintenta. al_morir(job_id, payload, error) se
+    llama cuando el trabajo pasa a dead letter (limpieza de temporales, etc.).
+    """
+    _handlers[tipo] = {"handler": handler, "al_morir": al_morir}
+
+
+# Corrutinas sin argumentos que se esperan al final de cada handler async,
+# antes de que asyncio.run() cierre su loop (clientes HTTP async atados a él)
+_cierres_async: List[Callable] = []
+
+
+def registrar_cierre_async(cerrar: Callable):
+    """Registra una corrutina de limpieza para el loop de los handlers async"""
+    _cierres_async.append(cerrar)
+
+
+async def _correr_handler_async(resultado):
+    try:
+        await resultado
+    finally:
+        for cerrar in _cierres_async:
+            try:
+                await cerrar()
+            except Exception as e:
+                print(f"⚠️ [JOBS] Error en limpieza async: {e}")
+
+
+# ============================================================================
+# PRODUCTOR
+# ============================================================================
+
+
+def encolar_trabajo(
+    tipo: str,
+    payload: Dict[str, Any],
+    usuario_id: Optional[int] = None,
+    job_id: Optional[str] = None,
+    archivo_local: bool = False,
+    max_intentos: int = JOB_MAX_INTENTOS,
+    conn=None,
+    retraso_seg: int = 0,
+) -> Optional[str]:
+    """
+    Inserta un trabajo en processing_jobs y despierta a los workers.
+
+    Args:
+        archivo_local: el payload apunta a un archivo de este nodo
+        conn: conexión existente para encolar en la misma transacción
+              (el NOTIFY se entrega al hacer commit)
+        retraso_seg: el trabajo queda disponible después de este tiempo
+                     (lo recoge el sondeo de respaldo)
+
+    Returns:
+        job_id, o None si no hay PostgreSQL (el llamador usa su fallback)
+    """
+    if not _es_postgresql():
+        return None
+
+    from database import get_db_connection
+
+    job_id = job_id or str(uuid.uuid4())
+    propia = conn is None
+    if propia:
+        conn = get_db_connection()
+
+    cursor = conn.cursor()
+    try:
+        cursor.execute(
+            """
+            INSERT INTO processing_jobs (
+                id, usuario_id, tipo, payload, video_path, nodo,
+                status, max_intentos, disponible_en, created_at
+            ) VALUES (%s, %s, %s, %s, %s, %s, 'pending', %s,
+                      CURRENT_TIMESTAMP + (%s * INTERVAL '1 second'),
+                      CURRENT_TIMESTAMP)
+        """,
+            (
+                job_id,
+                usuario_id,
+                tipo,
+                json.dumps(payload, default=str),
+                payload.get("video_path"),
+                NODO_LOCAL if archivo_local else None,
+                max_intentos,
+                retraso_seg,
+            ),
+        )
+        cursor.execute("SELECT pg_notify(%s, %s)", (CANAL_NOTIFY, tipo))
+        if propia:
+            conn.commit()
+        return job_id
+    except Exception:
+        if propia:
+            conn.rollback()
+        raise
+    finally:
+        cursor.close()
+        if propia:
+            conn.close()
+
+
+def contar_pendientes() -> int:
+    """Trabajos esperando worker (incluye reintentos programados)"""
+    if not _es_postgresql():
+        return 0
+
+    from database import get_db_connection
+
+    conn = get_db_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute(
+            "SELECT COUNT(*) FROM processing_jobs WHERE status = 'pending' AND tipo IS NOT NULL"
+        )
+        total = cursor.fetchone()[0]
+        cursor.close()
+        return total
+    finally:
+        conn.close()
+
+
+def listar_dead_letter(limite: int = 50) -> List[Dict]:
+    """Trabajos que agotaron sus reintentos"""
+    from database import get_db_connection
+
+    conn = get_db_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute(
+            """
+            SELECT id, tipo, usuario_id, intentos, error_message, completed_at, nodo
+            FROM processing_jobs
+            WHERE status = 'failed' AND tipo IS NOT NULL AND intentos >= max_intentos
+            ORDER BY completed_at DESC
+            LIMIT %s
+        """,
+            (limite,),
+        )
+        trabajos = [
+            {
+                "job_id": r[0],
+                "tipo": r[1],
+                "usuario_id": r[2],
+                "intentos": r[3],
+                "error": r[4],
+                "fallido_en": r[5].isoformat() if r[5] else None,
+                "nodo": r[6],
+            }
+            for r in cursor.fetchall()
+        ]
+        cursor.close()
+        return trabajos
+    finally:
+        conn.close()
+
+
+def reencolar_trabajo(job_id: str) -> bool:
+    """Saca un trabajo del dead letter y lo devuelve a la cola"""
+    from database import get_db_connection
+
+    conn = get_db_connection()
+    try:
+        cursor = conn.cursor()
+        cursor.execute(
+            """
+            UPDATE processing_jobs
+            SET status = 'pending', intentos = 0, error_message = NULL,
+                disponible_en = CURRENT_TIMESTAMP, completed_at = NULL
+            WHERE id = %s AND status = 'failed' AND tipo IS NOT NULL
+        """,
+            (job_id,),
+        )
+        ok = cursor.rowcount > 0
+        if ok:
+            cursor.execute("SELECT pg_notify(%s, %s)", (CANAL_NOTIFY, job_id))
+        conn.commit()
+        cursor.close()
+        return ok
+    finally:
+        conn.close()
+
+
+# ============================================================================
+# CONSUMIDOR
+# ============================================================================
+
+
+class ColaTrabajos:
+    """Pool de workers que consume processing_jobs"""
+
+    def __init__(self, num_workers: int = JOB_WORKERS):
+        self.num_workers = num_workers
+        self.is_running = False
+        self._threads: List[threading.Thread] = []
+        self._despertar = threading.Event()
+        self.stats = {
+            "procesados": 0,
+            "reintentados": 0,
+            "dead_letter": 0,
+            "notificaciones": 0,
+            "huerfanos": 0,
+        }
+        self._stats_lock = threading.Lock()
+        self._ultimo_latido = 0.0
+
+    # ------------------------------------------------------------------
+    def start(self):
+        if self.is_running:
+            return
+        if not _es_postgresql():
+            print("⚠️ [JOBS] Cola durable requiere PostgreSQL, workers no iniciados")
+            return
+
+        self.is_running = True
+
+        listener = threading.Thread(
+            target=self._escuchar, name="jobs-listener", daemon=True
+        )
+        listener.start()
+        self._threads.append(listener)
+
+        for i in range(self.num_workers):
+            t = threading.Thread(
+                target=self._worker, args=(f"{NODO_LOCAL}-w{i}",), daemon=True
+            )
+            t.start()
+            self._threads.append(t)
+
+        print(f"✅ [JOBS] {self.num_workers} workers escuchando '{CANAL_NOTIFY}'")
+
+    def stop(self):
+        self.is_running = False
+        self._despertar.set()
+
+    def _sumar(self, clave: str):
+        with self._stats_lock:
+            self.stats[clave] += 1
+
+    # ------------------------------------------------------------------
+    # LISTEN/NOTIFY
+    # ------------------------------------------------------------------
+    def _escuchar(self):
+        """Conexión dedicada con LISTEN; despierta a los workers en cada NOTIFY"""
+        from database import PSYCOPG_VERSION, _crear_conexion_postgresql
+
+        while self.is_running:
+            conn = None
+            try:
+                conn = _crear_conexion_postgresql(os.environ["DATABASE_URL"])
+                conn.autocommit = True
+                conn.cursor().execute(f"LISTEN {CANAL_NOTIFY}")
+
+                while self.is_running:
+                    if PSYCOPG_VERSION == 3:
+                        recibidas = list(
+                            conn.notifies(timeout=JOB_POLL_RESPALDO, stop_after=1)
+                        )
+                    else:
+                        recibidas = []
+                        if select.select([conn], [], [], JOB_POLL_RESPALDO)[0]:
+                            conn.poll()
+                            recibidas = list(conn.notifies)
+                            del conn.notifies[:]
+
+                    if recibidas:
+                        self._sumar("notificaciones")
+                    # Con o sin notificación: el timeout hace de sondeo de respaldo
+                    self._despertar.set()
+
+                    if time.monotonic() - self._ultimo_latido >= JOB_POLL_RESPALDO:
+                        self._ultimo_latido = time.monotonic()
+                        try:
+                            self._latir_y_rescatar()
+                        except Exception as e:
+                            print(f"⚠️ [JOBS] Latido del nodo: {e}")
+
+            except Exception as e:
+                print(f"⚠️ [JOBS] Listener caído, reconectando: {e}")
+                self._despertar.set()
+                time.sleep(5)
+            finally:
+                if conn is not None:
+                    try:
+                        conn.close()
+                    except Exception:
+                        pass
+
+    def _latir_y_rescatar(self):
+        """
+        Registra el latido de este nodo y manda a dead letter los trabajos
+        fijados a nodos sin latido (su archivo local ya no es accesible)
+        """
+        from database import get_db_connection
+
+        conn = get_db_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute(
+                """
+                INSERT INTO job_nodos (nodo, visto_en)
+                VALUES (%s, CURRENT_TIMESTAMP)
+                ON CONFLICT (nodo) DO UPDATE SET visto_en = EXCLUDED.visto_en
+            """,
+                (NODO_LOCAL,),
+            )
+            cursor.execute(
+                """
+                UPDATE processing_jobs j
+                SET status = 'failed',
+                    error_message =
+                        'Nodo ' || j.nodo || ' caído: archivo local inaccesible',
+                    intentos = GREATEST(j.intentos, j.max_intentos),
+                    nodo = NULL,
+                    completed_at = CURRENT_TIMESTAMP,
+                    bloqueado_hasta = NULL
+                WHERE j.id IN (
+                    SELECT p.id FROM processing_jobs p
+                    WHERE p.tipo IS NOT NULL
+                      AND p.nodo IS NOT NULL AND p.nodo <> %s
+                      AND (
+                        p.status = 'pending'
+                        OR (p.status = 'processing'
+                            AND p.bloqueado_hasta < CURRENT_TIMESTAMP)
+                      )
+                      AND p.created_at < CURRENT_TIMESTAMP - (%s * INTERVAL '1 second')
+                      AND NOT EXISTS (
+                        SELECT 1 FROM job_nodos n
+                        WHERE n.nodo = p.nodo
+                          AND n.visto_en
+                              >= CURRENT_TIMESTAMP - (%s * INTERVAL '1 second')
+                      )
+                    FOR UPDATE SKIP LOCKED
+                )
+                RETURNING j.id, j.tipo, j.payload, j.error_message
+            """,
+                (NODO_LOCAL, JOB_NODO_CADUCIDAD_SEG, JOB_NODO_CADUCIDAD_SEG),
+            )
+            huerfanos = cursor.fetchall()
+            conn.commit()
+            cursor.close()
+        finally:
+            conn.close()
+
+        for job_id, tipo, payload, error in huerfanos:
+            self._sumar("huerfanos")
+            print(f"💀 [JOBS] {job_id}: {error} → dead letter")
+            registro = _handlers.get(tipo)
+            if registro and registro.get("al_morir"):
+                if isinstance(payload, str):
+                    payload = json.loads(payload)
+                try:
+                    registro["al_morir"](job_id, payload, error)
+                except Exception as e:
+                    print(f"⚠️ [JOBS] al_morir {job_id}: {e}")
+
+    # ------------------------------------------------------------------
+    # Workers
+    # ------------------------------------------------------------------
+    def _worker(self, worker_id: str):
+        while self.is_running:
+            try:
+                trabajo = self._reclamar(worker_id)
+            except Exception as e:
+                print(f"❌ [JOBS] Error reclamando trabajo: {e}")
+                trabajo = None
+                time.sleep(2)
+
+            if trabajo is None:
+                self._despertar.wait(JOB_POLL_RESPALDO)
+                self._despertar.clear()
+                continue
+
+            if trabajo["intentos"] > trabajo["max_intentos"]:
+                # Reclamado por visibilidad vencida sin intentos restantes
+                self._marcar_fallo(
+                    trabajo,
+                    "Visibility timeout vencido sin intentos restantes",
+                    _handlers.get(trabajo["tipo"]),
+                )
+                continue
+
+            self._ejecutar(worker_id, trabajo)
+
+    def _reclamar(self, worker_id: str) -> Optional[Dict]:
+        """Toma el siguiente trabajo disponible (o con visibilidad vencida)"""
+        from database import get_db_connection
+
+        conn = get_db_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute(
+                """
+                UPDATE processing_jobs j
+                SET status = 'processing',
+                    intentos = j.intentos + 1,
+                    started_at = CURRENT_TIMESTAMP,
+                    bloqueado_hasta = CURRENT_TIMESTAMP + (%s * INTERVAL '1 second'),
+                    worker_id = %s
+                WHERE j.id = (
+                    SELECT id FROM processing_jobs
+                    WHERE tipo = ANY(%s)
+                      AND (nodo IS NULL OR nodo = %s)
+                      AND (
+                        (status = 'pending' AND disponible_en <= CURRENT_TIMESTAMP)
+                        OR (status = 'processing' AND bloqueado_hasta < CURRENT_TIMESTAMP)
+                      )
+                    ORDER BY disponible_en
+                    LIMIT 1
+                    FOR UPDATE SKIP LOCKED
+                )
+                RETURNING j.id, j.tipo, j.payload, j.usuario_id, j.intentos, j.max_intentos
+            """,
+                (JOB_VISIBILITY_TIMEOUT, worker_id, list(_handlers), NODO_LOCAL),
+            )
+            fila = cursor.fetchone()
+            conn.commit()
+            cursor.close()
+        finally:
+            conn.close()
+
+        if not fila:
+            return None
+
+        payload = fila[2]
+        if isinstance(payload, str):
+            payload = json.loads(payload)
+
+        return {
+            "id": fila[0],
+            "tipo": fila[1],
+            "payload": payload or {},
+            "usuario_id": fila[3],
+            "intentos": fila[4],
+            "max_intentos": fila[5],
+            "worker_id": worker_id,
+        }
+
+    def _ejecutar(self, worker_id: str, trabajo: Dict):
+        job_id = trabajo["id"]
+        registro = _handlers.get(trabajo["tipo"])
+
+        print(
+            f"🔧 [JOBS] {worker_id} → {trabajo['tipo']} {job_id} "
+            f"(intento {trabajo['intentos']}/{trabajo['max_intentos']})"
+        )
+
+        fin_heartbeat = threading.Event()
+        heartbeat = threading.Thread(
+            target=self._heartbeat, args=(job_id, worker_id, fin_heartbeat), daemon=True
+        )
+        heartbeat.start()
+
+        try:
+            if registro is None:
+                raise RuntimeError(f"Sin handler para tipo '{trabajo['tipo']}'")
+
+            resultado = registro["handler"](
+                job_id, trabajo["payload"], trabajo["usuario_id"]
+            )
+            if inspect.isawaitable(resultado):
+                asyncio.run(_correr_handler_async(resultado))
+
+            fin_heartbeat.set()
+            self._marcar_completado(job_id, worker_id)
+            self._sumar("procesados")
+
+        except Exception as e:
+            fin_heartbeat.set()
+            traceback.print_exc()
+            self._marcar_fallo(trabajo, str(e), registro)
+
+    def _heartbeat(self, job_id: str, worker_id: str, fin: threading.Event):
+        """Extiende bloqueado_hasta mientras el handler sigue vivo"""
+        from database import get_db_connection
+
+        intervalo = max(5, JOB_VISIBILITY_TIMEOUT // 3)
+        while not fin.wait(intervalo):
+            try:
+                conn = get_db_connection()
+                cursor = conn.cursor()
+                cursor.execute(
+                    """
+                    UPDATE processing_jobs
+                    SET bloqueado_hasta = CURRENT_TIMESTAMP + (%s * INTERVAL '1 second')
+                    WHERE id = %s AND worker_id = %s AND status = 'processing'
+                """,
+                    (JOB_VISIBILITY_TIMEOUT, job_id, worker_id),
+                )
+                conn.commit()
+                cursor.close()
+                conn.close()
+            except Exception as e:
+                print(f"⚠️ [JOBS] Heartbeat {job_id}: {e}")
+
+    def _marcar_completado(self, job_id: str, worker_id: str):
+        """
+        El handler pudo haber fijado su propio estado final; no lo pisa. Si el
+        trabajo se reclamó en otro worker, el cierre es de ese worker.
+        """
+        from database import get_db_connection
+
+        conn = get_db_connection()
+        try:
+            cursor = conn.cursor()
+            cursor.execute(
+                """
+                UPDATE processing_jobs
+                SET status = 'completed', completed_at = CURRENT_TIMESTAMP,
+                    bloqueado_hasta = NULL
+                WHERE id = %s AND worker_id = %s AND status = 'processing'
+            """,
+                (job_id, worker_id),
+            )
+            conn.commit()
+            cursor.close()
+        finally:
+            conn.close()
+
+    def _marcar_fallo(self, trabajo: Dict, error: str, registro: Optional[Dict]):
+        """Solo el worker que tiene el trabajo reclamado lo reintenta o lo mata"""
+        from database import get_db_connection
+
+        job_id = trabajo["id"]
+        worker_id = trabajo["worker_id"]
+        intentos = trabajo["intentos"]
+        definitivo = intentos >= trabajo["max_intentos"]
+
+        conn = get_db_connection()
+        try:
+            cursor = conn.cursor()
+            if definitivo:
+                cursor.execute(
+                    """
+                    UPDATE processing_jobs
+                    SET status = 'failed', error_message = %s,
+                        completed_at = CURRENT_TIMESTAMP, bloqueado_hasta = NULL
+                    WHERE id = %s AND worker_id = %s AND status = 'processing'
+                """,
+                    (error[:500], job_id, worker_id),
+                )
+            else:
+                espera = min(JOB_BACKOFF_MAX, JOB_BACKOFF_BASE * 2 ** (intentos - 1))
+                espera *= random.uniform(0.8, 1.2)
+                cursor.execute(
+                    """
+                    UPDATE processing_jobs
+                    SET status = 'pending', error_message = %s, bloqueado_hasta = NULL,
+                        disponible_en = CURRENT_TIMESTAMP + (%s * INTERVAL '1 second')
+                    WHERE id = %s AND worker_id = %s AND status = 'processing'
+                """,
+                    (error[:500], espera, job_id, worker_id),
+                )
+            propio = cursor.rowcount > 0
+            conn.commit()
+            cursor.close()
+        finally:
+            conn.close()
+
+        if not propio:
+            print(f"⚠️ [JOBS] {job_id} ya lo tiene otro worker; no se toca")
+            return
+
+        if definitivo:
+            self._sumar("dead_letter")
+            print(f"💀 [JOBS] {job_id} agotó {intentos} intentos → dead letter")
+            if registro and registro.get("al_morir"):
+                try:
+                    registro["al_morir"](job_id, trabajo["payload"], error)
+                except Exception as e:
+                    print(f"⚠️ [JOBS] al_morir {job_id}: {e}")
+        else:
+            self._sumar("reintentados")
+            print(f"🔁 [JOBS] {job_id} reintento programado")
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._stats_lock:
+            stats = dict(self.stats)
+        stats.update(
+            {
+                "is_running": self.is_running,
+                "workers": self.num_workers,
+                "nodo": NODO_LOCAL,
+                "tipos": sorted(_handlers),
+            }
+        )
+        return stats
+
+
+cola_trabajos = ColaTrabajos()
@@ -8,6 +8,7 @@ import tempfile
 import traceback
 import json
 import uuid
+import asyncio
 
 # LIMPIEZA DE CACHÉ AL INICIO .
 import shutil
@@ -52,6 +53,7 @@ from pydantic import BaseModel
 from database import (
     create_tables,
     get_db_connection,
+    get_postgres_pool,
     hash_password,
     verify_password,
     test_database_connection,
@@ -60,7 +62,28 @@ from database import (
     actualizar_inventario_desde_factura as actualizar_inventario_desde_factura,
     procesar_items_factura_y_guardar_precios,
 )
-from analytics_updater import actualizar_todas_las_tablas_analiticas
+from db_pool import estado_pools, cerrar_pools
+import db_async
+import claude_client
+import cache_vtex
+import catalogo_vtex
+import cliente_vtex
+import coalescencia
+import fusion_productos
+import indice_duplicados
+import indice_referencia
+import busqueda_productos
+import normalizacion_nombres
+import enriquecimiento_web
+import outbox_analitica
+import agregados_analiticos
+from job_queue import (
+    encolar_trabajo,
+    registrar_handler,
+    registrar_cierre_async,
+    listar_dead_letter,
+    reencolar_trabajo,
+)
 from calificaciones_api import router as calificaciones_router
 
 # Importar routers
@@ -69,7 +92,7 @@ from audit_system import AuditSystem
 from mobile_endpoints import router as mobile_router
 from storage import save_image_to_db, get_image_from_db
 from validator import FacturaValidator
-from claude_invoice import parse_invoice_with_claude
+from claude_invoice import parse_invoice_with_claude, parse_invoice_with_claude_async
 from comparador_api import router as comparador_router
 from fastapi.responses import FileResponse, HTMLResponse
 from auditoria_api_v2 import router as auditoria_router
@@ -97,7 +120,10 @@ print("\n" + "=" * 80)
 print("🔍 IMPORTANDO product_matcher.py LIMPIO...")
 print("=" * 80)
 
-from product_matcher import buscar_o_crear_producto_inteligente
+from product_matcher import (
+    buscar_o_crear_producto_inteligente,
+    crear_resolutor_factura,
+)
 
 print("\n" + "=" * 80)
 print("✅ product_matcher IMPORTADO EXITOSAMENTE")
@@ -490,11 +516,37 @@ async def lifespan(app: FastAPI):
     else:
         print("⚠️ Error de conexión a base de datos")
 
+    try:
+        pool = get_postgres_pool()
+        if pool and os.environ.get("DATABASE_TYPE", "sqlite").lower() == "postgresql":
+            pool.precalentar()
+            print(f"✅ Pool PostgreSQL listo: {pool.estado()['abiertas']} conexiones")
+    except Exception as e:
+        print(f"⚠️ No se pudo precalentar el pool: {e}")
+
+    await db_async.iniciar_pool_async()
+
     try:
         create_tables()
-        print("✅ Tablas verificadas/creadas")
+        print("✅ Esquema verificado (migraciones)")
     except Exception as e:
+        # Sin el esquema al día no se arranca
         print(f"❌ Error creando tablas: {e}")
+        raise
+
+    try:
+        intervalo = agregados_analiticos.AGREGADOS_CONCILIACION_INTERVALO_SEG
+        if intervalo > 0 and agregados_analiticos.programar_conciliacion(intervalo):
+            print("✅ Conciliación de analíticas programada")
+    except Exception as e:
+        print(f"⚠️ No se pudo programar la conciliación de analíticas: {e}")
+
+    try:
+        refrescos = catalogo_vtex.programar_refrescos()
+        if refrescos:
+            print(f"✅ Refresco del catálogo VTEX programado para {refrescos} tiendas")
+    except Exception as e:
+        print(f"⚠️ No se pudo programar el refresco del catálogo VTEX: {e}")
 
     print("=" * 60)
     print("✅ SERVIDOR LISTO")
@@ -503,6 +555,10 @@ async def lifespan(app: FastAPI):
     yield
 
     processor.stop()
+    await claude_client.cerrar_clientes_async()
+    await cliente_vtex.cerrar_clientes_async()
+    await db_async.cerrar_pool_async()
+    cerrar_pools()
     print("\n👋 Cerrando LecFac API...")
 
 
@@ -633,21 +689,23 @@ async def parse_video(
         video_size_mb = len(content) / (1024 * 1024)
         print(f"💾 Tamaño: {video_size_mb:.2f} MB")
 
-        conn = get_db_connection()
-        cursor = conn.cursor()
-
-        job_id = str(uuid.uuid4())
+        # Cola durable (PostgreSQL): sobrevive reinicios y la toma cualquier worker
+        job_id = encolar_trabajo(
+            "video_factura",
+            {"video_path": temp_video.name},
+            usuario_id=usuario_id,
+            archivo_local=True,
+        )
 
-        if os.environ.get("DATABASE_TYPE") == "postgresql":
-            cursor.execute(
-                """
-                INSERT INTO processing_jobs (
-                    id, usuario_id, status, created_at
-                ) VALUES (%s, %s, 'pending', CURRENT_TIMESTAMP)
-            """,
-                (job_id, usuario_id),
-            )
+        if job_id:
+            print(f"✅ Job encolado: {job_id}")
         else:
+            # SQLite: sin cola durable, procesar en BackgroundTasks
+            conn = get_db_connection()
+            cursor = conn.cursor()
+
+            job_id = str(uuid.uuid4())
+
             cursor.execute(
                 """
                 INSERT INTO processing_jobs (
@@ -657,17 +715,17 @@ async def parse_video(
                 (job_id, usuario_id, datetime.now()),
             )
 
-        conn.commit()
-        cursor.close()
-        conn.close()
+            conn.commit()
+            cursor.close()
+            conn.close()
 
-        print(f"✅ Job creado: {job_id}")
+            print(f"✅ Job creado: {job_id}")
 
-        background_tasks.add_task(
-            process_video_background_task, job_id, temp_video.name, usuario_id
-        )
+            background_tasks.add_task(
+                process_video_background_task, job_id, temp_video.name, usuario_id
+            )
 
-        print(f"✅ Tarea en background agregada")
+            print(f"✅ Tarea en background agregada")
         print(f"{'='*60}\n")
 
         return JSONResponse(
@@ -1277,6 +1335,19 @@ async def health_check():
             "database": db_status,
             "database_type": os.environ.get("DATABASE_TYPE", "postgresql"),
             "anthropic_configured": bool(os.environ.get("ANTHROPIC_API_KEY")),
+            "db_pool": estado_pools(),
+            "async_db_pool": db_async.estado_pool_async(),
+            "claude": claude_client.estado(),
+            "indice_referencia": indice_referencia.estadisticas(),
+            "normalizacion": normalizacion_nombres.estadisticas(),
+            "enriquecimiento_web": enriquecimiento_web.estadisticas(),
+            "vtex_http": cliente_vtex.estadisticas(),
+            "vtex_cache": cache_vtex.estadisticas(),
+            "catalogo_vtex": catalogo_vtex.estadisticas(),
+            "coalescencia": coalescencia.estadisticas(),
+            "indice_duplicados": indice_duplicados.estadisticas(),
+            "outbox_analitica": outbox_analitica.estadisticas(),
+            "agregados_analiticos": agregados_analiticos.estadisticas(),
             "timestamp": datetime.now().isoformat(),
         }
     except Exception as e:
@@ -1294,19 +1365,28 @@ async def buscar_productos_referencia_publico(
     cursor = conn.cursor()
 
     try:
-        search_param = f"%{busqueda}%"
-        cursor.execute(
-            """
-            SELECT id, codigo_ean, nombre, marca, categoria, presentacion
-            FROM productos_referencia
-            WHERE LOWER(nombre) LIKE LOWER(%s)
-            OR LOWER(marca) LIKE LOWER(%s)
-            OR codigo_ean LIKE %s
-            ORDER BY nombre
-            LIMIT %s
-        """,
-            (search_param, search_param, search_param, limite),
-        )
+        busqueda = busqueda.strip()
+        if busqueda.isdigit():
+            cursor.execute(
+                """
+                SELECT id, codigo_ean, nombre, marca, categoria, presentacion
+                FROM productos_referencia
+                WHERE codigo_ean LIKE %s
+                ORDER BY nombre
+                LIMIT %s
+            """,
+                (f"%{busqueda}%", limite),
+            )
+            filas = cursor.fetchall()
+        else:
+            # Nombre o marca (la marca va en nombre_tsv)
+            filas = busqueda_productos.buscar_en_tabla(
+                cursor,
+                "productos_referencia",
+                "id, codigo_ean, nombre, marca, categoria, presentacion",
+                busqueda,
+                limite,
+            )
 
         productos = [
             {
@@ -1317,7 +1397,7 @@ async def buscar_productos_referencia_publico(
                 "categoria": r[4],
                 "presentacion": r[5],
             }
-            for r in cursor.fetchall()
+            for r in filas
         ]
 
         return {"success": True, "productos": productos, "total": len(productos)}
@@ -1332,8 +1412,18 @@ async def serve_buscador_referencia():
 
 
 @app.post("/invoices/parse")
-async def parse_invoice(file: UploadFile = File(...), request: Request = None):
-    """Procesar factura con OCR - Para imágenes individuales"""
+async def parse_invoice(
+    file: UploadFile = File(...),
+    request: Request = None,
+    preprocesar: Optional[bool] = Form(None),
+    franjas: Optional[bool] = Form(None),
+):
+    """
+    Procesar factura con OCR - Para imágenes individuales
+
+    preprocesar: recortar/reducir la foto antes de Claude (por defecto OCR_PREPROCESAR)
+    franjas: dividir facturas largas en franjas paralelas (por defecto OCR_FRANJAS)
+    """
     print(f"\n{'='*60}")
     print(f"📸 NUEVA FACTURA: {file.filename}")
     print(f"{'='*60}")
@@ -1368,13 +1458,20 @@ async def parse_invoice(file: UploadFile = File(...), request: Request = None):
 
         print(f"✅ Archivo temporal: {temp_file.name}")
 
-        result = parse_invoice_with_claude(temp_file.name)
+        result = await parse_invoice_with_claude_async(
+            temp_file.name,
+            preprocesar=preprocesar,
+            usuario_id=usuario_id,
+            franjas=franjas,
+        )
 
         # ✅ NUEVO: Capturar tokens usados revisar
         usage_info = result.get("usage", {})
         tokens_input = usage_info.get("input_tokens", 0)
         tokens_output = usage_info.get("output_tokens", 0)
         modelo = usage_info.get("modelo", "claude-sonnet-4-20250514")
+        cache_hit = usage_info.get("cache_hit", False)
+        tokens_ahorrados = usage_info.get("tokens_ahorrados", 0)
 
         if not result.get("success"):
             # ✅ Registrar intento fallido
@@ -1489,6 +1586,8 @@ async def parse_invoice(file: UploadFile = File(...), request: Request = None):
             referencia_id=factura_id,
             referencia_tipo="factura",
             exitoso=True,
+            cache_hit=cache_hit,
+            tokens_ahorrados=tokens_ahorrados,
         )
 
         # Guardar reporte de anomalías si hubo correcciones
@@ -1502,8 +1601,20 @@ async def parse_invoice(file: UploadFile = File(...), request: Request = None):
 
             guardar_reporte_anomalia(factura_id, establecimiento_raw, metricas)
 
+        # PAPA/PLU/EAN de todas las líneas en pocas consultas
+        codigos_validos = []
+        for prod in productos_corregidos:
+            codigo_ean = str(prod.get("codigo", "")).strip()
+            codigos_validos.append(
+                codigo_ean if len(codigo_ean) >= 8 and codigo_ean.isdigit() else ""
+            )
+        resolutor = crear_resolutor_factura(
+            codigos_validos, establecimiento_id, establecimiento_raw, cursor, conn
+        )
+
         productos_guardados = 0
         for idx, prod in enumerate(productos_corregidos, 1):
+            resolutor.iniciar_linea()
             try:
                 codigo_ean = str(prod.get("codigo", "")).strip()
                 nombre = str(prod.get("nombre", "")).strip()
@@ -1520,14 +1631,8 @@ async def parse_invoice(file: UploadFile = File(...), request: Request = None):
                 if codigo_ean and len(codigo_ean) >= 8 and codigo_ean.isdigit():
                     codigo_ean_valido = codigo_ean
 
-                resultado_producto = buscar_o_crear_producto_inteligente(
-                    codigo=codigo_ean_valido or "",
-                    nombre_ocr=nombre,
-                    precio=precio_unitario,
-                    establecimiento_id=establecimiento_id,
-                    establecimiento_nombre=establecimiento_raw,
-                    cursor=cursor,
-                    conn=conn,
+                resultado_producto = resolutor.resolver(
+                    codigo_ean_valido or "", nombre, precio_unitario
                 )
                 producto_maestro_id = (
                     resultado_producto.get("producto_id")
@@ -1580,6 +1685,8 @@ async def parse_invoice(file: UploadFile = File(...), request: Request = None):
                 print(f"❌ Error producto {idx}: {e}")
                 continue
 
+        resolutor.finalizar()
+
         if os.environ.get("DATABASE_TYPE") == "postgresql":
             cursor.execute(
                 "UPDATE facturas SET productos_guardados = %s WHERE id = %s",
@@ -1591,6 +1698,10 @@ async def parse_invoice(file: UploadFile = File(...), request: Request = None):
                 (productos_guardados, factura_id),
             )
 
+        # Analíticas en segundo plano: el evento confirma junto con los items
+        outbox_analitica.registrar_factura(
+            conn, factura_id, usuario_id, establecimiento_id
+        )
         conn.commit()
 
         # Actualizar inventario
@@ -1601,34 +1712,6 @@ async def parse_invoice(file: UploadFile = File(...), request: Request = None):
         except Exception as e:
             print(f"⚠️ Error actualizando inventario: {e}")
             traceback.print_exc()
-        # ✅ NUEVO: Actualizar tablas analíticas (incluyendo gastos_mensuales)
-        print(f"📊 Actualizando tablas analíticas...")
-        try:
-            cursor.execute(
-                """
-                SELECT producto_maestro_id
-                FROM items_factura
-                WHERE factura_id = %s AND producto_maestro_id IS NOT NULL
-            """,
-                (factura_id,),
-            )
-            productos_ids = [row[0] for row in cursor.fetchall()]
-
-            resultado_analytics = actualizar_todas_las_tablas_analiticas(
-                cursor=cursor,
-                conn=conn,
-                factura_id=factura_id,
-                usuario_id=usuario_id,
-                establecimiento_id=establecimiento_id,
-                productos_ids=productos_ids,
-            )
-            print(
-                f"   ✅ Analíticas: historial={resultado_analytics['historial_compras']}, patrones={resultado_analytics['patrones_compra']}, gastos={resultado_analytics['gastos_mensuales']}"
-            )
-        except Exception as e:
-            print(f"⚠️ Error actualizando tablas analíticas: {e}")
-            traceback.print_exc()
-
         print(f"💰 Guardando precios para comparación...")
         try:
             stats = procesar_items_factura_y_guardar_precios(factura_id, usuario_id)
@@ -1662,6 +1745,8 @@ async def parse_invoice(file: UploadFile = File(...), request: Request = None):
             "productos_guardados": productos_guardados,
             "imagen_guardada": imagen_guardada,
             "deteccion_duplicados": resultado_deteccion.get("metricas", {}),
+            "preprocesamiento": result.get("preprocesamiento"),
+            "cache": result.get("cache", {"hit": False}),
             # ✅ NUEVO: Info de uso en respuesta
             "uso_api": (
                 uso_registrado.get("limites", {})
@@ -1785,9 +1870,18 @@ async def save_invoice_with_image(
 
         print(f"✅ Factura creada: ID {factura_id}")
 
+        resolutor = crear_resolutor_factura(
+            [str(prod.get("codigo", "")).strip() for prod in productos_list],
+            establecimiento_id,
+            establecimiento,
+            cursor,
+            conn,
+        )
+
         productos_guardados = 0
 
         for prod in productos_list:
+            resolutor.iniciar_linea()
             try:
                 codigo = prod.get("codigo", "").strip()
                 nombre = prod.get("nombre", "").strip()
@@ -1800,16 +1894,8 @@ async def save_invoice_with_image(
                 # ✅ NUEVO: Usar ProductResolver
                 # ========================================
                 # ✅ CAMBIO C: Usar buscar_o_crear_producto_inteligente
-                # ✅ CAMBIO C: Usar buscar_o_crear_producto_inteligente
-                resultado_producto = buscar_o_crear_producto_inteligente(
-                    codigo=codigo,
-                    nombre_ocr=nombre,
-                    precio=int(precio),
-                    establecimiento_id=establecimiento_id,
-                    establecimiento_nombre=establecimiento,
-                    cursor=cursor,
-                    conn=conn,
-                )
+                # (en lote: ResolutorFactura precargó PAPA/PLU/EAN)
+                resultado_producto = resolutor.resolver(codigo, nombre, int(precio))
                 producto_maestro_id = (
                     resultado_producto.get("producto_id")
                     if resultado_producto
@@ -1861,6 +1947,7 @@ async def save_invoice_with_image(
                 traceback.print_exc()
                 continue
 
+        resolutor.finalizar()
         print(f"✅ {productos_guardados} productos guardados")
 
         if os.environ.get("DATABASE_TYPE") == "postgresql":
@@ -1874,6 +1961,33 @@ async def save_invoice_with_image(
                 (productos_guardados, factura_id),
             )
 
+        # Ajustar precios por descuentos/duplicados en la transacción de los
+        # items: el evento de analíticas confirma ya con los precios ajustados
+        print(f"🔧 Ajustando precios por descuentos...")
+        cursor.execute("SAVEPOINT ajuste_precios")
+        try:
+            duplicados_eliminados = limpiar_items_duplicados(
+                factura_id, conn, commit=False
+            )
+            ajuste_exitoso = ajustar_precios_items_por_total(
+                factura_id, conn, commit=False
+            )
+            cursor.execute("RELEASE SAVEPOINT ajuste_precios")
+
+            if ajuste_exitoso:
+                print(f"✅ Precios ajustados correctamente")
+            else:
+                print(f"⚠️ No se pudo ajustar precios automáticamente")
+
+        except Exception as e:
+            cursor.execute("ROLLBACK TO SAVEPOINT ajuste_precios")
+            print(f"⚠️ Error en ajuste: {e}")
+            traceback.print_exc()
+
+        # Analíticas en segundo plano: el evento confirma junto con los items
+        outbox_analitica.registrar_factura(
+            conn, factura_id, usuario_id, establecimiento_id
+        )
         conn.commit()
 
         # Guardar reporte de anomalías
@@ -1887,21 +2001,6 @@ async def save_invoice_with_image(
 
             guardar_reporte_anomalia(factura_id, establecimiento, metricas)
 
-        # Ajustar precios por descuentos/duplicados
-        print(f"🔧 Ajustando precios por descuentos...")
-        try:
-            duplicados_eliminados = limpiar_items_duplicados(factura_id, conn)
-            ajuste_exitoso = ajustar_precios_items_por_total(factura_id, conn)
-
-            if ajuste_exitoso:
-                print(f"✅ Precios ajustados correctamente")
-            else:
-                print(f"⚠️ No se pudo ajustar precios automáticamente")
-
-        except Exception as e:
-            print(f"⚠️ Error en ajuste: {e}")
-            traceback.print_exc()
-
         # Actualizar inventario
         print(f"📦 Actualizando inventario del usuario...")
         try:
@@ -1911,53 +2010,6 @@ async def save_invoice_with_image(
             print(f"⚠️ Error actualizando inventario: {e}")
             traceback.print_exc()
 
-        # ✅ NUEVO: Actualizar tablas analíticas
-        print(f"📊 Actualizando tablas analíticas...")
-        try:
-            # Preparar items procesados desde items_factura
-            cursor.execute(
-                """
-                SELECT producto_maestro_id, codigo_leido
-                FROM items_factura
-                WHERE factura_id = %s
-            """,
-                (factura_id,),
-            )
-
-            items_data = []
-            for row in cursor.fetchall():
-                if row[0]:  # Solo si tiene producto_maestro_id
-                    items_data.append(
-                        {"producto_maestro_id": row[0], "codigo_leido": row[1] or ""}
-                    )
-            productos_ids = [
-                item["producto_maestro_id"]
-                for item in items_data
-                if item.get("producto_maestro_id")
-            ]
-            resultado_analytics = actualizar_todas_las_tablas_analiticas(
-                cursor=cursor,
-                conn=conn,
-                factura_id=factura_id,
-                usuario_id=usuario_id,
-                establecimiento_id=establecimiento_id,
-                productos_ids=productos_ids,
-            )
-
-            print(f"✅ Tablas analíticas actualizadas:")
-            print(f"   - Códigos: {resultado_analytics['codigos_actualizados']}")
-            print(f"   - Historial: {resultado_analytics['historial_compras']}")
-            print(f"   - Patrones: {resultado_analytics['patrones_compra']}")
-            print(
-                f"   - Precios: {resultado_analytics['productos_por_establecimiento']}"
-            )
-
-        except Exception as e:
-            print(f"⚠️ Error actualizando tablas analíticas: {e}")
-            import traceback
-
-            traceback.print_exc()
-
         print(f"💰 Guardando precios para comparación...")
         try:
             stats = procesar_items_factura_y_guardar_precios(factura_id, usuario_id)
@@ -2144,14 +2196,118 @@ async def crear_establecimiento(request: Request):
 # ==========================================
 # FUNCIÓN DE BACKGROUND - COMPLETA CON ESTABLECIMIENTO Y TRACKING
 # ==========================================
+VIDEO_CLAUDE_TIMEOUT = float(os.environ.get("VIDEO_CLAUDE_TIMEOUT", "300"))
+
+
+def _reclamar_job_video(job_id: str) -> bool:
+    """Verifica el job y lo pasa de 'pending' a 'processing' (flujo sin cola)"""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+
+    # Verificar job
+    try:
+        if os.environ.get("DATABASE_TYPE") == "postgresql":
+            cursor.execute(
+                "SELECT status, factura_id FROM processing_jobs WHERE id = %s",
+                (job_id,),
+            )
+        else:
+            cursor.execute(
+                "SELECT status, factura_id FROM processing_jobs WHERE id = ?",
+                (job_id,),
+            )
+
+        job_data = cursor.fetchone()
+
+        if not job_data:
+            print(f"❌ Job {job_id} no existe en BD")
+            return False
+
+        current_status, existing_factura_id = job_data[0], job_data[1]
+
+        if current_status == "completed":
+            print(f"⚠️ Job {job_id} ya completado. Factura: {existing_factura_id}")
+            return False
+
+        if existing_factura_id:
+            print(f"⚠️ Job {job_id} ya tiene factura {existing_factura_id}")
+            return False
+
+        if current_status == "processing":
+            print(f"⚠️ Job {job_id} ya está siendo procesado")
+            return False
+
+        print(f"✅ Job válido para procesar")
+
+    except Exception as e:
+        print(f"⚠️ Error verificando job: {e}")
+    finally:
+        cursor.close()
+        conn.close()
+        conn = None
+        cursor = None
+
+    # Actualizar status a processing
+    conn = get_db_connection()
+    cursor = conn.cursor()
+
+    try:
+        if os.environ.get("DATABASE_TYPE") == "postgresql":
+            cursor.execute(
+                """
+                UPDATE processing_jobs
+                SET status = 'processing', started_at = CURRENT_TIMESTAMP
+                WHERE id = %s AND status = 'pending'
+                """,
+                (job_id,),
+            )
+        else:
+            cursor.execute(
+                """
+                UPDATE processing_jobs
+                SET status = 'processing', started_at = ?
+                WHERE id = ? AND status = 'pending'
+                """,
+                (datetime.now(), job_id),
+            )
+
+        affected_rows = cursor.rowcount
+        conn.commit()
+
+        if affected_rows == 0:
+            print(f"⚠️ No se pudo actualizar job {job_id}")
+            return False
+
+        print(f"✅ Status actualizado a 'processing'")
+
+    except Exception as e:
+        print(f"❌ Error actualizando job status: {e}")
+        conn.rollback()
+        return False
+    finally:
+        if cursor:
+            cursor.close()
+        if conn:
+            conn.close()
+        conn = None
+        cursor = None
+
+    return True
+
+
 async def process_video_background_task(
     job_id: str,
     video_path: str,
     usuario_id: int,
     establecimiento_nombre: str = None,
     establecimiento_id: int = None,
+    desde_cola: bool = False,
 ):
-    """Procesa video en BACKGROUND con establecimiento confirmado"""
+    """Procesa video en BACKGROUND con establecimiento confirmado
+
+    Con desde_cola=True los errores se propagan para que job_queue decida
+    entre reintentar (conservando el video) o mandar a dead letter.
+    """
     conn = None
     cursor = None
     frames_paths = []
@@ -2159,6 +2315,8 @@ async def process_video_background_task(
     # ✅ NUEVO: Variables para tracking de tokens
     total_tokens_input = 0
     total_tokens_output = 0
+    total_tokens_ahorrados = 0
+    frames_desde_cache = 0
 
     try:
         print(f"\n{'='*80}")
@@ -2190,101 +2348,15 @@ async def process_video_background_task(
             conn.close()
             return
 
-        conn = get_db_connection()
-        cursor = conn.cursor()
-
-        # Verificar job
-        try:
-            if os.environ.get("DATABASE_TYPE") == "postgresql":
-                cursor.execute(
-                    "SELECT status, factura_id FROM processing_jobs WHERE id = %s",
-                    (job_id,),
-                )
-            else:
-                cursor.execute(
-                    "SELECT status, factura_id FROM processing_jobs WHERE id = ?",
-                    (job_id,),
-                )
-
-            job_data = cursor.fetchone()
-
-            if not job_data:
-                print(f"❌ Job {job_id} no existe en BD")
-                return
-
-            current_status, existing_factura_id = job_data[0], job_data[1]
-
-            if current_status == "completed":
-                print(f"⚠️ Job {job_id} ya completado. Factura: {existing_factura_id}")
-                return
-
-            if existing_factura_id:
-                print(f"⚠️ Job {job_id} ya tiene factura {existing_factura_id}")
-                return
-
-            if current_status == "processing":
-                print(f"⚠️ Job {job_id} ya está siendo procesado")
-                return
-
-            print(f"✅ Job válido para procesar")
-
-        except Exception as e:
-            print(f"⚠️ Error verificando job: {e}")
-        finally:
-            cursor.close()
-            conn.close()
-            conn = None
-            cursor = None
-
-        # Actualizar status a processing
-        conn = get_db_connection()
-        cursor = conn.cursor()
-
-        try:
-            if os.environ.get("DATABASE_TYPE") == "postgresql":
-                cursor.execute(
-                    """
-                    UPDATE processing_jobs
-                    SET status = 'processing', started_at = CURRENT_TIMESTAMP
-                    WHERE id = %s AND status = 'pending'
-                    """,
-                    (job_id,),
-                )
-            else:
-                cursor.execute(
-                    """
-                    UPDATE processing_jobs
-                    SET status = 'processing', started_at = ?
-                    WHERE id = ? AND status = 'pending'
-                    """,
-                    (datetime.now(), job_id),
-                )
-
-            affected_rows = cursor.rowcount
-            conn.commit()
-
-            if affected_rows == 0:
-                print(f"⚠️ No se pudo actualizar job {job_id}")
-                return
-
-            print(f"✅ Status actualizado a 'processing'")
-
-        except Exception as e:
-            print(f"❌ Error actualizando job status: {e}")
-            conn.rollback()
+        # Con la cola durable el job ya llega reclamado en 'processing'
+        if not desde_cola and not _reclamar_job_video(job_id):
             return
-        finally:
-            if cursor:
-                cursor.close()
-            if conn:
-                conn.close()
-            conn = None
-            cursor = None
 
         # Importar módulos de video
         try:
             from video_processor import (
                 extraer_frames_video,
+                seleccionar_keyframes,
                 deduplicar_productos,
                 limpiar_frames_temporales,
                 validar_fecha,
@@ -2295,15 +2367,13 @@ async def process_video_background_task(
 
         # Extraer frames
         print(f"🎬 Extrayendo frames...")
-        frames_paths = extraer_frames_video(video_path, intervalo=5.0)
-
         MAX_FRAMES = 5
-        if len(frames_paths) > MAX_FRAMES:
-            print(f"⚠️ Limitando de {len(frames_paths)} a {MAX_FRAMES} frames")
-            indices = [
-                int(i * len(frames_paths) / MAX_FRAMES) for i in range(MAX_FRAMES)
-            ]
-            frames_paths = [frames_paths[i] for i in indices]
+        frames_paths = seleccionar_keyframes(video_path, max_frames=MAX_FRAMES)
+        if not frames_paths:
+            print("⚠️ Sin keyframes, se usa muestreo uniforme")
+            frames_paths = extraer_frames_video(
+                video_path, intervalo=5.0, max_frames=MAX_FRAMES
+            )
 
         if not frames_paths:
             raise Exception("No se extrajeron frames del video")
@@ -2314,6 +2384,10 @@ async def process_video_background_task(
         print(f"🤖 Procesando con Claude...")
         start_time = time.time()
 
+        # Deadline común a todos los frames del job; la concurrencia real
+        # contra Claude la acota el límite global de claude_client
+        deadline_frames = time.monotonic() + VIDEO_CLAUDE_TIMEOUT
+
         # ✅ MODIFICADO: Retornar también usage
         def procesar_frame_individual(args):
             i, frame_path = args
@@ -2321,6 +2395,8 @@ async def process_video_background_task(
                 resultado = parse_invoice_with_claude(
                     frame_path,
                     establecimiento_preseleccionado=establecimiento_nombre,
+                    deadline=deadline_frames,
+                    usuario_id=usuario_id,
                 )
                 if resultado.get("success") and resultado.get("data"):
                     return (i, resultado["data"], resultado.get("usage", {}))
@@ -2348,6 +2424,9 @@ async def process_video_background_task(
             # Acumular tokens
             total_tokens_input += usage.get("input_tokens", 0)
             total_tokens_output += usage.get("output_tokens", 0)
+            total_tokens_ahorrados += usage.get("tokens_ahorrados", 0)
+            if usage.get("cache_hit"):
+                frames_desde_cache += 1
 
             if data:
                 frames_exitosos += 1
@@ -2503,6 +2582,8 @@ async def process_video_background_task(
                 referencia_id=factura_id,
                 referencia_tipo="factura",
                 exitoso=True,
+                cache_hit=frames_desde_cache == len(frames_paths),
+                tokens_ahorrados=total_tokens_ahorrados,
             )
             if uso_registrado.get("success"):
                 print(
@@ -2552,10 +2633,19 @@ async def process_video_background_task(
                 except Exception as e:
                     print(f"⚠️ Error guardando imagen: {e}")
 
+            resolutor = crear_resolutor_factura(
+                [str(p.get("codigo", "")).strip() for p in productos_unicos],
+                establecimiento_id,
+                establecimiento,
+                cursor,
+                conn,
+            )
+
             productos_guardados = 0
             productos_fallidos = 0
 
             for producto in productos_unicos:
+                resolutor.iniciar_linea()
                 try:
                     codigo = producto.get("codigo", "")
                     nombre = producto.get("nombre", "Sin nombre")
@@ -2591,14 +2681,8 @@ async def process_video_background_task(
                     producto_maestro_id = None
 
                     if codigo and len(codigo) >= 1:
-                        resultado_producto = buscar_o_crear_producto_inteligente(
-                            codigo=codigo,
-                            nombre_ocr=nombre,
-                            precio=int(precio),
-                            establecimiento_id=establecimiento_id,
-                            establecimiento_nombre=establecimiento,
-                            cursor=cursor,
-                            conn=conn,
+                        resultado_producto = resolutor.resolver(
+                            codigo, nombre, int(precio)
                         )
                         producto_maestro_id = (
                             resultado_producto.get("producto_id")
@@ -2664,12 +2748,12 @@ async def process_video_background_task(
                     productos_fallidos += 1
 
                     if "constraint" in str(e).lower():
-                        conn.rollback()
-                        conn = get_db_connection()
-                        cursor = conn.cursor()
+                        resolutor.descartar_linea()
 
                     continue
 
+            resolutor.finalizar()
+
             if os.environ.get("DATABASE_TYPE") == "postgresql":
                 cursor.execute(
                     "UPDATE facturas SET productos_guardados = %s WHERE id = %s",
@@ -2681,20 +2765,21 @@ async def process_video_background_task(
                     (productos_guardados, factura_id),
                 )
 
-            conn.commit()
-            print(f"✅ Productos guardados: {productos_guardados}")
-
-            if productos_fallidos > 0:
-                print(f"⚠️ Productos no guardados: {productos_fallidos}")
-
-            # Ajustar precios
+            # Ajustar precios en la transacción de los items: el evento de
+            # analíticas confirma ya con los precios ajustados
             print(f"🔧 Ajustando precios por descuentos...")
+            cursor.execute("SAVEPOINT ajuste_precios")
             try:
-                duplicados_eliminados = limpiar_items_duplicados(factura_id, conn)
+                duplicados_eliminados = limpiar_items_duplicados(
+                    factura_id, conn, commit=False
+                )
                 if duplicados_eliminados > 0:
                     print(f"   ✅ {duplicados_eliminados} items duplicados eliminados")
 
-                ajuste_exitoso = ajustar_precios_items_por_total(factura_id, conn)
+                ajuste_exitoso = ajustar_precios_items_por_total(
+                    factura_id, conn, commit=False
+                )
+                cursor.execute("RELEASE SAVEPOINT ajuste_precios")
 
                 if ajuste_exitoso:
                     print(f"   ✅ Precios ajustados correctamente")
@@ -2702,9 +2787,20 @@ async def process_video_background_task(
                     print(f"   ⚠️ No se requirió ajuste de precios")
 
             except Exception as e:
+                cursor.execute("ROLLBACK TO SAVEPOINT ajuste_precios")
                 print(f"   ⚠️ Error en ajuste automático: {e}")
                 traceback.print_exc()
 
+            # Analíticas en segundo plano: el evento confirma junto con los items
+            outbox_analitica.registrar_factura(
+                conn, factura_id, usuario_id, establecimiento_id
+            )
+            conn.commit()
+            print(f"✅ Productos guardados: {productos_guardados}")
+
+            if productos_fallidos > 0:
+                print(f"⚠️ Productos no guardados: {productos_fallidos}")
+
             # Actualizar inventario
             print(f"📦 Actualizando inventario del usuario...")
             try:
@@ -2714,54 +2810,6 @@ async def process_video_background_task(
                 print(f"⚠️ Error actualizando inventario: {e}")
                 traceback.print_exc()
 
-            # ✅ CORREGIDO: Actualizar tablas analíticas
-            print(f"📊 Actualizando tablas analíticas...")
-            try:
-                cursor.execute(
-                    """
-                    SELECT producto_maestro_id, codigo_leido
-                    FROM items_factura
-                    WHERE factura_id = %s AND producto_maestro_id IS NOT NULL
-                """,
-                    (factura_id,),
-                )
-
-                items_data = []
-                for row in cursor.fetchall():
-                    items_data.append(
-                        {"producto_maestro_id": row[0], "codigo_leido": row[1] or ""}
-                    )
-
-                # ✅ FIX: Definir productos_ids ANTES de usarlo
-                productos_ids = [
-                    item["producto_maestro_id"]
-                    for item in items_data
-                    if item.get("producto_maestro_id")
-                ]
-
-                resultado_analytics = actualizar_todas_las_tablas_analiticas(
-                    cursor=cursor,
-                    conn=conn,
-                    factura_id=factura_id,
-                    usuario_id=usuario_id,
-                    establecimiento_id=establecimiento_id,
-                    productos_ids=productos_ids,
-                )
-
-                print(
-                    f"   - Historial: {resultado_analytics.get('historial_compras', 0)}"
-                )
-                print(f"   - Patrones: {resultado_analytics.get('patrones_compra', 0)}")
-                print(
-                    f"   - Precios: {resultado_analytics.get('productos_por_establecimiento', 0)}"
-                )
-
-            except Exception as e:
-                print(f"⚠️ Error actualizando tablas analíticas: {e}")
-                import traceback
-
-                traceback.print_exc()
-
             print(f"💰 Guardando precios para comparación...")
             try:
                 stats = procesar_items_factura_y_guardar_precios(factura_id, usuario_id)
@@ -2874,6 +2922,14 @@ async def process_video_background_task(
                 error_mensaje=str(e)[:500],
             )
 
+        if desde_cola:
+            # Los frames se regeneran en el reintento; el video se conserva
+            if frames_paths:
+                from video_processor import limpiar_frames_temporales
+
+                limpiar_frames_temporales(frames_paths)
+            raise
+
         try:
             conn = get_db_connection()
             cursor = conn.cursor()
@@ -2924,6 +2980,41 @@ async def process_video_background_task(
             print(f"⚠️ Error limpiando archivos: {cleanup_error}")
 
 
+def _procesar_video_desde_cola(job_id: str, payload: dict, usuario_id: int):
+    """Handler de job_queue para trabajos 'video_factura'"""
+    return process_video_background_task(
+        job_id,
+        payload["video_path"],
+        usuario_id,
+        payload.get("establecimiento_nombre"),
+        payload.get("establecimiento_id"),
+        desde_cola=True,
+    )
+
+
+def _video_en_dead_letter(job_id: str, payload: dict, error: str):
+    """Sin más reintentos: liberar el video temporal"""
+    video_path = payload.get("video_path")
+    if video_path and os.path.exists(video_path):
+        os.remove(video_path)
+
+
+registrar_handler(
+    "video_factura", _procesar_video_desde_cola, al_morir=_video_en_dead_letter
+)
+registrar_handler(
+    enriquecimiento_web.TIPO_TRABAJO, enriquecimiento_web.procesar_trabajo
+)
+registrar_handler(catalogo_vtex.TIPO_TRABAJO, catalogo_vtex.sincronizar)
+registrar_handler(indice_duplicados.TIPO_TRABAJO, indice_duplicados.procesar_trabajo)
+registrar_handler(outbox_analitica.TIPO_TRABAJO, outbox_analitica.procesar_trabajo)
+registrar_handler(
+    agregados_analiticos.TIPO_TRABAJO, agregados_analiticos.procesar_trabajo
+)
+registrar_cierre_async(cliente_vtex.cerrar_clientes_async)
+registrar_cierre_async(claude_client.cerrar_clientes_async)
+
+
 # ==========================================
 # RESTO DE ENDPOINTS (simplificados por espacio)
 # ==========================================
@@ -3469,32 +3560,24 @@ async def procesar_factura_v2(request: Request, background_tasks: BackgroundTask
             video_size_mb = len(content) / (1024 * 1024)
             print(f"💾 Video guardado: {video_size_mb:.2f} MB")
 
-            job_id = str(uuid.uuid4())
-
-            cursor.execute(
-                """
-                INSERT INTO processing_jobs (
-                    id, usuario_id, status, created_at
-                ) VALUES (%s, %s, 'pending', CURRENT_TIMESTAMP)
-            """,
-                (job_id, user_id),
+            # ✅ Cola durable: el job y su payload quedan en processing_jobs
+            job_id = encolar_trabajo(
+                "video_factura",
+                {
+                    "video_path": temp_video.name,
+                    "establecimiento_nombre": establecimiento_nombre,
+                    "establecimiento_id": establecimiento_id,
+                },
+                usuario_id=user_id,
+                archivo_local=True,
+                conn=conn,
             )
 
             conn.commit()
             cursor.close()
             conn.close()
 
-            print(f"✅ Job creado: {job_id}")
-
-            # ✅ NUEVO: Pasar establecimiento_nombre y establecimiento_id a la tarea
-            background_tasks.add_task(
-                process_video_background_task,
-                job_id,
-                temp_video.name,
-                user_id,
-                establecimiento_nombre,  # ← NUEVO
-                establecimiento_id,  # ← NUEVO
-            )
+            print(f"✅ Job encolado: {job_id}")
 
             return {
                 "success": True,
@@ -3561,10 +3644,19 @@ async def procesar_factura_v2(request: Request, background_tasks: BackgroundTask
             print(f"✅ Factura creada: ID {factura_id}")
 
             # Procesar items
+            resolutor = crear_resolutor_factura(
+                [str(item.get("codigo", "")).strip() for item in items],
+                establecimiento_id,
+                establecimiento,
+                cursor,
+                conn,
+            )
+
             items_procesados = 0
             items_fallidos = 0
 
             for item in items:
+                resolutor.iniciar_linea()
                 try:
                     codigo = item.get("codigo", "")
                     nombre = item.get("nombre", "")
@@ -3579,14 +3671,8 @@ async def procesar_factura_v2(request: Request, background_tasks: BackgroundTask
                     producto_maestro_id = None
 
                     if codigo and len(codigo) >= 1:
-                        resultado_producto = buscar_o_crear_producto_inteligente(
-                            codigo=codigo,
-                            nombre_ocr=nombre,
-                            precio=int(precio),
-                            establecimiento_id=establecimiento_id,
-                            establecimiento_nombre=establecimiento,
-                            cursor=cursor,
-                            conn=conn,
+                        resultado_producto = resolutor.resolver(
+                            codigo, nombre, int(precio)
                         )
                         producto_maestro_id = (
                             resultado_producto.get("producto_id")
@@ -3625,6 +3711,8 @@ async def procesar_factura_v2(request: Request, background_tasks: BackgroundTask
                     items_fallidos += 1
                     continue
 
+            resolutor.finalizar()
+
             # Actualizar contador
             cursor.execute(
                 """
@@ -4869,6 +4957,29 @@ async def verificar_codigos():
         return {"success": False, "error": str(e)}
 
 
+@app.get("/admin/migraciones")
+async def ver_migraciones():
+    """Versión del esquema y migraciones pendientes"""
+    try:
+        from migraciones import estado_migraciones
+
+        return {"success": True, **estado_migraciones()}
+    except Exception as e:
+        return {"success": False, "error": str(e)}
+
+
+@app.post("/admin/migraciones/aplicar")
+async def aplicar_migraciones_pendientes():
+    """Aplica las migraciones pendientes (normalmente lo hace el arranque)"""
+    try:
+        from migraciones import aplicar_migraciones
+
+        resultado = await asyncio.to_thread(aplicar_migraciones)
+        return {"success": True, **resultado}
+    except Exception as e:
+        return {"success": False, "error": str(e)}
+
+
 print("✅ Endpoints de setup agregados")
 
 
@@ -5325,16 +5436,22 @@ async def get_inventario(usuario_id: int, consolidado: bool = False):
         Lista de productos (consolidados o sin consolidar)
     """
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-
         # ✅ NUEVO: Si piden consolidado, usar el nuevo módulo
         if consolidado:
-            inventario = obtener_inventario_consolidado(usuario_id, cursor)
-            estadisticas = obtener_estadisticas_stock(inventario)
 
-            cursor.close()
-            conn.close()
+            def _consolidado():
+                conn = get_db_connection()
+                try:
+                    cursor = conn.cursor()
+                    inventario = obtener_inventario_consolidado(usuario_id, cursor)
+                    cursor.close()
+                    return inventario
+                finally:
+                    conn.close()
+
+            # La consolidación es síncrona: correrla en un hilo, no en el loop
+            inventario = await asyncio.to_thread(_consolidado)
+            estadisticas = obtener_estadisticas_stock(inventario)
 
             return {
                 "success": True,
@@ -5343,8 +5460,37 @@ async def get_inventario(usuario_id: int, consolidado: bool = False):
                 "consolidado": True,
             }
 
-        # ❌ CÓDIGO EXISTENTE - NO MODIFICAR
-        # ... código actual del endpoint ...
+        rows = await db_async.obtener_inventario_usuario(usuario_id)
+
+        productos = []
+        for row in rows:
+            productos.append(
+                {
+                    "id": row[0],
+                    "producto_maestro_id": row[1],
+                    "codigo_ean": row[2],
+                    "nombre": row[3],
+                    "marca": row[4],
+                    "categoria": row[5],
+                    "cantidad_actual": float(row[6] or 0),
+                    "unidad_medida": row[7],
+                    "nivel_alerta": float(row[8] or 0),
+                    "fecha_ultima_compra": str(row[9]) if row[9] else None,
+                    "precio_ultima_compra": float(row[10] or 0),
+                    "precio_promedio": float(row[11] or 0),
+                    "establecimiento": row[12],
+                    "numero_compras": row[13] or 0,
+                    "total_gastado": float(row[14] or 0),
+                    "estado_stock": row[15],
+                }
+            )
+
+        return {
+            "success": True,
+            "productos": productos,
+            "total": len(productos),
+            "consolidado": False,
+        }
 
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -6708,7 +6854,8 @@ async def encontrar_duplicados(limite: int = 50):
     """
     try:
         from database import get_db_connection
-        from product_matcher import calcular_similitud
+        import motor_similitud
+        from normalizacion_nombres import analizar_nombre
 
         conn = get_db_connection()
         cursor = conn.cursor()
@@ -6727,6 +6874,13 @@ async def encontrar_duplicados(limite: int = 50):
         productos = cursor.fetchall()
         duplicados = []
 
+        # Similitud de nombre de todos los pares en bloque (solo las >= 90%),
+        # la misma de product_matcher.calcular_similitud
+        analisis = [analizar_nombre(p[1] or "") for p in productos]
+        similares = motor_similitud.pares_similares(
+            [a.limpio for a in analisis], 0.90, [a.palabras for a in analisis]
+        )
+
         # Comparar cada producto con los demás
         for i in range(len(productos)):
             for j in range(i + 1, len(productos)):
@@ -6748,7 +6902,7 @@ async def encontrar_duplicados(limite: int = 50):
                     continue
 
                 # Similitud de nombre
-                sim = calcular_similitud(nombre1, nombre2)
+                sim = similares.get((i, j), 0.0) if nombre1 and nombre2 else 0.0
 
                 if sim >= 0.90:
                     duplicados.append(
@@ -6779,7 +6933,7 @@ async def encontrar_duplicados(limite: int = 50):
 
 @app.post("/admin/fusionar-productos")
 async def fusionar_productos(
-    producto_principal_id: int, productos_duplicados: list[int]
+    producto_principal_id: int, productos_duplicados: list[int], dry_run: bool = False
 ):
     """
     Fusiona productos duplicados en uno solo
@@ -6792,54 +6946,19 @@ async def fusionar_productos(
     }
     """
     try:
-        from database import get_db_connection
-
-        conn = get_db_connection()
-        cursor = conn.cursor()
-
-        fusionados = 0
-
-        for dup_id in productos_duplicados:
-            # Actualizar items_factura
-            cursor.execute(
-                """
-                UPDATE items_factura
-                SET producto_maestro_id = %s
-                WHERE producto_maestro_id = %s
-            """,
-                (producto_principal_id, dup_id),
-            )
-
-            items_actualizados = cursor.rowcount
-
-            # Actualizar inventario_usuario
-            cursor.execute(
-                """
-                UPDATE inventario_usuario
-                SET producto_maestro_id = %s
-                WHERE producto_maestro_id = %s
-            """,
-                (producto_principal_id, dup_id),
-            )
-
-            # Eliminar producto duplicado
-            cursor.execute(
-                """
-                DELETE FROM productos_maestros
-                WHERE id = %s
-            """,
-                (dup_id,),
-            )
-
-            fusionados += 1
-
-        conn.commit()
-        cursor.close()
-        conn.close()
+        resultado = await asyncio.to_thread(
+            fusion_productos.fusionar,
+            {dup_id: producto_principal_id for dup_id in productos_duplicados},
+            dry_run,
+        )
+        if resultado is None:
+            return {"success": False, "error": "La fusión requiere PostgreSQL"}
 
         return {
             "success": True,
-            "mensaje": f"{fusionados} productos fusionados en ID {producto_principal_id}",
+            "mensaje": f"{resultado['productos_fusionados']} productos fusionados "
+            f"en ID {producto_principal_id}",
+            **resultado,
         }
 
     except Exception as e:
@@ -6848,6 +6967,37 @@ async def fusionar_productos(
         return {"success": False, "error": str(e), "traceback": traceback.format_exc()}
 
 
+class GrupoFusion(BaseModel):
+    sobreviviente_id: int
+    duplicados_ids: List[int]
+
+
+class FusionLoteRequest(BaseModel):
+    grupos: List[GrupoFusion]
+    dry_run: bool = False
+
+
+@app.post("/admin/duplicados/fusionar")
+async def fusionar_lote_productos(request: FusionLoteRequest):
+    """
+    Fusiona muchos grupos de duplicados en una sola transacción
+    (p. ej. los de /admin/duplicados/clusters). Con dry_run devuelve las
+    filas que se tocarían sin cambiar nada.
+    """
+    try:
+        mapeo = fusion_productos.mapeo_de_grupos(
+            (g.sobreviviente_id, g.duplicados_ids) for g in request.grupos
+        )
+        resultado = await asyncio.to_thread(
+            fusion_productos.fusionar, mapeo, request.dry_run
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if resultado is None:
+        raise HTTPException(status_code=503, detail="La fusión requiere PostgreSQL")
+    return {"success": True, **resultado}
+
+
 # ==========================================
 # ENDPOINTS DE DEPURACIÓN - DEBEN ESTAR ANTES DEL MAIN
 # ==========================================
@@ -10782,6 +10932,152 @@ async def get_ocr_stats():
     return processor.get_stats()
 
 
+@app.post("/admin/ocr-cache/purgar")
+async def purgar_ocr_cache():
+    """Elimina entradas vencidas, de otra versión del prompt o excedentes"""
+    from claude_invoice import VERSION_PROMPT
+    import ocr_cache
+
+    resultado = await asyncio.to_thread(ocr_cache.purgar, VERSION_PROMPT)
+    return {"success": "error" not in resultado, **resultado}
+
+
+@app.post("/admin/vtex-cache/purgar")
+async def purgar_vtex_cache():
+    """Elimina las consultas VTEX vencidas (positivas y negativas)"""
+    resultado = await asyncio.to_thread(cache_vtex.purgar)
+    return {"success": "error" not in resultado, **resultado}
+
+
+@app.post("/admin/catalogo-vtex/sincronizar")
+async def sincronizar_catalogo_vtex(establecimiento: Optional[str] = None):
+    """Encola la sincronización del espejo VTEX (una tienda o todas)"""
+    tiendas = (
+        [establecimiento] if establecimiento else catalogo_vtex.CATALOGO_VTEX_TIENDAS
+    )
+    trabajos = {}
+    for tienda in tiendas:
+        try:
+            trabajos[tienda.upper()] = await asyncio.to_thread(
+                catalogo_vtex.iniciar_sincronizacion, tienda
+            )
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+    if not any(trabajos.values()):
+        raise HTTPException(
+            status_code=503, detail="El espejo VTEX requiere PostgreSQL"
+        )
+    return {"success": True, "trabajos": trabajos}
+
+
+@app.get("/admin/catalogo-vtex/estado")
+async def estado_catalogo_vtex():
+    """Última sincronización y SKUs activos por tienda"""
+    return {"success": True, **await asyncio.to_thread(catalogo_vtex.estado)}
+
+
+@app.get("/admin/duplicados/candidatos")
+async def candidatos_duplicados(
+    umbral: float = 0.85,
+    limite: int = 100,
+    desde: int = 0,
+    producto_id: Optional[int] = None,
+):
+    """
+    Pares de productos_maestros_v2 con nombre casi igual o mismo EAN, de
+    todo el catálogo (índice MinHash/LSH de indice_duplicados)
+    """
+    pendientes = await asyncio.to_thread(indice_duplicados.pendientes)
+    pares = await asyncio.to_thread(
+        indice_duplicados.pares, umbral, limite, desde, producto_id
+    )
+    return {
+        "success": True,
+        "indice_al_dia": pendientes["pendientes"] == 0,
+        **pendientes,
+        "total": len(pares),
+        "pares": pares,
+    }
+
+
+@app.get("/admin/duplicados/clusters")
+async def clusters_duplicados(umbral: float = 0.85, limite: int = 50):
+    """Grupos de posibles duplicados, los más grandes primero"""
+    pendientes = await asyncio.to_thread(indice_duplicados.pendientes)
+    grupos = await asyncio.to_thread(indice_duplicados.clusters, umbral, limite)
+    return {
+        "success": True,
+        "indice_al_dia": pendientes["pendientes"] == 0,
+        **pendientes,
+        "total": len(grupos),
+        "clusters": grupos,
+    }
+
+
+@app.get("/admin/analitica/outbox")
+async def estado_outbox_analitica():
+    """Facturas pendientes de aplicar en las tablas analíticas"""
+    return {"success": True, **await asyncio.to_thread(outbox_analitica.pendientes)}
+
+
+@app.get("/admin/analitica/outbox/fallidos")
+async def fallidos_outbox_analitica(limite: int = 50):
+    """Facturas cuyas analíticas agotaron los reintentos, con el error"""
+    fallidos = await asyncio.to_thread(outbox_analitica.listar_fallidos, limite)
+    return {"success": True, "total": len(fallidos), "fallidos": fallidos}
+
+
+@app.post("/admin/analitica/outbox/reintentar")
+async def reintentar_outbox_analitica():
+    """Devuelve al outbox las facturas fallidas"""
+    reintentados = await asyncio.to_thread(outbox_analitica.reintentar_fallidos)
+    return {"success": True, "reintentados": reintentados}
+
+
+@app.post("/admin/analitica/conciliar")
+async def conciliar_agregados_analiticos():
+    """Encola un barrido de conciliación de los agregados incrementales"""
+    if os.environ.get("DATABASE_TYPE", "sqlite").lower() != "postgresql":
+        raise HTTPException(
+            status_code=503, detail="La conciliación requiere PostgreSQL"
+        )
+    job_id = await asyncio.to_thread(agregados_analiticos.programar_conciliacion)
+    return {"success": True, "job_id": job_id, "en_curso": job_id is None}
+
+
+@app.get("/admin/duplicados/indice/estado")
+async def estado_indice_duplicados():
+    """Productos indexados, pares y pendientes del índice de duplicados"""
+    return {"success": True, **await asyncio.to_thread(indice_duplicados.estado)}
+
+
+@app.post("/admin/duplicados/indice/reconstruir")
+async def reconstruir_indice_duplicados():
+    """Recalcula el índice de duplicados de todo el catálogo en la cola"""
+    resultado = await asyncio.to_thread(indice_duplicados.reconstruir)
+    if resultado is None:
+        raise HTTPException(
+            status_code=503, detail="El índice de duplicados requiere PostgreSQL"
+        )
+    return {"success": True, **resultado}
+
+
+@app.get("/admin/jobs/dead-letter")
+async def ver_jobs_dead_letter(limite: int = 50):
+    """Trabajos de la cola que agotaron sus reintentos"""
+    trabajos = await asyncio.to_thread(listar_dead_letter, limite)
+    return {"success": True, "trabajos": trabajos, "total": len(trabajos)}
+
+
+@app.post("/admin/jobs/{job_id}/reencolar")
+async def reencolar_job(job_id: str):
+    """Devuelve a la cola un trabajo en dead letter"""
+    if not await asyncio.to_thread(reencolar_trabajo, job_id):
+        raise HTTPException(status_code=404, detail="Job no está en dead letter")
+    return {"success": True, "job_id": job_id}
+
+
 # ==========================================
 # ENDPOINTS DE EDICIÓN (ADMIN)
 # ==========================================
@@ -0,0 +1,751 @@
+"""
+Migraciones Versionadas del Esquema
+===================================
+
+Reemplaza la ejecución de create_postgresql_tables() en cada arranque.
+
+- Tabla schema_migrations con la versión aplicada de cada migración
+- Al arrancar solo se consulta MAX(version): si el esquema está al día no
+  se ejecuta ningún DDL
+- Las migraciones pendientes se aplican en orden, bajo un advisory lock,
+  así dos instancias de un rolling deploy nunca corren DDL a la vez; la que
+  llega segunda espera el lock (hasta MIGRACIONES_ESPERA_LOCK) y aplica lo
+  que siga pendiente, o falla el arranque
+- lock_timeout acotado para que un ALTER no deje bloqueado el tráfico
+
+Para agregar una migración nueva, registrar una función con @migracion
+usando la siguiente versión libre. Las migraciones deben ser idempotentes
+(IF NOT EXISTS) porque bases existentes pudieron recibir esos cambios desde
+los antiguos endpoints /admin/setup-*.
+
+Autor: LecFac
+Versión: 1.0.0
+"""
+
+import os
+import time
+from dataclasses import dataclass
+from typing import Callable, Dict, List
+
+
+# Clave del advisory lock de migraciones (constante arbitraria del proyecto)
+MIGRACIONES_LOCK_KEY = 7301_2025
+MIGRACIONES_LOCK_TIMEOUT = os.environ.get("MIGRACIONES_LOCK_TIMEOUT", "5s")
+# Cuánto espera una instancia a que otra termine de migrar antes de abortar
+MIGRACIONES_ESPERA_LOCK = os.environ.get("MIGRACIONES_ESPERA_LOCK", "120s")
+
+
+@dataclass(frozen=True)
+class Migracion:
+    version: int
+    nombre: str
+    aplicar: Callable
+
+
+MIGRACIONES: List[Migracion] = []
+
+
+def migracion(version: int, nombre: str):
+    """Registra una migración del esquema"""
+
+    def decorador(funcion):
+        if any(m.version == version for m in MIGRACIONES):
+            raise ValueError(f"Migración {version} duplicada")
+        MIGRACIONES.append(Migracion(version, nombre, funcion))
+        MIGRACIONES.sort(key=lambda m: m.version)
+        return funcion
+
+    return decorador
+
+
+def version_objetivo() -> int:
+    return MIGRACIONES[-1].version if MIGRACIONES else 0
+
+
+# ============================================================================
+# MIGRACIONES
+# ============================================================================
+
+
+@migracion(1, "esquema_base")
+def _m001_esquema_base(conn):
+    """Esquema completo histórico (create_postgresql_tables)"""
+    from database import create_postgresql_tables
+
+    # El esquema histórico confirma por etapas, así que el SET LOCAL del
+    # motor no le alcanza: lock_timeout de sesión mientras dura
+    cursor = conn.cursor()
+    cursor.execute(
+        "SELECT set_config('lock_timeout', %s, false)", (MIGRACIONES_LOCK_TIMEOUT,)
+    )
+    try:
+        create_postgresql_tables(conn)
+    finally:
+        conn.rollback()
+        cursor.execute("RESET lock_timeout")
+        cursor.close()
+
+
+@migracion(2, "codigos_establecimiento")
+def _m002_codigos_establecimiento(conn):
+    """Antes: /admin/setup-codigos-establecimiento"""
+    from database import crear_tabla_codigos_establecimiento
+
+    if not crear_tabla_codigos_establecimiento():
+        raise RuntimeError("No se pudo crear codigos_establecimiento")
+
+
+@migracion(3, "configuracion_cadenas")
+def _m003_configuracion_cadenas(conn):
+    from database import crear_tabla_configuracion_cadenas
+
+    if crear_tabla_configuracion_cadenas() is False:
+        raise RuntimeError("No se pudo crear configuracion_cadenas")
+
+
+@migracion(4, "sistema_papa_hijos")
+def _m004_sistema_papa_hijos(conn):
+    """Antes: /admin/setup-sistema-papa-hijos"""
+    cursor = conn.cursor()
+    cursor.execute(
+        """
+        ALTER TABLE productos_maestros_v2
+            ADD COLUMN IF NOT EXISTS es_producto_papa BOOLEAN DEFAULT FALSE,
+            ADD COLUMN IF NOT EXISTS producto_papa_id INTEGER REFERENCES productos_maestros_v2(id),
+            ADD COLUMN IF NOT EXISTS fecha_validacion_papa TIMESTAMP,
+            ADD COLUMN IF NOT EXISTS validado_por_admin BOOLEAN DEFAULT FALSE
+    """
+    )
+    cursor.execute(
+        """
+        CREATE INDEX IF NOT EXISTS idx_producto_papa_id
+        ON productos_maestros_v2(producto_papa_id)
+    """
+    )
+    cursor.execute(
+        """
+        CREATE INDEX IF NOT EXISTS idx_es_producto_papa
+        ON productos_maestros_v2(es_producto_papa) WHERE es_producto_papa = TRUE
+    """
+    )
+    cursor.close()
+
+
+@migracion(5, "cola_trabajos_durable")
+def _m005_cola_trabajos_durable(conn):
+    """Columnas de la cola durable sobre processing_jobs (job_queue.py)"""
+    cursor = conn.cursor()
+    cursor.execute(
+        """
+        ALTER TABLE processing_jobs
+            ADD COLUMN IF NOT EXISTS tipo VARCHAR(30),
+            ADD COLUMN IF NOT EXISTS payload JSONB,
+            ADD COLUMN IF NOT EXISTS intentos INTEGER DEFAULT 0,
+            ADD COLUMN IF NOT EXISTS max_intentos INTEGER DEFAULT 3,
+            ADD COLUMN IF NOT EXISTS disponible_en TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            ADD COLUMN IF NOT EXISTS bloqueado_hasta TIMESTAMP,
+            ADD COLUMN IF NOT EXISTS worker_id VARCHAR(100),
+            ADD COLUMN IF NOT EXISTS nodo VARCHAR(100)
+    """
+    )
+    cursor.execute(
+        """
+        CREATE INDEX IF NOT EXISTS idx_processing_jobs_cola
+        ON processing_jobs(disponible_en)
+        WHERE tipo IS NOT NULL AND status IN ('pending', 'processing')
+    """
+    )
+    cursor.close()
+
+
+@migracion(6, "ocr_cache")
+def _m006_ocr_cache(conn):
+    """Caché de resultados OCR (ocr_cache.py) y marca de cache hit en uso_api"""
+    cursor = conn.cursor()
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS ocr_cache (
+            id SERIAL PRIMARY KEY,
+            sha256 CHAR(64) NOT NULL,
+            version_prompt VARCHAR(20) NOT NULL,
+            establecimiento VARCHAR(100) NOT NULL DEFAULT '',
+            phash VARCHAR(64),
+            usuario_id INTEGER,
+            resultado JSONB NOT NULL,
+            usage JSONB,
+            hits INTEGER DEFAULT 0,
+            creado_en TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            ultimo_uso TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            UNIQUE (sha256, version_prompt, establecimiento)
+        )
+    """
+    )
+    cursor.execute(
+        """
+        CREATE INDEX IF NOT EXISTS idx_ocr_cache_usuario
+        ON ocr_cache(usuario_id, version_prompt, creado_en DESC)
+        WHERE phash IS NOT NULL
+    """
+    )
+    cursor.execute(
+        """
+        CREATE INDEX IF NOT EXISTS idx_ocr_cache_ultimo_uso
+        ON ocr_cache(ultimo_uso)
+    """
+    )
+    cursor.execute(
+        """
+        ALTER TABLE uso_api
+            ADD COLUMN IF NOT EXISTS cache_hit BOOLEAN DEFAULT FALSE,
+            ADD COLUMN IF NOT EXISTS tokens_ahorrados INTEGER DEFAULT 0
+    """
+    )
+    cursor.close()
+
+
+@migracion(7, "busqueda_trigramas")
+def _m007_busqueda_trigramas(conn):
+    """pg_trgm/unaccent: índices GIN y nombre_tsv (busqueda_productos.py)"""
+    from busqueda_productos import asegurar_indices_busqueda
+
+    cursor = conn.cursor()
+    tablas = asegurar_indices_busqueda(cursor)
+    if tablas:
+        print(f"   🔎 Índices de búsqueda en: {', '.join(tablas)}")
+    else:
+        print("   ⚠️ Sin pg_trgm: la búsqueda por nombre sigue con LIKE")
+    cursor.close()
+
+
+@migracion(8, "enriquecimiento_web_pendiente")
+def _m008_enriquecimiento_web_pendiente(conn):
+    """Marca de enriquecimiento VTEX en segundo plano (enriquecimiento_web.py)"""
+    cursor = conn.cursor()
+    cursor.execute(
+        """
+        ALTER TABLE productos_maestros_v2
+            ADD COLUMN IF NOT EXISTS enriquecimiento_web VARCHAR(20)
+    """
+    )
+    cursor.execute(
+        """
+        CREATE INDEX IF NOT EXISTS idx_productos_maestros_v2_enriquecimiento_pendiente
+        ON productos_maestros_v2 (id)
+        WHERE enriquecimiento_web = 'pendiente'
+    """
+    )
+    cursor.close()
+
+
+@migracion(9, "vtex_consultas_cache")
+def _m009_vtex_consultas_cache(conn):
+    """Caché positiva y negativa de consultas VTEX (cache_vtex.py)"""
+    cursor = conn.cursor()
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS vtex_consultas_cache (
+            establecimiento VARCHAR(30) NOT NULL,
+            tipo VARCHAR(20) NOT NULL,
+            clave VARCHAR(200) NOT NULL,
+            productos JSONB NOT NULL,
+            encontrado BOOLEAN NOT NULL,
+            hits INTEGER DEFAULT 0,
+            actualizado_en TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (establecimiento, tipo, clave)
+        )
+    """
+    )
+    cursor.execute(
+        """
+        CREATE INDEX IF NOT EXISTS idx_vtex_consultas_cache_actualizado
+        ON vtex_consultas_cache(actualizado_en)
+    """
+    )
+    cursor.close()
+
+
+@migracion(10, "catalogo_vtex")
+def _m010_catalogo_vtex(conn):
+    """Espejo local de los catálogos VTEX y sus checkpoints (catalogo_vtex.py)"""
+    from busqueda_productos import asegurar_indices_busqueda
+
+    cursor = conn.cursor()
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS catalogo_vtex (
+            establecimiento VARCHAR(30) NOT NULL,
+            sku_id VARCHAR(40) NOT NULL,
+            product_id VARCHAR(40),
+            ean VARCHAR(30),
+            plu VARCHAR(60),
+            nombre TEXT NOT NULL,
+            marca VARCHAR(200),
+            categoria TEXT,
+            precio INTEGER,
+            presentacion TEXT,
+            url_producto TEXT,
+            imagen_url TEXT,
+            huella CHAR(32) NOT NULL,
+            activo BOOLEAN DEFAULT TRUE,
+            sincronizacion_id INTEGER,
+            actualizado_en TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (establecimiento, sku_id)
+        )
+    """
+    )
+    cursor.execute(
+        """
+        CREATE INDEX IF NOT EXISTS idx_catalogo_vtex_plu
+        ON catalogo_vtex(establecimiento, plu) WHERE activo
+    """
+    )
+    cursor.execute(
+        """
+        CREATE INDEX IF NOT EXISTS idx_catalogo_vtex_ean
+        ON catalogo_vtex(establecimiento, ean) WHERE activo
+    """
+    )
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS catalogo_vtex_sincronizaciones (
+            id SERIAL PRIMARY KEY,
+            establecimiento VARCHAR(30) NOT NULL,
+            estado VARCHAR(20) NOT NULL,
+            categorias JSONB,
+            indice_categoria INTEGER DEFAULT 0,
+            desde INTEGER DEFAULT 0,
+            paginas INTEGER DEFAULT 0,
+            skus INTEGER DEFAULT 0,
+            nuevos INTEGER DEFAULT 0,
+            actualizados INTEGER DEFAULT 0,
+            desactivados INTEGER DEFAULT 0,
+            iniciada_en TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            actualizada_en TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            terminada_en TIMESTAMP
+        )
+    """
+    )
+    cursor.execute(
+        """
+        CREATE INDEX IF NOT EXISTS idx_catalogo_vtex_sincronizaciones_tienda
+        ON catalogo_vtex_sincronizaciones(establecimiento, id DESC)
+    """
+    )
+    # Trigramas / nombre_tsv para la búsqueda por nombre en el espejo
+    asegurar_indices_busqueda(cursor)
+    cursor.close()
+
+
+@migracion(11, "indice_duplicados")
+def _m011_indice_duplicados(conn):
+    """Índice MinHash/LSH de candidatos a duplicado (indice_duplicados.py)"""
+    cursor = conn.cursor()
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS duplicados_firmas (
+            producto_id INTEGER PRIMARY KEY,
+            nombre_normalizado TEXT NOT NULL,
+            actualizado_en TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """
+    )
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS duplicados_bandas (
+            banda SMALLINT NOT NULL,
+            hash BIGINT NOT NULL,
+            producto_id INTEGER NOT NULL,
+            PRIMARY KEY (banda, hash, producto_id)
+        )
+    """
+    )
+    cursor.execute(
+        """
+        CREATE INDEX IF NOT EXISTS idx_duplicados_bandas_producto
+        ON duplicados_bandas(producto_id)
+    """
+    )
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS duplicados_pares (
+            producto_id_1 INTEGER NOT NULL,
+            producto_id_2 INTEGER NOT NULL,
+            similitud DOUBLE PRECISION NOT NULL,
+            mismo_ean BOOLEAN DEFAULT FALSE,
+            actualizado_en TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (producto_id_1, producto_id_2),
+            CHECK (producto_id_1 < producto_id_2)
+        )
+    """
+    )
+    cursor.execute(
+        """
+        CREATE INDEX IF NOT EXISTS idx_duplicados_pares_producto_2
+        ON duplicados_pares(producto_id_2)
+    """
+    )
+    cursor.execute(
+        """
+        CREATE INDEX IF NOT EXISTS idx_duplicados_pares_similitud
+        ON duplicados_pares(similitud DESC)
+    """
+    )
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS duplicados_pendientes (
+            producto_id INTEGER PRIMARY KEY,
+            encolado_en TIMESTAMP DEFAULT clock_timestamp()
+        )
+    """
+    )
+    cursor.execute(
+        """
+        CREATE INDEX IF NOT EXISTS idx_duplicados_pendientes_encolado
+        ON duplicados_pendientes(encolado_en)
+    """
+    )
+    # Cada alta, renombre, cambio de EAN o borrado en el catálogo deja el
+    # producto pendiente de reindexar
+    cursor.execute(
+        """
+        CREATE OR REPLACE FUNCTION duplicados_marcar_pendiente() RETURNS trigger AS $$
+        BEGIN
+            INSERT INTO duplicados_pendientes (producto_id, encolado_en)
+            VALUES (
+                CASE WHEN TG_OP = 'DELETE' THEN OLD.id ELSE NEW.id END,
+                clock_timestamp()
+            )
+            ON CONFLICT (producto_id) DO UPDATE SET encolado_en = clock_timestamp();
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+    """
+    )
+    cursor.execute(
+        "DROP TRIGGER IF EXISTS trg_duplicados_alta_baja ON productos_maestros_v2"
+    )
+    cursor.execute(
+        """
+        CREATE TRIGGER trg_duplicados_alta_baja
+        AFTER INSERT OR DELETE ON productos_maestros_v2
+        FOR EACH ROW EXECUTE PROCEDURE duplicados_marcar_pendiente()
+    """
+    )
+    cursor.execute(
+        "DROP TRIGGER IF EXISTS trg_duplicados_cambio ON productos_maestros_v2"
+    )
+    cursor.execute(
+        """
+        CREATE TRIGGER trg_duplicados_cambio
+        AFTER UPDATE OF nombre_consolidado, codigo_ean ON productos_maestros_v2
+        FOR EACH ROW
+        WHEN (OLD.nombre_consolidado IS DISTINCT FROM NEW.nombre_consolidado
+              OR OLD.codigo_ean IS DISTINCT FROM NEW.codigo_ean)
+        EXECUTE PROCEDURE duplicados_marcar_pendiente()
+    """
+    )
+    # Carga inicial: todo el catálogo queda pendiente
+    cursor.execute(
+        """
+        INSERT INTO duplicados_pendientes (producto_id)
+        SELECT id FROM productos_maestros_v2
+        ON CONFLICT (producto_id) DO NOTHING
+    """
+    )
+    cursor.close()
+
+
+@migracion(12, "outbox_analitica")
+def _m012_outbox_analitica(conn):
+    """Eventos de facturas pendientes de analíticas (outbox_analitica.py)"""
+    cursor = conn.cursor()
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS outbox_analitica (
+            id BIGSERIAL PRIMARY KEY,
+            factura_id INTEGER NOT NULL,
+            usuario_id INTEGER NOT NULL,
+            establecimiento_id INTEGER,
+            creado_en TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """
+    )
+    cursor.close()
+
+
+@migracion(13, "agregados_incrementales")
+def _m013_agregados_incrementales(conn):
+    """
+    Estado acumulado de patrones_compra y productos_por_establecimiento
+    (agregados_analiticos.py), calculado una vez desde items_factura. Las
+    filas sin historia quedan en NULL y se siembran con su primer delta.
+    """
+    cursor = conn.cursor()
+    for tabla in ("patrones_compra", "productos_por_establecimiento"):
+        cursor.execute(
+            f"""
+            ALTER TABLE {tabla}
+                ADD COLUMN IF NOT EXISTS suma_precios BIGINT,
+                ADD COLUMN IF NOT EXISTS num_precios INTEGER
+        """
+        )
+    cursor.execute(
+        """
+        UPDATE patrones_compra pc SET
+            suma_precios = h.suma,
+            num_precios = h.num
+        FROM (
+            SELECT i.usuario_id, i.producto_maestro_id,
+                   COALESCE(SUM(i.precio_pagado), 0) AS suma,
+                   COUNT(i.precio_pagado) AS num
+            FROM items_factura i
+            WHERE i.producto_maestro_id IS NOT NULL
+              AND NOT EXISTS (
+                  SELECT 1 FROM outbox_analitica o WHERE o.factura_id = i.factura_id
+              )
+            GROUP BY i.usuario_id, i.producto_maestro_id
+        ) h
+        WHERE pc.usuario_id = h.usuario_id
+          AND pc.producto_maestro_id = h.producto_maestro_id
+          AND pc.num_precios IS NULL
+    """
+    )
+    cursor.execute(
+        """
+        UPDATE productos_por_establecimiento ppe SET
+            suma_precios = h.suma,
+            num_precios = h.num
+        FROM (
+            SELECT i.producto_maestro_id, f.establecimiento_id,
+                   COALESCE(SUM(i.precio_pagado), 0) AS suma,
+                   COUNT(i.precio_pagado) AS num
+            FROM items_factura i
+            JOIN facturas f ON f.id = i.factura_id
+            WHERE i.producto_maestro_id IS NOT NULL
+              AND NOT EXISTS (
+                  SELECT 1 FROM outbox_analitica o WHERE o.factura_id = i.factura_id
+              )
+            GROUP BY i.producto_maestro_id, f.establecimiento_id
+        ) h
+        WHERE ppe.producto_maestro_id = h.producto_maestro_id
+          AND ppe.establecimiento_id = h.establecimiento_id
+          AND ppe.num_precios IS NULL
+    """
+    )
+    cursor.close()
+
+
+@migracion(14, "outbox_analitica_fallidos")
+def _m014_outbox_analitica_fallidos(conn):
+    """Reintentos y eventos fallidos del outbox de analíticas"""
+    cursor = conn.cursor()
+    cursor.execute(
+        """
+        ALTER TABLE outbox_analitica
+            ADD COLUMN IF NOT EXISTS intentos INTEGER NOT NULL DEFAULT 0,
+            ADD COLUMN IF NOT EXISTS ultimo_error TEXT,
+            ADD COLUMN IF NOT EXISTS fallido_en TIMESTAMP
+    """
+    )
+    cursor.close()
+
+
+@migracion(15, "catalogo_vtex_vistos")
+def _m015_catalogo_vtex_vistos(conn):
+    """SKUs vistos por sincronización (los iguales no reescriben catalogo_vtex)"""
+    cursor = conn.cursor()
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS catalogo_vtex_vistos (
+            sincronizacion_id INTEGER NOT NULL,
+            sku_id VARCHAR(40) NOT NULL,
+            PRIMARY KEY (sincronizacion_id, sku_id)
+        )
+    """
+    )
+    cursor.close()
+
+
+@migracion(16, "outbox_analitica_factura")
+def _m016_outbox_analitica_factura(conn):
+    """Índice del NOT EXISTS por factura de los agregados y la conciliación"""
+    cursor = conn.cursor()
+    cursor.execute(
+        """
+        CREATE INDEX IF NOT EXISTS idx_outbox_analitica_factura
+        ON outbox_analitica(factura_id)
+    """
+    )
+    cursor.close()
+
+
+@migracion(17, "job_nodos")
+def _m017_job_nodos(conn):
+    """Latido de cada nodo de la cola durable (trabajos fijados a nodos caídos)"""
+    cursor = conn.cursor()
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS job_nodos (
+            nodo VARCHAR(100) PRIMARY KEY,
+            visto_en TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+        )
+    """
+    )
+    cursor.close()
+
+
+# ============================================================================
+# MOTOR
+# ============================================================================
+
+
+def _asegurar_tabla_versiones(cursor):
+    cursor.execute(
+        """
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INTEGER PRIMARY KEY,
+            nombre VARCHAR(100) NOT NULL,
+            aplicada_en TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            duracion_ms INTEGER
+        )
+    """
+    )
+
+
+def version_actual(cursor) -> int:
+    """Última versión aplicada (0 si la tabla no existe)"""
+    cursor.execute("SELECT to_regclass('public.schema_migrations') IS NOT NULL")
+    if not cursor.fetchone()[0]:
+        return 0
+    cursor.execute("SELECT COALESCE(MAX(version), 0) FROM schema_migrations")
+    return cursor.fetchone()[0]
+
+
+def _versiones_aplicadas(cursor) -> set:
+    cursor.execute("SELECT version FROM schema_migrations")
+    return {row[0] for row in cursor.fetchall()}
+
+
+def aplicar_migraciones() -> Dict:
+    """
+    Aplica las migraciones pendientes.
+
+    Returns:
+        Dict con version_inicial, version_final y migraciones aplicadas
+    """
+    from database import get_db_connection
+
+    resultado = {
+        "version_inicial": 0,
+        "version_final": 0,
+        "version_objetivo": version_objetivo(),
+        "aplicadas": [],
+    }
+
+    conn = get_db_connection()
+    cursor = conn.cursor()
+
+    try:
+        # Camino rápido: una sola consulta cuando el esquema está al día
+        actual = version_actual(cursor)
+        conn.commit()
+        resultado["version_inicial"] = resultado["version_final"] = actual
+
+        if actual >= version_objetivo():
+            print(f"✅ Esquema al día (versión {actual})")
+            return resultado
+
+        # Si otra instancia está migrando se espera a que termine (con tope):
+        # arrancar sobre el esquema viejo no es opción. Si se vence la espera,
+        # el error sube y el arranque falla.
+        print("🔒 Esperando el lock de migraciones...")
+        cursor.execute(
+            "SELECT set_config('lock_timeout', %s, false)", (MIGRACIONES_ESPERA_LOCK,)
+        )
+        try:
+            cursor.execute("SELECT pg_advisory_lock(%s)", (MIGRACIONES_LOCK_KEY,))
+        except Exception as e:
+            conn.rollback()
+            raise RuntimeError(
+                f"No se obtuvo el lock de migraciones en {MIGRACIONES_ESPERA_LOCK}"
+            ) from e
+        finally:
+            cursor.execute("RESET lock_timeout")
+            conn.commit()
+
+        try:
+            # Con el lock tomado se relee: la otra instancia pudo haber
+            # aplicado parte (o todo) de lo pendiente
+            actual = version_actual(cursor)
+            resultado["version_inicial"] = resultado["version_final"] = actual
+            _asegurar_tabla_versiones(cursor)
+            conn.commit()
+            aplicadas = _versiones_aplicadas(cursor)
+            conn.commit()
+
+            for m in MIGRACIONES:
+                if m.version in aplicadas:
+                    continue
+
+                print(f"🏗️ Aplicando migración {m.version:03d}_{m.nombre}...")
+                inicio = time.monotonic()
+
+                cursor.execute(
+                    "SET LOCAL lock_timeout = %s", (MIGRACIONES_LOCK_TIMEOUT,)
+                )
+                m.aplicar(conn)
+
+                duracion_ms = int((time.monotonic() - inicio) * 1000)
+                cursor.execute(
+                    """
+                    INSERT INTO schema_migrations (version, nombre, duracion_ms)
+                    VALUES (%s, %s, %s)
+                """,
+                    (m.version, m.nombre, duracion_ms),
+                )
+                conn.commit()
+
+                resultado["aplicadas"].append(
+                    {"version": m.version, "nombre": m.nombre, "ms": duracion_ms}
+                )
+                resultado["version_final"] = m.version
+                print(f"   ✅ {m.version:03d}_{m.nombre} ({duracion_ms} ms)")
+
+        finally:
+            conn.rollback()
+            cursor.execute("SELECT pg_advisory_unlock(%s)", (MIGRACIONES_LOCK_KEY,))
+            conn.commit()
+
+        return resultado
+
+    except Exception as e:
+        print(f"❌ Error aplicando migraciones: {e}")
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def estado_migraciones() -> Dict:
+    """Versión actual, objetivo y migraciones pendientes"""
+    from database import get_db_connection
+
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        aplicadas = set()
+        if version_actual(cursor) > 0:
+            aplicadas = _versiones_aplicadas(cursor)
+        return {
+            "version_actual": max(aplicadas) if aplicadas else 0,
+            "version_objetivo": version_objetivo(),
+            "pendientes": [
+                f"{m.version:03d}_{m.nombre}"
+                for m in MIGRACIONES
+                if m.version not in aplicadas
+            ],
+        }
+    finally:
+        cursor.close()
+        conn.close()
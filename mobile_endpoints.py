@@ -9,6 +9,7 @@ from typing import Optional
 from fastapi import APIRouter, Header, HTTPException, UploadFile, File
 from pydantic import BaseModel
 from database import get_db_connection
+import db_async
 
 router = APIRouter(prefix="/api/mobile", tags=["mobile"])
 
@@ -224,47 +225,11 @@ async def get_my_invoices(
     print(f"📄 [MOBILE] Obteniendo facturas para usuario {usuario_id} (página {page})")
 
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-
-        # Obtener facturas
-        if os.environ.get("DATABASE_TYPE") == "postgresql":
-            cursor.execute("""
-                SELECT
-                    f.id,
-                    f.establecimiento,
-                    f.total_factura,
-                    f.fecha_factura,
-                    f.fecha_cargue,
-                    f.productos_guardados,
-                    f.tiene_imagen,
-                    f.estado_validacion,
-                    f.cadena
-                FROM facturas f
-                WHERE f.usuario_id = %s
-                ORDER BY f.fecha_cargue DESC
-                LIMIT %s OFFSET %s
-            """, (usuario_id, limit, offset))
-        else:
-            cursor.execute("""
-                SELECT
-                    f.id,
-                    f.establecimiento,
-                    f.total_factura,
-                    f.fecha_factura,
-                    f.fecha_cargue,
-                    f.productos_guardados,
-                    f.tiene_imagen,
-                    f.estado_validacion,
-                    f.cadena
-                FROM facturas f
-                WHERE f.usuario_id = ?
-                ORDER BY f.fecha_cargue DESC
-                LIMIT ? OFFSET ?
-            """, (usuario_id, limit, offset))
+        # Consulta asíncrona: no bloquea el event loop mientras espera la BD
+        rows, total = await db_async.obtener_facturas_usuario(usuario_id, limit, offset)
 
         facturas = []
-        for row in cursor.fetchall():
+        for row in rows:
             facturas.append({
                 "id": row[0],
                 "establecimiento": row[1] or "Desconocido",
@@ -277,20 +242,6 @@ async def get_my_invoices(
                 "cadena": row[8] or "Otro"
             })
 
-        # Contar total
-        if os.environ.get("DATABASE_TYPE") == "postgresql":
-            cursor.execute("""
-                SELECT COUNT(*) FROM facturas WHERE usuario_id = %s
-            """, (usuario_id,))
-        else:
-            cursor.execute("""
-                SELECT COUNT(*) FROM facturas WHERE usuario_id = ?
-            """, (usuario_id,))
-
-        total = cursor.fetchone()[0] or 0
-
-        conn.close()
-
         print(f"✅ [MOBILE] {len(facturas)} facturas obtenidas (total: {total})")
 
         return {
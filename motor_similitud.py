@@ -0,0 +1,338 @@
+"""
+Motor de Similitud Vectorizado
+==============================
+
+Puntúa una consulta contra miles de nombres, o todos los pares de un bloque,
+con operaciones NumPy en lugar de un SequenceMatcher por pareja.
+
+- Cada nombre se codifica como un vector disperso de conteos de caracteres
+  y un conjunto de palabras (CSR: índices + fila de cada índice)
+- Con los conteos se calcula en bloque el quick_ratio de difflib, que es una
+  cota superior exacta de SequenceMatcher.ratio(); el Jaccard de palabras
+  se calcula exacto
+- Solo los candidatos cuya cota alcanza el umbral (o al mejor ya encontrado)
+  se puntúan con el scorer original, así el ranking y los resultados son
+  idénticos a los del cálculo par a par
+
+Sin NumPy se usa el cálculo par a par de siempre.
+
+Autor: LecFac
+Versión: 1.0.0
+"""
+
+from difflib import SequenceMatcher
+from typing import Callable, Dict, FrozenSet, List, Optional, Sequence, Tuple
+
+try:
+    import numpy as np
+
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+
+
+# Peso de SequenceMatcher y Jaccard en similitud_normalizada()
+PESO_RATIO = 0.6
+PESO_JACCARD = 0.4
+# Holgura de redondeo al comparar cotas (float64) contra puntajes exactos
+EPSILON = 1e-9
+# Elementos (filas x columnas x caracteres) por bloque en pares_similares
+ELEMENTOS_POR_BLOQUE = 4_000_000
+
+
+# ============================================================================
+# SCORERS EXACTOS (referencia)
+# ============================================================================
+
+
+def ratio(a: str, b: str) -> float:
+    return SequenceMatcher(None, a, b).ratio()
+
+
+def jaccard(palabras1: FrozenSet[str], palabras2: FrozenSet[str]) -> float:
+    union = palabras1 | palabras2
+    return len(palabras1 & palabras2) / len(union) if union else 0.0
+
+
+def similitud(
+    a: str,
+    b: str,
+    palabras1: Optional[FrozenSet[str]] = None,
+    palabras2: Optional[FrozenSet[str]] = None,
+) -> float:
+    """Ratio, o 0.6·ratio + 0.4·Jaccard si ambos tienen palabras"""
+    r = ratio(a, b)
+    if palabras1 and palabras2:
+        return r * PESO_RATIO + jaccard(palabras1, palabras2) * PESO_JACCARD
+    return r
+
+
+# ============================================================================
+# CODIFICACIÓN
+# ============================================================================
+
+
+def _bytes(texto: str) -> bytes:
+    # Caracteres fuera de latin-1 se funden en "?": la cota sigue siendo válida
+    return texto.encode("latin-1", "replace")
+
+
+class MatrizNombres:
+    """
+    Nombres codificados para puntuar en bloque.
+
+    Args:
+        textos: Nombres tal como los compara el scorer (ya normalizados)
+        palabras: Conjuntos de palabras para el Jaccard (opcional)
+    """
+
+    def __init__(
+        self,
+        textos: Sequence[str],
+        palabras: Optional[Sequence[FrozenSet[str]]] = None,
+    ):
+        self.textos = list(textos)
+        self.palabras = list(palabras) if palabras is not None else None
+        n = len(self.textos)
+
+        codificados = [_bytes(t) for t in self.textos]
+        self.longitudes = np.fromiter(
+            (len(b) for b in codificados), dtype=np.int32, count=n
+        )
+        conteos = np.zeros((n, 256), dtype=np.int32)
+        if n:
+            filas = np.repeat(np.arange(n), self.longitudes)
+            valores = np.frombuffer(b"".join(codificados), dtype=np.uint8)
+            np.add.at(conteos, (filas, valores), 1)
+        # Solo las columnas de caracteres que aparecen
+        self._columnas = np.flatnonzero(conteos.any(axis=0))
+        self.conteos = conteos[:, self._columnas]
+
+        self._vocabulario: Dict[str, int] = {}
+        self.n_palabras = np.zeros(n, dtype=np.int32)
+        if self.palabras is not None:
+            indices, filas_palabras = [], []
+            for fila, conjunto in enumerate(self.palabras):
+                for palabra in conjunto:
+                    indices.append(
+                        self._vocabulario.setdefault(palabra, len(self._vocabulario))
+                    )
+                    filas_palabras.append(fila)
+                self.n_palabras[fila] = len(conjunto)
+            self._indices = np.array(indices, dtype=np.int32)
+            self._filas = np.array(filas_palabras, dtype=np.int32)
+
+    def __len__(self) -> int:
+        return len(self.textos)
+
+    def _conteos_consulta(self, texto: str) -> Tuple:
+        completos = np.bincount(
+            np.frombuffer(_bytes(texto), dtype=np.uint8), minlength=256
+        )
+        # Caracteres de la consulta que ninguna fila tiene no suman intersección
+        return completos[self._columnas], len(_bytes(texto))
+
+    def cotas_ratio(self, texto: str) -> "np.ndarray":
+        """quick_ratio(texto, fila) para cada fila: cota de ratio()"""
+        conteos, longitud = self._conteos_consulta(texto)
+        interseccion = np.minimum(self.conteos, conteos).sum(axis=1)
+        total = self.longitudes + longitud
+        return np.where(total > 0, 2.0 * interseccion / np.maximum(total, 1), 1.0)
+
+    def jaccard(self, palabras: FrozenSet[str]) -> "np.ndarray":
+        """Jaccard exacto de `palabras` contra las palabras de cada fila"""
+        ids = [self._vocabulario[p] for p in palabras if p in self._vocabulario]
+        interseccion = np.bincount(
+            self._filas[np.isin(self._indices, ids)], minlength=len(self)
+        )
+        union = self.n_palabras + len(palabras) - interseccion
+        return np.where(union > 0, interseccion / np.maximum(union, 1), 0.0)
+
+    def cotas_similitud(
+        self, texto: str, palabras: Optional[FrozenSet[str]] = None
+    ) -> "np.ndarray":
+        """Cota superior de similitud(texto, fila, palabras, palabras_fila)"""
+        cotas = self.cotas_ratio(texto)
+        if not palabras or self.palabras is None:
+            return cotas
+        combinada = cotas * PESO_RATIO + self.jaccard(palabras) * PESO_JACCARD
+        return np.where(self.n_palabras > 0, combinada, cotas)
+
+
+# ============================================================================
+# CONSULTAS
+# ============================================================================
+
+
+def rankear(
+    texto: str,
+    matriz: MatrizNombres,
+    palabras: Optional[FrozenSet[str]] = None,
+    k: int = 10,
+    umbral: float = 0.0,
+) -> List[Tuple[int, float]]:
+    """
+    Los k nombres más parecidos a `texto` con puntaje >= umbral, en el mismo
+    orden que daría puntuar todos con similitud() (empates: índice menor).
+
+    Returns:
+        [(índice en la matriz, puntaje exacto), ...]
+    """
+    if not len(matriz):
+        return []
+
+    cotas = matriz.cotas_similitud(texto, palabras)
+    orden = np.argsort(-cotas, kind="stable")
+    palabras_filas = matriz.palabras
+
+    mejores: List[Tuple[int, float]] = []
+    for i in orden:
+        cota = cotas[i]
+        if cota + EPSILON < umbral:
+            break
+        if len(mejores) >= k and cota + EPSILON < mejores[-1][1]:
+            break
+        puntaje = similitud(
+            texto,
+            matriz.textos[i],
+            palabras,
+            palabras_filas[i] if palabras_filas is not None else None,
+        )
+        if puntaje >= umbral:
+            mejores.append((int(i), puntaje))
+            mejores.sort(key=lambda x: (-x[1], x[0]))
+            del mejores[k:]
+    return mejores
+
+
+def mejor_por_cotas(
+    cotas: "np.ndarray", puntuar: Callable[[int], float], umbral: float = 0.0
+) -> Optional[Tuple[int, float]]:
+    """
+    El índice de mayor puntaje exacto (>= umbral; empates: índice menor),
+    llamando a `puntuar(i)` solo mientras la cota de i pueda superar al mejor.
+
+    Sirve para scorers compuestos (varias similitudes, bonus, penalizaciones)
+    siempre que `cotas[i] >= puntuar(i)`.
+    """
+    mejor: Optional[Tuple[int, float]] = None
+    for i in np.argsort(-cotas, kind="stable"):
+        cota = cotas[i] + EPSILON
+        if cota < umbral or (mejor is not None and cota < mejor[1]):
+            break
+        puntaje = puntuar(int(i))
+        if puntaje < umbral:
+            continue
+        if (
+            mejor is None
+            or puntaje > mejor[1]
+            or (puntaje == mejor[1] and i < mejor[0])
+        ):
+            mejor = (int(i), puntaje)
+    return mejor
+
+
+def _palabras_comunes(
+    matriz: MatrizNombres,
+    filas_de_palabra: "np.ndarray",
+    punteros: "np.ndarray",
+    inicio: int,
+    fin: int,
+) -> "np.ndarray":
+    """Palabras en común de las filas [inicio, fin) con cada fila (bloque x n)"""
+    n = len(matriz)
+    desde, hasta = np.searchsorted(matriz._filas, [inicio, fin])
+    palabras = matriz._indices[desde:hasta]
+    origen = matriz._filas[desde:hasta].astype(np.int64) - inicio
+    # Cada (fila del bloque, palabra) se cruza con todas las filas que la tienen
+    largos = punteros[palabras + 1] - punteros[palabras]
+    total = int(largos.sum())
+    desplazamiento = np.arange(total) - np.repeat(np.cumsum(largos) - largos, largos)
+    destino = filas_de_palabra[np.repeat(punteros[palabras], largos) + desplazamiento]
+    return np.bincount(
+        np.repeat(origen, largos) * n + destino, minlength=(fin - inicio) * n
+    ).reshape(fin - inicio, n)
+
+
+def pares_similares(
+    textos: Sequence[str],
+    umbral: float,
+    palabras: Optional[Sequence[FrozenSet[str]]] = None,
+) -> Dict[Tuple[int, int], float]:
+    """
+    Todos los pares (i, j), i < j, con similitud() >= umbral.
+
+    Las cotas de todos los pares se calculan por bloques de filas; solo los
+    pares que las pasan se puntúan con el scorer exacto.
+    """
+    n = len(textos)
+    resultado: Dict[Tuple[int, int], float] = {}
+    if n < 2:
+        return resultado
+
+    if not NUMPY_AVAILABLE:
+        for i in range(n):
+            for j in range(i + 1, n):
+                puntaje = similitud(
+                    textos[i],
+                    textos[j],
+                    palabras[i] if palabras else None,
+                    palabras[j] if palabras else None,
+                )
+                if puntaje >= umbral:
+                    resultado[(i, j)] = puntaje
+        return resultado
+
+    matriz = MatrizNombres(textos, palabras)
+    conteos, longitudes = matriz.conteos, matriz.longitudes
+    usar_jaccard = palabras is not None and bool(matriz._vocabulario)
+    if usar_jaccard:
+        # Índice invertido palabra -> filas (CSR por palabra): una incidencia
+        # densa n x vocabulario no cabe con catálogos grandes
+        por_palabra = np.argsort(matriz._indices, kind="stable")
+        filas_de_palabra = matriz._filas[por_palabra]
+        punteros = np.zeros(len(matriz._vocabulario) + 1, dtype=np.int64)
+        np.cumsum(
+            np.bincount(matriz._indices, minlength=len(matriz._vocabulario)),
+            out=punteros[1:],
+        )
+
+    bloque = max(1, ELEMENTOS_POR_BLOQUE // max(1, n * conteos.shape[1]))
+    for inicio in range(0, n - 1, bloque):
+        filas = np.arange(inicio, min(n, inicio + bloque))
+        interseccion = np.minimum(conteos[filas, None, :], conteos[None, :, :]).sum(
+            axis=2
+        )
+        total = longitudes[filas, None] + longitudes[None, :]
+        cotas = np.where(total > 0, 2.0 * interseccion / np.maximum(total, 1), 1.0)
+
+        if usar_jaccard:
+            comunes = _palabras_comunes(
+                matriz, filas_de_palabra, punteros, inicio, inicio + len(filas)
+            )
+            union = (
+                matriz.n_palabras[filas, None] + matriz.n_palabras[None, :] - comunes
+            )
+            ambos = (matriz.n_palabras[filas, None] > 0) & (matriz.n_palabras > 0)
+            cotas = np.where(
+                ambos,
+                cotas * PESO_RATIO
+                + np.where(union > 0, comunes / np.maximum(union, 1), 0.0)
+                * PESO_JACCARD,
+                cotas,
+            )
+
+        # Solo j > i
+        cotas[np.arange(len(filas))[:, None] >= (np.arange(n)[None, :] - inicio)] = -1
+        for fila, j in zip(*np.nonzero(cotas + EPSILON >= umbral)):
+            i = inicio + int(fila)
+            puntaje = similitud(
+                textos[i],
+                textos[j],
+                palabras[i] if palabras else None,
+                palabras[j] if palabras else None,
+            )
+            if puntaje >= umbral:
+                resultado[(i, int(j))] = puntaje
+
+    return resultado
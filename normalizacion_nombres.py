@@ -0,0 +1,711 @@
+"""
+Normalización de Nombres de Productos
+=====================================
+
+Diccionarios y extractores compartidos por product_matcher (matching contra
+el catálogo) y duplicate_detector (agrupación de líneas de video).
+
+- ABREVIATURAS_COLOMBIA (tickets) y ABREVIATURAS_VIDEO (errores de OCR en
+  frames de video, se suma a las de tickets) compiladas en una sola regex
+  por perfil: el nombre se expande en una pasada
+- MARCAS_CONOCIDAS compiladas en una regex; gana la marca más larga
+- analizar_nombre() devuelve un NombreAnalizado inmutable (nombre limpio,
+  expandido, palabras, marca, cantidad, metros) memoizado en una LRU
+  (NORMALIZACION_CACHE_MAX entradas) con contadores de aciertos
+
+Autor: LecFac
+Versión: 1.0.0
+"""
+
+import os
+import re
+import threading
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Callable, Dict, FrozenSet, Optional
+
+NORMALIZACION_CACHE_MAX = int(os.environ.get("NORMALIZACION_CACHE_MAX", "20000"))
+
+# ============================================================================
+# PALABRAS SIN VALOR PARA COMPARAR
+# ============================================================================
+
+PALABRAS_IGNORAR = {
+    "DE",
+    "LA",
+    "EL",
+    "EN",
+    "CON",
+    "SIN",
+    "POR",
+    "PARA",
+    "UND",
+    "UN",
+    "UNA",
+    "GR",
+    "ML",
+    "KG",
+    "LT",
+    "X",
+    "Y",
+    "O",
+    "A",
+    "AL",
+    "DEL",
+    "LOS",
+    "LAS",
+    "MAS",
+    "MENOS",
+    "PACK",
+    "PAQUETE",
+    "BOLSA",
+    "CAJA",
+    "BOTELLA",
+    "LATA",
+}
+
+# ============================================================================
+# DICCIONARIO DE ABREVIATURAS COLOMBIANAS (tickets de supermercado)
+# ============================================================================
+
+ABREVIATURAS_COLOMBIA = {
+    # Papel higiénico y aseo
+    "P HIG": "PAPEL HIGIENICO",
+    "PAP HIG": "PAPEL HIGIENICO",
+    "P.HIG": "PAPEL HIGIENICO",
+    "PHIG": "PAPEL HIGIENICO",
+    "P HIGI": "PAPEL HIGIENICO",
+    "PAP HIGI": "PAPEL HIGIENICO",
+    "TOA COC": "TOALLAS COCINA",
+    "TOA HIG": "TOALLAS HIGIENICAS",
+    "SERV": "SERVILLETAS",
+    "SERVILL": "SERVILLETAS",
+    "PROT FEM": "PROTECTORES FEMENINOS",
+    # Marcas abreviadas en tickets
+    "FAM": "FAMILIA",
+    "ROSAL30H": "ROSAL 30M",
+    "ROSAL15H": "ROSAL 15M",
+    "ROSALSON": "ROSAL",
+    "SCOTT15": "SCOTT 15M",
+    "SCOTT30": "SCOTT 30M",
+    # Alimentos básicos
+    "ACE VEG": "ACEITE VEGETAL",
+    "ACE VEGT": "ACEITE VEGETAL",
+    "ACE GIR": "ACEITE GIRASOL",
+    "ARR BLCO": "ARROZ BLANCO",
+    "ARR BLC": "ARROZ BLANCO",
+    "AREPA MAI": "AREPA MAIZ",
+    "AREPA MZ": "AREPA MAIZ",
+    "PAN TAJ": "PAN TAJADO",
+    "PAN MOLD": "PAN MOLDE",
+    "HUEV": "HUEVOS",
+    "HVO": "HUEVOS",
+    "HUEVOS ORO AA": "HUEVOS ORO",
+    # Lácteos
+    "LCH ENT": "LECHE ENTERA",
+    "LCH DESLA": "LECHE DESLACTOSADA",
+    "LCH DESC": "LECHE DESCREMADA",
+    "LECH ENT": "LECHE ENTERA",
+    "YOG": "YOGURT",
+    "QUES": "QUESO",
+    "QUESO CAMPES": "QUESO CAMPESINO",
+    "MANT": "MANTEQUILLA",
+    "MARG": "MARGARINA",
+    # Carnes y embutidos
+    "JAMN": "JAMON",
+    "JAM": "JAMON",
+    "SALCH": "SALCHICHA",
+    "SALCHICH": "SALCHICHA",
+    "PECH POL": "PECHUGA POLLO",
+    "CARN MOL": "CARNE MOLIDA",
+    # Bebidas
+    "GAL AGUA": "GALON AGUA",
+    "BEB GASEO": "BEBIDA GASEOSA",
+    "GASEO": "GASEOSA",
+    "JUG NAR": "JUGO NARANJA",
+    "JGO NAR": "JUGO NARANJA",
+    "GATOR": "GATORADE",
+    # Limpieza
+    "JAB LAV": "JABON LAVAPLATOS",
+    "JAB TOC": "JABON TOCADOR",
+    "JAB LIQ": "JABON LIQUIDO",
+    "DET LIQ": "DETERGENTE LIQUIDO",
+    "DET POL": "DETERGENTE POLVO",
+    "LIMP MUL": "LIMPIADOR MULTIUSOS",
+    "LIMP VID": "LIMPIADOR VIDRIOS",
+    "SUAV ROA": "SUAVIZANTE ROPA",
+    "SUAV": "SUAVIZANTE",
+    "BLANQ": "BLANQUEADOR",
+    # Salsas y condimentos
+    "SALSAMEN": "SALSA MAYONESA",
+    "SALSA TOM": "SALSA TOMATE",
+    "SALSA BBQ": "SALSA BARBECUE",
+    "MAYO": "MAYONESA",
+    "KETCH": "KETCHUP",
+    "MOST": "MOSTAZA",
+    # Snacks y dulces
+    "CHOC POL": "CHOCOLATE POLVO",
+    "CHOC TAB": "CHOCOLATE TABLETA",
+    "GAL SAL": "GALLETAS SALADAS",
+    "GAL DUL": "GALLETAS DULCES",
+    "PAP FRI": "PAPAS FRITAS",
+    # Cuidado personal
+    "CREM DENT": "CREMA DENTAL",
+    "CEP DENT": "CEPILLO DENTAL",
+    "DESOD": "DESODORANTE",
+    "SHAMPO": "SHAMPOO",
+    "SHAMP": "SHAMPOO",
+    "ACOND": "ACONDICIONADOR",
+    "CREMA CORP": "CREMA CORPORAL",
+    # Otros
+    "LEV INST": "LEVADURA INSTANTANEA",
+    "HAR TRIG": "HARINA TRIGO",
+    "AZUC": "AZUCAR",
+    "SAL REF": "SAL REFINADA",
+    "CAFE MOL": "CAFE MOLIDO",
+    "CAFE INST": "CAFE INSTANTANEO",
+    # Unidades (corrección OCR)
+    "UHD": "UNIDADES",
+    "UND": "UNIDADES",
+    "UNDS": "UNIDADES",
+    "UNID": "UNIDADES",
+}
+
+# Marcas comunes colombianas (para extraer de nombres OCR y de video)
+MARCAS_CONOCIDAS = {
+    # Papel y aseo
+    "ROSAL",
+    "FAMILIA",
+    "SUAVE",
+    "SCOTT",
+    "ELITE",
+    "TECNOQUIMICAS",
+    "NOSOTRAS",
+    "COTTONELLE",
+    "RENOVA",
+    "NEVAX",
+    "PETALO",
+    # Alimentos
+    "RAMO",
+    "BIMBO",
+    "COMAPAN",
+    "SANTA CLARA",
+    "ORO",
+    "KIKES",
+    "SANTAREYES",
+    "HUEVOS ORO",
+    "DIANA",
+    "FLORHUILA",
+    "ROA",
+    "ARROZ ROA",
+    "ARROZ DIANA",
+    "DORIA",
+    "PASTAS DORIA",
+    "COMARRICO",
+    "LA MUÑECA",
+    "ALPINA",
+    "COLANTA",
+    "ALQUERIA",
+    "PARMALAT",
+    "ZENÚ",
+    "RICA",
+    "PIETRÁN",
+    "SUIZO",
+    "CAMPO VERDE",
+    "CELEMA",
+    "COOLECHERA",
+    "ALGARRA",
+    "NORMANDY",
+    "YOPLAIT",
+    "DANONE",
+    "NESTLE",
+    "POMAR",
+    "ZENU",
+    "RANCHERA",
+    "KOIPE",
+    "MAZOLA",
+    "GOURMET",
+    "PREMIER",
+    "OLEOCALI",
+    "LA BUENA",
+    # Bebidas
+    "POSTOBON",
+    "COCA COLA",
+    "PEPSI",
+    "QUATRO",
+    "COLOMBIANA",
+    "HIT",
+    "TAMPICO",
+    "FRUTTO",
+    "DEL VALLE",
+    "BIG COLA",
+    "JUGOS HIT",
+    "FRUTIÑO",
+    "COUNTRY HILL",
+    # Salsas
+    "FRUCO",
+    "RESPIN",
+    "MAGGI",
+    "LA CONSTANCIA",
+    "SAN JORGE",
+    # Limpieza
+    "FAB",
+    "ARIEL",
+    "ACE",
+    "DERSA",
+    "TOP",
+    "VANISH",
+    "AXION",
+    "LAVAPLATOS",
+    "FABULOSO",
+    "CLOROX",
+    "LIS",
+    # Cuidado personal
+    "COLGATE",
+    "FORTIDENT",
+    "KOLYNOS",
+    "ORAL B",
+    "PALMOLIVE",
+    "PROTEX",
+    "DOVE",
+    "REXONA",
+    "AXE",
+    "HEAD SHOULDERS",
+    "SEDAL",
+    "PANTENE",
+    "ELVIVE",
+    # Snacks
+    "MARGARITA",
+    "DE TODITO",
+    "YUPI",
+    "SUPER RICAS",
+    "FESTIVAL",
+    "SALTINAS",
+    "DUCALES",
+    "CLUB SOCIAL",
+    "FRITO LAY",
+    "NOEL",
+    "COLOMBINA",
+    "CHOCORAMO",
+    # Otros
+    "NESCAFE",
+    "SELLO ROJO",
+    "AGUILA ROJA",
+    "COLCAFE",
+    "MANUELITA",
+    "INCAUCA",
+    "RIOPAILA",
+    # Marcas propias de supermercados
+    "EKONO",
+    "MARCA PROPIA",
+    "ARA",
+    "EXITO",
+    "JUMBO",
+    "OLIMPICA",
+    "D1",
+    "CARULLA",
+    "ALKOSTO",
+}
+
+# ============================================================================
+# ABREVIATURAS DE OCR EN VIDEO (duplicate_detector)
+# ============================================================================
+# Se aplican junto con ABREVIATURAS_COLOMBIA; estas ganan si se repiten
+
+ABREVIATURAS_VIDEO = {
+    # Papel higiénico y limpieza
+    "P ATG": "PAPEL HIGIENICO",  # Error OCR común
+    "P HTG": "PAPEL HIGIENICO",  # Error OCR
+    "HIG": "HIGIENICO",
+    "ROSAL30N": "ROSAL 30M",  # N es error OCR de M
+    "ROSAL30M": "ROSAL 30M",
+    "ROSALSON": "ROSAL 30M",  # Error OCR
+    "ROSAL3OH": "ROSAL 30M",  # O en vez de 0
+    "ULTRACONF": "ULTRACONFORT",
+    "ULTRACNF": "ULTRACONFORT",
+    # Huevos
+    "HVS": "HUEVOS",
+    "HUEVOS ORO AA": "HUEVOS ORO TIPO AA",  # como "HUEV ORO AA"
+    "AA": "TIPO AA",
+    "AAA": "TIPO AAA",
+    "X30": "30 UNIDADES",
+    "X30UND": "30 UNIDADES",
+    "X30UHD": "30 UNIDADES",  # Error OCR
+    "X15": "15 UNIDADES",
+    "X12": "12 UNIDADES",
+    "X12UND": "12 UNIDADES",
+    "X12R": "12 ROLLOS",
+    # Aceites y grasas
+    "ACE": "ACEITE",
+    "ACEIT": "ACEITE",
+    "VEG": "VEGETAL",
+    "VEGETAL": "VEGETAL",
+    "GIRAS": "GIRASOL",
+    "MZLLA": "MAZOLA",
+    # Lácteos
+    "LCH": "LECHE",
+    "LECH": "LECHE",
+    "YOGH": "YOGURT",
+    "QSO": "QUESO",
+    "QESO": "QUESO",
+    "DESLA": "DESLACTOSADA",
+    "DESLAC": "DESLACTOSADA",
+    "SEMIDES": "SEMIDESCREMADA",
+    "DESC": "DESCREMADA",
+    "ENT": "ENTERA",
+    # Carnes
+    "PCH": "PECHUGA",
+    "PECH": "PECHUGA",
+    "PLL": "POLLO",
+    "POLL": "POLLO",
+    "CRN": "CARNE",
+    "CARN": "CARNE",
+    "RES": "RES",
+    "CRD": "CERDO",
+    "CERD": "CERDO",
+    "MOL": "MOLIDA",
+    "MOLD": "MOLIDA",
+    "COST": "COSTILLA",
+    "CHUL": "CHULETA",
+    "LOM": "LOMO",
+    # Bebidas
+    "GAS": "GASEOSA",
+    "GASS": "GASEOSA",
+    "JGO": "JUGO",
+    "JUG": "JUGO",
+    "AGU": "AGUA",
+    "CCA": "COCA COLA",
+    "CCOLA": "COCA COLA",
+    "PPS": "PEPSI",
+    "PEPS": "PEPSI",
+    "POSTB": "POSTOBON",
+    "POSTBN": "POSTOBON",
+    # Limpieza
+    "JAB": "JABON",
+    "LAVAP": "LAVAPLATOS",
+    "DET": "DETERGENTE",
+    "DETERG": "DETERGENTE",
+    "LIMP": "LIMPIADOR",
+    "LIMPIA": "LIMPIADOR",
+    "DESINF": "DESINFECTANTE",
+    "CLOR": "CLORO",
+    "BLNQ": "BLANQUEADOR",
+    "SUAVIZ": "SUAVIZANTE",
+    # Panadería
+    "PN": "PAN",
+    "PAND": "PANDEBONO",
+    "PDBON": "PANDEBONO",
+    "ALMOJ": "ALMOJABANA",
+    "BUNS": "PANES",
+    "TAJD": "TAJADO",
+    "TAJ": "TAJADO",
+    "INTEG": "INTEGRAL",
+    "INTGR": "INTEGRAL",
+    "BLA": "BLANCO",
+    "BLANC": "BLANCO",
+    # Snacks
+    "PAP FRT": "PAPAS FRITAS",
+    "PAPFRT": "PAPAS FRITAS",
+    "PAP FR": "PAPAS FRITAS",
+    "CHOC": "CHOCOLATE",
+    "CHOCOL": "CHOCOLATE",
+    "GALL": "GALLETAS",
+    "GALLT": "GALLETAS",
+    # Granos y cereales
+    "ARR": "ARROZ",
+    "ARRZ": "ARROZ",
+    "FRIJ": "FRIJOL",
+    "FRIJL": "FRIJOL",
+    "LENT": "LENTEJA",
+    "LENTJ": "LENTEJA",
+    "GARB": "GARBANZO",
+    "AVN": "AVENA",
+    "AVEN": "AVENA",
+    # Frutas y verduras
+    "TOM": "TOMATE",
+    "TOMT": "TOMATE",
+    "CEB": "CEBOLLA",
+    "CEBL": "CEBOLLA",
+    "ZAN": "ZANAHORIA",
+    "ZANAH": "ZANAHORIA",
+    "PAP": "PAPA",
+    "PLAT": "PLATANO",
+    "BANAN": "BANANO",
+    "MZN": "MANZANA",
+    "MANZ": "MANZANA",
+    "NAR": "NARANJA",
+    "NARNJ": "NARANJA",
+    "LIM": "LIMON",
+    "LIMN": "LIMON",
+    # Marcas comunes
+    "FAML": "FAMILIA",
+    "ALPN": "ALPINA",
+    "ALP": "ALPINA",
+    "COLNT": "COLANTA",
+    "COL": "COLANTA",
+    "ALQ": "ALQUERIA",
+    "ALQR": "ALQUERIA",
+    "ZNU": "ZENU",
+    "RCHM": "RANCHERA",
+    "RNCH": "RANCHERA",
+    "KOIPE": "KOIPE",
+    "GOURM": "GOURMET",
+    "PREM": "PREMIUM",
+    # Unidades y cantidades
+    "UDS": "UNIDADES",
+    "GR": "GRAMOS",
+    "GRS": "GRAMOS",
+    "KG": "KILOGRAMOS",
+    "KGS": "KILOGRAMOS",
+    "ML": "MILILITROS",
+    "MLS": "MILILITROS",
+    "LT": "LITROS",
+    "LTS": "LITROS",
+    "PZS": "PIEZAS",
+    "PCS": "PIEZAS",
+}
+
+
+# ============================================================================
+# CACHÉS
+# ============================================================================
+
+_caches: Dict[str, Callable] = {}
+_caches_lock = threading.Lock()
+
+
+def memoizar(nombre: str):
+    """
+    lru_cache de NORMALIZACION_CACHE_MAX entradas registrada para
+    estadisticas(). Solo para funciones puras que devuelven valores inmutables.
+    """
+
+    def decorador(funcion):
+        cacheada = lru_cache(maxsize=NORMALIZACION_CACHE_MAX)(funcion)
+        with _caches_lock:
+            _caches[nombre] = cacheada
+        return cacheada
+
+    return decorador
+
+
+def estadisticas() -> Dict:
+    """Aciertos, fallos y ocupación de cada caché de normalización"""
+    with _caches_lock:
+        caches = dict(_caches)
+
+    resultado = {}
+    for nombre, funcion in caches.items():
+        info = funcion.cache_info()
+        consultas = info.hits + info.misses
+        resultado[nombre] = {
+            "aciertos": info.hits,
+            "fallos": info.misses,
+            "entradas": info.currsize,
+            "max_entradas": info.maxsize,
+            "hit_rate": round(info.hits / consultas * 100, 2) if consultas else 0.0,
+        }
+    return resultado
+
+
+def limpiar_caches():
+    """Vacía las cachés (tras cambiar los diccionarios en caliente)"""
+    with _caches_lock:
+        caches = list(_caches.values())
+    for funcion in caches:
+        funcion.cache_clear()
+
+
+# ============================================================================
+# EXPANSIÓN Y EXTRACCIÓN
+# ============================================================================
+
+_NO_PALABRA = re.compile(r"[^\w\s]")
+_ESPACIOS = re.compile(r"\s+")
+
+
+def _compilar_abreviaturas(diccionario: Dict[str, str]) -> re.Pattern:
+    """
+    Una alternancia con las abreviaturas de más larga a más corta: en cada
+    posición gana la más larga, igual que los reemplazos sucesivos de antes.
+    """
+    claves = sorted(diccionario, key=len, reverse=True)
+    return re.compile(r"\b(?:" + "|".join(re.escape(c) for c in claves) + r")\b")
+
+
+PERFILES_ABREVIATURAS = {
+    "ticket": ABREVIATURAS_COLOMBIA,
+    "video": {**ABREVIATURAS_COLOMBIA, **ABREVIATURAS_VIDEO},
+}
+_PATRONES_ABREVIATURAS = {
+    perfil: _compilar_abreviaturas(diccionario)
+    for perfil, diccionario in PERFILES_ABREVIATURAS.items()
+}
+
+# Marcas delimitadas por no-letras (ROSAL30H sí, PARA no es ARA); el
+# lookahead devuelve todas las apariciones, solapadas, para elegir la más larga
+_PATRON_MARCAS = re.compile(
+    r"(?<![^\W\d_])(?=("
+    + "|".join(re.escape(m) for m in sorted(MARCAS_CONOCIDAS, key=len, reverse=True))
+    + r")(?![^\W\d_]))"
+)
+
+_PATRONES_CANTIDAD = [
+    re.compile(patron)
+    for patron in (
+        r"X(\d+)[RU]?\b",  # X12, X12R, X12U
+        r"(\d+)\s*UND",  # 12UND, 12 UND
+        r"(\d+)\s*UHD",  # 12UHD (OCR mal leído)
+        r"(\d+)\s*UNID",  # 12UNID
+        r"(\d+)\s*[R]\b",  # 12R (rollos)
+        r"(\d+)\s*GR?\b",  # 500G, 500GR
+        r"(\d+)\s*KG\b",  # 1KG
+        r"(\d+)\s*ML\b",  # 500ML
+        r"(\d+)\s*LT?\b",  # 1L, 1LT
+    )
+]
+
+_PATRONES_METROS = [
+    re.compile(patron)
+    for patron in (
+        r"(\d+)\s*M\b",  # 30M, 15M
+        r"(\d+)\s*H\b",  # 30H, 15H (OCR confunde M→H)
+        r"(\d+)\s*MTS?\b",  # 30MTS, 30MT
+        r"(\d+)\s*METROS?\b",  # 30 METROS
+    )
+]
+# Solo valores típicos de papel higiénico
+METROS_VALIDOS = {"15", "20", "25", "30", "40", "50"}
+
+
+def limpiar_nombre(nombre: str) -> str:
+    """Limpia y normaliza un nombre de producto"""
+    if not nombre:
+        return ""
+
+    nombre = _NO_PALABRA.sub(" ", nombre.upper().strip())
+    return _ESPACIOS.sub(" ", nombre).strip()
+
+
+def _expandir(nombre: str, perfil: str) -> str:
+    if not nombre:
+        return ""
+
+    diccionario = PERFILES_ABREVIATURAS[perfil]
+    nombre_upper = _PATRONES_ABREVIATURAS[perfil].sub(
+        lambda m: diccionario[m.group(0)], nombre.upper()
+    )
+    return _ESPACIOS.sub(" ", nombre_upper).strip()
+
+
+@memoizar("expandir_abreviaturas")
+def expandir_abreviaturas(nombre: str, perfil: str = "ticket") -> str:
+    """
+    Expande abreviaturas de tickets colombianos en una sola pasada.
+
+    perfil: "ticket" (product_matcher) o "video" (duplicate_detector, suma
+    los errores de OCR de frames)
+    """
+    return _expandir(nombre, perfil)
+
+
+def extraer_marca(nombre: str) -> Optional[str]:
+    """Marca conocida presente en el nombre (la más larga si hay varias)"""
+    if not nombre:
+        return None
+
+    mejor = None
+    for match in _PATRON_MARCAS.finditer(nombre.upper()):
+        marca = match.group(1)
+        if mejor is None or len(marca) > len(mejor):
+            mejor = marca
+    return mejor
+
+
+def extraer_cantidad(nombre: str) -> Optional[str]:
+    """
+    Extrae información de cantidad (ej: 12, X12, 30M, 500G).
+    Retorna solo el número principal.
+    """
+    if not nombre:
+        return None
+
+    nombre_upper = nombre.upper()
+    for patron in _PATRONES_CANTIDAD:
+        match = patron.search(nombre_upper)
+        if match:
+            return match.group(1)
+
+    return None
+
+
+def extraer_metros(nombre: str) -> Optional[str]:
+    """
+    Extrae metros de papel higiénico/toallas (15M, 30M, etc).
+    OCR a veces confunde M→H: "ROSAL30H" = "ROSAL 30M"
+    """
+    if not nombre:
+        return None
+
+    nombre_upper = nombre.upper()
+    for patron in _PATRONES_METROS:
+        match = patron.search(nombre_upper)
+        if match and match.group(1) in METROS_VALIDOS:
+            return match.group(1)
+
+    return None
+
+
+def palabras_significativas(nombre_limpio: str) -> FrozenSet[str]:
+    """Palabras de 3+ letras que no están en PALABRAS_IGNORAR"""
+    return frozenset(
+        p for p in nombre_limpio.split() if p not in PALABRAS_IGNORAR and len(p) >= 3
+    )
+
+
+# ============================================================================
+# NOMBRE ANALIZADO
+# ============================================================================
+
+
+@dataclass(frozen=True)
+class NombreAnalizado:
+    """Todo lo que el matching necesita de un nombre, calculado una vez"""
+
+    nombre: str
+    limpio: str
+    expandido: str
+    palabras: FrozenSet[str]
+    palabras_expandido: FrozenSet[str]
+    marca: Optional[str]
+    cantidad: Optional[str]
+    metros: Optional[str]
+
+
+def analizar_nombre_sin_cache(nombre: str) -> NombreAnalizado:
+    """
+    analizar_nombre() sin pasar por la LRU, para cargas masivas (catálogo
+    completo) que solo desalojarían los nombres de factura recientes
+    """
+    limpio = limpiar_nombre(nombre)
+    expandido = limpiar_nombre(_expandir(limpio, "ticket"))
+    return NombreAnalizado(
+        nombre=nombre or "",
+        limpio=limpio,
+        expandido=expandido,
+        palabras=palabras_significativas(limpio),
+        palabras_expandido=palabras_significativas(expandido),
+        marca=extraer_marca(limpio) or extraer_marca(expandido),
+        cantidad=extraer_cantidad(limpio),
+        metros=extraer_metros(limpio) or extraer_metros(expandido),
+    )
+
+
+@memoizar("analizar_nombre")
+def analizar_nombre(nombre: str) -> NombreAnalizado:
+    """
+    Nombre limpio y expandido, palabras significativas y marca/cantidad/metros.
+
+    El resultado se comparte entre llamadas (LRU); es inmutable.
+    """
+    return analizar_nombre_sin_cache(nombre)
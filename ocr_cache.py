@@ -0,0 +1,366 @@
+"""
+Caché de Resultados OCR
+=======================
+
+Caché direccionada por contenido delante de parse_invoice_with_claude().
+
+- Clave exacta: SHA-256 de los bytes de la imagen + versión del prompt +
+  establecimiento preseleccionado. Sirve a cualquier usuario.
+- Clave perceptual: dHash de 256 bits para re-fotos casi idénticas de la
+  misma factura. Solo se consulta entre las entradas recientes del mismo
+  usuario (los recibos de una misma cadena se parecen demasiado entre sí).
+- La versión del prompt es parte de la clave: al cambiar VERSION_PROMPT en
+  claude_invoice las entradas anteriores dejan de coincidir y se purgan.
+- Expiración por TTL (OCR_CACHE_TTL_DIAS) y tamaño (OCR_CACHE_MAX_ENTRADAS).
+
+Vive en la tabla ocr_cache (migración 006), así todas las instancias la
+comparten. Con SQLite la caché queda deshabilitada.
+
+Autor: LecFac
+Versión: 1.0.0
+"""
+
+import hashlib
+import io
+import json
+import os
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+try:
+    import cv2
+    import numpy as np
+
+    CV2_AVAILABLE = True
+except Exception:
+    CV2_AVAILABLE = False
+
+try:
+    from PIL import Image, ImageOps
+
+    PIL_AVAILABLE = True
+except Exception:
+    PIL_AVAILABLE = False
+
+
+OCR_CACHE_HABILITADA = os.environ.get("OCR_CACHE", "true").lower() == "true"
+OCR_CACHE_TTL_DIAS = int(os.environ.get("OCR_CACHE_TTL_DIAS", "30"))
+OCR_CACHE_MAX_ENTRADAS = int(os.environ.get("OCR_CACHE_MAX_ENTRADAS", "5000"))
+# Bits distintos (de 256) tolerados para considerar dos fotos la misma factura
+OCR_CACHE_DISTANCIA_PHASH = int(os.environ.get("OCR_CACHE_DISTANCIA_PHASH", "10"))
+# Entradas recientes del usuario contra las que se compara el hash perceptual
+OCR_CACHE_CANDIDATOS_PHASH = 50
+# Intervalo mínimo entre purgas automáticas (segundos)
+OCR_CACHE_INTERVALO_PURGA = 600
+
+LADO_DHASH = 16
+
+_stats_lock = threading.Lock()
+_stats = {
+    "consultas": 0,
+    "hits_exactos": 0,
+    "hits_perceptuales": 0,
+    "guardadas": 0,
+    "errores": 0,
+    "tokens_ahorrados": 0,
+}
+_ultima_purga = 0.0
+
+
+def _activa() -> bool:
+    return (
+        OCR_CACHE_HABILITADA
+        and os.environ.get("DATABASE_TYPE", "sqlite").lower() == "postgresql"
+    )
+
+
+def _incrementar(clave: str, valor: int = 1):
+    with _stats_lock:
+        _stats[clave] += valor
+
+
+# ============================================================================
+# HUELLAS
+# ============================================================================
+
+
+def _dhash(datos: bytes) -> Optional[str]:
+    """dHash de 16x16 (256 bits) en hexadecimal; None sin OpenCV ni Pillow"""
+    try:
+        if CV2_AVAILABLE:
+            gris = cv2.imdecode(np.frombuffer(datos, np.uint8), cv2.IMREAD_GRAYSCALE)
+            if gris is None:
+                return None
+            pequena = cv2.resize(
+                gris, (LADO_DHASH + 1, LADO_DHASH), interpolation=cv2.INTER_AREA
+            )
+            pixeles = pequena.tolist()
+        elif PIL_AVAILABLE:
+            imagen = ImageOps.exif_transpose(Image.open(io.BytesIO(datos)))
+            pequena = imagen.convert("L").resize((LADO_DHASH + 1, LADO_DHASH))
+            valores = list(pequena.getdata())
+            pixeles = [
+                valores[fila * (LADO_DHASH + 1) : (fila + 1) * (LADO_DHASH + 1)]
+                for fila in range(LADO_DHASH)
+            ]
+        else:
+            return None
+    except Exception as e:
+        print(f"⚠️ [OCR CACHE] No se pudo calcular el hash perceptual: {e}")
+        return None
+
+    bits = 0
+    for fila in pixeles:
+        for izquierda, derecha in zip(fila, fila[1:]):
+            bits = (bits << 1) | (1 if derecha > izquierda else 0)
+    return f"{bits:064x}"
+
+
+def calcular_huellas(datos: bytes) -> Tuple[str, Optional[str]]:
+    """(sha256, dhash) de los bytes originales de la imagen"""
+    return hashlib.sha256(datos).hexdigest(), _dhash(datos)
+
+
+def distancia_hamming(hash_a: str, hash_b: str) -> int:
+    return bin(int(hash_a, 16) ^ int(hash_b, 16)).count("1")
+
+
+def _clave_establecimiento(establecimiento: Optional[str]) -> str:
+    return (establecimiento or "").strip().upper()[:100]
+
+
+# ============================================================================
+# CONSULTA / ESCRITURA
+# ============================================================================
+
+
+def buscar(
+    sha256: str,
+    phash: Optional[str],
+    version_prompt: str,
+    establecimiento: Optional[str] = None,
+    usuario_id: Optional[int] = None,
+) -> Optional[Dict]:
+    """
+    Busca un resultado OCR guardado.
+
+    Returns:
+        {"data", "usage", "tipo": "exacto"|"perceptual", "distancia"} o None
+    """
+    if not _activa():
+        return None
+
+    from database import get_db_connection
+
+    _incrementar("consultas")
+    establecimiento = _clave_establecimiento(establecimiento)
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        cursor.execute(
+            """
+            SELECT id, resultado, usage
+            FROM ocr_cache
+            WHERE sha256 = %s AND version_prompt = %s AND establecimiento = %s
+              AND creado_en > NOW() - (%s * INTERVAL '1 day')
+        """,
+            (sha256, version_prompt, establecimiento, OCR_CACHE_TTL_DIAS),
+        )
+        fila = cursor.fetchone()
+        tipo, distancia = "exacto", 0
+
+        if fila is None and phash and usuario_id is not None:
+            cursor.execute(
+                """
+                SELECT id, resultado, usage, phash
+                FROM ocr_cache
+                WHERE usuario_id = %s AND version_prompt = %s
+                  AND establecimiento = %s AND phash IS NOT NULL
+                  AND creado_en > NOW() - (%s * INTERVAL '1 day')
+                ORDER BY creado_en DESC
+                LIMIT %s
+            """,
+                (
+                    usuario_id,
+                    version_prompt,
+                    establecimiento,
+                    OCR_CACHE_TTL_DIAS,
+                    OCR_CACHE_CANDIDATOS_PHASH,
+                ),
+            )
+            mejor = None
+            for candidato in cursor.fetchall():
+                d = distancia_hamming(phash, candidato[3])
+                if d <= OCR_CACHE_DISTANCIA_PHASH and (mejor is None or d < mejor[0]):
+                    mejor = (d, candidato)
+            if mejor is not None:
+                distancia, fila = mejor[0], mejor[1][:3]
+                tipo = "perceptual"
+
+        if fila is None:
+            return None
+
+        cursor.execute(
+            """
+            UPDATE ocr_cache
+            SET hits = hits + 1, ultimo_uso = CURRENT_TIMESTAMP
+            WHERE id = %s
+        """,
+            (fila[0],),
+        )
+        conn.commit()
+
+        resultado, usage = fila[1], fila[2] or {}
+        if isinstance(resultado, str):
+            resultado = json.loads(resultado)
+        if isinstance(usage, str):
+            usage = json.loads(usage)
+
+        _incrementar("hits_exactos" if tipo == "exacto" else "hits_perceptuales")
+        _incrementar("tokens_ahorrados", int(usage.get("total_tokens", 0)))
+        return {"data": resultado, "usage": usage, "tipo": tipo, "distancia": distancia}
+
+    except Exception as e:
+        conn.rollback()
+        _incrementar("errores")
+        print(f"⚠️ [OCR CACHE] Error consultando: {e}")
+        return None
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def guardar(
+    sha256: str,
+    phash: Optional[str],
+    version_prompt: str,
+    data: Dict,
+    usage: Dict,
+    establecimiento: Optional[str] = None,
+    usuario_id: Optional[int] = None,
+):
+    """Guarda (o reemplaza) el resultado OCR exitoso de una imagen"""
+    if not _activa():
+        return
+
+    from database import get_db_connection
+
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        cursor.execute(
+            """
+            INSERT INTO ocr_cache (
+                sha256, version_prompt, establecimiento, phash, usuario_id,
+                resultado, usage
+            ) VALUES (%s, %s, %s, %s, %s, %s, %s)
+            ON CONFLICT (sha256, version_prompt, establecimiento) DO UPDATE SET
+                phash = EXCLUDED.phash,
+                resultado = EXCLUDED.resultado,
+                usage = EXCLUDED.usage,
+                creado_en = CURRENT_TIMESTAMP,
+                ultimo_uso = CURRENT_TIMESTAMP
+        """,
+            (
+                sha256,
+                version_prompt,
+                _clave_establecimiento(establecimiento),
+                phash,
+                usuario_id,
+                json.dumps(data, default=str),
+                json.dumps(usage, default=str),
+            ),
+        )
+        conn.commit()
+        _incrementar("guardadas")
+    except Exception as e:
+        conn.rollback()
+        _incrementar("errores")
+        print(f"⚠️ [OCR CACHE] Error guardando: {e}")
+    finally:
+        cursor.close()
+        conn.close()
+
+    _purgar_si_corresponde(version_prompt)
+
+
+# ============================================================================
+# EXPIRACIÓN
+# ============================================================================
+
+
+def purgar(version_prompt: str) -> Dict:
+    """Elimina entradas vencidas, de otras versiones del prompt y excedentes"""
+    if not _activa():
+        return {"eliminadas": 0}
+
+    from database import get_db_connection
+
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        cursor.execute(
+            """
+            DELETE FROM ocr_cache
+            WHERE version_prompt <> %s
+               OR creado_en < NOW() - (%s * INTERVAL '1 day')
+        """,
+            (version_prompt, OCR_CACHE_TTL_DIAS),
+        )
+        vencidas = cursor.rowcount
+
+        cursor.execute(
+            """
+            DELETE FROM ocr_cache
+            WHERE id IN (
+                SELECT id FROM ocr_cache
+                ORDER BY ultimo_uso DESC
+                OFFSET %s
+            )
+        """,
+            (OCR_CACHE_MAX_ENTRADAS,),
+        )
+        excedentes = cursor.rowcount
+        conn.commit()
+
+        if vencidas or excedentes:
+            print(
+                f"🧹 [OCR CACHE] Purga: {vencidas} vencidas/otra versión, "
+                f"{excedentes} por tamaño"
+            )
+        return {
+            "eliminadas": vencidas + excedentes,
+            "vencidas": vencidas,
+            "excedentes": excedentes,
+        }
+    except Exception as e:
+        conn.rollback()
+        print(f"⚠️ [OCR CACHE] Error purgando: {e}")
+        return {"eliminadas": 0, "error": str(e)}
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def _purgar_si_corresponde(version_prompt: str):
+    global _ultima_purga
+    ahora = time.monotonic()
+    with _stats_lock:
+        if ahora - _ultima_purga < OCR_CACHE_INTERVALO_PURGA:
+            return
+        _ultima_purga = ahora
+    purgar(version_prompt)
+
+
+def estadisticas() -> Dict:
+    with _stats_lock:
+        stats = dict(_stats)
+    hits = stats["hits_exactos"] + stats["hits_perceptuales"]
+    stats["hit_rate"] = (
+        round(hits / stats["consultas"] * 100, 2) if stats["consultas"] else 0.0
+    )
+    stats["activa"] = _activa()
+    stats["ttl_dias"] = OCR_CACHE_TTL_DIAS
+    stats["max_entradas"] = OCR_CACHE_MAX_ENTRADAS
+    return stats
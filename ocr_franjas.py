@@ -0,0 +1,354 @@
+"""
+OCR por Franjas para Facturas Largas
+====================================
+
+Las facturas largas de Éxito/Olímpica llegan como una sola imagen muy alta.
+Enviada completa, Claude la reduce a 1568 px de alto y las líneas quedan
+ilegibles. Este módulo la divide en franjas horizontales solapadas que se
+procesan en paralelo y luego fusiona los resultados:
+
+1. dividir_en_franjas(): franjas de proporción legible (OCR_FRANJA_RELACION
+   alto/ancho) con un solape (OCR_FRANJA_SOLAPE) para no cortar líneas
+2. Cada franja devuelve posicion_vertical (0-100) relativa a la franja; se
+   traduce a la coordenada y de la imagen completa
+3. En cada zona de solape se emparejan 1 a 1 los ítems repetidos por
+   posición + duplicate_detector.son_productos_similares, y se conserva la
+   lectura más alejada del borde de su franja
+4. Reconciliación contra el total impreso: si la suma excede el total en
+   el valor exacto de un ítem de zona de solape, ese ítem era un duplicado
+
+Autor: LecFac
+Versión: 1.0.0
+"""
+
+import io
+import math
+import os
+from typing import Dict, List, Optional
+
+from duplicate_detector import son_productos_similares
+
+try:
+    import cv2
+    import numpy as np
+
+    CV2_AVAILABLE = True
+except Exception:
+    CV2_AVAILABLE = False
+
+try:
+    from PIL import Image, ImageOps
+
+    PIL_AVAILABLE = True
+except Exception:
+    PIL_AVAILABLE = False
+
+
+# "auto" = solo imágenes altas; "true"/"false" fuerzan
+OCR_FRANJAS = os.environ.get("OCR_FRANJAS", "auto").lower()
+# Relación alto/ancho desde la que una factura se considera larga
+OCR_FRANJAS_RELACION_MIN = float(os.environ.get("OCR_FRANJAS_RELACION_MIN", "2.5"))
+# Relación alto/ancho de cada franja
+OCR_FRANJA_RELACION = float(os.environ.get("OCR_FRANJA_RELACION", "1.5"))
+# Fracción de cada franja que se solapa con la siguiente
+OCR_FRANJA_SOLAPE = float(os.environ.get("OCR_FRANJA_SOLAPE", "0.15"))
+OCR_FRANJAS_MAX = int(os.environ.get("OCR_FRANJAS_MAX", "6"))
+# Resolución que conserva el preprocesamiento antes de dividir
+OCR_FRANJAS_LADO_MAX = int(os.environ.get("OCR_FRANJAS_LADO_MAX", "8000"))
+
+LADO_MAX_FRANJA = 1568
+JPEG_CALIDAD = 85
+# Tolerancia de la reconciliación con el total impreso
+TOLERANCIA_TOTAL = 0.01
+
+
+def debe_usar_franjas(modo: Optional[bool]) -> Optional[bool]:
+    """
+    True fuerza las franjas, False las desactiva, None = decidir por la
+    forma de la imagen (según OCR_FRANJAS)
+    """
+    if modo is not None:
+        return bool(modo)
+    if OCR_FRANJAS == "true":
+        return True
+    if OCR_FRANJAS == "false":
+        return False
+    return None
+
+
+def es_factura_larga(ancho: int, alto: int) -> bool:
+    return ancho > 0 and alto / float(ancho) >= OCR_FRANJAS_RELACION_MIN
+
+
+# ============================================================================
+# DIVISIÓN
+# ============================================================================
+
+
+def _decodificar(datos: bytes):
+    if CV2_AVAILABLE:
+        imagen = cv2.imdecode(np.frombuffer(datos, np.uint8), cv2.IMREAD_GRAYSCALE)
+        if imagen is None:
+            raise ValueError("Imagen no decodificable")
+        return imagen, imagen.shape[1], imagen.shape[0]
+    imagen = ImageOps.exif_transpose(Image.open(io.BytesIO(datos))).convert("L")
+    return imagen, imagen.size[0], imagen.size[1]
+
+
+def _recortar_y_codificar(imagen, y0: int, y1: int) -> bytes:
+    if CV2_AVAILABLE:
+        franja = imagen[y0:y1, :]
+        alto, ancho = franja.shape[:2]
+        escala = LADO_MAX_FRANJA / float(max(alto, ancho))
+        if escala < 1.0:
+            franja = cv2.resize(
+                franja, None, fx=escala, fy=escala, interpolation=cv2.INTER_AREA
+            )
+        ok, buffer = cv2.imencode(
+            ".jpg", franja, [cv2.IMWRITE_JPEG_QUALITY, JPEG_CALIDAD]
+        )
+        if not ok:
+            raise ValueError("No se pudo codificar la franja")
+        return buffer.tobytes()
+
+    franja = imagen.crop((0, y0, imagen.size[0], y1))
+    if max(franja.size) > LADO_MAX_FRANJA:
+        resampling = getattr(Image, "Resampling", Image).LANCZOS
+        franja.thumbnail((LADO_MAX_FRANJA, LADO_MAX_FRANJA), resampling)
+    salida = io.BytesIO()
+    franja.save(salida, "JPEG", quality=JPEG_CALIDAD)
+    return salida.getvalue()
+
+
+def dividir_en_franjas(datos: bytes, forzar: bool = False) -> Optional[Dict]:
+    """
+    Divide una factura alta en franjas horizontales solapadas.
+
+    Returns:
+        {"alto": px, "ancho": px, "franjas": [{"indice", "y0", "y1", "bytes",
+        "media_type"}]} o None si la imagen no es lo bastante alta (o no hay
+        OpenCV/Pillow para dividirla)
+    """
+    if not (CV2_AVAILABLE or PIL_AVAILABLE):
+        return None
+
+    try:
+        imagen, ancho, alto = _decodificar(datos)
+    except Exception as e:
+        print(f"⚠️ [FRANJAS] No se pudo leer la imagen: {e}")
+        return None
+
+    if not forzar and not es_factura_larga(ancho, alto):
+        return None
+
+    alto_franja = int(ancho * OCR_FRANJA_RELACION)
+    solape = int(alto_franja * OCR_FRANJA_SOLAPE)
+    paso = max(1, alto_franja - solape)
+    cantidad = max(1, math.ceil((alto - solape) / float(paso)))
+
+    if cantidad > OCR_FRANJAS_MAX:
+        # Franjas más altas para no pasar del máximo
+        cantidad = OCR_FRANJAS_MAX
+        alto_franja = int(
+            math.ceil(alto / (cantidad - (cantidad - 1) * OCR_FRANJA_SOLAPE))
+        )
+        solape = int(alto_franja * OCR_FRANJA_SOLAPE)
+        paso = alto_franja - solape
+
+    if cantidad < 2:
+        return None
+
+    franjas = []
+    for i in range(cantidad):
+        y0 = i * paso
+        y1 = alto if i == cantidad - 1 else min(alto, y0 + alto_franja)
+        franjas.append(
+            {
+                "indice": i,
+                "y0": y0,
+                "y1": y1,
+                "bytes": _recortar_y_codificar(imagen, y0, y1),
+                "media_type": "image/jpeg",
+            }
+        )
+
+    print(
+        f"🪓 [FRANJAS] {ancho}x{alto} → {cantidad} franjas de ~{alto_franja}px "
+        f"(solape {solape}px)"
+    )
+    return {"alto": alto, "ancho": ancho, "franjas": franjas}
+
+
+# ============================================================================
+# FUSIÓN
+# ============================================================================
+
+
+def _mismo_item(a: Dict, b: Dict) -> bool:
+    if a.get("codigo") and a.get("codigo") == b.get("codigo"):
+        return a.get("precio") == b.get("precio")
+    return son_productos_similares(
+        {"nombre": a.get("nombre", ""), "valor": a.get("precio", 0)},
+        {"nombre": b.get("nombre", ""), "valor": b.get("precio", 0)},
+    )
+
+
+def _subtotal(producto: Dict) -> int:
+    return int(producto.get("precio", 0) * float(producto.get("cantidad", 1)))
+
+
+def _deduplicar_solape(
+    previos: List[Dict], nuevos: List[Dict], franja_prev: Dict, franja_sig: Dict
+) -> int:
+    """
+    Empareja 1 a 1 los ítems leídos dos veces en el solape de dos franjas
+    consecutivas. Modifica las listas; devuelve cuántos duplicados quitó.
+    """
+    zona_inicio, zona_fin = franja_sig["y0"], franja_prev["y1"]
+    solape = max(1, zona_fin - zona_inicio)
+    margen = solape * 0.25
+    tolerancia = solape * 0.6
+
+    candidatos_prev = [p for p in previos if p["_y"] >= zona_inicio - margen]
+    candidatos_sig = [p for p in nuevos if p["_y"] <= zona_fin + margen]
+    for p in candidatos_prev + candidatos_sig:
+        p["_zona_solape"] = True
+
+    usados = set()
+    eliminar_prev, eliminar_sig = [], []
+    for nuevo in sorted(candidatos_sig, key=lambda p: p["_y"]):
+        mejor = None
+        for previo in candidatos_prev:
+            if id(previo) in usados:
+                continue
+            distancia = abs(previo["_y"] - nuevo["_y"])
+            if distancia > tolerancia or not _mismo_item(previo, nuevo):
+                continue
+            if mejor is None or distancia < mejor[0]:
+                mejor = (distancia, previo)
+        if mejor is None:
+            continue
+
+        previo = mejor[1]
+        usados.add(id(previo))
+        # La lectura más alejada del borde de su franja es la más confiable
+        if franja_prev["y1"] - previo["_y"] >= nuevo["_y"] - franja_sig["y0"]:
+            eliminar_sig.append(nuevo)
+        else:
+            eliminar_prev.append(previo)
+            nuevo["_zona_solape"] = True
+
+    for p in eliminar_prev:
+        previos.remove(p)
+    for p in eliminar_sig:
+        nuevos.remove(p)
+    return len(eliminar_prev) + len(eliminar_sig)
+
+
+def _reconciliar_total(productos: List[Dict], total: int) -> Dict:
+    """Quita duplicados de solape que explican exactamente un exceso sobre el total"""
+    suma = sum(_subtotal(p) for p in productos)
+    ajustes = []
+
+    while total > 0 and suma > total * (1 + TOLERANCIA_TOTAL):
+        exceso = suma - total
+        candidatos = [
+            p
+            for p in productos
+            if p.get("_zona_solape")
+            and abs(_subtotal(p) - exceso) <= max(100, exceso * TOLERANCIA_TOTAL)
+        ]
+        if not candidatos:
+            break
+        quitado = min(candidatos, key=lambda p: abs(_subtotal(p) - exceso))
+        productos.remove(quitado)
+        suma -= _subtotal(quitado)
+        ajustes.append(
+            {"nombre": quitado.get("nombre"), "subtotal": _subtotal(quitado)}
+        )
+        print(
+            f"   🔧 [FRANJAS] Duplicado de solape por total: "
+            f"{quitado.get('nombre')} ${_subtotal(quitado):,}"
+        )
+
+    diferencia_pct = abs(suma - total) / total * 100 if total > 0 else None
+    return {
+        "suma_calculada": suma,
+        "total_declarado": total,
+        "diferencia_pct": (
+            round(diferencia_pct, 2) if diferencia_pct is not None else None
+        ),
+        "cuadra": diferencia_pct is not None
+        and diferencia_pct <= TOLERANCIA_TOTAL * 100,
+        "ajustes": ajustes,
+    }
+
+
+def fusionar_franjas(datos_franjas: List[Dict], division: Dict) -> Dict:
+    """
+    Fusiona los `data` de cada franja (salida de _procesar_respuesta de
+    claude_invoice, en el orden de division["franjas"]) en un único `data`.
+    """
+    franjas = division["franjas"]
+    alto = float(division["alto"])
+
+    productos: List[Dict] = []
+    duplicados = 0
+    anteriores: List[Dict] = []
+
+    for i, (franja, data) in enumerate(zip(franjas, datos_franjas)):
+        actuales = []
+        for prod in data.get("productos", []):
+            prod = dict(prod)
+            relativo = float(prod.get("posicion_vertical", 50)) / 100.0
+            prod["_y"] = franja["y0"] + relativo * (franja["y1"] - franja["y0"])
+            actuales.append(prod)
+
+        if i > 0:
+            duplicados += _deduplicar_solape(
+                anteriores, actuales, franjas[i - 1], franja
+            )
+        productos.extend(anteriores)
+        anteriores = actuales
+    productos.extend(anteriores)
+    productos.sort(key=lambda p: p["_y"])
+
+    # El encabezado está en la primera franja y el total en la última
+    base = dict(datos_franjas[0])
+    for data in datos_franjas:
+        for clave in ("establecimiento", "fecha"):
+            if not base.get(clave) and data.get(clave):
+                base[clave] = data[clave]
+    total = 0
+    for data in reversed(datos_franjas):
+        if data.get("total"):
+            total = data["total"]
+            break
+
+    reconciliacion = _reconciliar_total(productos, total)
+
+    for prod in productos:
+        prod["posicion_vertical"] = int(round(prod.pop("_y") / alto * 100))
+        prod.pop("_zona_solape", None)
+
+    plus_unicos = {p.get("codigo") for p in productos if p.get("codigo")}
+    base["productos"] = productos
+    base["total"] = total
+    base["metadatos"] = {
+        **datos_franjas[0].get("metadatos", {}),
+        "metodo": "claude-vision-v6.2-franjas",
+        "franjas": len(franjas),
+        "items_totales": len(productos),
+        "plus_unicos": len(plus_unicos),
+        "sin_codigo": sum(1 for p in productos if not p.get("codigo")),
+        "duplicados_solape": duplicados + len(reconciliacion["ajustes"]),
+        "suma_calculada": reconciliacion["suma_calculada"],
+        "total_declarado": total,
+        "reconciliacion": reconciliacion,
+    }
+
+    print(
+        f"🧩 [FRANJAS] Fusión: {len(productos)} ítems, {duplicados} duplicados "
+        f"de solape, suma ${reconciliacion['suma_calculada']:,} vs total ${total:,}"
+    )
+    return base
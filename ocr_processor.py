@@ -17,7 +17,6 @@ ULTIMA ACTUALIZACION: 2025-11-25
 
 import re
 import threading
-from queue import Queue
 import time
 import os
 from datetime import datetime
@@ -32,6 +31,8 @@ from database import (
     procesar_items_factura_y_guardar_precios,
 )
 from claude_invoice import parse_invoice_with_claude
+from preprocesamiento_imagen import estadisticas as estadisticas_preprocesamiento
+import ocr_cache
 
 # Importar normalizador de codigos
 from normalizador_codigos import normalizar_codigo_por_establecimiento
@@ -59,12 +60,48 @@ except ImportError:
     DUPLICATE_DETECTOR_AVAILABLE = False
     print("⚠️  Detector de duplicados no disponible")
 
-# Colas y tracking globales
-ocr_queue = Queue()
+from job_queue import cola_trabajos, contar_pendientes, encolar_trabajo, registrar_handler
+
+# Tracking global (la cola vive en processing_jobs, ver job_queue.py)
 processing = {}
 error_log = []
 
 
+def encolar_factura(task: Dict[str, Any]) -> Optional[str]:
+    """
+    Encola una factura para OCR en la cola durable.
+
+    Sin PostgreSQL no hay cola durable: se procesa en un hilo aparte.
+    """
+    job_id = encolar_trabajo(
+        "ocr_factura",
+        task,
+        usuario_id=task.get("user_id"),
+        archivo_local=True,
+    )
+    if job_id is None:
+        threading.Thread(
+            target=processor.process_invoice, args=(task,), daemon=True
+        ).start()
+    return job_id
+
+
+class _ColaOCR:
+    """Compatibilidad con la antigua Queue: ocr_queue.put(task) encola en BD"""
+
+    def put(self, task: Dict[str, Any]):
+        encolar_factura(task)
+
+    def qsize(self) -> int:
+        return contar_pendientes()
+
+    def empty(self) -> bool:
+        return self.qsize() == 0
+
+
+ocr_queue = _ColaOCR()
+
+
 def limpiar_precio_colombiano(precio_str) -> int:
     """Convierte precio colombiano a entero (sin decimales)"""
     if precio_str is None or precio_str == "":
@@ -540,8 +577,8 @@ class OCRProcessor:
             return
 
         self.is_running = True
-        self.worker_thread = threading.Thread(target=self.process_queue, daemon=True)
-        self.worker_thread.start()
+        registrar_handler("ocr_factura", self._procesar_desde_cola)
+        cola_trabajos.start()
 
         print("=" * 80)
         print("🚀 PROCESADOR OCR V4.1 - FILTRADO MEJORADO")
@@ -555,37 +592,19 @@ class OCRProcessor:
 
     def stop(self):
         self.is_running = False
+        cola_trabajos.stop()
         print("⏹️  Deteniendo procesador OCR...")
 
-    def process_queue(self):
-        while self.is_running:
-            try:
-                if not ocr_queue.empty():
-                    task = ocr_queue.get(timeout=1)
-                    self.process_invoice(task)
-
-                    if self.processed_count + self.error_count > 0:
-                        self.success_rate = (
-                            self.processed_count
-                            / (self.processed_count + self.error_count)
-                        ) * 100
+    def _procesar_desde_cola(self, job_id: str, payload: Dict, usuario_id: int):
+        """Handler de job_queue: los errores se propagan para reintentar"""
+        self.process_invoice(payload, lanzar_errores=True)
 
-                    time.sleep(1)
-                else:
-                    time.sleep(5)
-
-            except Exception as e:
-                print(f"❌ Error en procesador: {e}")
-                error_log.append(
-                    {
-                        "timestamp": datetime.now(),
-                        "error": str(e),
-                        "traceback": traceback.format_exc(),
-                    }
-                )
-                time.sleep(5)
+        if self.processed_count + self.error_count > 0:
+            self.success_rate = (
+                self.processed_count / (self.processed_count + self.error_count)
+            ) * 100
 
-    def process_invoice(self, task: Dict[str, Any]):
+    def process_invoice(self, task: Dict[str, Any], lanzar_errores: bool = False):
         factura_id = task.get("factura_id")
         image_path = task.get("image_path")
         user_id = task.get("user_id", 1)
@@ -610,7 +629,11 @@ class OCRProcessor:
 
             print("🔍 Extrayendo datos con Claude Vision...")
             result = parse_invoice_with_claude(
-                image_path, establecimiento_preseleccionado=establecimiento_nombre
+                image_path,
+                establecimiento_preseleccionado=establecimiento_nombre,
+                preprocesar=task.get("preprocesar"),
+                usuario_id=user_id,
+                franjas=task.get("franjas"),
             )
 
             conn = get_db_connection()
@@ -678,6 +701,8 @@ class OCRProcessor:
                 "error": str(e),
                 "failed_at": datetime.now(),
             }
+            if lanzar_errores:
+                raise
 
     def _process_successful_ocr(
         self, cursor, conn, factura_id: int, data: Dict, user_id: int
@@ -978,6 +1003,9 @@ class OCRProcessor:
                 self.last_processed.isoformat() if self.last_processed else None
             ),
             "queue_size": ocr_queue.qsize(),
+            "cola_trabajos": cola_trabajos.get_stats(),
+            "preprocesamiento": estadisticas_preprocesamiento(),
+            "ocr_cache": ocr_cache.estadisticas(),
             "processing_count": len(
                 [p for p in processing.values() if p.get("status") == "processing"]
             ),
@@ -0,0 +1,450 @@
+"""
+Outbox de Analíticas por Factura
+================================
+
+Las tablas analíticas (historial_compras_usuario, patrones_compra,
+productos_por_establecimiento, gastos_mensuales) ya no se recalculan dentro
+del request que guarda la factura: el guardado deja un evento en
+outbox_analitica en su misma transacción y un consumidor de la cola durable
+los aplica por lotes.
+
+- registrar_factura(): INSERT del evento + su trabajo "analitica_facturas",
+  sin commit: confirma junto con la factura. Un trabajo que ve otro
+  pendiente detrás termina sin hacer nada (ese drena lo confirmado), así
+  ningún evento queda sin trabajo
+- El consumidor toma hasta OUTBOX_ANALITICA_LOTE eventos, los agrupa por
+  factura, (usuario, producto), (producto, tienda) y (usuario, mes) y
+  aplica cada tabla con una sola sentencia; los eventos se borran en la
+  misma transacción (cada factura se aplica una vez)
+- Si el lote falla se reintenta factura por factura (SAVEPOINT); las que
+  fallan vuelven al final del outbox con su error y, tras
+  OUTBOX_ANALITICA_MAX_INTENTOS, quedan como fallidas sin frenar al resto
+  (reintentar_fallidos() las devuelve a la cola)
+- Un solo consumidor a la vez (pg_advisory_xact_lock)
+- Si agota OUTBOX_ANALITICA_PRESUPUESTO_SEG encola su continuación
+
+historial_compras_usuario y gastos_mensuales con los mismos cálculos que
+analytics_updater (que sigue disponible para recálculos manuales);
+patrones_compra y productos_por_establecimiento por deltas
+(agregados_analiticos). Con SQLite no hay outbox.
+
+Autor: LecFac
+Versión: 1.0.0
+"""
+
+import os
+import threading
+import time
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import agregados_analiticos
+from job_queue import encolar_trabajo
+
+OUTBOX_ANALITICA_LOTE = int(os.environ.get("OUTBOX_ANALITICA_LOTE", "500"))
+OUTBOX_ANALITICA_PRESUPUESTO_SEG = float(
+    os.environ.get("OUTBOX_ANALITICA_PRESUPUESTO_SEG", "120")
+)
+OUTBOX_ANALITICA_MAX_INTENTOS = int(
+    os.environ.get("OUTBOX_ANALITICA_MAX_INTENTOS", "3")
+)
+OUTBOX_ANALITICA_REINTENTO_SEG = int(
+    os.environ.get("OUTBOX_ANALITICA_REINTENTO_SEG", "60")
+)
+
+TIPO_TRABAJO = "analitica_facturas"
+OUTBOX_ANALITICA_LOCK_KEY = 7311024
+
+_lock = threading.Lock()
+_stats = {
+    "registrados": 0,
+    "lotes": 0,
+    "eventos": 0,
+    "facturas": 0,
+    "reintentos": 0,
+    "fallidos": 0,
+    "ms_lotes": 0.0,
+}
+
+
+def _activo() -> bool:
+    return os.environ.get("DATABASE_TYPE", "sqlite").lower() == "postgresql"
+
+
+def _sumar(**valores):
+    with _lock:
+        for clave, valor in valores.items():
+            _stats[clave] += valor
+
+
+# ============================================================================
+# PRODUCTOR
+# ============================================================================
+
+
+def registrar_factura(
+    conn, factura_id: int, usuario_id: int, establecimiento_id: Optional[int]
+) -> bool:
+    """
+    Deja la factura pendiente de analíticas en la transacción de `conn`
+    (el llamador hace el commit).
+
+    Returns:
+        False sin PostgreSQL
+    """
+    if not _activo():
+        return False
+
+    cursor = conn.cursor()
+    try:
+        cursor.execute(
+            """
+            INSERT INTO outbox_analitica (factura_id, usuario_id, establecimiento_id)
+            VALUES (%s, %s, %s)
+        """,
+            (factura_id, usuario_id, establecimiento_id),
+        )
+    finally:
+        cursor.close()
+
+    # Siempre en la misma transacción: un trabajo ya reclamado pudo hacer su
+    # último DELETE antes de que este evento sea visible
+    encolar_trabajo(TIPO_TRABAJO, {}, conn=conn)
+    _sumar(registrados=1)
+    return True
+
+
+# ============================================================================
+# CONSUMIDOR
+# ============================================================================
+
+
+def _historial_compras(cursor, facturas: List[int], usuarios: List[int]) -> int:
+    cursor.execute(
+        """
+        INSERT INTO historial_compras_usuario
+            (usuario_id, producto_id, factura_id, fecha_compra, precio_pagado)
+        SELECT l.usuario_id, i.producto_maestro_id, i.factura_id,
+               i.fecha_creacion, i.precio_pagado
+        FROM unnest(%s::int[], %s::int[]) AS l(factura_id, usuario_id)
+        JOIN items_factura i ON i.factura_id = l.factura_id
+        WHERE i.producto_maestro_id IS NOT NULL
+    """,
+        (facturas, usuarios),
+    )
+    return cursor.rowcount
+
+
+def _gastos_mensuales(cursor, facturas: List[int]) -> int:
+    cursor.execute(
+        """
+        INSERT INTO gastos_mensuales
+            (usuario_id, mes, anio, total_gastado, num_facturas)
+        SELECT m.usuario_id, m.mes, m.anio,
+               COALESCE(SUM(f.total_factura), 0), COUNT(*)
+        FROM (
+            SELECT DISTINCT usuario_id,
+                EXTRACT(MONTH FROM COALESCE(fecha_factura, fecha_cargue))::INT AS mes,
+                EXTRACT(YEAR FROM COALESCE(fecha_factura, fecha_cargue))::INT AS anio
+            FROM facturas
+            WHERE id = ANY(%s)
+        ) m
+        JOIN facturas f
+          ON f.usuario_id = m.usuario_id
+         AND EXTRACT(MONTH FROM COALESCE(f.fecha_factura, f.fecha_cargue)) = m.mes
+         AND EXTRACT(YEAR FROM COALESCE(f.fecha_factura, f.fecha_cargue)) = m.anio
+        GROUP BY m.usuario_id, m.mes, m.anio
+        ON CONFLICT (usuario_id, mes, anio) DO UPDATE SET
+            total_gastado = EXCLUDED.total_gastado,
+            num_facturas = EXCLUDED.num_facturas,
+            fecha_actualizacion = NOW()
+    """,
+        (facturas,),
+    )
+    return cursor.rowcount
+
+
+def aplicar_eventos(cursor, eventos: Sequence[Tuple]) -> Dict[str, int]:
+    """
+    Aplica un lote de eventos (factura_id, usuario_id, establecimiento_id)
+    sin commit. Una factura repetida en el lote cuenta una vez.
+    """
+    por_factura = {factura_id: usuario_id for factura_id, usuario_id, _ in eventos}
+    facturas = list(por_factura)
+    usuarios = list(por_factura.values())
+    return {
+        "historial_compras": _historial_compras(cursor, facturas, usuarios),
+        "patrones_compra": agregados_analiticos.aplicar_patrones_compra(
+            cursor, facturas
+        ),
+        "productos_por_establecimiento": (
+            agregados_analiticos.aplicar_productos_por_establecimiento(cursor, facturas)
+        ),
+        "gastos_mensuales": _gastos_mensuales(cursor, facturas),
+    }
+
+
+def _devolver(cursor, eventos: Sequence[Tuple], error: str) -> bool:
+    """
+    Devuelve al final del outbox los eventos de una factura que falló.
+
+    Returns:
+        True si quedan para reintento, False si pasan a fallidos
+    """
+    _, factura_id, usuario_id, establecimiento_id, _ = eventos[0]
+    intentos = max(e[4] for e in eventos) + 1
+    fallido = intentos >= OUTBOX_ANALITICA_MAX_INTENTOS
+    cursor.execute(
+        """
+        INSERT INTO outbox_analitica
+            (factura_id, usuario_id, establecimiento_id, intentos, ultimo_error,
+             fallido_en)
+        VALUES (%s, %s, %s, %s, %s, CASE WHEN %s THEN NOW() END)
+    """,
+        (factura_id, usuario_id, establecimiento_id, intentos, error[:500], fallido),
+    )
+    return not fallido
+
+
+def _aplicar_por_factura(conn, cursor, eventos: Sequence[Tuple]) -> Dict[str, int]:
+    """
+    Aplica cada factura del lote con su propio SAVEPOINT; las que fallan se
+    devuelven al outbox (con un trabajo diferido para reintentarlas).
+    """
+    por_factura: Dict[int, List[Tuple]] = {}
+    for evento in eventos:
+        por_factura.setdefault(evento[1], []).append(evento)
+
+    filas: Dict[str, int] = {}
+    reintentar = False
+    for factura_id, propios in por_factura.items():
+        cursor.execute("SAVEPOINT outbox_factura")
+        try:
+            aplicadas = aplicar_eventos(cursor, [e[1:4] for e in propios])
+            cursor.execute("RELEASE SAVEPOINT outbox_factura")
+        except Exception as e:
+            cursor.execute("ROLLBACK TO SAVEPOINT outbox_factura")
+            print(f"⚠️ [OUTBOX ANALITICA] Factura {factura_id} falló: {e}")
+            if _devolver(cursor, propios, str(e)):
+                _sumar(reintentos=1)
+                reintentar = True
+            else:
+                _sumar(fallidos=1)
+            continue
+        for tabla, n in aplicadas.items():
+            filas[tabla] = filas.get(tabla, 0) + n
+
+    if reintentar:
+        encolar_trabajo(
+            TIPO_TRABAJO,
+            {},
+            conn=conn,
+            retraso_seg=OUTBOX_ANALITICA_REINTENTO_SEG,
+        )
+    return filas
+
+
+def _procesar_lote(conn) -> int:
+    """Aplica y borra hasta OUTBOX_ANALITICA_LOTE eventos; devuelve cuántos"""
+    inicio = time.perf_counter()
+    cursor = conn.cursor()
+    try:
+        # Espera al consumidor anterior en lugar de saltarse el lote
+        cursor.execute("SELECT pg_advisory_xact_lock(%s)", (OUTBOX_ANALITICA_LOCK_KEY,))
+        cursor.execute(
+            """
+            DELETE FROM outbox_analitica
+            WHERE id IN (
+                SELECT id FROM outbox_analitica
+                WHERE fallido_en IS NULL
+                ORDER BY id
+                LIMIT %s
+            )
+            RETURNING id, factura_id, usuario_id, establecimiento_id, intentos
+        """,
+            (OUTBOX_ANALITICA_LOTE,),
+        )
+        eventos = cursor.fetchall()
+        if eventos:
+            # Camino normal: todo el lote con una sentencia por tabla
+            cursor.execute("SAVEPOINT outbox_lote")
+            try:
+                filas = aplicar_eventos(cursor, [e[1:4] for e in eventos])
+                cursor.execute("RELEASE SAVEPOINT outbox_lote")
+            except Exception as e:
+                cursor.execute("ROLLBACK TO SAVEPOINT outbox_lote")
+                print(f"⚠️ [OUTBOX ANALITICA] Lote falló, factura por factura: {e}")
+                filas = _aplicar_por_factura(conn, cursor, eventos)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+
+    if eventos:
+        facturas = len({e[1] for e in eventos})
+        _sumar(
+            lotes=1,
+            eventos=len(eventos),
+            facturas=facturas,
+            ms_lotes=(time.perf_counter() - inicio) * 1000,
+        )
+        print(
+            f"📊 [OUTBOX ANALITICA] {len(eventos)} eventos ({facturas} facturas): "
+            + ", ".join(f"{t}={n}" for t, n in filas.items())
+        )
+    return len(eventos)
+
+
+def _hay_otro_pendiente(conn, job_id: str) -> bool:
+    """Otro trabajo del outbox ya disponible que correrá después de este"""
+    cursor = conn.cursor()
+    try:
+        cursor.execute(
+            """
+            SELECT 1 FROM processing_jobs
+            WHERE tipo = %s AND status = 'pending'
+              AND disponible_en <= CURRENT_TIMESTAMP
+              AND id <> %s
+            LIMIT 1
+        """,
+            (TIPO_TRABAJO, job_id),
+        )
+        pendiente = cursor.fetchone() is not None
+        conn.commit()
+        return pendiente
+    finally:
+        cursor.close()
+
+
+def procesar_trabajo(job_id: str, payload: Dict, usuario_id: Optional[int]):
+    """
+    Handler de job_queue: aplica lotes hasta vaciar el outbox o agotar
+    OUTBOX_ANALITICA_PRESUPUESTO_SEG (entonces encola la continuación).
+    Termina de inmediato si hay otro trabajo pendiente: ese verá todo lo
+    confirmado hasta ahora. Un error fuera de las facturas (conexión, lock)
+    revierte el lote y el trabajo se reintenta.
+    """
+    from database import get_db_connection
+
+    inicio = time.monotonic()
+    conn = get_db_connection()
+    try:
+        if _hay_otro_pendiente(conn, job_id):
+            return
+        while True:
+            aplicados = _procesar_lote(conn)
+            if aplicados < OUTBOX_ANALITICA_LOTE:
+                return
+            if time.monotonic() - inicio > OUTBOX_ANALITICA_PRESUPUESTO_SEG:
+                encolar_trabajo(TIPO_TRABAJO, payload, conn=conn)
+                conn.commit()
+                return
+    finally:
+        conn.close()
+
+
+# ============================================================================
+# ESTADO
+# ============================================================================
+
+
+def pendientes() -> Dict:
+    """Eventos en el outbox y antigüedad del más viejo"""
+    if not _activo():
+        return {"activo": False}
+
+    from database import get_db_connection
+
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        cursor.execute("""
+            SELECT COUNT(*) FILTER (WHERE fallido_en IS NULL),
+                   MIN(creado_en) FILTER (WHERE fallido_en IS NULL),
+                   COUNT(*) FILTER (WHERE fallido_en IS NOT NULL)
+            FROM outbox_analitica
+        """)
+        total, mas_antiguo, fallidos = cursor.fetchone()
+        conn.commit()
+    finally:
+        cursor.close()
+        conn.close()
+    return {
+        "activo": True,
+        "pendientes": total,
+        "pendiente_desde": mas_antiguo.isoformat() if mas_antiguo else None,
+        "fallidos": fallidos,
+    }
+
+
+def listar_fallidos(limite: int = 50) -> List[Dict]:
+    """Eventos que agotaron sus intentos, con el último error"""
+    if not _activo():
+        return []
+
+    from database import get_db_connection
+
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        cursor.execute(
+            """
+            SELECT factura_id, usuario_id, intentos, ultimo_error, fallido_en
+            FROM outbox_analitica
+            WHERE fallido_en IS NOT NULL
+            ORDER BY fallido_en DESC
+            LIMIT %s
+        """,
+            (limite,),
+        )
+        filas = cursor.fetchall()
+        conn.commit()
+    finally:
+        cursor.close()
+        conn.close()
+    return [
+        {
+            "factura_id": f[0],
+            "usuario_id": f[1],
+            "intentos": f[2],
+            "error": f[3],
+            "fallido_en": f[4].isoformat() if f[4] else None,
+        }
+        for f in filas
+    ]
+
+
+def reintentar_fallidos() -> int:
+    """Devuelve los eventos fallidos a la cola; cuántos"""
+    if not _activo():
+        return 0
+
+    from database import get_db_connection
+
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        cursor.execute("""
+            UPDATE outbox_analitica
+            SET fallido_en = NULL, intentos = 0
+            WHERE fallido_en IS NOT NULL
+        """)
+        reintentados = cursor.rowcount
+        if reintentados:
+            encolar_trabajo(TIPO_TRABAJO, {}, conn=conn)
+        conn.commit()
+        return reintentados
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        cursor.close()
+        conn.close()
+
+
+def estadisticas() -> Dict:
+    with _lock:
+        stats = dict(_stats)
+    stats["ms_por_lote"] = round(stats.pop("ms_lotes") / max(stats["lotes"], 1), 1)
+    return stats
@@ -0,0 +1,253 @@
+"""
+Paridad del Motor de Similitud
+==============================
+
+Compara motor_similitud contra el cálculo par a par de siempre (puntuar cada
+nombre con similitud(), es decir SequenceMatcher + Jaccard) sobre el corpus
+fijo de fixtures/:
+
+- similitud_nombres.txt: nombres de productos con variantes de OCR,
+  abreviaturas, acentos, caracteres fuera de latin-1 y duplicados exactos
+- similitud_consultas.txt: consultas (nombres con ruido, nuevos y bordes)
+
+Revisa que rankear, mejor_por_cotas (con un scorer compuesto con bonus,
+como product_matcher) y pares_similares (con bloques de varios tamaños)
+devuelvan exactamente lo mismo que la referencia: mismos índices, mismos
+puntajes y mismo desempate. Sale con código 1 si algo difiere.
+
+Uso:
+
+    python paridad_similitud.py
+    python paridad_similitud.py --k 5 --umbrales 0.6 0.8
+
+Autor: LecFac
+Versión: 1.0.0
+"""
+
+import argparse
+import os
+import sys
+import time
+from typing import Dict, FrozenSet, List, Optional, Sequence, Tuple
+
+import motor_similitud
+from motor_similitud import similitud
+
+CARPETA_FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+# Bonus del scorer compuesto: misma primera palabra (como el bonus de marca)
+BONUS_PRIMERA_PALABRA = 0.1
+
+
+def _leer(nombre: str) -> List[str]:
+    with open(os.path.join(CARPETA_FIXTURES, nombre), encoding="utf-8") as f:
+        return f.read().splitlines()
+
+
+def _palabras(texto: str) -> FrozenSet[str]:
+    return frozenset(texto.split())
+
+
+# ============================================================================
+# REFERENCIA (par a par)
+# ============================================================================
+
+
+def _referencia_rankear(
+    texto: str,
+    textos: Sequence[str],
+    palabras: Optional[FrozenSet[str]],
+    palabras_filas: Optional[Sequence[FrozenSet[str]]],
+    k: int,
+    umbral: float,
+) -> List[Tuple[int, float]]:
+    puntajes = []
+    for i, otro in enumerate(textos):
+        puntaje = similitud(
+            texto, otro, palabras, palabras_filas[i] if palabras_filas else None
+        )
+        if puntaje >= umbral:
+            puntajes.append((i, puntaje))
+    puntajes.sort(key=lambda x: (-x[1], x[0]))
+    return puntajes[:k]
+
+
+def _puntaje_compuesto(texto: str, otro: str) -> float:
+    puntaje = similitud(texto, otro, _palabras(texto), _palabras(otro))
+    if texto.split()[:1] == otro.split()[:1] and texto.split():
+        puntaje += BONUS_PRIMERA_PALABRA
+    return min(puntaje, 1.0)
+
+
+def _referencia_mejor(
+    texto: str, textos: Sequence[str], umbral: float
+) -> Optional[Tuple[int, float]]:
+    mejor = None
+    for i, otro in enumerate(textos):
+        puntaje = _puntaje_compuesto(texto, otro)
+        if puntaje >= umbral and (mejor is None or puntaje > mejor[1]):
+            mejor = (i, puntaje)
+    return mejor
+
+
+def _referencia_pares(
+    textos: Sequence[str],
+    umbral: float,
+    palabras: Optional[Sequence[FrozenSet[str]]],
+) -> Dict[Tuple[int, int], float]:
+    pares = {}
+    for i in range(len(textos)):
+        for j in range(i + 1, len(textos)):
+            puntaje = similitud(
+                textos[i],
+                textos[j],
+                palabras[i] if palabras else None,
+                palabras[j] if palabras else None,
+            )
+            if puntaje >= umbral:
+                pares[(i, j)] = puntaje
+    return pares
+
+
+# ============================================================================
+# CHEQUEOS
+# ============================================================================
+
+
+def revisar_rankear(
+    nombres: List[str], consultas: List[str], k: int, umbrales: List[float]
+) -> int:
+    palabras_filas = [_palabras(t) for t in nombres]
+    con_palabras = motor_similitud.MatrizNombres(nombres, palabras_filas)
+    sin_palabras = motor_similitud.MatrizNombres(nombres)
+    diferencias = 0
+    for umbral in umbrales:
+        for consulta in consultas:
+            for matriz, palabras, filas in (
+                (con_palabras, _palabras(consulta), palabras_filas),
+                (sin_palabras, None, None),
+            ):
+                esperado = _referencia_rankear(
+                    consulta, nombres, palabras, filas, k, umbral
+                )
+                obtenido = motor_similitud.rankear(
+                    consulta, matriz, palabras, k=k, umbral=umbral
+                )
+                if obtenido != esperado:
+                    diferencias += 1
+                    print(f"   ❌ rankear({consulta!r}, umbral={umbral})")
+                    print(f"      esperado: {esperado}")
+                    print(f"      obtenido: {obtenido}")
+    return diferencias
+
+
+def revisar_mejor_por_cotas(
+    nombres: List[str], consultas: List[str], umbrales: List[float]
+) -> int:
+    import numpy as np
+
+    matriz = motor_similitud.MatrizNombres(nombres, [_palabras(t) for t in nombres])
+    primeras = [t.split()[:1] for t in nombres]
+    diferencias = 0
+    for umbral in umbrales:
+        for consulta in consultas:
+            bonus = np.array(
+                [
+                    (
+                        BONUS_PRIMERA_PALABRA
+                        if consulta.split() and p == consulta.split()[:1]
+                        else 0.0
+                    )
+                    for p in primeras
+                ]
+            )
+            cotas = np.clip(
+                matriz.cotas_similitud(consulta, _palabras(consulta)) + bonus, 0.0, 1.0
+            )
+            esperado = _referencia_mejor(consulta, nombres, umbral)
+            obtenido = motor_similitud.mejor_por_cotas(
+                cotas, lambda i: _puntaje_compuesto(consulta, nombres[i]), umbral
+            )
+            if obtenido != esperado:
+                diferencias += 1
+                print(f"   ❌ mejor_por_cotas({consulta!r}, umbral={umbral})")
+                print(f"      esperado: {esperado}")
+                print(f"      obtenido: {obtenido}")
+    return diferencias
+
+
+def revisar_pares(nombres: List[str], umbrales: List[float]) -> int:
+    palabras = [_palabras(t) for t in nombres]
+    original = motor_similitud.ELEMENTOS_POR_BLOQUE
+    diferencias = 0
+    try:
+        for umbral in umbrales:
+            for con_palabras in (palabras, None):
+                esperado = _referencia_pares(nombres, umbral, con_palabras)
+                # Un bloque con todo, bloques medianos y una fila por bloque
+                for elementos in (original, 200_000, 1):
+                    motor_similitud.ELEMENTOS_POR_BLOQUE = elementos
+                    obtenido = motor_similitud.pares_similares(
+                        nombres, umbral, con_palabras
+                    )
+                    if obtenido != esperado:
+                        diferencias += 1
+                        faltan = set(esperado) - set(obtenido)
+                        sobran = set(obtenido) - set(esperado)
+                        print(
+                            f"   ❌ pares_similares(umbral={umbral}, "
+                            f"palabras={con_palabras is not None}, "
+                            f"bloque={elementos}): faltan {sorted(faltan)[:5]}, "
+                            f"sobran {sorted(sobran)[:5]}"
+                        )
+    finally:
+        motor_similitud.ELEMENTOS_POR_BLOQUE = original
+    return diferencias
+
+
+# ============================================================================
+# MAIN
+# ============================================================================
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument(
+        "--umbrales", type=float, nargs="+", default=[0.0, 0.5, 0.7, 0.85]
+    )
+    args = parser.parse_args()
+
+    if not motor_similitud.NUMPY_AVAILABLE:
+        print("⚠️ NumPy no está instalado: el motor usa el cálculo par a par")
+        return 0
+
+    nombres = _leer("similitud_nombres.txt")
+    consultas = _leer("similitud_consultas.txt")
+    print(f"📋 {len(nombres)} nombres, {len(consultas)} consultas")
+
+    diferencias = 0
+    for nombre, chequeo in (
+        ("rankear", lambda: revisar_rankear(nombres, consultas, args.k, args.umbrales)),
+        (
+            "mejor_por_cotas",
+            lambda: revisar_mejor_por_cotas(nombres, consultas, args.umbrales),
+        ),
+        (
+            "pares_similares",
+            lambda: revisar_pares(nombres, [u for u in args.umbrales if u >= 0.5]),
+        ),
+    ):
+        inicio = time.perf_counter()
+        encontradas = chequeo()
+        estado = "✅" if not encontradas else "❌"
+        print(
+            f"{estado} {nombre}: {encontradas} diferencias "
+            f"({time.perf_counter() - inicio:.1f}s)"
+        )
+        diferencias += encontradas
+
+    return 1 if diferencias else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
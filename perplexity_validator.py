@@ -20,6 +20,8 @@ import requests
 import time
 import unicodedata
 
+import coalescencia
+
 # ========== CONFIGURACIÓN ==========
 PERPLEXITY_API_KEY = os.environ.get("lefact", "").strip()
 PERPLEXITY_API_URL = "https://api.perplexity.ai/chat/completions"
@@ -300,9 +302,18 @@ def validar_con_perplexity(nombre_corregido, precio, supermercado, codigo="", no
             "temperature": 0.1
         }
 
-        # Hacer request
+        # Hacer request (las validaciones idénticas en vuelo comparten respuesta)
+        clave = (
+            normalizar_nombre_supermercado(supermercado),
+            codigo or "",
+            " ".join(nombre_corregido.upper().split()),
+            precio,
+        )
         inicio = time.time()
-        response = requests.post(
+        response = coalescencia.ejecutar(
+            "perplexity",
+            clave,
+            requests.post,
             PERPLEXITY_API_URL,
             json=payload,
             headers=headers,
@@ -0,0 +1,369 @@
+"""
+Preprocesamiento de Imágenes de Facturas
+========================================
+
+Etapa previa al OCR con Claude: la foto original (típicamente 4000x3000,
+10+ MB) se reduce a lo que Claude realmente necesita para leer el recibo.
+
+1. Detecta el papel del recibo y lo recorta (contorno claro más grande)
+2. Endereza: la perspectiva del recorte corrige la inclinación; si el papel
+   ocupa toda la foto se estima el ángulo del texto
+3. Escala de grises + contraste local (CLAHE)
+4. Reduce al lado largo objetivo (OCR_LADO_MAX, por defecto el máximo que
+   Claude procesa sin reescalar) y re-codifica como JPEG
+
+Usa OpenCV si está instalado; con solo Pillow aplica grises, contraste y
+reducción (sin recorte ni enderezado). Sin ninguno devuelve la imagen tal cual.
+
+Cada llamada devuelve un reporte con bytes y tokens estimados ahorrados.
+
+Autor: LecFac
+Versión: 1.0.0
+"""
+
+import io
+import os
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+try:
+    import cv2
+    import numpy as np
+
+    CV2_AVAILABLE = True
+except Exception:
+    CV2_AVAILABLE = False
+
+try:
+    from PIL import Image, ImageOps
+
+    PIL_AVAILABLE = True
+except Exception:
+    PIL_AVAILABLE = False
+
+
+OCR_PREPROCESAR = os.environ.get("OCR_PREPROCESAR", "true").lower() == "true"
+OCR_LADO_MAX = int(os.environ.get("OCR_LADO_MAX", "1568"))
+OCR_JPEG_CALIDAD = int(os.environ.get("OCR_JPEG_CALIDAD", "85"))
+
+# Límites de imagen de Claude: sobre esto la API reescala por su cuenta
+CLAUDE_LADO_MAX = 1568
+CLAUDE_TOKENS_MAX_IMAGEN = 1600
+PIXELES_POR_TOKEN = 750
+
+# El recibo debe ocupar entre estas fracciones de la foto para recortarlo
+AREA_RECIBO_MIN = 0.10
+AREA_RECIBO_MAX = 0.95
+# Ángulos de inclinación que se corrigen (grados)
+ANGULO_MIN = 0.5
+ANGULO_MAX = 15.0
+
+_stats_lock = threading.Lock()
+_stats = {
+    "imagenes": 0,
+    "preprocesadas": 0,
+    "bytes_originales": 0,
+    "bytes_finales": 0,
+    "tokens_estimados_originales": 0,
+    "tokens_estimados_finales": 0,
+    "ms_total": 0.0,
+}
+
+
+def estimar_tokens_imagen(ancho: int, alto: int) -> int:
+    """Tokens de entrada que Claude cobra por una imagen de ancho x alto"""
+    if ancho <= 0 or alto <= 0:
+        return 0
+    escala = min(1.0, CLAUDE_LADO_MAX / max(ancho, alto))
+    tokens = (ancho * escala) * (alto * escala) / PIXELES_POR_TOKEN
+    return int(min(tokens, CLAUDE_TOKENS_MAX_IMAGEN))
+
+
+def debe_preprocesar(preprocesar: Optional[bool]) -> bool:
+    """Resuelve el flag por solicitud contra el valor por defecto (OCR_PREPROCESAR)"""
+    return OCR_PREPROCESAR if preprocesar is None else bool(preprocesar)
+
+
+# ============================================================================
+# OPENCV
+# ============================================================================
+
+
+def _ordenar_esquinas(puntos):
+    """Esquinas en orden: sup-izq, sup-der, inf-der, inf-izq"""
+    puntos = puntos.reshape(4, 2).astype("float32")
+    suma = puntos.sum(axis=1)
+    diferencia = np.diff(puntos, axis=1).ravel()
+    return np.array(
+        [
+            puntos[np.argmin(suma)],
+            puntos[np.argmin(diferencia)],
+            puntos[np.argmax(suma)],
+            puntos[np.argmax(diferencia)],
+        ],
+        dtype="float32",
+    )
+
+
+def _recortar_recibo(gris):
+    """Recorta y endereza el papel si se distingue del fondo; si no, None"""
+    alto, ancho = gris.shape[:2]
+    escala = min(1.0, 1000.0 / max(alto, ancho))
+    pequena = cv2.resize(gris, None, fx=escala, fy=escala, interpolation=cv2.INTER_AREA)
+
+    suavizada = cv2.GaussianBlur(pequena, (5, 5), 0)
+    _, mascara = cv2.threshold(suavizada, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+    kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (15, 15))
+    mascara = cv2.morphologyEx(mascara, cv2.MORPH_CLOSE, kernel)
+
+    contornos, _ = cv2.findContours(mascara, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    if not contornos:
+        return None
+
+    contorno = max(contornos, key=cv2.contourArea)
+    fraccion = cv2.contourArea(contorno) / float(mascara.shape[0] * mascara.shape[1])
+    if not AREA_RECIBO_MIN <= fraccion <= AREA_RECIBO_MAX:
+        return None
+
+    esquinas = _ordenar_esquinas(cv2.boxPoints(cv2.minAreaRect(contorno)) / escala)
+    sup_izq, sup_der, inf_der, inf_izq = esquinas
+    ancho_destino = int(
+        max(np.linalg.norm(sup_der - sup_izq), np.linalg.norm(inf_der - inf_izq))
+    )
+    alto_destino = int(
+        max(np.linalg.norm(inf_izq - sup_izq), np.linalg.norm(inf_der - sup_der))
+    )
+    if ancho_destino < 50 or alto_destino < 50:
+        return None
+
+    destino = np.array(
+        [
+            [0, 0],
+            [ancho_destino - 1, 0],
+            [ancho_destino - 1, alto_destino - 1],
+            [0, alto_destino - 1],
+        ],
+        dtype="float32",
+    )
+    matriz = cv2.getPerspectiveTransform(esquinas, destino)
+    return cv2.warpPerspective(
+        gris,
+        matriz,
+        (ancho_destino, alto_destino),
+        flags=cv2.INTER_LINEAR,
+        borderMode=cv2.BORDER_REPLICATE,
+    )
+
+
+def _enderezar(gris):
+    """Corrige la inclinación estimada a partir de los píxeles de texto"""
+    _, texto = cv2.threshold(gris, 0, 255, cv2.THRESH_BINARY_INV + cv2.THRESH_OTSU)
+    puntos = cv2.findNonZero(texto)
+    if puntos is None or len(puntos) < 100:
+        return gris, 0.0
+
+    # La convención del ángulo cambia entre versiones de OpenCV
+    # ([-90, 0) o (0, 90]); se lleva a [-45, 45)
+    angulo = (cv2.minAreaRect(puntos)[-1] + 45) % 90 - 45
+    if not ANGULO_MIN <= abs(angulo) <= ANGULO_MAX:
+        return gris, 0.0
+
+    alto, ancho = gris.shape[:2]
+    matriz = cv2.getRotationMatrix2D((ancho / 2, alto / 2), angulo, 1.0)
+    rotada = cv2.warpAffine(
+        gris,
+        matriz,
+        (ancho, alto),
+        flags=cv2.INTER_LINEAR,
+        borderMode=cv2.BORDER_REPLICATE,
+    )
+    return rotada, angulo
+
+
+def _preprocesar_cv2(datos: bytes, lado_max: int) -> Tuple[bytes, Tuple, Tuple, list]:
+    imagen = cv2.imdecode(np.frombuffer(datos, np.uint8), cv2.IMREAD_COLOR)
+    if imagen is None:
+        raise ValueError("Imagen no decodificable")
+
+    original = (imagen.shape[1], imagen.shape[0])
+    pasos = []
+
+    gris = cv2.cvtColor(imagen, cv2.COLOR_BGR2GRAY)
+    pasos.append("grises")
+
+    recortada = _recortar_recibo(gris)
+    if recortada is not None:
+        gris = recortada
+        pasos.append("recorte")
+    else:
+        gris, angulo = _enderezar(gris)
+        if angulo:
+            pasos.append(f"enderezado({angulo:.1f}°)")
+
+    alto, ancho = gris.shape[:2]
+    escala = lado_max / float(max(alto, ancho))
+    if escala < 1.0:
+        gris = cv2.resize(
+            gris, None, fx=escala, fy=escala, interpolation=cv2.INTER_AREA
+        )
+        pasos.append("reduccion")
+
+    clahe = cv2.createCLAHE(clipLimit=2.0, tileGridSize=(8, 8))
+    gris = clahe.apply(gris)
+    pasos.append("contraste")
+
+    ok, buffer = cv2.imencode(
+        ".jpg", gris, [cv2.IMWRITE_JPEG_QUALITY, OCR_JPEG_CALIDAD]
+    )
+    if not ok:
+        raise ValueError("No se pudo codificar la imagen")
+
+    return buffer.tobytes(), original, (gris.shape[1], gris.shape[0]), pasos
+
+
+# ============================================================================
+# PILLOW (sin recorte ni enderezado)
+# ============================================================================
+
+
+def _preprocesar_pil(datos: bytes, lado_max: int) -> Tuple[bytes, Tuple, Tuple, list]:
+    imagen = Image.open(io.BytesIO(datos))
+    imagen = ImageOps.exif_transpose(imagen)
+    original = imagen.size
+    pasos = ["grises"]
+
+    imagen = imagen.convert("L")
+
+    if max(imagen.size) > lado_max:
+        resampling = getattr(Image, "Resampling", Image).LANCZOS
+        imagen.thumbnail((lado_max, lado_max), resampling)
+        pasos.append("reduccion")
+
+    imagen = ImageOps.autocontrast(imagen, cutoff=1)
+    pasos.append("contraste")
+
+    salida = io.BytesIO()
+    imagen.save(salida, "JPEG", quality=OCR_JPEG_CALIDAD, optimize=True)
+    return salida.getvalue(), original, imagen.size, pasos
+
+
+# ============================================================================
+# API PÚBLICA
+# ============================================================================
+
+
+def preprocesar_imagen(
+    datos: bytes,
+    media_type: str = "image/jpeg",
+    lado_max: int = None,
+    registrar: bool = True,
+) -> Tuple[bytes, str, Dict]:
+    """
+    Prepara la foto de una factura para el OCR.
+
+    Args:
+        datos: Bytes de la imagen original
+        media_type: Tipo MIME de la imagen original
+        lado_max: Lado largo objetivo en píxeles (por defecto OCR_LADO_MAX)
+        registrar: Sumar la imagen a las estadísticas del proceso
+
+    Returns:
+        (bytes, media_type, reporte). Si la etapa no aplica o no reduce la
+        imagen se devuelven los bytes originales con reporte["aplicado"] False.
+    """
+    lado_max = lado_max or OCR_LADO_MAX
+    inicio = time.monotonic()
+    reporte = {
+        "aplicado": False,
+        "motor": None,
+        "pasos": [],
+        "bytes_original": len(datos),
+        "bytes_final": len(datos),
+        "bytes_ahorrados": 0,
+        "tokens_estimados_original": None,
+        "tokens_estimados_final": None,
+        "tokens_ahorrados": 0,
+    }
+
+    if CV2_AVAILABLE:
+        motor, funcion = "opencv", _preprocesar_cv2
+    elif PIL_AVAILABLE:
+        motor, funcion = "pillow", _preprocesar_pil
+    else:
+        reporte["motor"] = "ninguno"
+        return datos, media_type, reporte
+
+    try:
+        procesada, original, final, pasos = funcion(datos, lado_max)
+    except Exception as e:
+        print(f"⚠️ [PREPROCESAMIENTO] Se usa la imagen original: {e}")
+        reporte["error"] = str(e)
+        return datos, media_type, reporte
+
+    tokens_original = estimar_tokens_imagen(*original)
+    tokens_final = estimar_tokens_imagen(*final)
+    reporte.update(
+        {
+            "motor": motor,
+            "pasos": pasos,
+            "dimensiones_original": list(original),
+            "dimensiones_final": list(final),
+            "tokens_estimados_original": tokens_original,
+            "tokens_estimados_final": tokens_final,
+            "ms": round((time.monotonic() - inicio) * 1000, 1),
+        }
+    )
+
+    if len(procesada) >= len(datos) and tokens_final >= tokens_original:
+        reporte["tokens_estimados_final"] = tokens_original
+        if registrar:
+            _registrar(reporte)
+        return datos, media_type, reporte
+
+    reporte.update(
+        {
+            "aplicado": True,
+            "bytes_final": len(procesada),
+            "bytes_ahorrados": len(datos) - len(procesada),
+            "tokens_ahorrados": tokens_original - tokens_final,
+        }
+    )
+    if not registrar:
+        return procesada, "image/jpeg", reporte
+    _registrar(reporte)
+
+    print(
+        f"🖼️ [PREPROCESAMIENTO] {original[0]}x{original[1]} → {final[0]}x{final[1]} "
+        f"| {len(datos) / 1024:.0f} KB → {len(procesada) / 1024:.0f} KB "
+        f"| ~{tokens_original} → ~{tokens_final} tokens ({', '.join(pasos)})"
+    )
+    return procesada, "image/jpeg", reporte
+
+
+def _registrar(reporte: Dict):
+    with _stats_lock:
+        _stats["imagenes"] += 1
+        if reporte["aplicado"]:
+            _stats["preprocesadas"] += 1
+        _stats["bytes_originales"] += reporte["bytes_original"]
+        _stats["bytes_finales"] += reporte["bytes_final"]
+        _stats["tokens_estimados_originales"] += (
+            reporte["tokens_estimados_original"] or 0
+        )
+        _stats["tokens_estimados_finales"] += reporte["tokens_estimados_final"] or 0
+        _stats["ms_total"] += reporte.get("ms", 0.0)
+
+
+def estadisticas() -> Dict:
+    """Acumulado del proceso para /ocr-stats"""
+    with _stats_lock:
+        stats = dict(_stats)
+    stats["bytes_ahorrados"] = stats["bytes_originales"] - stats["bytes_finales"]
+    stats["tokens_ahorrados"] = (
+        stats["tokens_estimados_originales"] - stats["tokens_estimados_finales"]
+    )
+    stats["ms_total"] = round(stats["ms_total"], 1)
+    stats["motor"] = "opencv" if CV2_AVAILABLE else "pillow" if PIL_AVAILABLE else None
+    stats["habilitado_por_defecto"] = OCR_PREPROCESAR
+    return stats
@@ -29,11 +29,26 @@ FLUJO DE VALIDACIÓN (orden de prioridad):
 ============================================================================
 """
 
-import re
-from typing import Optional, Dict, Any, Tuple
+from typing import Optional, Dict, Any, List, Tuple
 from difflib import SequenceMatcher
 from datetime import datetime
 
+from normalizacion_nombres import (
+    PALABRAS_IGNORAR,
+    analizar_nombre,
+    expandir_abreviaturas,
+    extraer_cantidad,
+    extraer_marca,
+    extraer_metros,
+    limpiar_nombre,
+    palabras_significativas,
+)
+import enriquecimiento_web
+import motor_similitud
+
+if motor_similitud.NUMPY_AVAILABLE:
+    import numpy as np
+
 # ============================================================================
 # CONFIGURACIÓN
 # ============================================================================
@@ -41,382 +56,31 @@ from datetime import datetime
 UMBRAL_SIMILITUD_NOMBRE = 0.85  # 85% de similitud para considerar match
 UMBRAL_SIMILITUD_AUDITORIA = 0.45  # 45% para match con auditoría (permite abreviaturas)
 
-PALABRAS_IGNORAR = {
-    "DE",
-    "LA",
-    "EL",
-    "EN",
-    "CON",
-    "SIN",
-    "POR",
-    "PARA",
-    "UND",
-    "UN",
-    "UNA",
-    "GR",
-    "ML",
-    "KG",
-    "LT",
-    "X",
-    "Y",
-    "O",
-    "A",
-    "AL",
-    "DEL",
-    "LOS",
-    "LAS",
-    "MAS",
-    "MENOS",
-    "PACK",
-    "PAQUETE",
-    "BOLSA",
-    "CAJA",
-    "BOTELLA",
-    "LATA",
-}
-
-# ============================================================================
-# DICCIONARIO DE ABREVIATURAS COLOMBIANAS (tickets de supermercado)
-# ============================================================================
-
-ABREVIATURAS_COLOMBIA = {
-    # Papel higiénico y aseo
-    "P HIG": "PAPEL HIGIENICO",
-    "PAP HIG": "PAPEL HIGIENICO",
-    "P.HIG": "PAPEL HIGIENICO",
-    "PHIG": "PAPEL HIGIENICO",
-    "P HIGI": "PAPEL HIGIENICO",
-    "PAP HIGI": "PAPEL HIGIENICO",
-    "TOA COC": "TOALLAS COCINA",
-    "TOA HIG": "TOALLAS HIGIENICAS",
-    "SERV": "SERVILLETAS",
-    "SERVILL": "SERVILLETAS",
-    "PROT FEM": "PROTECTORES FEMENINOS",
-    # Marcas abreviadas en tickets
-    "FAM": "FAMILIA",
-    "ROSAL30H": "ROSAL 30M",
-    "ROSAL15H": "ROSAL 15M",
-    "ROSALSON": "ROSAL",
-    "SCOTT15": "SCOTT 15M",
-    "SCOTT30": "SCOTT 30M",
-    # Alimentos básicos
-    "ACE VEG": "ACEITE VEGETAL",
-    "ACE VEGT": "ACEITE VEGETAL",
-    "ACE GIR": "ACEITE GIRASOL",
-    "ARR BLCO": "ARROZ BLANCO",
-    "ARR BLC": "ARROZ BLANCO",
-    "AREPA MAI": "AREPA MAIZ",
-    "AREPA MZ": "AREPA MAIZ",
-    "PAN TAJ": "PAN TAJADO",
-    "PAN MOLD": "PAN MOLDE",
-    "HUEV": "HUEVOS",
-    "HVO": "HUEVOS",
-    "HUEVOS ORO AA": "HUEVOS ORO",
-    # Lácteos
-    "LCH ENT": "LECHE ENTERA",
-    "LCH DESLA": "LECHE DESLACTOSADA",
-    "LCH DESC": "LECHE DESCREMADA",
-    "LECH ENT": "LECHE ENTERA",
-    "YOG": "YOGURT",
-    "QUES": "QUESO",
-    "QUESO CAMPES": "QUESO CAMPESINO",
-    "MANT": "MANTEQUILLA",
-    "MARG": "MARGARINA",
-    # Carnes y embutidos
-    "JAMN": "JAMON",
-    "JAM": "JAMON",
-    "SALCH": "SALCHICHA",
-    "SALCHICH": "SALCHICHA",
-    "PECH POL": "PECHUGA POLLO",
-    "CARN MOL": "CARNE MOLIDA",
-    # Bebidas
-    "GAL AGUA": "GALON AGUA",
-    "BEB GASEO": "BEBIDA GASEOSA",
-    "GASEO": "GASEOSA",
-    "JUG NAR": "JUGO NARANJA",
-    "JGO NAR": "JUGO NARANJA",
-    "GATOR": "GATORADE",
-    # Limpieza
-    "JAB LAV": "JABON LAVAPLATOS",
-    "JAB TOC": "JABON TOCADOR",
-    "JAB LIQ": "JABON LIQUIDO",
-    "DET LIQ": "DETERGENTE LIQUIDO",
-    "DET POL": "DETERGENTE POLVO",
-    "LIMP MUL": "LIMPIADOR MULTIUSOS",
-    "LIMP VID": "LIMPIADOR VIDRIOS",
-    "SUAV ROA": "SUAVIZANTE ROPA",
-    "SUAV": "SUAVIZANTE",
-    "BLANQ": "BLANQUEADOR",
-    # Salsas y condimentos
-    "SALSAMEN": "SALSA MAYONESA",
-    "SALSA TOM": "SALSA TOMATE",
-    "SALSA BBQ": "SALSA BARBECUE",
-    "MAYO": "MAYONESA",
-    "KETCH": "KETCHUP",
-    "MOST": "MOSTAZA",
-    # Snacks y dulces
-    "CHOC POL": "CHOCOLATE POLVO",
-    "CHOC TAB": "CHOCOLATE TABLETA",
-    "GAL SAL": "GALLETAS SALADAS",
-    "GAL DUL": "GALLETAS DULCES",
-    "PAP FRI": "PAPAS FRITAS",
-    # Cuidado personal
-    "CREM DENT": "CREMA DENTAL",
-    "CEP DENT": "CEPILLO DENTAL",
-    "DESOD": "DESODORANTE",
-    "SHAMPO": "SHAMPOO",
-    "SHAMP": "SHAMPOO",
-    "ACOND": "ACONDICIONADOR",
-    "CREMA CORP": "CREMA CORPORAL",
-    # Otros
-    "LEV INST": "LEVADURA INSTANTANEA",
-    "HAR TRIG": "HARINA TRIGO",
-    "AZUC": "AZUCAR",
-    "SAL REF": "SAL REFINADA",
-    "CAFE MOL": "CAFE MOLIDO",
-    "CAFE INST": "CAFE INSTANTANEO",
-    # Unidades (corrección OCR)
-    "UHD": "UNIDADES",
-    "UND": "UNIDADES",
-    "UNDS": "UNIDADES",
-    "UNID": "UNIDADES",
-}
-
-# Marcas comunes colombianas (para extraer de nombres OCR)
-MARCAS_CONOCIDAS = {
-    # Papel y aseo
-    "ROSAL",
-    "FAMILIA",
-    "SUAVE",
-    "SCOTT",
-    "ELITE",
-    "TECNOQUIMICAS",
-    "NOSOTRAS",
-    # Alimentos
-    "RAMO",
-    "BIMBO",
-    "COMAPAN",
-    "SANTA CLARA",
-    "ORO",
-    "KIKES",
-    "SANTAREYES",
-    "HUEVOS ORO",
-    "DIANA",
-    "FLORHUILA",
-    "ROA",
-    "ARROZ ROA",
-    "ARROZ DIANA",
-    "DORIA",
-    "PASTAS DORIA",
-    "COMARRICO",
-    "LA MUÑECA",
-    "ALPINA",
-    "COLANTA",
-    "ALQUERIA",
-    "PARMALAT",
-    "ZENÚ",
-    "RICA",
-    "PIETRÁN",
-    "SUIZO",
-    # Bebidas
-    "POSTOBON",
-    "COCA COLA",
-    "PEPSI",
-    "QUATRO",
-    "COLOMBIANA",
-    "HIT",
-    "TAMPICO",
-    "FRUTTO",
-    "DEL VALLE",
-    # Salsas
-    "FRUCO",
-    "RESPIN",
-    "MAGGI",
-    "LA CONSTANCIA",
-    "SAN JORGE",
-    # Limpieza
-    "FAB",
-    "ARIEL",
-    "ACE",
-    "DERSA",
-    "TOP",
-    "VANISH",
-    "AXION",
-    "LAVAPLATOS",
-    "FABULOSO",
-    # Cuidado personal
-    "COLGATE",
-    "FORTIDENT",
-    "KOLYNOS",
-    "ORAL B",
-    "PALMOLIVE",
-    "PROTEX",
-    "DOVE",
-    "REXONA",
-    "AXE",
-    "HEAD SHOULDERS",
-    "SEDAL",
-    "PANTENE",
-    "ELVIVE",
-    # Snacks
-    "MARGARITA",
-    "DE TODITO",
-    "YUPI",
-    "SUPER RICAS",
-    "FESTIVAL",
-    "SALTINAS",
-    "DUCALES",
-    "CLUB SOCIAL",
-    # Otros
-    "NESCAFE",
-    "SELLO ROJO",
-    "AGUILA ROJA",
-    "COLCAFE",
-    "MANUELITA",
-    "INCAUCA",
-    "RIOPAILA",
-}
-
-
 # ============================================================================
 # FUNCIONES DE UTILIDAD
 # ============================================================================
 
 
-def limpiar_nombre(nombre: str) -> str:
-    """Limpia y normaliza un nombre de producto"""
-    if not nombre:
-        return ""
-
-    nombre = nombre.upper().strip()
-    nombre = re.sub(r"[^\w\s]", " ", nombre)
-    nombre = re.sub(r"\s+", " ", nombre)
-
-    return nombre.strip()
-
-
-def expandir_abreviaturas(nombre: str) -> str:
-    """
-    Expande abreviaturas comunes en nombres de tickets colombianos.
-    """
-    if not nombre:
-        return ""
-
-    nombre_upper = nombre.upper()
-
-    # Ordenar por longitud descendente para evitar reemplazos parciales
-    abreviaturas_ordenadas = sorted(
-        ABREVIATURAS_COLOMBIA.items(), key=lambda x: len(x[0]), reverse=True
-    )
-
-    for abrev, expansion in abreviaturas_ordenadas:
-        # Buscar la abreviatura como palabra completa
-        patron = r"\b" + re.escape(abrev) + r"\b"
-        nombre_upper = re.sub(patron, expansion, nombre_upper)
-
-    # Limpiar espacios múltiples
-    nombre_upper = re.sub(r"\s+", " ", nombre_upper).strip()
-
-    return nombre_upper
-
-
-def extraer_marca(nombre: str) -> Optional[str]:
-    """
-    Extrae la marca de un nombre de producto si es conocida.
-    """
-    if not nombre:
-        return None
-
-    nombre_upper = nombre.upper()
-
-    # Buscar marcas de más largas a más cortas (para evitar matches parciales)
-    marcas_ordenadas = sorted(MARCAS_CONOCIDAS, key=len, reverse=True)
-
-    for marca in marcas_ordenadas:
-        if marca in nombre_upper:
-            return marca
-
-    return None
-
-
-def extraer_cantidad(nombre: str) -> Optional[str]:
-    """
-    Extrae información de cantidad (ej: 12, X12, 30M, 500G).
-    Retorna solo el número principal.
-    """
-    if not nombre:
-        return None
-
-    nombre_upper = nombre.upper()
-
-    # Buscar patrones como: X12, 12UND, 30M, 500G, 1LT, X12R
-    patrones = [
-        r"X(\d+)[RU]?\b",  # X12, X12R, X12U
-        r"(\d+)\s*UND",  # 12UND, 12 UND
-        r"(\d+)\s*UHD",  # 12UHD (OCR mal leído)
-        r"(\d+)\s*UNID",  # 12UNID
-        r"(\d+)\s*[R]\b",  # 12R (rollos)
-        r"(\d+)\s*GR?\b",  # 500G, 500GR
-        r"(\d+)\s*KG\b",  # 1KG
-        r"(\d+)\s*ML\b",  # 500ML
-        r"(\d+)\s*LT?\b",  # 1L, 1LT
-    ]
-
-    for patron in patrones:
-        match = re.search(patron, nombre_upper)
-        if match:
-            return match.group(1)
-
-    return None
-
-
-def extraer_metros(nombre: str) -> Optional[str]:
-    """
-    Extrae metros de papel higiénico/toallas (15M, 30M, etc).
-    Importante para diferenciar variantes de misma marca.
-
-    OCR a veces confunde M→H, así que buscamos ambos.
-    Ejemplo: "ROSAL30H" = "ROSAL 30M"
-    """
-    if not nombre:
-        return None
-
-    nombre_upper = nombre.upper()
-
-    # Patrones para metros (M o H por error OCR)
-    patrones = [
-        r"(\d+)\s*M\b",  # 30M, 15M
-        r"(\d+)\s*H\b",  # 30H, 15H (OCR confunde M→H)
-        r"(\d+)\s*MTS?\b",  # 30MTS, 30MT
-        r"(\d+)\s*METROS?\b",  # 30 METROS
-    ]
-
-    for patron in patrones:
-        match = re.search(patron, nombre_upper)
-        if match:
-            metros = match.group(1)
-            # Solo valores típicos de papel higiénico: 15, 20, 25, 30, 40, 50
-            if metros in ["15", "20", "25", "30", "40", "50"]:
-                return metros
-
-    return None
-
-
 def calcular_similitud(nombre1: str, nombre2: str) -> float:
     """Calcula similitud entre dos nombres (0.0 - 1.0)"""
     if not nombre1 or not nombre2:
         return 0.0
 
-    n1 = limpiar_nombre(nombre1)
-    n2 = limpiar_nombre(nombre2)
+    a1 = analizar_nombre(nombre1)
+    a2 = analizar_nombre(nombre2)
+
+    return similitud_normalizada(a1.limpio, a1.palabras, a2.limpio, a2.palabras)
 
+
+def similitud_normalizada(n1: str, palabras1: set, n2: str, palabras2: set) -> float:
+    """
+    calcular_similitud() sobre nombres ya pasados por limpiar_nombre() y sus
+    palabras significativas (para quien las tiene precalculadas)
+    """
     # Similitud directa
     ratio = SequenceMatcher(None, n1, n2).ratio()
 
     # Similitud por palabras significativas
-    palabras1 = set(p for p in n1.split() if p not in PALABRAS_IGNORAR and len(p) >= 3)
-    palabras2 = set(p for p in n2.split() if p not in PALABRAS_IGNORAR and len(p) >= 3)
-
     if palabras1 and palabras2:
         interseccion = palabras1 & palabras2
         union = palabras1 | palabras2
@@ -540,6 +204,143 @@ def buscar_en_auditoria_por_ean(ean: str, cursor) -> Optional[Dict]:
     return None
 
 
+def _bonus_candidato(
+    ref: Dict, marca, cantidad, metros, palabras_busqueda: list
+) -> Tuple[float, float]:
+    """Bonus y penalización por marca, metros, cantidad y palabras clave"""
+    bonus = 0
+    penalizacion = 0
+
+    # Bonus por marca coincidente
+    marca_ref = ref["marca_extraida"]
+    if marca and marca_ref and marca == marca_ref:
+        bonus += 0.15
+    elif marca and marca_ref and (marca in marca_ref or marca_ref in marca):
+        bonus += 0.10
+    elif marca and marca_ref and marca != marca_ref:
+        # Penalizar si las marcas son diferentes (evita confundir ROSAL con FAMILIA)
+        penalizacion += 0.20
+
+    # Bonus/Penalización por metros (crucial para papel higiénico)
+    metros_ref = ref["metros_extraidos"]
+    if metros and metros_ref:
+        if metros == metros_ref:
+            bonus += 0.15  # Mismo metraje = muy probable que sea el mismo
+        else:
+            penalizacion += 0.25  # Diferente metraje = probablemente otro producto
+
+    # Bonus por cantidad coincidente
+    cantidad_ref = ref["cantidad_extraida"]
+    if cantidad and cantidad_ref and cantidad == cantidad_ref:
+        bonus += 0.10
+
+    # Bonus por palabras clave que coinciden
+    nombre_ref_upper = ref["nombre_upper"]
+    palabras_coinciden = sum(1 for p in palabras_busqueda if p in nombre_ref_upper)
+    bonus += 0.05 * min(palabras_coinciden, 3)  # Máximo +15% por palabras
+
+    return bonus, penalizacion
+
+
+def _puntuar_candidato(
+    ref: Dict, analisis, palabras_busqueda: list
+) -> Tuple[float, float, float, float]:
+    """(score_final, similitud, bonus, penalización) de un candidato"""
+    # Similitud 1: Nombre expandido vs nombre expandido
+    sim1 = similitud_normalizada(
+        analisis.expandido,
+        analisis.palabras_expandido,
+        ref["nombre_expandido"],
+        ref["palabras_expandido"],
+    )
+
+    # Similitud 2: Nombre original vs referencia
+    sim2 = similitud_normalizada(
+        analisis.limpio, analisis.palabras, ref["nombre_limpio"], ref["palabras"]
+    )
+
+    # Similitud 3: Nombre expandido vs referencia original
+    sim3 = similitud_normalizada(
+        analisis.expandido,
+        analisis.palabras_expandido,
+        ref["nombre_limpio"],
+        ref["palabras"],
+    )
+
+    # Tomar la mejor
+    similitud = max(sim1, sim2, sim3)
+
+    bonus, penalizacion = _bonus_candidato(
+        ref, analisis.marca, analisis.cantidad, analisis.metros, palabras_busqueda
+    )
+    score_final = min(1.0, max(0, similitud + bonus - penalizacion))
+    return score_final, similitud, bonus, penalizacion
+
+
+def _mejor_candidato_auditoria(
+    candidatos: list, analisis, palabras_busqueda: list, umbral: float
+) -> Optional[Tuple[Dict, float, float, float, float]]:
+    """
+    El candidato de mayor score >= umbral (empates: el primero), igual que
+    puntuarlos todos en orden.
+
+    Con NumPy las tres similitudes se acotan en bloque (motor_similitud) y
+    los bonus/penalizaciones se suman como arreglos; solo se calcula el
+    SequenceMatcher de los candidatos cuya cota aún puede ganar.
+    """
+    if not candidatos:
+        return None
+
+    if not motor_similitud.NUMPY_AVAILABLE:
+        mejor = None
+        for ref in candidatos:
+            puntaje = _puntuar_candidato(ref, analisis, palabras_busqueda)
+            if puntaje[0] >= umbral and (mejor is None or puntaje[0] > mejor[1]):
+                mejor = (ref, *puntaje)
+        return mejor
+
+    expandidos = motor_similitud.MatrizNombres(
+        [ref["nombre_expandido"] for ref in candidatos],
+        [ref["palabras_expandido"] for ref in candidatos],
+    )
+    limpios = motor_similitud.MatrizNombres(
+        [ref["nombre_limpio"] for ref in candidatos],
+        [ref["palabras"] for ref in candidatos],
+    )
+    cota_similitud = np.maximum.reduce(
+        [
+            expandidos.cotas_similitud(analisis.expandido, analisis.palabras_expandido),
+            limpios.cotas_similitud(analisis.limpio, analisis.palabras),
+            limpios.cotas_similitud(analisis.expandido, analisis.palabras_expandido),
+        ]
+    )
+    ajustes = np.array(
+        [
+            _bonus_candidato(
+                ref,
+                analisis.marca,
+                analisis.cantidad,
+                analisis.metros,
+                palabras_busqueda,
+            )
+            for ref in candidatos
+        ],
+        dtype=np.float64,
+    ).reshape(-1, 2)
+    cotas = np.clip(cota_similitud + ajustes[:, 0] - ajustes[:, 1], 0.0, 1.0)
+
+    puntajes = {}
+
+    def puntuar(i: int) -> float:
+        puntajes[i] = _puntuar_candidato(candidatos[i], analisis, palabras_busqueda)
+        return puntajes[i][0]
+
+    mejor = motor_similitud.mejor_por_cotas(cotas, puntuar, umbral)
+    if mejor is None:
+        return None
+    return (candidatos[mejor[0]], *puntajes[mejor[0]])
+
+
 def buscar_en_auditoria_por_nombre(
     nombre_ocr: str, cursor, umbral: float = UMBRAL_SIMILITUD_AUDITORIA
 ) -> Optional[Dict]:
@@ -551,16 +352,16 @@ def buscar_en_auditoria_por_nombre(
         return None
 
     try:
-        nombre_limpio = limpiar_nombre(nombre_ocr)
-
-        # PASO 0: Expandir abreviaturas
-        nombre_expandido = expandir_abreviaturas(nombre_limpio)
+        # PASO 0: Expandir abreviaturas y extraer marca, cantidad y metros
+        # (memoizado: el mismo nombre se repite entre facturas)
+        analisis = analizar_nombre(nombre_ocr)
+        nombre_limpio = analisis.limpio
+        nombre_expandido = analisis.expandido
         print(f"   🔄 Nombre expandido: {nombre_limpio} → {nombre_expandido}")
 
-        # Extraer marca, cantidad y metros para búsqueda inteligente
-        marca = extraer_marca(nombre_limpio) or extraer_marca(nombre_expandido)
-        cantidad = extraer_cantidad(nombre_limpio)
-        metros = extraer_metros(nombre_limpio) or extraer_metros(nombre_expandido)
+        marca = analisis.marca
+        cantidad = analisis.cantidad
+        metros = analisis.metros
         print(f"   🏷️ Marca: {marca} | Cantidad: {cantidad} | Metros: {metros}")
 
         # Extraer palabras significativas (del nombre expandido)
@@ -579,107 +380,43 @@ def buscar_en_auditoria_por_nombre(
         if not palabras_busqueda:
             return None
 
-        # PASO A: Buscar candidatos que contengan palabras clave
-        # Usar hasta 4 palabras para la búsqueda
-        palabras_query = palabras_busqueda[:4]
-        condiciones = " OR ".join(["UPPER(nombre) LIKE %s" for _ in palabras_query])
-        parametros = [f"%{p}%" for p in palabras_query]
+        # PASO A: Candidatos desde el índice en memoria del catálogo
+        # (precalculado: nombres expandidos, marca, cantidad, metros)
+        import indice_referencia
 
-        query = f"""
-            SELECT
-                id,
-                codigo_ean,
-                nombre,
-                marca,
-                presentacion,
-                categoria,
-                validaciones
-            FROM productos_referencia_ean
-            WHERE {condiciones}
-            ORDER BY validaciones DESC
-            LIMIT 50
-        """
-
-        cursor.execute(query, parametros)
-        candidatos = cursor.fetchall()
+        candidatos = indice_referencia.candidatos(palabras_busqueda)
+        if candidatos is None:
+            candidatos = _candidatos_auditoria_sql(palabras_busqueda, cursor)
 
         print(f"   🔎 Candidatos encontrados: {len(candidatos)}")
 
         # PASO B: Calcular similitud con múltiples estrategias
+        # (cotas vectorizadas; el puntaje exacto solo para quien puede ganar)
+        resultado = _mejor_candidato_auditoria(
+            candidatos, analisis, palabras_busqueda, umbral
+        )
+
         mejor_match = None
         mejor_score = 0
-
-        for row in candidatos:
-            nombre_ref = row[2]
-            nombre_ref_expandido = expandir_abreviaturas(nombre_ref)
-
-            # Similitud 1: Nombre expandido vs nombre expandido
-            sim1 = calcular_similitud(nombre_expandido, nombre_ref_expandido)
-
-            # Similitud 2: Nombre original vs referencia
-            sim2 = calcular_similitud(nombre_limpio, nombre_ref)
-
-            # Similitud 3: Nombre expandido vs referencia original
-            sim3 = calcular_similitud(nombre_expandido, nombre_ref)
-
-            # Tomar la mejor
-            similitud = max(sim1, sim2, sim3)
-
-            # BONUS por coincidencias específicas
-            bonus = 0
-            penalizacion = 0
-
-            # Bonus por marca coincidente
-            marca_ref = extraer_marca(nombre_ref)
-            if marca and marca_ref and marca == marca_ref:
-                bonus += 0.15
-            elif marca and marca_ref and (marca in marca_ref or marca_ref in marca):
-                bonus += 0.10
-            elif marca and marca_ref and marca != marca_ref:
-                # Penalizar si las marcas son diferentes (evita confundir ROSAL con FAMILIA)
-                penalizacion += 0.20
-
-            # Bonus/Penalización por metros (crucial para papel higiénico)
-            metros_ref = extraer_metros(nombre_ref)
-            if metros and metros_ref:
-                if metros == metros_ref:
-                    bonus += 0.15  # Mismo metraje = muy probable que sea el mismo
-                else:
-                    penalizacion += (
-                        0.25  # Diferente metraje = probablemente otro producto
-                    )
-
-            # Bonus por cantidad coincidente
-            cantidad_ref = extraer_cantidad(nombre_ref)
-            if cantidad and cantidad_ref and cantidad == cantidad_ref:
-                bonus += 0.10
-
-            # Bonus por palabras clave que coinciden
-            nombre_ref_upper = nombre_ref.upper()
-            palabras_coinciden = sum(
-                1 for p in palabras_busqueda if p in nombre_ref_upper
+        if resultado:
+            ref, score_final, similitud, bonus, penalizacion = resultado
+            nombre_ref = ref["nombre"]
+            mejor_score = score_final
+            mejor_match = {
+                "referencia_id": ref["referencia_id"],
+                "codigo_ean": ref["codigo_ean"],
+                "nombre": nombre_ref,
+                "marca": ref["marca"],
+                "presentacion": ref["presentacion"],
+                "categoria": ref["categoria"],
+                "validaciones": ref["validaciones"],
+                "similitud": score_final,
+                "fuente": "AUDITORIA_NOMBRE",
+                "confianza": 0.85 * score_final,
+            }
+            print(
+                f"      📊 {nombre_ref[:35]}: sim={similitud:.0%} +bonus={bonus:.0%} -pen={penalizacion:.0%} = {score_final:.0%}"
             )
-            bonus += 0.05 * min(palabras_coinciden, 3)  # Máximo +15% por palabras
-
-            score_final = min(1.0, max(0, similitud + bonus - penalizacion))
-
-            if score_final > mejor_score and score_final >= umbral:
-                mejor_score = score_final
-                mejor_match = {
-                    "referencia_id": row[0],
-                    "codigo_ean": row[1],
-                    "nombre": row[2],
-                    "marca": row[3],
-                    "presentacion": row[4],
-                    "categoria": row[5],
-                    "validaciones": row[6],
-                    "similitud": score_final,
-                    "fuente": "AUDITORIA_NOMBRE",
-                    "confianza": 0.85 * score_final,
-                }
-                print(
-                    f"      📊 {nombre_ref[:35]}: sim={similitud:.0%} +bonus={bonus:.0%} -pen={penalizacion:.0%} = {score_final:.0%}"
-                )
 
         if mejor_match:
             print(
@@ -699,6 +436,24 @@ def buscar_en_auditoria_por_nombre(
     return None
 
 
+def _candidatos_auditoria_sql(palabras_busqueda: list, cursor) -> list:
+    """Candidatos desde la tabla (sin índice en memoria): trigramas o LIKE"""
+    from busqueda_productos import buscar_en_tabla
+    from indice_referencia import preparar_referencia
+
+    # Usar hasta 4 palabras para la búsqueda (basta con que coincida una)
+    filas = buscar_en_tabla(
+        cursor,
+        "productos_referencia_ean",
+        "id, codigo_ean, nombre, marca, presentacion, categoria, validaciones",
+        " ".join(palabras_busqueda[:4]),
+        50,
+        popularidad="validaciones",
+        cualquier_palabra=True,
+    )
+    return [preparar_referencia(row) for row in filas]
+
+
 # ============================================================================
 # PASO 3: BUSCAR EN WEB (VTEX) + VALIDAR CONTRA AUDITORÍA
 # ============================================================================
@@ -728,55 +483,64 @@ def buscar_en_web_y_validar(
         if not resultado.encontrado:
             return None
 
-        print(f"   🌐 [PASO 3] Web encontró: {resultado.nombre_web}")
+        return validar_resultado_web(resultado, cursor)
 
-        # Validar contra auditoría si tenemos EAN
-        confianza = 0.8
-        fuente = "WEB"
+    except Exception as e:
+        print(f"   ⚠️ Error buscando en web: {e}")
 
-        if resultado.codigo_ean:
-            auditoria = buscar_en_auditoria_por_ean(resultado.codigo_ean, cursor)
+    return None
 
-            if auditoria:
-                # EAN existe en auditoría → validado!
-                similitud_nombre = calcular_similitud(
-                    resultado.nombre_web, auditoria["nombre"]
-                )
 
-                if similitud_nombre >= 0.7:
-                    print(
-                        f"   ✅ [PASO 3] EAN validado con auditoría ({similitud_nombre:.0%})"
-                    )
-                    confianza = 0.95
-                    fuente = "WEB_VALIDADO"
-
-                    # Usar nombre de auditoría si es mejor
-                    if similitud_nombre < 0.95:
-                        resultado.nombre_web = auditoria["nombre"]
-                        resultado.marca = auditoria.get("marca") or resultado.marca
-                else:
-                    print(
-                        f"   ⚠️ [PASO 3] EAN coincide pero nombres muy diferentes ({similitud_nombre:.0%})"
-                    )
-                    confianza = 0.6
+def validar_resultado_web(resultado, cursor) -> Dict:
+    """
+    Datos del producto a partir de un ResultadoEnriquecimiento encontrado,
+    con la confianza según lo valide o no la auditoría (también lo usa el
+    enriquecimiento en segundo plano)
+    """
+    print(f"   🌐 [PASO 3] Web encontró: {resultado.nombre_web}")
+
+    # Validar contra auditoría si tenemos EAN
+    confianza = 0.8
+    fuente = "WEB"
 
-        return {
-            "nombre": resultado.nombre_web,
-            "codigo_ean": resultado.codigo_ean,
-            "codigo_plu": resultado.codigo_plu,
-            "marca": resultado.marca,
-            "precio_web": resultado.precio_web,
-            "categoria": resultado.categoria,
-            "url": resultado.url_producto,
-            "imagen": resultado.imagen_url,
-            "fuente": fuente,
-            "confianza": confianza,
-        }
+    if resultado.codigo_ean:
+        auditoria = buscar_en_auditoria_por_ean(resultado.codigo_ean, cursor)
 
-    except Exception as e:
-        print(f"   ⚠️ Error buscando en web: {e}")
+        if auditoria:
+            # EAN existe en auditoría → validado!
+            similitud_nombre = calcular_similitud(
+                resultado.nombre_web, auditoria["nombre"]
+            )
 
-    return None
+            if similitud_nombre >= 0.7:
+                print(
+                    f"   ✅ [PASO 3] EAN validado con auditoría ({similitud_nombre:.0%})"
+                )
+                confianza = 0.95
+                fuente = "WEB_VALIDADO"
+
+                # Usar nombre de auditoría si es mejor
+                if similitud_nombre < 0.95:
+                    resultado.nombre_web = auditoria["nombre"]
+                    resultado.marca = auditoria.get("marca") or resultado.marca
+            else:
+                print(
+                    f"   ⚠️ [PASO 3] EAN coincide pero nombres muy diferentes ({similitud_nombre:.0%})"
+                )
+                confianza = 0.6
+
+    return {
+        "nombre": resultado.nombre_web,
+        "codigo_ean": resultado.codigo_ean,
+        "codigo_plu": resultado.codigo_plu,
+        "marca": resultado.marca,
+        "precio_web": resultado.precio_web,
+        "categoria": resultado.categoria,
+        "url": resultado.url_producto,
+        "imagen": resultado.imagen_url,
+        "fuente": fuente,
+        "confianza": confianza,
+    }
 
 
 # ============================================================================
@@ -980,10 +744,16 @@ def buscar_o_crear_producto_inteligente(
     # ========================================
     # PASO 3: Buscar en Web (VTEX)
     # ========================================
-    print("\n📌 PASO 3: Buscando en Web (VTEX)...")
-    web = buscar_en_web_y_validar(
-        plu, nombre_limpio, establecimiento_nombre, precio, cursor
-    )
+    diferir_web = enriquecimiento_web.debe_diferirse(establecimiento_nombre)
+    web = None
+    if diferir_web:
+        print("\n📌 PASO 3: Web (VTEX) diferida al enriquecimiento en segundo plano")
+    else:
+        print("\n📌 PASO 3: Buscando en Web (VTEX)...")
+        web = buscar_en_web_y_validar(
+            plu, nombre_limpio, establecimiento_nombre, precio, cursor
+        )
+
     if web:
         producto_id = crear_o_actualizar_producto(
             plu=plu,
@@ -1002,6 +772,52 @@ def buscar_o_crear_producto_inteligente(
             "confianza": web["confianza"],
         }
 
+    resultado = _buscar_cache_o_crear_ocr(
+        plu,
+        nombre_limpio,
+        precio,
+        establecimiento_id,
+        establecimiento_nombre,
+        plu_existente,
+        cursor,
+        conn,
+    )
+
+    if diferir_web:
+        try:
+            enriquecimiento_web.diferir(
+                [
+                    {
+                        "producto_id": resultado["producto_id"],
+                        "plu": plu,
+                        "nombre": nombre_limpio,
+                        "precio": precio,
+                    }
+                ],
+                establecimiento_id,
+                establecimiento_nombre,
+                cursor,
+                conn,
+            )
+            conn.commit()
+        except Exception as e:
+            print(f"   ⚠️ Error encolando enriquecimiento web: {e}")
+            conn.rollback()
+
+    return resultado
+
+
+def _buscar_cache_o_crear_ocr(
+    plu: str,
+    nombre_limpio: str,
+    precio: int,
+    establecimiento_id: int,
+    establecimiento_nombre: str,
+    plu_existente: Optional[Dict],
+    cursor,
+    conn,
+) -> Dict[str, Any]:
+    """Pasos 4 y 5 de buscar_o_crear_producto_inteligente()"""
     # ========================================
     # PASO 4: Buscar en Cache VTEX
     # ========================================
@@ -1063,6 +879,532 @@ def buscar_o_crear_producto_inteligente(
     }
 
 
+# ============================================================================
+# RESOLUCIÓN POR FACTURA (EN LOTE)
+# ============================================================================
+
+
+class ResolutorFactura:
+    """
+    Mismo flujo que buscar_o_crear_producto_inteligente() para todas las
+    líneas de una factura, con las lecturas y escrituras agrupadas:
+
+    - precargar(): PAPA, PLU existente, auditoría por EAN y cache VTEX de
+      todos los PLUs en 3 consultas (= ANY(%s))
+    - resolver(): por línea; solo lo que no resolvió la precarga pasa por
+      auditoría por nombre / web / creación
+    - finalizar(): actualizaciones de precio y de auditoría en lote, y el
+      trabajo de enriquecimiento web de las líneas sin match
+      (enriquecimiento_web.py)
+
+    No hace commit: el llamador confirma junto con los items_factura. Cada
+    línea va en su SAVEPOINT (iniciar_linea); si su INSERT falla, la
+    siguiente línea la descarta sola y la factura sigue.
+
+        resolutor = crear_resolutor_factura(
+            [p.get("codigo") for p in productos], establecimiento_id,
+            establecimiento, cursor, conn,
+        )
+        for p in productos:
+            resolutor.iniciar_linea()
+            resultado = resolutor.resolver(codigo, nombre, precio)
+            cursor.execute("INSERT INTO items_factura ...")
+        resolutor.finalizar()
+        conn.commit()
+    """
+
+    def __init__(
+        self,
+        establecimiento_id: int,
+        establecimiento_nombre: str,
+        cursor,
+        conn,
+    ):
+        self.establecimiento_id = establecimiento_id
+        self.establecimiento_nombre = establecimiento_nombre or ""
+        self.cursor = cursor
+        self.conn = conn
+        self._por_plu: Dict[str, Dict] = {}
+        self._auditoria_ean: Dict[str, Dict] = {}
+        self._cache_vtex: Dict[str, Dict] = {}
+        self._resueltos: Dict[str, Dict] = {}
+        self._precios: Dict[Tuple[int, str], list] = {}
+        self._auditorias: Dict[int, Dict] = {}
+        # Líneas cuyo PASO 3 (web) va al enriquecimiento en segundo plano
+        self._pendientes_web: List[Dict] = []
+        self.stats = {"lineas": 0, "precargadas": 0, "repetidas": 0, "restantes": 0}
+        # False = sin precarga, cada línea usa el flujo individual
+        self.en_lote = True
+        # Cambios en memoria de la línea abierta, para deshacerlos si se
+        # revierte su SAVEPOINT (None = ninguna línea abierta)
+        self._deshacer: Optional[List] = None
+
+    # ------------------------------------------------------------------
+    # Lecturas en lote
+    # ------------------------------------------------------------------
+
+    def precargar(self, codigos: List[str]):
+        """Lee de una vez todo lo que se pueda resolver por PLU/EAN"""
+        plus = sorted(
+            {str(c).strip() if c else "" for c in codigos} - set(self._por_plu)
+        )
+        if not plus:
+            return
+
+        for plu in plus:
+            self._por_plu[plu] = {"papa": None, "existente": None}
+
+        self.cursor.execute(
+            """
+            SELECT
+                ppe.codigo_plu,
+                pm.id,
+                pm.nombre_consolidado,
+                pm.codigo_ean,
+                pm.marca,
+                pm.categoria_id,
+                pm.fuente_datos,
+                pm.confianza_datos,
+                ppe.precio_unitario,
+                pm.es_producto_papa
+            FROM productos_maestros_v2 pm
+            JOIN productos_por_establecimiento ppe ON pm.id = ppe.producto_maestro_id
+            WHERE ppe.codigo_plu = ANY(%s)
+              AND ppe.establecimiento_id = %s
+            ORDER BY pm.id
+        """,
+            (plus, self.establecimiento_id),
+        )
+        for row in self.cursor.fetchall():
+            datos = self._por_plu[row[0]]
+            producto = {
+                "producto_id": row[1],
+                "nombre": row[2],
+                "codigo_ean": row[3],
+                "marca": row[4],
+                "categoria_id": row[5],
+                "fuente": row[6] or "BD",
+                "confianza": float(row[7]) if row[7] else 0.5,
+                "precio_bd": row[8],
+            }
+            if row[9] and datos["papa"] is None:
+                datos["papa"] = producto
+            if datos["existente"] is None:
+                datos["existente"] = producto
+
+        eans = sorted(
+            {
+                d["existente"]["codigo_ean"]
+                for d in self._por_plu.values()
+                if d["existente"]
+                and d["existente"]["codigo_ean"]
+                and len(d["existente"]["codigo_ean"]) >= 8
+            }
+            - set(self._auditoria_ean)
+        )
+        if eans:
+            self.cursor.execute(
+                """
+                SELECT
+                    id, codigo_ean, nombre, marca, presentacion, categoria,
+                    validaciones
+                FROM productos_referencia_ean
+                WHERE codigo_ean = ANY(%s)
+            """,
+                (eans,),
+            )
+            for row in self.cursor.fetchall():
+                self._auditoria_ean[row[1]] = {
+                    "referencia_id": row[0],
+                    "codigo_ean": row[1],
+                    "nombre": row[2],
+                    "marca": row[3],
+                    "presentacion": row[4],
+                    "categoria": row[5],
+                    "validaciones": row[6],
+                    "fuente": "AUDITORIA",
+                    "confianza": 0.95,
+                }
+
+        self.cursor.execute(
+            """
+            SELECT
+                id, nombre, ean, plu, marca, precio, categoria
+            FROM productos_vtex_cache
+            WHERE (plu = ANY(%s) OR ean = ANY(%s))
+              AND establecimiento = %s
+            ORDER BY veces_usado DESC
+        """,
+            (plus, plus, self.establecimiento_nombre.upper()),
+        )
+        for row in self.cursor.fetchall():
+            cache = {
+                "cache_id": row[0],
+                "nombre": row[1],
+                "codigo_ean": row[2],
+                "codigo_plu": row[3],
+                "marca": row[4],
+                "precio_web": row[5],
+                "categoria": row[6],
+                "fuente": "CACHE_VTEX",
+                "confianza": 0.7,
+            }
+            for clave in (row[3], row[2]):
+                if clave in self._por_plu and clave not in self._cache_vtex:
+                    self._cache_vtex[clave] = cache
+
+        print(
+            f"   📦 [LOTE] {len(plus)} PLUs precargados: "
+            f"{sum(1 for p in plus if self._por_plu[p]['papa'])} PAPA, "
+            f"{sum(1 for p in plus if self._por_plu[p]['existente'])} existentes, "
+            f"{len(self._auditoria_ean)} en auditoría, "
+            f"{len(self._cache_vtex)} en cache VTEX"
+        )
+
+    # ------------------------------------------------------------------
+    # Transacción por línea
+    # ------------------------------------------------------------------
+
+    def iniciar_linea(self):
+        """Cierra la línea anterior y abre el SAVEPOINT de la siguiente"""
+        if not self.en_lote:
+            return
+        self._cerrar_linea()
+        self.cursor.execute("SAVEPOINT resolutor_linea")
+        self._deshacer = []
+
+    def descartar_linea(self):
+        """Revierte lo escrito por la línea abierta (BD y memoria)"""
+        if self._deshacer is None:
+            return
+        self.cursor.execute("ROLLBACK TO SAVEPOINT resolutor_linea")
+        self.cursor.execute("RELEASE SAVEPOINT resolutor_linea")
+        for deshacer in reversed(self._deshacer):
+            deshacer()
+        self._deshacer = None
+
+    def _cerrar_linea(self):
+        if self._deshacer is None:
+            return
+        try:
+            self.cursor.execute("RELEASE SAVEPOINT resolutor_linea")
+            self._deshacer = None
+        except Exception as e:
+            # La línea dejó la transacción abortada (p. ej. su INSERT)
+            print(f"   ⚠️ [LOTE] Línea descartada: {e}")
+            self.descartar_linea()
+
+    # ------------------------------------------------------------------
+    # Resolución por línea
+    # ------------------------------------------------------------------
+
+    def resolver(self, codigo: str, nombre_ocr: str, precio: int) -> Dict[str, Any]:
+        """Resultado con la misma forma que buscar_o_crear_producto_inteligente()"""
+        if not self.en_lote:
+            return buscar_o_crear_producto_inteligente(
+                codigo=codigo,
+                nombre_ocr=nombre_ocr,
+                precio=precio,
+                establecimiento_id=self.establecimiento_id,
+                establecimiento_nombre=self.establecimiento_nombre,
+                cursor=self.cursor,
+                conn=self.conn,
+            )
+
+        plu = str(codigo).strip() if codigo else ""
+        self.stats["lineas"] += 1
+
+        try:
+            return self._resolver(plu, nombre_ocr, precio)
+        except Exception:
+            self.descartar_linea()
+            raise
+
+    def _resolver(self, plu: str, nombre_ocr: str, precio: int) -> Dict[str, Any]:
+        if plu and plu in self._resueltos:
+            # Mismo PLU ya resuelto en esta factura: solo cuenta el reporte
+            self.stats["repetidas"] += 1
+            resultado = dict(self._resueltos[plu], es_nuevo=False)
+            self._registrar_precio(resultado["producto_id"], plu, precio)
+            return resultado
+
+        if plu not in self._por_plu:
+            self.precargar([plu])
+        datos = self._por_plu[plu]
+
+        papa = datos["papa"]
+        existente = datos["existente"]
+        auditoria = (
+            self._auditoria_ean.get(existente["codigo_ean"])
+            if existente and existente["codigo_ean"]
+            else None
+        )
+
+        if papa:
+            self.stats["precargadas"] += 1
+            self._registrar_precio(papa["producto_id"], plu, precio)
+            resultado = {
+                "producto_id": papa["producto_id"],
+                "nombre": papa["nombre"],
+                "codigo_ean": papa.get("codigo_ean"),
+                "es_nuevo": False,
+                "fuente": "PAPA",
+                "confianza": 1.0,
+            }
+        elif auditoria:
+            self.stats["precargadas"] += 1
+            producto_id = existente["producto_id"]
+            if producto_id not in self._auditorias:
+                self._auditorias[producto_id] = auditoria
+                self._al_descartar(lambda: self._auditorias.pop(producto_id, None))
+            self._registrar_precio(existente["producto_id"], plu, precio)
+            resultado = {
+                "producto_id": existente["producto_id"],
+                "nombre": auditoria["nombre"],
+                "codigo_ean": auditoria["codigo_ean"],
+                "es_nuevo": False,
+                "fuente": "AUDITORIA",
+                "confianza": 0.95,
+            }
+        else:
+            self.stats["restantes"] += 1
+            resultado = self._resolver_restante(
+                plu, limpiar_nombre(nombre_ocr), precio, datos
+            )
+
+        if plu:
+            self._resueltos[plu] = resultado
+            self._al_descartar(lambda: self._resueltos.pop(plu, None))
+        return resultado
+
+    def _resolver_restante(
+        self, plu: str, nombre_limpio: str, precio: int, datos: Dict
+    ) -> Dict[str, Any]:
+        """Pasos 2 (nombre) a 5 de buscar_o_crear_producto_inteligente()"""
+        print(f"   🔍 [LOTE] Sin match directo: PLU={plu} | {nombre_limpio[:30]}")
+
+        encontrado = buscar_en_auditoria_por_nombre(nombre_limpio, self.cursor)
+        diferir_web = False
+        if not encontrado:
+            if enriquecimiento_web.debe_diferirse(self.establecimiento_nombre):
+                diferir_web = True
+            else:
+                encontrado = buscar_en_web_y_validar(
+                    plu, nombre_limpio, self.establecimiento_nombre, precio, self.cursor
+                )
+        if not encontrado:
+            encontrado = self._cache_vtex.get(plu)
+
+        resultado = self._crear_o_usar_existente(
+            plu, nombre_limpio, precio, datos, encontrado
+        )
+        if diferir_web:
+            linea = {
+                "producto_id": resultado["producto_id"],
+                "plu": plu,
+                "nombre": nombre_limpio,
+                "precio": precio,
+            }
+            self._pendientes_web.append(linea)
+            self._al_descartar(lambda: self._pendientes_web.remove(linea))
+        return resultado
+
+    def _crear_o_usar_existente(
+        self,
+        plu: str,
+        nombre_limpio: str,
+        precio: int,
+        datos: Dict,
+        encontrado: Optional[Dict],
+    ) -> Dict[str, Any]:
+        """Producto con los datos encontrados, el PLU existente o solo OCR"""
+        if encontrado:
+            producto_id = crear_o_actualizar_producto(
+                plu=plu,
+                establecimiento_id=self.establecimiento_id,
+                datos=encontrado,
+                precio=precio,
+                cursor=self.cursor,
+                conn=self.conn,
+                commit=False,
+            )
+            return {
+                "producto_id": producto_id,
+                "nombre": encontrado["nombre"],
+                "codigo_ean": encontrado.get("codigo_ean"),
+                "es_nuevo": True,
+                "fuente": encontrado["fuente"],
+                "confianza": encontrado["confianza"],
+            }
+
+        existente = datos["existente"]
+        if existente:
+            self._registrar_precio(existente["producto_id"], plu, precio)
+            return {
+                "producto_id": existente["producto_id"],
+                "nombre": existente["nombre"],
+                "codigo_ean": existente.get("codigo_ean"),
+                "es_nuevo": False,
+                "fuente": existente["fuente"],
+                "confianza": existente["confianza"],
+            }
+
+        producto_id = crear_producto_ocr(
+            plu=plu,
+            nombre=nombre_limpio,
+            precio=precio,
+            establecimiento_id=self.establecimiento_id,
+            cursor=self.cursor,
+            conn=self.conn,
+            commit=False,
+        )
+        return {
+            "producto_id": producto_id,
+            "nombre": nombre_limpio,
+            "codigo_ean": None,
+            "es_nuevo": True,
+            "fuente": "OCR",
+            "confianza": 0.5,
+        }
+
+    def _registrar_precio(self, producto_id: int, plu: str, precio: int):
+        clave = (producto_id, plu)
+        anterior = self._precios.get(clave)
+        self._precios[clave] = [precio, anterior[1] + 1 if anterior else 1]
+
+        def deshacer():
+            if anterior:
+                self._precios[clave] = anterior
+            else:
+                self._precios.pop(clave, None)
+
+        self._al_descartar(deshacer)
+
+    def _al_descartar(self, deshacer):
+        if self._deshacer is not None:
+            self._deshacer.append(deshacer)
+
+    # ------------------------------------------------------------------
+    # Escrituras en lote
+    # ------------------------------------------------------------------
+
+    def finalizar(self):
+        """Aplica precios y datos de auditoría acumulados (sin commit)"""
+        if not self.en_lote:
+            return
+
+        self._cerrar_linea()
+        self.cursor.execute("SAVEPOINT resolutor_finalizar")
+        try:
+            self._escribir_lote()
+            self.cursor.execute("RELEASE SAVEPOINT resolutor_finalizar")
+        except Exception as e:
+            print(f"   ⚠️ Error aplicando actualizaciones en lote: {e}")
+            self.cursor.execute("ROLLBACK TO SAVEPOINT resolutor_finalizar")
+
+        if self._pendientes_web:
+            self.cursor.execute("SAVEPOINT resolutor_web")
+            try:
+                enriquecimiento_web.diferir(
+                    self._pendientes_web,
+                    self.establecimiento_id,
+                    self.establecimiento_nombre,
+                    self.cursor,
+                    self.conn,
+                )
+                self.cursor.execute("RELEASE SAVEPOINT resolutor_web")
+            except Exception as e:
+                print(f"   ⚠️ Error encolando enriquecimiento web: {e}")
+                self.cursor.execute("ROLLBACK TO SAVEPOINT resolutor_web")
+
+        print(
+            f"   📦 [LOTE] {self.stats['lineas']} líneas: "
+            f"{self.stats['precargadas']} por precarga, "
+            f"{self.stats['repetidas']} repetidas, "
+            f"{self.stats['restantes']} por búsqueda completa | "
+            f"{len(self._precios)} precios y {len(self._auditorias)} "
+            f"auditorías en lote, {len(self._pendientes_web)} a enriquecimiento web"
+        )
+        self._precios.clear()
+        self._auditorias.clear()
+        self._pendientes_web.clear()
+
+    def _escribir_lote(self):
+        if self._auditorias:
+            ids = list(self._auditorias)
+            self.cursor.execute(
+                """
+                UPDATE productos_maestros_v2 pm
+                SET nombre_consolidado = v.nombre,
+                    marca = v.marca,
+                    fuente_datos = 'AUDITORIA',
+                    confianza_datos = 0.95,
+                    es_producto_papa = TRUE,
+                    fecha_validacion = CURRENT_TIMESTAMP
+                FROM unnest(%s::int[], %s::text[], %s::text[]) AS v(id, nombre, marca)
+                WHERE pm.id = v.id
+            """,
+                (
+                    ids,
+                    [self._auditorias[i]["nombre"] for i in ids],
+                    [self._auditorias[i].get("marca") for i in ids],
+                ),
+            )
+
+        if self._precios:
+            claves = list(self._precios)
+            self.cursor.execute(
+                """
+                UPDATE productos_por_establecimiento ppe
+                SET precio_unitario = v.precio,
+                    precio_actual = v.precio,
+                    ultima_actualizacion = CURRENT_TIMESTAMP,
+                    total_reportes = ppe.total_reportes + v.veces
+                FROM unnest(%s::int[], %s::text[], %s::numeric[], %s::int[])
+                    AS v(producto_id, plu, precio, veces)
+                WHERE ppe.producto_maestro_id = v.producto_id
+                  AND ppe.establecimiento_id = %s
+                  AND ppe.codigo_plu = v.plu
+            """,
+                (
+                    [c[0] for c in claves],
+                    [c[1] for c in claves],
+                    [self._precios[c][0] for c in claves],
+                    [self._precios[c][1] for c in claves],
+                    self.establecimiento_id,
+                ),
+            )
+
+
+def crear_resolutor_factura(
+    codigos: List[str],
+    establecimiento_id: int,
+    establecimiento_nombre: str,
+    cursor,
+    conn,
+) -> ResolutorFactura:
+    """
+    ResolutorFactura ya precargado con los códigos de la factura. Si la
+    precarga falla, el resolutor trabaja línea por línea con
+    buscar_o_crear_producto_inteligente().
+    """
+    resolutor = ResolutorFactura(
+        establecimiento_id, establecimiento_nombre, cursor, conn
+    )
+    try:
+        cursor.execute("SAVEPOINT resolutor_precarga")
+        resolutor.precargar(codigos)
+        cursor.execute("RELEASE SAVEPOINT resolutor_precarga")
+    except Exception as e:
+        print(f"   ⚠️ Error precargando productos de la factura: {e}")
+        resolutor.en_lote = False
+        try:
+            cursor.execute("ROLLBACK TO SAVEPOINT resolutor_precarga")
+        except Exception:
+            conn.rollback()
+    return resolutor
+
+
 # ============================================================================
 # FUNCIONES DE ACTUALIZACIÓN Y CREACIÓN
 # ============================================================================
@@ -1118,9 +1460,18 @@ def actualizar_producto_con_auditoria(producto_id: int, auditoria: Dict, cursor,
 
 
 def crear_o_actualizar_producto(
-    plu: str, establecimiento_id: int, datos: Dict, precio: int, cursor, conn
+    plu: str,
+    establecimiento_id: int,
+    datos: Dict,
+    precio: int,
+    cursor,
+    conn,
+    commit: bool = True,
 ) -> int:
-    """Crea o actualiza un producto con los datos proporcionados"""
+    """
+    Crea o actualiza un producto con los datos proporcionados.
+    Con commit=False no confirma ni revierte (lo maneja el llamador).
+    """
     try:
         # Verificar si ya existe por EAN
         producto_id = None
@@ -1192,18 +1543,26 @@ def crear_o_actualizar_producto(
             (producto_id, establecimiento_id, plu, precio, precio),
         )
 
-        conn.commit()
+        if commit:
+            conn.commit()
         print(f"   ✅ Producto {producto_id} creado/actualizado")
         return producto_id
 
     except Exception as e:
         print(f"   ❌ Error creando producto: {e}")
-        conn.rollback()
+        if commit:
+            conn.rollback()
         raise
 
 
 def crear_producto_ocr(
-    plu: str, nombre: str, precio: int, establecimiento_id: int, cursor, conn
+    plu: str,
+    nombre: str,
+    precio: int,
+    establecimiento_id: int,
+    cursor,
+    conn,
+    commit: bool = True,
 ) -> int:
     """Crea un producto nuevo solo con datos OCR"""
     try:
@@ -1229,13 +1588,15 @@ def crear_producto_ocr(
             (producto_id, establecimiento_id, plu, precio, precio),
         )
 
-        conn.commit()
+        if commit:
+            conn.commit()
         print(f"   📝 Producto OCR creado: ID {producto_id}")
         return producto_id
 
     except Exception as e:
         print(f"   ❌ Error creando producto OCR: {e}")
-        conn.rollback()
+        if commit:
+            conn.rollback()
         raise
 
 
@@ -180,19 +180,18 @@ class ProductResolver:
         }
 
     def _get_connection(self):
-        """Obtiene conexión a PostgreSQL"""
+        """Obtiene conexión a PostgreSQL desde el pool compartido del proceso"""
         if not self.database_url or not psycopg:
             print("   ⚠️ No hay DATABASE_URL o psycopg no disponible")
             return None
         try:
-            if PSYCOPG_VERSION == 3:
-                return psycopg.connect(self.database_url, autocommit=False)
-            else:
-                return psycopg.connect(self.database_url)
+            from database import get_postgres_pool
+
+            # Un solo factory por DSN: el pool es el mismo que usa database.py
+            return get_postgres_pool(self.database_url).getconn()
         except Exception as e:
             print(f"❌ Error conectando a BD: {e}")
             return None
-            return None
 
     @staticmethod
     def normalizar_supermercado(nombre: str) -> Optional[str]:
@@ -365,6 +364,13 @@ class ProductResolver:
             if not scraper_key:
                 return None
 
+            # Espejo local del catálogo: sin red si la tienda ya se sincronizó
+            local = self._consultar_catalogo_local(
+                scraper_key.upper(), codigo, es_ean
+            )
+            if local:
+                return local
+
             resultado = await enriquecer_producto(
                 nombre_ocr=nombre_ocr,
                 plu_ocr=codigo if not es_ean else None,
@@ -393,6 +399,42 @@ class ProductResolver:
             print(f"   ❌ Error consultando API: {e}")
             return None
 
+    def _consultar_catalogo_local(
+        self, establecimiento: str, codigo: str, es_ean: bool
+    ) -> Optional[Dict]:
+        """Busca el código en catalogo_vtex (espejo del catálogo VTEX)"""
+        if not codigo:
+            return None
+        try:
+            import catalogo_vtex
+
+            if not catalogo_vtex.disponible(establecimiento):
+                return None
+
+            productos = catalogo_vtex.buscar_codigo(
+                establecimiento, "ean" if es_ean else "plu", codigo
+            )
+            if not productos:
+                return None
+
+            producto = productos[0]
+            sku = producto["items"][0]
+            precios = sku.get("sellers") or [{}]
+            return {
+                "ean": sku.get("ean") or None,
+                "plu": producto.get("productReference") or None,
+                "nombre_completo": producto.get("productName"),
+                "marca": producto.get("brand"),
+                "presentacion": sku.get("name"),
+                "precio_web": precios[0].get("commertialOffer", {}).get("Price"),
+                "url": producto.get("link"),
+                "verificado": True,
+                "fuente": "catalogo_local",
+            }
+        except Exception as e:
+            print(f"   ⚠️ Error consultando catálogo local: {e}")
+            return None
+
     # ========================================================================
     # GUARDAR RESULTADOS
     # ========================================================================
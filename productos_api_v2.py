@@ -6,8 +6,9 @@ from database import get_db_connection
 import base64
 import httpx
 from web_enricher import WebEnricher, es_tienda_vtex, SUPERMERCADOS_VTEX
-import requests
 import urllib.parse
+import catalogo_vtex
+import cliente_vtex
 
 
 logger = logging.getLogger(__name__)
@@ -1265,96 +1266,101 @@ async def buscar_plu_en_supermercado(establecimiento: str, codigo_plu: str):
 
     try:
         # Intentar buscar por el código
-        async with httpx.AsyncClient(timeout=15.0) as client:
-            # Primero intentar búsqueda directa por código
-            search_url = f"{config['search_url']}?fq=alternateIds_RefId:{codigo_plu}"
+        # Primero intentar búsqueda directa por código
+        search_url = f"{config['search_url']}?fq=alternateIds_RefId:{codigo_plu}"
 
-            headers = {
-                "Accept": "application/json",
-                "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36",
-            }
+        headers = {
+            "Accept": "application/json",
+            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36",
+        }
 
-            response = await client.get(search_url, headers=headers)
+        response = await cliente_vtex.get_async(
+            search_url, headers=headers, timeout=15.0
+        )
 
-            productos = []
+        productos = []
+
+        if response.status_code == 200:
+            data = response.json()
+            if data and len(data) > 0:
+                productos = data
+
+        # Si no encontró, intentar búsqueda por EAN
+        if not productos:
+            search_url = f"{config['search_url']}?fq=alternateIds_Ean:{codigo_plu}"
+            response = await cliente_vtex.get_async(
+                search_url, headers=headers, timeout=15.0
+            )
 
             if response.status_code == 200:
                 data = response.json()
                 if data and len(data) > 0:
                     productos = data
 
-            # Si no encontró, intentar búsqueda por EAN
-            if not productos:
-                search_url = f"{config['search_url']}?fq=alternateIds_Ean:{codigo_plu}"
-                response = await client.get(search_url, headers=headers)
-
-                if response.status_code == 200:
-                    data = response.json()
-                    if data and len(data) > 0:
-                        productos = data
-
-            # Si aún no encontró, buscar como texto
-            if not productos:
-                search_url = f"{config['search_url']}?ft={codigo_plu}"
-                response = await client.get(search_url, headers=headers)
-
-                if response.status_code == 200:
-                    data = response.json()
-                    if data and len(data) > 0:
-                        productos = data[:3]  # Limitar a 3 resultados
-
-            if not productos:
-                return {
-                    "success": False,
-                    "error": f"No se encontró el código '{codigo_plu}' en {establecimiento_norm}",
-                    "codigo_buscado": codigo_plu,
-                    "establecimiento": establecimiento_norm,
-                }
-
-            # Procesar resultados
-            resultados = []
-            for prod in productos[:5]:  # Máximo 5 resultados
-                # Extraer EAN
-                ean = None
-                if "items" in prod and prod["items"]:
-                    item = prod["items"][0]
-                    ean = item.get("ean") or item.get("referenceId", [{}])[0].get(
-                        "Value"
-                    )
-
-                # Extraer precio
-                precio = None
-                if "items" in prod and prod["items"]:
-                    item = prod["items"][0]
-                    if "sellers" in item and item["sellers"]:
-                        precio = (
-                            item["sellers"][0].get("commertialOffer", {}).get("Price")
-                        )
+        # Si aún no encontró, buscar como texto
+        if not productos:
+            search_url = f"{config['search_url']}?ft={codigo_plu}"
+            response = await cliente_vtex.get_async(
+                search_url, headers=headers, timeout=15.0
+            )
 
-                resultado = {
-                    "nombre": prod.get("productName", "Sin nombre"),
-                    "marca": prod.get("brand", ""),
-                    "ean": ean,
-                    "precio": precio,
-                    "categoria": (
-                        prod.get("categories", [""])[0]
-                        if prod.get("categories")
-                        else ""
-                    ),
-                    "imagen": prod.get("items", [{}])[0]
-                    .get("images", [{}])[0]
-                    .get("imageUrl", ""),
-                }
-                resultados.append(resultado)
+            if response.status_code == 200:
+                data = response.json()
+                if data and len(data) > 0:
+                    productos = data[:3]  # Limitar a 3 resultados
 
+        if not productos:
             return {
-                "success": True,
+                "success": False,
+                "error": f"No se encontró el código '{codigo_plu}' en {establecimiento_norm}",
                 "codigo_buscado": codigo_plu,
                 "establecimiento": establecimiento_norm,
-                "resultados": resultados,
-                "total": len(resultados),
             }
 
+        # Procesar resultados
+        resultados = []
+        for prod in productos[:5]:  # Máximo 5 resultados
+            # Extraer EAN
+            ean = None
+            if "items" in prod and prod["items"]:
+                item = prod["items"][0]
+                ean = item.get("ean") or item.get("referenceId", [{}])[0].get(
+                    "Value"
+                )
+
+            # Extraer precio
+            precio = None
+            if "items" in prod and prod["items"]:
+                item = prod["items"][0]
+                if "sellers" in item and item["sellers"]:
+                    precio = (
+                        item["sellers"][0].get("commertialOffer", {}).get("Price")
+                    )
+
+            resultado = {
+                "nombre": prod.get("productName", "Sin nombre"),
+                "marca": prod.get("brand", ""),
+                "ean": ean,
+                "precio": precio,
+                "categoria": (
+                    prod.get("categories", [""])[0]
+                    if prod.get("categories")
+                    else ""
+                ),
+                "imagen": prod.get("items", [{}])[0]
+                .get("images", [{}])[0]
+                .get("imageUrl", ""),
+            }
+            resultados.append(resultado)
+
+        return {
+            "success": True,
+            "codigo_buscado": codigo_plu,
+            "establecimiento": establecimiento_norm,
+            "resultados": resultados,
+            "total": len(resultados),
+        }
+
     except httpx.TimeoutException:
         return {
             "success": False,
@@ -1595,8 +1601,10 @@ async def obtener_factura_producto(producto_id: int):
 # =============================================================
 
 
+# Síncrono a propósito: WebEnricher y cliente_vtex.get bloquean (red y rate
+# limit), así FastAPI lo corre en su threadpool y no frena el event loop
 @router.get("/api/v2/buscar-vtex/{establecimiento}/{codigo}")
-async def buscar_en_vtex(establecimiento: str, codigo: str):
+def buscar_en_vtex(establecimiento: str, codigo: str):
     """
     Busca un código PLU/EAN en la API VTEX del supermercado.
 
@@ -1733,7 +1741,7 @@ def _buscar_plu_variante(args):
     codigo, base_url, headers, establecimiento = args
     try:
         url = f"{base_url}/api/catalog_system/pub/products/search?fq=alternateIds_RefId:{codigo}"
-        resp = requests.get(url, headers=headers, timeout=3)
+        resp = cliente_vtex.get(url, headers=headers, timeout=3)
         if resp.status_code == 200:
             data = resp.json()
             resultados = []
@@ -1768,8 +1776,9 @@ def _buscar_plu_variante(args):
 from concurrent.futures import ThreadPoolExecutor, as_completed
 
 
+# Síncrono a propósito (ver buscar_en_vtex)
 @router.get("/api/v2/buscar-productos/{establecimiento}")
-async def buscar_productos_vtex(
+def buscar_productos_vtex(
     establecimiento: str,
     q: str = None,
     limite: int = 15,
@@ -1779,6 +1788,7 @@ async def buscar_productos_vtex(
     VERSION 2.0 - Con búsqueda por palabras individuales
 
     Estrategias:
+    0. Espejo local del catálogo (catalogo_vtex), si ya se sincronizó
     1. Búsqueda fullText directa
     2. Búsqueda por primera palabra + filtrado
     3. Búsqueda por variantes PLU (si es número)
@@ -1813,34 +1823,58 @@ async def buscar_productos_vtex(
     estrategia_usada = ""
 
     try:
+        # ========================================
+        # ESTRATEGIA 0: Espejo local del catálogo (sin red)
+        # ========================================
+        catalogo_local = catalogo_vtex.disponible(establecimiento_upper)
+
+        if catalogo_local:
+            print(f"🔍 [VTEX] Buscando: '{termino}' en {establecimiento_upper}")
+            print(f"   Estrategia 0: catálogo local")
+            for item in catalogo_vtex.buscar_texto(
+                establecimiento_upper, termino, limite + 10
+            ):
+                prod = _parsear_producto(item, base_url, establecimiento_upper)
+                if prod and not _ya_existe(prod, resultados):
+                    resultados.append(prod)
+            print(f"   → {len(resultados)} resultados")
+
+            if resultados:
+                estrategia_usada = "catalogo_local"
+
         # ========================================
         # ESTRATEGIA 1: Búsqueda fullText directa
         # ========================================
-        url = f"{base_url}/api/catalog_system/pub/products/search?ft={urllib.parse.quote(termino)}&_from=0&_to={limite + 10}"
+        if not resultados:
+            url = f"{base_url}/api/catalog_system/pub/products/search?ft={urllib.parse.quote(termino)}&_from=0&_to={limite + 10}"
 
-        print(f"🔍 [VTEX] Buscando: '{termino}' en {establecimiento_upper}")
-        print(f"   Estrategia 1: fullText directo")
+            print(f"🔍 [VTEX] Buscando: '{termino}' en {establecimiento_upper}")
+            print(f"   Estrategia 1: fullText directo")
 
-        resp = requests.get(url, headers=headers, timeout=15)
+            resp = cliente_vtex.get(url, headers=headers, timeout=15)
 
-        if resp.status_code in [200, 206]:
-            data = resp.json()
-            print(f"   → {len(data)} resultados")
+            if resp.status_code in [200, 206]:
+                data = resp.json()
+                print(f"   → {len(data)} resultados")
 
-            for item in data:
-                prod = _parsear_producto(item, base_url, establecimiento_upper)
-                if prod and not _ya_existe(prod, resultados):
-                    resultados.append(prod)
+                for item in data:
+                    prod = _parsear_producto(item, base_url, establecimiento_upper)
+                    if prod and not _ya_existe(prod, resultados):
+                        resultados.append(prod)
 
-            if resultados:
-                estrategia_usada = "fulltext_directo"
+                if resultados:
+                    estrategia_usada = "fulltext_directo"
 
         # ========================================
         # ESTRATEGIA 2: Búsqueda por palabras (para "queso tajadas")
         # ========================================
         palabras = [p for p in termino.upper().split() if len(p) >= 3]
 
-        if len(resultados) < 3 and len(palabras) >= 2:
+        if (
+            estrategia_usada != "catalogo_local"
+            and len(resultados) < 3
+            and len(palabras) >= 2
+        ):
             print(f"   Estrategia 2: Búsqueda por palabras {palabras}")
 
             # Buscar por la primera palabra (más específica)
@@ -1850,7 +1884,7 @@ async def buscar_productos_vtex(
             url = f"{base_url}/api/catalog_system/pub/products/search?ft={urllib.parse.quote(palabra_principal)}&_from=0&_to=50"
 
             try:
-                resp = requests.get(url, headers=headers, timeout=15)
+                resp = cliente_vtex.get(url, headers=headers, timeout=15)
 
                 if resp.status_code in [200, 206]:
                     data = resp.json()
@@ -1880,7 +1914,11 @@ async def buscar_productos_vtex(
         # ========================================
         # ESTRATEGIA 2.5: Buscar por segunda palabra si la primera no dio resultados
         # ========================================
-        if len(resultados) < 3 and len(palabras) >= 2:
+        if (
+            estrategia_usada != "catalogo_local"
+            and len(resultados) < 3
+            and len(palabras) >= 2
+        ):
             print(f"   Estrategia 2.5: Invertir palabras")
 
             # Intentar con la segunda palabra como principal
@@ -1890,7 +1928,7 @@ async def buscar_productos_vtex(
                 url = f"{base_url}/api/catalog_system/pub/products/search?ft={urllib.parse.quote(palabra)}&_from=0&_to=50"
 
                 try:
-                    resp = requests.get(url, headers=headers, timeout=10)
+                    resp = cliente_vtex.get(url, headers=headers, timeout=10)
 
                     if resp.status_code in [200, 206]:
                         data = resp.json()
@@ -1940,6 +1978,18 @@ async def buscar_productos_vtex(
                 (v, base_url, headers, establecimiento_upper) for v in variantes_lista
             ]
 
+            if catalogo_local:
+                # Una sola consulta al espejo en vez de 30 requests a VTEX
+                for item in catalogo_vtex.buscar_plus(
+                    establecimiento_upper, [termino] + variantes_lista
+                ):
+                    prod = _parsear_producto(item, base_url, establecimiento_upper)
+                    if prod and not _ya_existe(prod, resultados):
+                        resultados.append(prod)
+                    if len(resultados) >= limite:
+                        break
+                args_list = []
+
             with ThreadPoolExecutor(max_workers=5) as executor:
                 futures = {
                     executor.submit(_buscar_plu_variante, args): args[0]
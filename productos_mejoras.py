@@ -24,6 +24,7 @@ import json
 
 # Importar funciones de database.py
 from database import get_db_connection
+import motor_similitud
 
 router = APIRouter(prefix="/api/productos", tags=["productos-mejoras"])
 
@@ -42,23 +43,24 @@ class FusionarRequest(BaseModel):
 # FUNCIONES AUXILIARES
 # ============================================================================
 
+def normalizar_para_similitud(texto: str) -> str:
+    """Minúsculas, sin acentos, sin espacios extra"""
+    texto = texto.lower().strip()
+    texto = re.sub(r'\s+', ' ', texto)
+    # Quitar acentos
+    acentos = {'á': 'a', 'é': 'e', 'í': 'i', 'ó': 'o', 'ú': 'u', 'ñ': 'n'}
+    for acento, sin_acento in acentos.items():
+        texto = texto.replace(acento, sin_acento)
+    return texto
+
+
 def similitud_nombres(nombre1: str, nombre2: str) -> float:
     """Calcula similitud entre dos nombres usando SequenceMatcher"""
     if not nombre1 or not nombre2:
         return 0.0
 
-    # Normalizar: minúsculas, sin acentos, sin espacios extra
-    def normalizar(texto: str) -> str:
-        texto = texto.lower().strip()
-        texto = re.sub(r'\s+', ' ', texto)
-        # Quitar acentos
-        acentos = {'á': 'a', 'é': 'e', 'í': 'i', 'ó': 'o', 'ú': 'u', 'ñ': 'n'}
-        for acento, sin_acento in acentos.items():
-            texto = texto.replace(acento, sin_acento)
-        return texto
-
-    n1 = normalizar(nombre1)
-    n2 = normalizar(nombre2)
+    n1 = normalizar_para_similitud(nombre1)
+    n2 = normalizar_para_similitud(nombre2)
 
     return SequenceMatcher(None, n1, n2).ratio()
 
@@ -404,24 +406,27 @@ async def detectar_nombres_similares(
         duplicados_encontrados = []
         productos_procesados = set()
 
+        # Similitudes de todos los pares en bloque (solo las >= umbral)
+        nombres = [p[1] or p[2] or '' for p in productos]
+        similares = motor_similitud.pares_similares(
+            [normalizar_para_similitud(n) for n in nombres], umbral_similitud
+        )
+
         for i, p1 in enumerate(productos):
             if p1[0] in productos_procesados:
                 continue
 
             grupo_similares = [p1]
 
-            for p2 in productos[i+1:]:
+            for j in range(i + 1, len(productos)):
+                p2 = productos[j]
                 if p2[0] in productos_procesados:
                     continue
 
-                # Calcular similitud
-                nombre1 = p1[1] or p1[2] or ''
-                nombre2 = p2[1] or p2[2] or ''
-
-                if not nombre1 or not nombre2:
+                if not nombres[i] or not nombres[j]:
                     continue
 
-                similitud = similitud_nombres(nombre1, nombre2)
+                similitud = similares.get((i, j), 0.0)
 
                 if similitud >= umbral_similitud:
                     grupo_similares.append(p2)
@@ -4,11 +4,11 @@ from fastapi import APIRouter, HTTPException, Header
 from pydantic import BaseModel
 from typing import List, Optional
 import json
-from anthropic import Anthropic
 import os
 
 # ✅ IMPORTAR TRACKER
 from api_usage_tracker import registrar_uso_api, verificar_limite_usuario
+import claude_client
 
 router = APIRouter(prefix="/api/menus", tags=["Menús"])
 
@@ -276,13 +276,14 @@ Responde ÚNICAMENTE con el JSON, sin texto adicional ni markdown.
         if not api_key:
             raise HTTPException(500, "ANTHROPIC_API_KEY no configurada")
 
-        client = Anthropic(api_key=api_key)
         modelo = "claude-haiku-4-5-20251001"
 
         print(f"🤖 Llamando a Claude ({modelo})...")
 
         # ✅ LLAMAR A CLAUDE
-        message = client.messages.create(
+        message = await claude_client.crear_mensaje_async(
+            timeout=60,
+            etiqueta="generar_menu",
             model=modelo,
             max_tokens=2500,
             system=SYSTEM_PROMPT,
@@ -0,0 +1,289 @@
+"""
+Servidor Stub de la API de Catálogo VTEX
+========================================
+
+Servidor HTTP local que responde como
+/api/catalog_system/pub/products/search de las tiendas VTEX, para probar
+web_enricher, los scrapers y cliente_vtex sin salir a internet.
+
+- Búsquedas soportadas: fq=alternateIds_RefId:X, fq=alternateIds_Ean:X,
+  fq=skuId:X, fq=C:/id/.../, ft=texto, /search/{texto} y paginación
+  _from/_to; /category/tree/{niveles} se arma con los categoriesIds
+- Catálogo por host: el cliente manda el host original en X-Vtex-Host
+  (cliente_vtex con VTEX_URL_STUB); sin catálogo propio se usa el común
+- Latencia y fallos configurables para probar rate limit y circuit breaker:
+  al iniciar o con POST /__config {"latencia": 0.5, "estado": 503}
+- GET /__solicitudes devuelve cuántas solicitudes recibió cada host
+
+Uso:
+
+    servidor, url = stub_vtex.iniciar()  # puerto libre, en un thread
+    os.environ["VTEX_URL_STUB"] = url     # antes de importar cliente_vtex
+    ...
+    servidor.shutdown()
+
+    python stub_vtex.py --puerto 8765 --latencia 0.2
+
+Autor: LecFac
+Versión: 1.0.0
+"""
+
+import argparse
+import json
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, unquote, urlsplit
+
+RUTA_BUSQUEDA = "/api/catalog_system/pub/products/search"
+RUTA_CATEGORIAS = "/api/catalog_system/pub/category/tree/"
+
+
+def producto_vtex(
+    product_id: str,
+    nombre: str,
+    plu: str,
+    ean: str,
+    marca: str = "",
+    precio: int = 0,
+    categoria: str = "/Mercado/",
+    categoria_ids: str = "/1/",
+) -> Dict:
+    """Producto con la estructura que devuelve la API de catálogo VTEX"""
+    return {
+        "productId": product_id,
+        "productName": nombre,
+        "brand": marca,
+        "productReference": plu,
+        "link": f"/{nombre.lower().replace(' ', '-')}/p",
+        "categories": [categoria],
+        "categoriesIds": [categoria_ids],
+        "items": [
+            {
+                "itemId": product_id,
+                "name": nombre,
+                "ean": ean,
+                "referenceId": [{"Key": "RefId", "Value": plu}],
+                "images": [
+                    {"imageUrl": f"https://stub.vtex/arquivos/ids/{product_id}.jpg"}
+                ],
+                "sellers": [{"commertialOffer": {"Price": precio}}],
+            }
+        ],
+    }
+
+
+CATALOGO_BASE = [
+    producto_vtex(
+        "1001",
+        "Chocolate Corona Tradicional 500 g",
+        "632967",
+        "7702007001234",
+        "CORONA",
+        13500,
+    ),
+    producto_vtex(
+        "1002",
+        "Leche Alquería Entera 1100 ml",
+        "237373",
+        "7702177001002",
+        "ALQUERIA",
+        4900,
+    ),
+    producto_vtex(
+        "1003",
+        "Arroz Diana Premium 1000 g",
+        "104512",
+        "7702511000011",
+        "DIANA",
+        5200,
+    ),
+    producto_vtex(
+        "1004",
+        "Papel Higiénico Familia Acolchamax 12 Rollos 30 m",
+        "881203",
+        "7702026180018",
+        "FAMILIA",
+        32900,
+    ),
+]
+
+
+class _Estado:
+    def __init__(self, catalogos: Dict[str, List[Dict]], latencia: float, estado):
+        self.catalogos = catalogos
+        self.latencia = latencia
+        self.estado = estado
+        self.solicitudes: Counter = Counter()
+        self.lock = threading.Lock()
+
+    def catalogo(self, host: str) -> List[Dict]:
+        return self.catalogos.get(host) or self.catalogos.get("*") or []
+
+
+def _filtrar(catalogo: List[Dict], ruta: str, query: Dict) -> List[Dict]:
+    texto = ""
+    if ruta.startswith(RUTA_BUSQUEDA + "/"):
+        texto = unquote(ruta[len(RUTA_BUSQUEDA) + 1 :])
+    texto = (query.get("ft") or [texto])[0].lower()
+
+    resultados = catalogo
+    for fq in query.get("fq", []):
+        campo, _, valor = fq.partition(":")
+        if campo == "alternateIds_RefId":
+            resultados = [
+                p
+                for p in resultados
+                if any(r["Value"] == valor for r in p["items"][0]["referenceId"])
+            ]
+        elif campo == "alternateIds_Ean":
+            resultados = [p for p in resultados if p["items"][0]["ean"] == valor]
+        elif campo == "skuId":
+            resultados = [p for p in resultados if p["items"][0]["itemId"] == valor]
+        elif campo == "C":
+            resultados = [
+                p
+                for p in resultados
+                if any(c.startswith(valor) for c in p.get("categoriesIds", []))
+            ]
+        else:
+            resultados = []
+
+    if texto:
+        palabras = texto.split()
+        resultados = [
+            p
+            for p in resultados
+            if all(w in p["productName"].lower() for w in palabras)
+        ]
+
+    desde = int((query.get("_from") or ["0"])[0])
+    hasta = int((query.get("_to") or [str(desde + 9)])[0])
+    return resultados[desde : hasta + 1]
+
+
+def _arbol_categorias(catalogo: List[Dict]) -> List[Dict]:
+    """Árbol /category/tree armado con los categoriesIds del catálogo"""
+    raiz: Dict = {}
+    for producto in catalogo:
+        for ruta in producto.get("categoriesIds", []):
+            nivel = raiz
+            for parte in ruta.strip("/").split("/"):
+                nivel = nivel.setdefault(int(parte), {})
+
+    def nodos(nivel: Dict) -> List[Dict]:
+        return [
+            {
+                "id": cid,
+                "name": f"Categoría {cid}",
+                "hasChildren": bool(hijos),
+                "children": nodos(hijos),
+            }
+            for cid, hijos in sorted(nivel.items())
+        ]
+
+    return nodos(raiz)
+
+
+def _crear_handler(estado: _Estado):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def _responder(self, codigo: int, cuerpo):
+            datos = json.dumps(cuerpo).encode("utf-8")
+            self.send_response(codigo)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(datos)))
+            self.end_headers()
+            self.wfile.write(datos)
+
+        def do_GET(self):
+            partes = urlsplit(self.path)
+            if partes.path == "/__solicitudes":
+                with estado.lock:
+                    return self._responder(200, dict(estado.solicitudes))
+
+            host = self.headers.get("X-Vtex-Host") or self.headers.get("Host", "")
+            with estado.lock:
+                estado.solicitudes[host] += 1
+                latencia, codigo = estado.latencia, estado.estado
+
+            if latencia:
+                time.sleep(latencia)
+            if codigo:
+                return self._responder(codigo, {"error": "stub"})
+            if partes.path.startswith(RUTA_CATEGORIAS):
+                return self._responder(200, _arbol_categorias(estado.catalogo(host)))
+            if not partes.path.startswith(RUTA_BUSQUEDA):
+                return self._responder(404, {"error": "ruta no soportada"})
+
+            resultados = _filtrar(
+                estado.catalogo(host), partes.path, parse_qs(partes.query)
+            )
+            # VTEX responde 206 (Partial Content) cuando hay resultados
+            self._responder(206 if resultados else 200, resultados)
+
+        def do_POST(self):
+            if urlsplit(self.path).path != "/__config":
+                return self._responder(404, {"error": "ruta no soportada"})
+            largo = int(self.headers.get("Content-Length") or 0)
+            config = json.loads(self.rfile.read(largo) or b"{}")
+            with estado.lock:
+                if "latencia" in config:
+                    estado.latencia = float(config["latencia"])
+                if "estado" in config:
+                    estado.estado = config["estado"]
+                if "catalogos" in config:
+                    estado.catalogos = config["catalogos"]
+                if config.get("reiniciar_contadores"):
+                    estado.solicitudes.clear()
+            self._responder(200, {"ok": True})
+
+    return Handler
+
+
+def iniciar(
+    puerto: int = 0,
+    catalogos: Optional[Dict[str, List[Dict]]] = None,
+    latencia: float = 0.0,
+    estado: Optional[int] = None,
+) -> Tuple[ThreadingHTTPServer, str]:
+    """
+    Levanta el stub en un thread daemon.
+
+    Args:
+        puerto: 0 = puerto libre
+        catalogos: {host: [productos]}; "*" aplica a cualquier host
+        latencia: segundos de espera por solicitud
+        estado: código HTTP fijo a devolver (simula un host caído)
+
+    Returns:
+        (servidor, url base)
+    """
+    servidor = ThreadingHTTPServer(
+        ("127.0.0.1", puerto),
+        _crear_handler(_Estado(catalogos or {"*": CATALOGO_BASE}, latencia, estado)),
+    )
+    servidor.daemon_threads = True
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    return servidor, f"http://127.0.0.1:{servidor.server_address[1]}"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Stub de la API de catálogo VTEX")
+    parser.add_argument("--puerto", type=int, default=8765)
+    parser.add_argument("--latencia", type=float, default=0.0)
+    parser.add_argument("--estado", type=int, default=None)
+    args = parser.parse_args()
+
+    servidor, url = iniciar(args.puerto, latencia=args.latencia, estado=args.estado)
+    print(f"🧪 Stub VTEX escuchando en {url} (VTEX_URL_STUB={url})")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        servidor.shutdown()
@@ -9,10 +9,12 @@ Fecha: 2025-10-30
 Sistema: LecFac
 """
 
-import os
-import anthropic
 from typing import Optional, Dict, Tuple
 from datetime import datetime
+import hashlib
+
+import claude_client
+import coalescencia
 
 
 def validar_producto_con_claude(codigo_leido: str, nombre_leido: str,
@@ -41,13 +43,6 @@ def validar_producto_con_claude(codigo_leido: str, nombre_leido: str,
     print(f"   Establecimiento: {establecimiento or 'N/A'}")
 
     try:
-        # Cliente Anthropic
-        api_key = os.environ.get("ANTHROPIC_API_KEY", "").strip()
-        if not api_key:
-            raise ValueError("ANTHROPIC_API_KEY no configurada")
-
-        client = anthropic.Anthropic(api_key=api_key)
-
         # Prompt especializado para productos colombianos
         prompt = f"""Eres un experto en productos de supermercados COLOMBIANOS.
 
@@ -123,9 +118,16 @@ Output:
 
 ANALIZA Y RESPONDE SOLO CON JSON:"""
 
-        # Llamar a Claude
-        message = client.messages.create(
-            model="claude-3-5-sonnet-20241022",  # Sonnet para mejor razonamiento
+        # Llamar a Claude (el mismo prompt en vuelo se pide una sola vez)
+        modelo = "claude-3-5-sonnet-20241022"
+        clave = hashlib.sha256(f"{modelo}\n{prompt}".encode("utf-8")).hexdigest()
+        message = coalescencia.ejecutar(
+            "claude_validacion",
+            clave,
+            claude_client.crear_mensaje,
+            timeout=60,
+            etiqueta="validar_producto",
+            model=modelo,  # Sonnet para mejor razonamiento
             max_tokens=1000,
             temperature=0,
             messages=[{
@@ -259,21 +259,58 @@ if __name__ == "__main__":
 # ==========================================
 
 
-def extraer_frames_video(video_path: str, intervalo: float = 1.0) -> List[str]:
+# Prefijo de los directorios temporales por job (ver limpiar_frames_temporales)
+PREFIJO_DIR_FRAMES = "lecfac_frames_"
+
+# Con saltos mayores a esto (en segundos) se busca con seek en vez de grab()
+SALTO_MIN_SEEK = 2.0
+
+
+def _indices_objetivo(
+    total_frames: int, fps: float, intervalo: float, max_frames: int = None
+) -> List[int]:
+    """
+    Índices de los frames a extraer: uno cada `intervalo` segundos y, si
+    sobran, una muestra uniforme de `max_frames` entre ellos.
+    """
+    paso = max(1, int(fps * intervalo))
+    indices = list(range(0, total_frames, paso))
+    if max_frames and len(indices) > max_frames:
+        indices = [
+            indices[int(i * len(indices) / max_frames)] for i in range(max_frames)
+        ]
+    return indices
+
+
+def extraer_frames_video(
+    video_path: str,
+    intervalo: float = 1.0,
+    max_frames: int = None,
+    directorio: str = None,
+) -> List[str]:
     """
     Extrae frames de un video a intervalos regulares.
 
+    Solo se decodifican los frames que se guardan: los intermedios se
+    saltan con seek (saltos largos) o grab() (saltos cortos), sin
+    convertirlos a imagen.
+
     Args:
         video_path: Ruta del video
         intervalo: Segundos entre cada frame (default: 1.0)
+        max_frames: Máximo de frames; si hay más se toma una muestra uniforme
+        directorio: Carpeta destino. Por defecto se crea una temporal propia
+            del llamado, así dos jobs simultáneos no se pisan los frames
 
     Returns:
         Lista de rutas de frames extraídos
     """
     import cv2
     import os
+    import tempfile
 
     frames_paths = []
+    cap = None
 
     try:
         # Abrir el video
@@ -289,31 +326,40 @@ def extraer_frames_video(video_path: str, intervalo: float = 1.0) -> List[str]:
         if fps == 0:
             fps = 30  # Fallback
 
-        frame_interval = int(fps * intervalo)
+        if directorio is None:
+            directorio = tempfile.mkdtemp(prefix=PREFIJO_DIR_FRAMES)
 
         print(f"📹 Video: {fps:.1f} FPS, {total_frames} frames totales")
-        print(f"🎯 Extrayendo 1 frame cada {frame_interval} frames ({intervalo}s)")
-
-        frame_count = 0
-        saved_count = 0
-
-        while True:
-            ret, frame = cap.read()
-
-            if not ret:
-                break
-
-            # Guardar frame cada 'frame_interval' frames
-            if frame_count % frame_interval == 0:
-                frame_filename = f"/tmp/frame_{saved_count:04d}.jpg"
-                cv2.imwrite(frame_filename, frame, [cv2.IMWRITE_JPEG_QUALITY, 85])
-                frames_paths.append(frame_filename)
-                saved_count += 1
-                print(f"   ✓ Frame {saved_count} guardado")
 
-            frame_count += 1
+        def guardar(frame):
+            frame_filename = os.path.join(
+                directorio, f"frame_{len(frames_paths):04d}.jpg"
+            )
+            cv2.imwrite(frame_filename, frame, [cv2.IMWRITE_JPEG_QUALITY, 85])
+            frames_paths.append(frame_filename)
+            print(f"   ✓ Frame {len(frames_paths)} guardado")
+
+        if total_frames <= 0:
+            # Contenedor sin conteo de frames: recorrido secuencial con grab()
+            _extraer_secuencial(cap, fps, intervalo, guardar)
+            if max_frames and len(frames_paths) > max_frames:
+                conservar = {
+                    int(i * len(frames_paths) / max_frames) for i in range(max_frames)
+                }
+                descartados = [
+                    f for i, f in enumerate(frames_paths) if i not in conservar
+                ]
+                frames_paths[:] = [
+                    f for i, f in enumerate(frames_paths) if i in conservar
+                ]
+                for frame_path in descartados:
+                    os.remove(frame_path)
+        else:
+            indices = _indices_objetivo(total_frames, fps, intervalo, max_frames)
+            print(f"🎯 Extrayendo {len(indices)} frames (1 cada {intervalo}s)")
 
-        cap.release()
+            for _, frame in _iterar_frames(cap, fps, indices):
+                guardar(frame)
 
         print(f"✅ Extraídos {len(frames_paths)} frames del video")
         return frames_paths
@@ -323,13 +369,55 @@ def extraer_frames_video(video_path: str, intervalo: float = 1.0) -> List[str]:
         import traceback
 
         traceback.print_exc()
+        limpiar_frames_temporales(frames_paths)
         return []
 
+    finally:
+        if cap is not None:
+            cap.release()
+
+
+def _iterar_frames(cap, fps: float, indices: List[int]):
+    """
+    Genera (indice, frame) para los índices pedidos (ordenados), decodificando
+    solo esos: saltos largos con seek, cortos con grab()
+    """
+    import cv2
+
+    salto_seek = max(1, int(fps * SALTO_MIN_SEEK))
+    posicion = 0  # Índice del próximo frame que entrega el decoder
+    for indice in indices:
+        if indice - posicion > salto_seek and cap.set(cv2.CAP_PROP_POS_FRAMES, indice):
+            posicion = indice
+        while posicion < indice and cap.grab():
+            posicion += 1
+        ret, frame = cap.read()
+        if not ret:
+            return
+        posicion += 1
+        yield indice, frame
+
+
+def _extraer_secuencial(cap, fps: float, intervalo: float, guardar) -> None:
+    """Guarda 1 frame cada `intervalo` segundos decodificando solo esos"""
+    frame_interval = max(1, int(fps * intervalo))
+    frame_count = 0
+
+    while cap.grab():
+        if frame_count % frame_interval == 0:
+            ret, frame = cap.retrieve()
+            if not ret:
+                break
+            guardar(frame)
+        frame_count += 1
+
 
 def limpiar_frames_temporales(frames_paths: List[str]) -> None:
     """
     Elimina archivos temporales de frames.
 
+    También borra el directorio temporal del job si quedó vacío.
+
     Args:
         frames_paths: Lista de rutas de frames a eliminar
     """
@@ -337,9 +425,13 @@ def limpiar_frames_temporales(frames_paths: List[str]) -> None:
 
     eliminados = 0
     errores = 0
+    directorios = set()
 
     for frame_path in frames_paths:
         try:
+            directorio = os.path.dirname(frame_path)
+            if os.path.basename(directorio).startswith(PREFIJO_DIR_FRAMES):
+                directorios.add(directorio)
             if os.path.exists(frame_path):
                 os.remove(frame_path)
                 eliminados += 1
@@ -347,12 +439,225 @@ def limpiar_frames_temporales(frames_paths: List[str]) -> None:
             print(f"⚠️ Error eliminando {frame_path}: {e}")
             errores += 1
 
+    for directorio in directorios:
+        try:
+            os.rmdir(directorio)
+        except OSError:
+            pass
+
     if eliminados > 0:
         print(f"🧹 {eliminados} frames temporales eliminados")
     if errores > 0:
         print(f"⚠️ {errores} errores al eliminar frames")
 
 
+# ==========================================
+# SELECCIÓN DE KEYFRAMES
+# ==========================================
+
+# Candidatos: 1 cada INTERVALO_CANDIDATOS segundos, como máximo MAX_CANDIDATOS
+INTERVALO_CANDIDATOS = 0.5
+MAX_CANDIDATOS = 60
+# Ancho al que se reducen los candidatos para puntuarlos
+ANCHO_ANALISIS = 480
+# Candidatos con nitidez menor a esta fracción de la mediana se descartan
+NITIDEZ_MIN_RELATIVA = 0.35
+# Fracción del alto que deben compartir dos keyframes consecutivos para no
+# cortar líneas de la factura entre uno y otro
+SOLAPE_KEYFRAMES = 0.15
+# Respuesta mínima de phaseCorrelate para confiar en el desplazamiento
+RESPUESTA_MIN_DESPLAZAMIENTO = 0.08
+# Correlación de histogramas desde la que dos vistas son la misma
+CORRELACION_MISMA_VISTA = 0.97
+
+
+def _nitidez(gris) -> float:
+    """Varianza del laplaciano: mayor = más enfocado"""
+    import cv2
+
+    return float(cv2.Laplacian(gris, cv2.CV_64F).var())
+
+
+def _desplazamiento_vertical(anterior, actual) -> float:
+    """
+    Píxeles (escala de análisis) que avanzó el contenido entre dos
+    candidatos. Usa correlación de fase; si no es confiable, compara
+    histogramas: misma vista → 0, vista distinta → un alto completo.
+    """
+    import cv2
+    import numpy as np
+
+    a = np.float32(anterior)
+    b = np.float32(actual)
+    ventana = cv2.createHanningWindow((a.shape[1], a.shape[0]), cv2.CV_32F)
+    (_, dy), respuesta = cv2.phaseCorrelate(a, b, ventana)
+    if respuesta >= RESPUESTA_MIN_DESPLAZAMIENTO:
+        return float(dy)
+
+    histogramas = [
+        cv2.normalize(cv2.calcHist([g], [0], None, [64], [0, 256]), None)
+        for g in (anterior, actual)
+    ]
+    correlacion = cv2.compareHist(*histogramas, cv2.HISTCMP_CORREL)
+    return 0.0 if correlacion >= CORRELACION_MISMA_VISTA else float(a.shape[0])
+
+
+def _cubrir_recibo(candidatos: List[Dict], alto: int) -> List[Dict]:
+    """
+    Mínimo conjunto de candidatos cuyas ventanas verticales cubren todo el
+    recibo (cobertura de intervalos voraz). Entre los que avanzan casi lo
+    mismo se prefiere el más nítido.
+    """
+    if not candidatos:
+        return []
+
+    nitideces = sorted(c["nitidez"] for c in candidatos)
+    umbral = nitideces[len(nitideces) // 2] * NITIDEZ_MIN_RELATIVA
+    nitidos = [c for c in candidatos if c["nitidez"] >= umbral] or candidatos
+
+    inicio = min(c["inicio"] for c in nitidos)
+    fin = max(c["inicio"] + alto for c in nitidos)
+    solape = alto * SOLAPE_KEYFRAMES
+
+    seleccion = []
+    cubierto = inicio
+    while fin - cubierto >= 1:
+        limite = cubierto if not seleccion else cubierto - solape
+        alcanzables = [c for c in nitidos if c["inicio"] <= limite + 1]
+        if not alcanzables or max(c["inicio"] + alto for c in alcanzables) <= cubierto:
+            # Hueco en la cobertura: se salta al siguiente candidato
+            siguientes = [c for c in nitidos if c["inicio"] + alto > cubierto]
+            inicio_siguiente = min(c["inicio"] for c in siguientes)
+            alcanzables = [c for c in siguientes if c["inicio"] == inicio_siguiente]
+
+        mejor_fin = max(c["inicio"] + alto for c in alcanzables)
+        casi_mejores = [
+            c
+            for c in alcanzables
+            if c["inicio"] + alto > cubierto
+            and c["inicio"] + alto >= mejor_fin - solape / 2
+        ]
+        elegido = max(casi_mejores, key=lambda c: c["nitidez"])
+        seleccion.append(elegido)
+        cubierto = elegido["inicio"] + alto
+
+    return sorted(seleccion, key=lambda c: c["indice"])
+
+
+def seleccionar_keyframes(
+    video_path: str, max_frames: int = 5, directorio: str = None
+) -> List[str]:
+    """
+    Extrae los keyframes de un video de factura.
+
+    Puntúa candidatos densos por nitidez (varianza del laplaciano) y estima
+    cuánto se desplazó el recibo entre uno y otro (correlación de fase, con
+    histogramas como respaldo). Devuelve el mínimo conjunto de frames nítidos
+    que cubre todo el alto del recibo, incluida la zona de totales.
+
+    Args:
+        video_path: Ruta del video
+        max_frames: Tope de frames; si la cobertura necesita más se conservan
+            el primero, el último y una muestra uniforme del resto
+        directorio: Carpeta destino (por defecto una temporal propia)
+
+    Returns:
+        Lista de rutas de frames, en orden del video ([] si falla)
+    """
+    import cv2
+    import os
+    import tempfile
+
+    cap = None
+    frames_paths = []
+
+    try:
+        cap = cv2.VideoCapture(video_path)
+        if not cap.isOpened():
+            print(f"❌ No se pudo abrir el video: {video_path}")
+            return []
+
+        fps = cap.get(cv2.CAP_PROP_FPS) or 30
+        total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        if total_frames <= 0:
+            return []
+
+        indices = _indices_objetivo(
+            total_frames, fps, INTERVALO_CANDIDATOS, MAX_CANDIDATOS
+        )
+
+        candidatos = []
+        anterior = None
+        posicion = 0.0
+        alto = None
+        for indice, frame in _iterar_frames(cap, fps, indices):
+            escala = ANCHO_ANALISIS / float(frame.shape[1])
+            gris = cv2.cvtColor(
+                cv2.resize(
+                    frame, None, fx=escala, fy=escala, interpolation=cv2.INTER_AREA
+                ),
+                cv2.COLOR_BGR2GRAY,
+            )
+            if anterior is not None and gris.shape == anterior.shape:
+                posicion -= _desplazamiento_vertical(anterior, gris)
+            anterior = gris
+            alto = gris.shape[0]
+
+            ok, buffer = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, 85])
+            if ok:
+                candidatos.append(
+                    {
+                        "indice": indice,
+                        "inicio": posicion,
+                        "nitidez": _nitidez(gris),
+                        "jpeg": buffer,
+                    }
+                )
+
+        if not candidatos:
+            return []
+
+        seleccion = _cubrir_recibo(candidatos, alto)
+        if max_frames and len(seleccion) > max_frames:
+            if max_frames == 1:
+                seleccion = [seleccion[-1]]
+            else:
+                paso = (len(seleccion) - 1) / float(max_frames - 1)
+                seleccion = [seleccion[round(i * paso)] for i in range(max_frames)]
+
+        if directorio is None:
+            directorio = tempfile.mkdtemp(prefix=PREFIJO_DIR_FRAMES)
+        for candidato in seleccion:
+            frame_filename = os.path.join(
+                directorio, f"frame_{len(frames_paths):04d}.jpg"
+            )
+            with open(frame_filename, "wb") as f:
+                f.write(candidato["jpeg"].tobytes())
+            frames_paths.append(frame_filename)
+
+        recorrido = max(c["inicio"] for c in candidatos) - min(
+            c["inicio"] for c in candidatos
+        )
+        print(
+            f"🎯 Keyframes: {len(frames_paths)} de {len(candidatos)} candidatos "
+            f"(recorrido ≈ {recorrido / alto + 1:.1f} pantallas, "
+            f"frames {[c['indice'] for c in seleccion]})"
+        )
+        return frames_paths
+
+    except Exception as e:
+        print(f"❌ Error seleccionando keyframes: {e}")
+        import traceback
+
+        traceback.print_exc()
+        limpiar_frames_temporales(frames_paths)
+        return []
+
+    finally:
+        if cap is not None:
+            cap.release()
+
+
 def combinar_frames_vertical(
     frames_paths: List[str], output_path: str, max_width: int = 800
 ) -> str:
@@ -11,10 +11,11 @@ import os
 import re
 import json
 
+import claude_client
+
 router = APIRouter()
 
-# Cliente de Anthropic
-client = anthropic.Anthropic(api_key=os.getenv("ANTHROPIC_API_KEY"))
+VISION_TIMEOUT = float(os.getenv("VISION_TIMEOUT", "60"))
 
 
 class ImagenProductoRequest(BaseModel):
@@ -94,7 +95,9 @@ Si la imagen no es clara o no es un producto, responde:
         # Llamar a Claude Vision
         print("🤖 Enviando a Claude Vision...")
 
-        message = client.messages.create(
+        message = await claude_client.crear_mensaje_async(
+            timeout=VISION_TIMEOUT,
+            etiqueta="vision_producto",
             model="claude-sonnet-4-20250514",
             max_tokens=500,
             messages=[
@@ -153,6 +156,9 @@ Si la imagen no es clara o no es un producto, responde:
         raise HTTPException(
             status_code=400, detail=f"Error al procesar imagen: {str(e)}"
         )
+    except claude_client.ClaudeDeadlineExcedido as e:
+        print(f"⏱️ {e}")
+        raise HTTPException(status_code=504, detail="Claude no respondió a tiempo")
     except json.JSONDecodeError as e:
         print(f"❌ Error parseando JSON: {e}")
         return {
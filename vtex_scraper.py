@@ -17,11 +17,12 @@ Uso:
 """
 
 import asyncio
-import aiohttp
 import re
 from typing import Optional, Dict, List
 import urllib.parse
 
+import cliente_vtex
+
 
 # ============================================
 # CONFIGURACIÓN DE SUPERMERCADOS VTEX
@@ -200,19 +201,18 @@ class VTEXScraper:
         productos = []
         url = f"{self.base_url}{self.api_search}/{urllib.parse.quote(nombre)}"
 
-        async with aiohttp.ClientSession() as session:
-            try:
-                async with session.get(
-                    url, headers=self.headers, timeout=aiohttp.ClientTimeout(total=20)
-                ) as response:
-                    if response.status in [200, 206]:
-                        data = await response.json()
-                        for item in data[:max_results]:
-                            producto = self._parsear_producto(item)
-                            if producto:
-                                productos.append(producto)
-            except Exception as e:
-                print(f"   ❌ Error API {self.supermercado}: {str(e)[:50]}")
+        try:
+            response = await cliente_vtex.get_async(
+                url, headers=self.headers, timeout=20
+            )
+            if response.status_code in [200, 206]:
+                data = response.json()
+                for item in data[:max_results]:
+                    producto = self._parsear_producto(item)
+                    if producto:
+                        productos.append(producto)
+        except Exception as e:
+            print(f"   ❌ Error API {self.supermercado}: {str(e)[:50]}")
 
         return productos
 
@@ -220,17 +220,16 @@ class VTEXScraper:
         """Busca por PLU (Reference ID)"""
         url = f"{self.base_url}{self.api_search}?fq=alternateIds_RefId:{plu}"
 
-        async with aiohttp.ClientSession() as session:
-            try:
-                async with session.get(
-                    url, headers=self.headers, timeout=aiohttp.ClientTimeout(total=15)
-                ) as response:
-                    if response.status in [200, 206]:
-                        data = await response.json()
-                        if data:
-                            return self._parsear_producto(data[0])
-            except Exception as e:
-                print(f"   ❌ Error buscando PLU: {str(e)[:50]}")
+        try:
+            response = await cliente_vtex.get_async(
+                url, headers=self.headers, timeout=15
+            )
+            if response.status_code in [200, 206]:
+                data = response.json()
+                if data:
+                    return self._parsear_producto(data[0])
+        except Exception as e:
+            print(f"   ❌ Error buscando PLU: {str(e)[:50]}")
 
         return None
 
@@ -238,17 +237,16 @@ class VTEXScraper:
         """Busca por código de barras EAN"""
         url = f"{self.base_url}{self.api_search}?fq=alternateIds_Ean:{ean}"
 
-        async with aiohttp.ClientSession() as session:
-            try:
-                async with session.get(
-                    url, headers=self.headers, timeout=aiohttp.ClientTimeout(total=15)
-                ) as response:
-                    if response.status in [200, 206]:
-                        data = await response.json()
-                        if data:
-                            return self._parsear_producto(data[0])
-            except Exception as e:
-                print(f"   ❌ Error buscando EAN: {str(e)[:50]}")
+        try:
+            response = await cliente_vtex.get_async(
+                url, headers=self.headers, timeout=15
+            )
+            if response.status_code in [200, 206]:
+                data = response.json()
+                if data:
+                    return self._parsear_producto(data[0])
+        except Exception as e:
+            print(f"   ❌ Error buscando EAN: {str(e)[:50]}")
 
         return None
 
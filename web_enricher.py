@@ -10,12 +10,15 @@ y enriquecer datos de productos con información web.
 ============================================================================
 """
 
-import requests
 import urllib.parse
 from dataclasses import dataclass
 from typing import Optional, Dict, Any, List
 import logging
 
+import cache_vtex
+import catalogo_vtex
+import cliente_vtex
+
 logger = logging.getLogger(__name__)
 
 
@@ -282,6 +285,29 @@ class WebEnricher:
 
         return None
 
+    def _consultar_vtex(
+        self, url: str, establecimiento: str, tipo: str, clave: str
+    ) -> Optional[List[Dict]]:
+        """
+        GET a la API de catálogo pasando por cache_vtex (también guarda las
+        búsquedas sin resultados). None si la respuesta no es 200/206.
+
+        PLU y EAN se buscan primero en el espejo local (catalogo_vtex) cuando
+        la tienda ya tiene una sincronización completa.
+        """
+        if tipo in ("plu", "ean") and catalogo_vtex.disponible(establecimiento):
+            productos = catalogo_vtex.buscar_codigo(establecimiento, tipo, clave)
+            if productos:
+                return productos
+
+        def buscar() -> Optional[List[Dict]]:
+            resp = cliente_vtex.get(url, headers=HEADERS, timeout=self.timeout)
+            if resp.status_code in [200, 206]:
+                return resp.json()
+            return None
+
+        return cache_vtex.consultar(establecimiento, tipo, clave, buscar)
+
     def _buscar_por_plu_vtex(
         self, plu: str, base_url: str, establecimiento: str
     ) -> ResultadoEnriquecimiento:
@@ -291,14 +317,11 @@ class WebEnricher:
         url = f"{base_url}/api/catalog_system/pub/products/search?fq=alternateIds_RefId:{plu}"
 
         try:
-            resp = requests.get(url, headers=HEADERS, timeout=self.timeout)
-
-            if resp.status_code in [200, 206]:
-                data = resp.json()
-                if data and len(data) > 0:
-                    return self._parsear_producto_vtex(
-                        data[0], base_url, establecimiento, "api_vtex_plu"
-                    )
+            data = self._consultar_vtex(url, establecimiento, "plu", plu)
+            if data:
+                return self._parsear_producto_vtex(
+                    data[0], base_url, establecimiento, "api_vtex_plu"
+                )
         except Exception as e:
             logger.warning(f"Error buscando PLU en VTEX: {e}")
 
@@ -313,14 +336,11 @@ class WebEnricher:
         url = f"{base_url}/api/catalog_system/pub/products/search?fq=alternateIds_Ean:{ean}"
 
         try:
-            resp = requests.get(url, headers=HEADERS, timeout=self.timeout)
-
-            if resp.status_code in [200, 206]:
-                data = resp.json()
-                if data and len(data) > 0:
-                    return self._parsear_producto_vtex(
-                        data[0], base_url, establecimiento, "api_vtex_ean"
-                    )
+            data = self._consultar_vtex(url, establecimiento, "ean", ean)
+            if data:
+                return self._parsear_producto_vtex(
+                    data[0], base_url, establecimiento, "api_vtex_ean"
+                )
         except Exception as e:
             logger.warning(f"Error buscando EAN en VTEX: {e}")
 
@@ -351,10 +371,9 @@ class WebEnricher:
             url = f"{base_url}/api/catalog_system/pub/products/search?ft={urllib.parse.quote(palabra)}&_from=0&_to=20"
 
             try:
-                resp = requests.get(url, headers=HEADERS, timeout=self.timeout)
+                data = self._consultar_vtex(url, establecimiento, "texto", palabra)
 
-                if resp.status_code in [200, 206]:
-                    data = resp.json()
+                if data is not None:
 
                     # Filtrar por PLU si lo tenemos
                     if codigo and len(codigo) >= 4: